@@ -8,6 +8,7 @@ from collections import OrderedDict
 import requests
 
 from ..exceptions import PDRServiceException, PDRServerError, IDNotFound
+from ..sessions import get_session
 
 class MetadataClient(object):
     """
@@ -47,7 +48,7 @@ class MetadataClient(object):
     def _retrieve(self, url, id):
         hdrs = { "Accept": "application/json" }
         try:
-            resp = requests.get(url, headers=hdrs)
+            resp = get_session().get(url, headers=hdrs)
 
             if resp.status_code >= 500:
                 raise RMMServerError(id, resp.status_code, resp.reason)
@@ -2,23 +2,37 @@
 This distrib submodule provides a client interface to the PDR Distribution 
 Service.
 """
-import os, sys, shutil, logging, json
+import os, sys, shutil, logging, json, hashlib
 
 import urllib
 import requests
 
 from ..exceptions import PDRException, PDRServiceException, PDRServerError
+from ..sessions import get_session
+
+DEF_CHUNK_SIZE = 256 * 1024
+PART_EXT = ".part"
 
 class RESTServiceClient(object):
     """
     a generic public client interface to a REST service
     """
 
-    def __init__(self, baseurl):
+    def __init__(self, baseurl, chunk_size=None, resume=False):
         """
         initialized the service to the given base URL
+
+        :param str baseurl:     the base URL for the service
+        :param int chunk_size:  the number of bytes to read at a time when 
+                                downloading files (default: DEF_CHUNK_SIZE)
+        :param bool resume:     if True, retrieve_file() will resume an 
+                                interrupted download from where it left off 
+                                rather than starting over.  This should only be 
+                                set when the content at a URL never changes.
         """
         self.base = baseurl
+        self.chunk_size = int(chunk_size or DEF_CHUNK_SIZE)
+        self.resume = resume
 
     def get_json(self, relurl):
         """
@@ -34,7 +48,7 @@ class RESTServiceClient(object):
 
         resp = None
         try:
-            resp = requests.get(self.base+relurl, headers=hdrs)
+            resp = get_session().get(self.base+relurl, headers=hdrs)
 
             if resp.status_code >= 500:
                 raise DistribServerError(relurl, resp.status_code, resp.reason)
@@ -108,14 +122,46 @@ class RESTServiceClient(object):
 
     def retrieve_file(self, relurl, filepath):
         """
-        retrive the content at the given URL and save it to a local file
+        retrive the content at the given URL and save it to a local file.  
+
+        The content is first written to a file with the same name plus a ".part"
+        extension, which is renamed to the requested name once the transfer is 
+        complete.  If this client was created with resume=True and a partial file
+        from an interrupted transfer exists, only the remaining content is 
+        requested (via an HTTP Range request).  
+
+        :return str:  the SHA-256 hash of the saved file's contents, calculated 
+                      during the transfer
         """
         if not relurl.startswith('/'):
             relurl = '/'+relurl
 
+        partfile = filepath + PART_EXT
+        hasher = hashlib.sha256()
+        offset = 0
+        if self.resume and os.path.isfile(partfile):
+            # pick up the hash calculation where the interrupted transfer left off
+            with open(partfile, "rb") as fd:
+                buf = fd.read(self.chunk_size)
+                while buf:
+                    hasher.update(buf)
+                    offset += len(buf)
+                    buf = fd.read(self.chunk_size)
+
+        headers = {}
+        if offset > 0:
+            headers['Range'] = "bytes={0}-".format(offset)
+
         resp = None
         try:
-            resp = requests.get(self.base+relurl, stream=True)
+            resp = get_session().get(self.base+relurl, stream=True, headers=headers)
+
+            if offset > 0 and resp.status_code == 416:
+                # the partial file does not fit the content; start over
+                resp.close()
+                resp = None
+                os.remove(partfile)
+                return self.retrieve_file(relurl, filepath)
 
             if resp.status_code >= 500:
                 raise DistribServerError(relurl, resp.status_code, resp.reason)
@@ -123,15 +169,25 @@ class RESTServiceClient(object):
                 raise DistribResourceNotFound(relurl, resp.reason)
             elif resp.status_code >= 400:
                 raise DistribClientError(relurl, resp.status_code, resp.reason)
-            elif resp.status_code != 200:
+            elif resp.status_code != 200 and not (offset > 0 and resp.status_code == 206):
                 raise DistribServerError(relurl, resp.status_code, resp.reason,
                                message="Unexpected response from server: {0} {1}"
                                         .format(resp.status_code, resp.reason))
 
-            with open(filepath, "wb") as fd:
-                for chunk in resp.iter_content(chunk_size=1024):
+            mode = "ab"
+            if resp.status_code != 206:
+                # we're getting the whole thing
+                mode = "wb"
+                hasher = hashlib.sha256()
+
+            with open(partfile, mode) as fd:
+                for chunk in resp.iter_content(chunk_size=self.chunk_size):
                     if chunk:
                         fd.write(chunk)
+                        hasher.update(chunk)
+
+            os.rename(partfile, filepath)
+            return hasher.hexdigest()
         
         except requests.RequestException as ex:
             raise DistribServerError(message="Trouble connecting to distribution"
@@ -140,6 +196,8 @@ class RESTServiceClient(object):
         finally:
             if resp is not None:
                 resp.close()
+            if not self.resume and os.path.exists(partfile):
+                os.remove(partfile)
 
     def head(self, relurl):
         """
@@ -156,7 +214,7 @@ class RESTServiceClient(object):
 
         resp = None
         try:
-            resp = requests.get(self.base+relurl, allow_redirects=True)
+            resp = get_session().get(self.base+relurl, allow_redirects=True)
             return (resp.status_code, resp.reason)
 
         except requests.RequestException as ex:
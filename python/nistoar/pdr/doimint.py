@@ -6,6 +6,7 @@ from collections import Mapping, Sequence, OrderedDict
 
 from .exceptions import (StateException, ConfigurationException, PDRException, NERDError)
 from .utils import write_json, read_nerd, read_json
+from . import schemas
 from ..doi import datacite as dc
 from ..pdr import def_jq_libdir, def_schema_dir
 from .. import jq
@@ -101,8 +102,7 @@ class DOIMintingClient(object):
 
         if validate:
             try:
-                valid8r = valid8.create_validator(self._cfg.get('schema_dir', def_schema_dir), nerdm)
-                valid8r.validate(nerdm, strict=True, raiseex=True)
+                schemas.validate(nerdm, self._cfg.get('schema_dir', def_schema_dir), raiseex=True)
             except valid8.ValidationError as ex:
                 raise NERDError("Input record (id=%s) is not a valid record" % nerdm.get("@id"), ex)
             except valid8.RefResolutionError as ex:
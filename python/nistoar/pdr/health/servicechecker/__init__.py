@@ -10,6 +10,11 @@ try:
 except ImportError:
     JSONDecodeError = ValueError
 
+from ...sessions import get_session
+
+# health checks should report a failure to connect right away rather than retry
+_check_session_config = { "retries": 0 }
+
 CONNECTION_FAILED = "Connection failed"
 
 class CheckResult(object):
@@ -85,7 +90,7 @@ def check_service(url, method='HEAD', ok_status=200, failure_status=[], desc=Non
             extra['headers'] = dict([('Authorization', "Bearer "+cred)])
         if verifysite is not None:
             extra['verify'] = verifysite
-        resp = requests.request(method, url, **extra)
+        resp = get_session(_check_session_config).request(method, url, **extra)
         if not out.message:
             out.message = resp.reason
         out.status = "%i %s" % (resp.status_code, resp.reason)
@@ -7,9 +7,10 @@ from collections import Mapping, Sequence, OrderedDict
 from ..exceptions import (StateException, ConfigurationException, PDRException,
                           NERDError)
 from ..utils import write_json, read_nerd
+from ..sessions import get_session
 
 def submit_for_ingest(record, endpoint, name=None,
-                      authkey=None, authmeth='qparam'):
+                      authkey=None, authmeth='qparam', session=None):
     """
     Send the given JSON data-object to the ingest service.
 
@@ -23,6 +24,8 @@ def submit_for_ingest(record, endpoint, name=None,
                              Authorization header field) or 'qparam' (send
                              as a query parameter to the URL).  If not provided,
                              'qparam' is assumed.
+    :param session Session:  the HTTP session to send the record through; if not 
+                             provided, the default shared session is used.
 
     :raises TypeError:          if the input is not a Mapping (dict-like) object.
     :raises IngestClientError:  raised ingest fails due to a client problem 
@@ -41,8 +44,11 @@ def submit_for_ingest(record, endpoint, name=None,
         else:
             endpoint += "?auth="+authkey
     
+    if not session:
+        session = get_session()
+    
     try:
-        resp = requests.post(endpoint, json=record, headers=hdrs)
+        resp = session.post(endpoint, json=record, headers=hdrs)
         if resp.status_code >= 500:
             raise IngestServerError(resp.status_code, resp.reason, name)
         elif resp.status_code == 401:
@@ -229,7 +235,8 @@ class IngestClient(object):
             try:
 
                 submit_for_ingest(rec, self._endpt, name,
-                                  self._auth[1], self._auth[0])
+                                  self._auth[1], self._auth[0],
+                                  get_session(self._cfg.get('http_session')))
 
             except NotValidForIngest as ex:
                 # the file is bad, send it to jail
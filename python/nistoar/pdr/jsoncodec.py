@@ -0,0 +1,192 @@
+"""
+This module provides the codec used to read and write the JSON files (NERDm and POD
+records, annotations, status and cache files, etc.) managed by the PDR system.
+
+The codec can be built on one of several JSON libraries, or backends.  Each backend
+must be able to decode JSON objects into ``OrderedDict`` instances (so that the order
+of properties in the metadata is preserved) and must produce the same text as the
+standard library's ``json`` module for the same formatting options.  The backends
+currently supported are:
+
+``simplejson``
+    the external library from which the standard library module is derived.  It is
+    used by default when it is installed with its C speedups.
+``json``
+    the standard library module, used when no faster backend is available.
+
+Other fast libraries (e.g. ujson, orjson) are not supported as they cannot decode
+objects while preserving the order of their properties.
+
+The default backend can be set by the ``OAR_JSON_BACKEND`` environment variable or
+via :func:`set_default_codec`.
+
+Encoding is always done to a string in one step (rather than streamed out to a file),
+as this allows the backend's C accelerations to be used.  Data can be written either
+pretty-printed (with a given indentation) or, for internal files that are not
+preserved and are not meant to be read by people, compactly:  on a single line
+without any inessential whitespace.
+"""
+import os, json, logging, threading, importlib
+from collections import OrderedDict
+
+log = logging.getLogger("pdr.jsoncodec")
+
+PRETTY_SEPARATORS = (',', ': ')
+COMPACT_SEPARATORS = (',', ':')
+
+# the backends to try, in order of preference, when none is requested
+AUTO_BACKENDS = ("simplejson", "json")
+
+class JSONCodec(object):
+    """
+    an encoder and decoder of JSON data built on a particular JSON library.
+    """
+
+    def __init__(self, module, name=None):
+        """
+        :param module module:  the JSON library module to use; it must support the
+                               json module's loads() and dumps() interface,
+                               including the object_pairs_hook parameter.
+        :param str name:       the name of the backend (defaults to the module's
+                               name)
+        """
+        self.module = module
+        self.name = name or module.__name__
+
+    def loads(self, text):
+        """
+        decode the given JSON text, returning objects as OrderedDict instances
+
+        :param str text:  the JSON text; if given as encoded bytes, it is assumed
+                          to be UTF-8.
+        """
+        if isinstance(text, bytes):
+            # simplejson decodes ASCII-only strings within a byte string as str
+            # rather than unicode; decode first so all backends agree with json
+            text = text.decode('utf-8')
+        return self.module.loads(text, object_pairs_hook=OrderedDict)
+
+    def load(self, fd):
+        """
+        decode the JSON text read from the given file object, returning objects as
+        OrderedDict instances
+        """
+        return self.loads(fd.read())
+
+    def dumps(self, data, indent=4):
+        """
+        encode the given data as JSON text
+
+        :param data:        the JSON data to encode
+        :param int indent:  the number of characters to use for indentation when
+                            pretty-printing (default: 4).  If None, the data is
+                            encoded compactly.
+        """
+        if indent is None:
+            return self.module.dumps(data, separators=COMPACT_SEPARATORS)
+        return self.module.dumps(data, indent=indent, separators=PRETTY_SEPARATORS)
+
+    def dump(self, data, fd, indent=4):
+        """
+        encode the given data as JSON text and write it to the given file object
+
+        :param data:        the JSON data to encode
+        :param file fd:     the file object to write to
+        :param int indent:  the number of characters to use for indentation when
+                            pretty-printing (default: 4).  If None, the data is
+                            encoded compactly.
+        """
+        fd.write(self.dumps(data, indent))
+
+def _import_backend(name):
+    # return the JSON library module for the named backend; raise ImportError if it
+    # is not installed
+    if name == "json":
+        return json
+    if name == "simplejson":
+        import simplejson
+        return simplejson
+    raise ValueError("Unsupported JSON backend: " + str(name))
+
+def _is_accelerated(name):
+    # return True if the named backend is installed with its C accelerations
+    try:
+        if name == "simplejson":
+            importlib.import_module("simplejson._speedups")
+        else:
+            _import_backend(name)
+        return True
+    except ImportError:
+        return False
+
+def available_backends():
+    """
+    return the names of the supported backends that are installed, in order of
+    preference.
+    """
+    out = []
+    for name in AUTO_BACKENDS:
+        try:
+            _import_backend(name)
+            out.append(name)
+        except ImportError:
+            pass
+    return out
+
+_codecs = {}
+_default = None
+_lock = threading.Lock()
+
+def get_codec(backend=None):
+    """
+    return the codec built on the named backend.
+
+    :param str backend:  the name of the backend to use; if None, the default
+                         codec is returned.
+    :rtype: JSONCodec
+    :raise ValueError:   if the backend is not supported
+    :raise ImportError:  if the backend is not installed
+    """
+    if not backend:
+        return default_codec()
+    with _lock:
+        out = _codecs.get(backend)
+        if not out:
+            out = JSONCodec(_import_backend(backend), backend)
+            _codecs[backend] = out
+        return out
+
+def default_codec():
+    """
+    return the codec used by default (e.g. by nistoar.pdr.utils.read_json() and
+    write_json()).  Unless set via set_default_codec(), this is determined by the
+    OAR_JSON_BACKEND environment variable or, if it is not set, the first
+    accelerated backend that is installed.
+    """
+    global _default
+    if _default is None:
+        name = os.environ.get('OAR_JSON_BACKEND')
+        codec = None
+        if name:
+            try:
+                codec = get_codec(name)
+            except (ValueError, ImportError) as ex:
+                log.warning("OAR_JSON_BACKEND: %s; using the standard json module",
+                            str(ex))
+        if not codec:
+            name = ([b for b in AUTO_BACKENDS if _is_accelerated(b)] or ["json"])[0]
+            codec = get_codec(name)
+        _default = codec
+    return _default
+
+def set_default_codec(backend=None):
+    """
+    set the codec to be used by default.
+
+    :param str backend:  the name of the backend to use; if None, the default will
+                         be determined anew (see default_codec()).
+    :raise ValueError:   if the backend is not supported
+    :raise ImportError:  if the backend is not installed
+    """
+    global _default
+    _default = (backend and get_codec(backend)) or None
@@ -10,7 +10,6 @@ from abc import ABCMeta, abstractmethod, abstractproperty
 from .. import PreservationSystem, sys, read_nerd, read_pod, read_json, write_json
 from .. import (SIPDirectoryError, PDRException, NERDError, PODError,
                 PreservationStateError)
-from ..bagit.builder import checksum_of
 from ...config import merge_config
 
 def moddate_of(filepath):
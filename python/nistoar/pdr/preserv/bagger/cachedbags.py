@@ -0,0 +1,158 @@
+"""
+An index of the data files contained in serialized member bags cached in local
+store directories.
+
+Checking whether a data file is available in a locally cached member bag (see
+:meth:`~nistoar.pdr.preserv.bagger.datachecker.DataChecker.available_in_cached_bag`)
+requires finding the serialized copies of the bag in the store directory and
+looking inside of them.  A :class:`CachedBagIndex` does this once per bag:  it
+finds the serialized bags via the store directories' catalogs (see
+:mod:`~nistoar.pdr.preserv.bagger.storecat`) and caches, for each serialized bag
+consulted, the set of data file paths read from its table of contents (e.g. a
+zip file's central directory).  Each cached entry records the modification time
+and size of the file it was read from, so the index stays correct as bags are
+replaced in a store.
+
+The bag contents are cached in memory (for a limited number of bags) so that they
+can be shared by all indexes in a process.
+"""
+import os, zipfile, threading
+from collections import OrderedDict
+
+import multibag as mb
+
+from .storecat import catalog_for
+
+# the maximum number of serialized bags whose contents are held in memory
+DEF_CACHE_SIZE = 200
+
+_contents = OrderedDict()
+_cache_lock = threading.RLock()
+_cache_size = DEF_CACHE_SIZE
+
+def set_cache_size(size):
+    """
+    set the maximum number of serialized bags whose contents will be cached in
+    memory.  A value of zero or less turns off caching of bag contents.
+    """
+    global _cache_size
+    with _cache_lock:
+        _cache_size = size
+        while len(_contents) > max(_cache_size, 0):
+            _contents.popitem(last=False)
+
+def clear_cache():
+    """
+    remove all cached bag contents
+    """
+    with _cache_lock:
+        _contents.clear()
+
+def _stamp(filepath):
+    # return a signature of the file's current state, or None if it does not exist
+    try:
+        st = os.stat(filepath)
+        return (st.st_mtime, st.st_size)
+    except OSError:
+        return None
+
+def _as_unicode(path):
+    if isinstance(path, str):
+        try:
+            return path.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return path
+
+class CachedBagIndex(object):
+    """
+    an index of the data files available in the serialized bags found in a set of
+    store directories.
+    """
+
+    def __init__(self, storedirs, catdir=None):
+        """
+        :param list storedirs:  the directories where serialized bags are stored;
+                                entries that are None are ignored.
+        :param str catdir:      the directory where the store directories'
+                                catalogs are persisted (see storecat.catalog_for())
+        """
+        if isinstance(storedirs, (str, unicode)):
+            storedirs = [storedirs]
+        self.storedirs = [d for d in storedirs if d]
+        self._catdir = catdir
+
+    def serialized_bags(self, bagname):
+        """
+        return the paths to the serialized copies of the named bag found in the
+        store directories
+        """
+        out = []
+        for storedir in self.storedirs:
+            out.extend([os.path.join(storedir, f) for f in
+                        catalog_for(storedir, self._catdir).serializations_of(bagname)])
+        return out
+
+    def _read_contents(self, bagfile):
+        # return the set of data file paths (relative to the payload directory)
+        # in the given serialized bag
+        if zipfile.is_zipfile(bagfile):
+            out = set()
+            with zipfile.ZipFile(bagfile) as zf:
+                for name in zf.namelist():
+                    if name.endswith('/'):
+                        continue
+                    parts = _as_unicode(name).split('/', 2)
+                    if len(parts) == 3 and parts[1] == "data":
+                        out.add(parts[2])
+            return frozenset(out)
+        return None
+
+    def contents(self, bagfile):
+        """
+        return the set of data file paths (relative to the payload directory) in
+        the given serialized bag, or None if the bag's serialization does not
+        support indexing.
+
+        :raises IOError:  if the bag file cannot be read
+        """
+        stamp = _stamp(bagfile)
+        with _cache_lock:
+            cached = _contents.get(bagfile)
+            if cached is not None:
+                _contents[bagfile] = _contents.pop(bagfile)   # mark as recently used
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        files = self._read_contents(bagfile)
+        with _cache_lock:
+            if _cache_size > 0:
+                _contents.pop(bagfile, None)
+                _contents[bagfile] = (stamp, files)
+                while len(_contents) > _cache_size:
+                    _contents.popitem(last=False)
+        return files
+
+    def has_file(self, bagname, filepath):
+        """
+        return True if the given data file is contained in a serialized copy of
+        the named bag.
+
+        :param str bagname:   the name of the member bag that should contain the file
+        :param str filepath:  the path to the file relative to the bag's payload
+                              directory
+        """
+        filepath = _as_unicode(filepath)
+        for bagfile in self.serialized_bags(bagname):
+            try:
+                files = self.contents(bagfile)
+                if files is None:
+                    # not indexable; look inside directly
+                    if mb.open_bag(bagfile).isfile('/'.join(['data', filepath])):
+                        return True
+                elif filepath in files:
+                    return True
+            except Exception:
+                # unreadable bag; try another copy
+                continue
+        return False
@@ -1,13 +1,17 @@
 """
 tools for checking the availability of distributions described in a NIST bag.
 """
-import os, re
-from collections import Mapping
+import os, re, time, threading
+from collections import Mapping, OrderedDict
+from urlparse import urlparse
+from multiprocessing.pool import ThreadPool
 
-import multibag as mb
 import requests
 
 from .utils import parse_bag_name
+from ..bagit.lookup import FileLookupIndex
+from .cachedbags import CachedBagIndex
+from ...sessions import get_session
 from ...exceptions import ConfigurationException, StateException
 from ...distrib import (RESTServiceClient, BagDistribClient, DistribServerError,
                         DistribServiceException, DistribResourceNotFound)
@@ -27,6 +31,33 @@ class DataChecker(object):
        a) a cached copy of the specified member bag
        b) in a remote copy of the specified member bag available via the 
           distribution service.
+
+    Checking files whose availability must be confirmed remotely can be slow 
+    when there are many of them; thus, the checker can optionally check 
+    files concurrently (see the ``check_workers`` configuration parameter).
+    In either mode, the checker records the number of checks of each type 
+    it has made and the time spent on them (see :meth:`timing_summary`).
+
+    This class supports the following configuration parameters:
+
+    :prop store_dir str:  the directory where serialized member bags may be 
+                      cached
+    :prop restricted_store_dir str:  a directory where serialized member bags
+                      containing restricted data may be cached
+    :prop store_catalog_dir str:  a directory where catalogs of the bags in the
+                      store directories are persisted (see storecat.StoreCatalog)
+    :prop pdr_dist_url_pattern str:  a regular expression that matches the 
+                      download URLs that point into the PDR's distribution 
+                      service; it must capture the file path in a group.
+    :prop repo_access dict:  the configuration for accessing the repository's
+                      services, including the distribution service 
+                      ("distrib_service")
+    :prop check_workers int (1):  the maximum number of files to check at once;
+                      a value greater than 1 turns on concurrent checking.
+    :prop max_per_host int (4):  the maximum number of simultaneous HEAD 
+                      requests to send to any one host.
+    :prop http_session dict:  the configuration for the HTTP session used to 
+                      access download URLs (see :mod:`nistoar.pdr.sessions`)
     """
 
     AVAIL_NOT = "not available"
@@ -35,6 +66,11 @@ class DataChecker(object):
     AVAIL_VIA_URL = "available via download URL"
     AVAIL_IN_REMOTE_BAG = "available in remote bag via service"
 
+    CHECK_IN_BAG = "in_bag"
+    CHECK_CACHED_BAG = "cached_bag"
+    CHECK_URL = "download_url"
+    CHECK_REMOTE_BAG = "remote_bag"
+
     def __init__(self, bag, config=None, log=None):
         """
         initialize the checker around the bag to be checked
@@ -44,9 +80,29 @@ class DataChecker(object):
             config = {}
         self.cfg = config
         self.log = log
+
+        try:
+            self._workers = int(self.cfg.get('check_workers', 1))
+            self._max_per_host = max(int(self.cfg.get('max_per_host', 4)), 1)
+        except (TypeError, ValueError) as ex:
+            raise ConfigurationException("check_workers and max_per_host must be integers: "+
+                                         str(ex))
+
+        # for limiting the number of simultaneous requests per host
+        self._hostsemas = {}
+
+        # remote bag listings, cached so that each is retrieved only once
+        self._baglists = {}
+        self._baglistlocks = {}
+
+        self._lock = threading.Lock()
+        self._timings = OrderedDict()
         
         self._store = config.get('store_dir')
-        self._mbag = mb.open_headbag(bag.dir)
+        self._lookup = FileLookupIndex(bag.dir, tagdir=bag.multibag_dir)
+        self._cached_bags = CachedBagIndex([self._store,
+                                            self.cfg.get('restricted_store_dir')],
+                                           self.cfg.get('store_catalog_dir'))
         self._disturlpat = self.cfg.get('pdr_dist_url_pattern',
                                         r'^https?://[^/]+/od/ds/(.+)')
         try:
@@ -65,6 +121,43 @@ class DataChecker(object):
         if svcurl:
             self._distsvc = RESTServiceClient(svcurl)
 
+    def _timed(self, checktype, func, *args):
+        # run a check, recording how long it took
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            dur = time.time() - start
+            with self._lock:
+                tm = self._timings.setdefault(checktype,
+                                              OrderedDict([("count", 0), ("total_time", 0.0),
+                                                           ("max_time", 0.0)]))
+                tm['count'] += 1
+                tm['total_time'] += dur
+                tm['max_time'] = max(tm['max_time'], dur)
+
+    def timing_summary(self):
+        """
+        return a summary of the checks made so far by type.  The keys of the 
+        returned dictionary are the types of checks--"in_bag", "cached_bag", 
+        "download_url", and "remote_bag"--and each value is a dictionary giving 
+        the number of checks of that type ("count") as well as the total, 
+        maximum, and mean times spent on them, in seconds.  
+        """
+        out = OrderedDict()
+        with self._lock:
+            for checktype, tm in self._timings.items():
+                out[checktype] = OrderedDict(tm)
+                out[checktype]['mean_time'] = tm['total_time'] / tm['count']
+        return out
+
+    def _log_timing_summary(self):
+        if self.log:
+            self.log.debug("data file check timings: %s",
+                           "; ".join("%s: %d in %.3f s (max %.3f s)" %
+                                     (k, v['count'], v['total_time'], v['max_time'])
+                                     for k, v in self.timing_summary().items()))
+
     def available_in_bag(self, cmp):
         """
         return True if the specified data is found in the bag.  
@@ -104,7 +197,7 @@ class DataChecker(object):
             cmp = cmp['filepath']
 
         path = '/'.join(['data', cmp])
-        return self._mbag.lookup_file(path)
+        return self._lookup.lookup_file(path)
 
     def located_here(self, cmp):
         """
@@ -149,24 +242,7 @@ class DataChecker(object):
         if not inbag:
             return False
 
-        locs = [ os.path.join(self._store, inbag) ]
-        if not os.path.isdir(locs[0]):
-            locs = [os.path.join(self._store, f) for f in os.listdir(self._store)
-                                                 if f.startswith(inbag+".")]
-            if len(locs) == 0:
-                return False
-
-        for loc in locs:
-            if not os.path.isfile(loc):
-                continue
-            try:
-                mbag = mb.open_bag(loc)
-            except Exception as ex:
-                continue
-            if mbag.isfile('/'.join(['data', cmp])):
-                return True
-
-        return False
+        return self._cached_bags.has_file(inbag, cmp)
 
     def has_pdr_url(self, cmp):
         """
@@ -190,23 +266,40 @@ class DataChecker(object):
         return bool(self._disturlpat.match(cmp))
 
     @classmethod
-    def head_url(cls, url):
+    def head_url(cls, url, session=None):
         """
         make a HEAD request on the given URL and return the status code
         and associated message as a tuple.  
 
         This raises a requests.RequestsException if a connection cannot be 
         made.
+
+        :param str url:  the URL to access
+        :param Session session:  the HTTP session to send the request through; 
+                         if not provided, the default shared session is used.
         """
+        if not session:
+            session = get_session()
         resp = None
         try:
-            resp = requests.head(url, allow_redirects=True)
+            resp = session.head(url, allow_redirects=True)
             return (resp.status_code, resp.reason)
         finally:
             if resp is not None:
                 resp.close()
         
 
+    def _host_semaphore(self, url):
+        # return the semaphore that limits the number of simultaneous requests to 
+        # the host in the given URL
+        host = urlparse(url).netloc
+        with self._lock:
+            sema = self._hostsemas.get(host)
+            if not sema:
+                sema = threading.BoundedSemaphore(self._max_per_host)
+                self._hostsemas[host] = sema
+            return sema
+
     def available_via_url(self, cmp):
         """
         return True if the specified data file appears available via its 
@@ -230,7 +323,8 @@ class DataChecker(object):
             cmp = cmp.get('filepath', dlurl)
 
         try:
-            (stat, msg) = self.head_url(dlurl)
+            with self._host_semaphore(dlurl):
+                (stat, msg) = self.head_url(dlurl, get_session(self.cfg.get('http_session')))
             ok = stat >= 200 and stat < 300
             if not ok and self.log:
                 self.log.debug("HEAD on %s: %s (%i)", cmp, msg, stat)
@@ -257,14 +351,15 @@ class DataChecker(object):
                              available via its downloadURL if the URL points
                              to the PDR's distribution service. 
         """
-        if self.available_in_bag(cmp):
+        if self._timed(self.CHECK_IN_BAG, self.available_in_bag, cmp):
             return self.AVAIL_IN_BAG
-        if self.available_in_cached_bag(cmp):
+        if self._timed(self.CHECK_CACHED_BAG, self.available_in_cached_bag, cmp):
             return self.AVAIL_IN_CACHED_BAG
         if (not viadistrib or self.has_pdr_url(cmp.get('downloadURL',''))) and \
-           self.available_via_url(cmp):
+           self._timed(self.CHECK_URL, self.available_via_url, cmp):
             return self.AVAIL_VIA_URL
-        if not strict and self._distsvc and self.containing_bag_available(cmp):
+        if not strict and self._distsvc and \
+           self._timed(self.CHECK_REMOTE_BAG, self.containing_bag_available, cmp):
             return self.AVAIL_IN_REMOTE_BAG
         return self.AVAIL_NOT
 
@@ -321,10 +416,9 @@ class DataChecker(object):
         
         if not self._distsvc:
             raise StateException("Distribution service not configured")
-        bagsvc = BagDistribClient(parts[0], self._distsvc)
 
         try:
-            matches = [f for f in bagsvc.list_for_version(parts[1])
+            matches = [f for f in self._list_remote_bags(parts[0], parts[1])
                          if f.startswith(mbagname+".")]
             return len(matches) > 0
 
@@ -345,6 +439,31 @@ class DataChecker(object):
                                mbagname, str(ex))
             
 
+    def _list_remote_bags(self, aipid, version):
+        # return the names of the bags available from the distribution service for
+        # the given AIP version.  Each listing is retrieved only once, even when 
+        # requested by several threads at once; a failure is remembered and 
+        # re-raised on subsequent requests.
+        key = (aipid, version)
+        with self._lock:
+            klock = self._baglistlocks.get(key)
+            if not klock:
+                klock = threading.Lock()
+                self._baglistlocks[key] = klock
+
+        with klock:
+            if key not in self._baglists:
+                try:
+                    bagsvc = BagDistribClient(aipid, self._distsvc)
+                    self._baglists[key] = bagsvc.list_for_version(version)
+                except DistribServiceException as ex:
+                    self._baglists[key] = ex
+            out = self._baglists[key]
+
+        if isinstance(out, Exception):
+            raise out
+        return out
+
     def unavailable_files(self, strict=False, viadistrib=True):
         """
         return a list of the data file component filepaths that appear to 
@@ -362,7 +481,7 @@ class DataChecker(object):
                              its download URL points to the PDR's 
                              distribution service. 
         """
-        missing = []
+        tocheck = []
         nerd = self.bag.nerdm_record(False)
         for cmp in nerd.get('components',[]):
             if "dcat:Distribution" not in cmp.get('@type',[]) or \
@@ -371,10 +490,22 @@ class DataChecker(object):
             if viadistrib and 'downloadURL' in cmp and \
                not self.has_pdr_url(cmp['downloadURL']):
                 continue
-            if not self.available(cmp, strict, False):
-                missing.append(cmp.get('filepath') or cmp.get('downloadURL'))
+            tocheck.append(cmp)
 
-        return missing
+        check = lambda c: self.available(c, strict, False)
+        if self._workers > 1 and len(tocheck) > 1:
+            pool = ThreadPool(min(self._workers, len(tocheck)))
+            try:
+                avail = pool.map(check, tocheck)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            avail = [check(c) for c in tocheck]
+
+        self._log_timing_summary()
+        return [c.get('filepath') or c.get('downloadURL')
+                for c, ok in zip(tocheck, avail) if not ok]
 
     def all_files_available(self, strict=False, viadistrib=True):
         """
@@ -14,7 +14,7 @@ from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import OrderedDict
 from copy import deepcopy
 
-from .base import SIPBagger, moddate_of, checksum_of, read_pod
+from .base import SIPBagger, moddate_of, read_pod
 from .base import sys as _sys
 from . import utils as bagutils
 from ..bagit.builder import BagBuilder, NERDMD_FILENAME, FILEMD_FILENAME
@@ -437,7 +437,7 @@ class MIDASMetadataBagger(SIPBagger):
         if not update:
             # we'll double check with the checksum in case mod dates are
             # not accurate
-            update = checksum_of(self.inpodfile) != checksum_of(outpod)
+            update = utils.checksum_of(self.inpodfile) != utils.checksum_of(outpod)
             if update:
                 self.log.info("Detected change in POD file (by checksum); updating.")
 
@@ -1277,7 +1277,8 @@ class PreservationBagger(SIPBagger):
         """
         config = {
             "repo_access": self.cfg.get('repo_access', {}),
-            "store_dir":  self.cfg.get('store_dir')
+            "store_dir":  self.cfg.get('store_dir'),
+            "store_catalog_dir":  self.cfg.get('store_catalog_dir')
         }
         config.update( deepcopy(data_checker_config) )
 
@@ -18,7 +18,7 @@ from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import OrderedDict, Mapping
 from copy import deepcopy
 
-from .base import SIPBagger, moddate_of, checksum_of, read_pod, read_json
+from .base import SIPBagger, moddate_of, read_pod, read_json
 from .base import sys as _sys
 from . import utils as bagutils
 from ..bagit.builder import BagBuilder, NERDMD_FILENAME, FILEMD_FILENAME
@@ -26,15 +26,15 @@ from ..bagit import NISTBag
 from ..bagit.tools import synchronize_enhanced_refs
 from ....id import PDRMinter
 from ....nerdm import utils as nerdutils
-from ... import def_merge_etcdir, utils, ARK_NAAN, PDR_PUBLIC_SERVER
+from ... import def_merge_etcdir, utils, schemas, ARK_NAAN, PDR_PUBLIC_SERVER
 from .. import (SIPDirectoryError, SIPDirectoryNotFound, AIPValidationError,
                 ConfigurationException, StateException, PODError, NERDError,
                 PreservationStateError)
 from .... import pdr
 from .prepupd import UpdatePrepService
 from .datachecker import DataChecker
+from . import srcindex
 from nistoar.nerdm.merge import MergerFactory
-from nistoar.nerdm.validate import create_validator
 
 # _sys = PreservationSystem()
 log = logging.getLogger(_sys.system_abbrev)   \
@@ -344,9 +344,13 @@ class MIDASSIP(object):
                       files found in the SIP.
         """
         out = OrderedDict()
+        available = self.available_files()
 
         for fp in self.list_registered_filepaths(prefer_pod):
-            srcpath = self.find_source_file_for(fp)
+            srcpath = available.get(fp)
+            if not srcpath:
+                # not indexed (e.g. it has an ignorable name); look directly
+                srcpath = self.find_source_file_for(fp)
             if srcpath:
                 out[fp] = srcpath
 
@@ -366,23 +370,10 @@ class MIDASSIP(object):
         datafiles = {}
 
         # check each of the possible locations; locations found later take
-        # precedence
+        # precedence.  The shared indexes skip dot-files and pod files written
+        # by MIDAS and only re-list subdirectories that have changed.
         for root in self._indirs:
-            root = root.rstrip('/')
-            for dir, subdirs, files in os.walk(root):
-                reldir = dir[len(root)+1:]
-                for f in files:
-                    # don't descend into subdirectories with ignorable names
-                    for d in range(len(subdirs)-1, -1, -1):
-                        if subdirs[d].startswith('.') or \
-                           subdirs[d].startswith('_'):
-                            del subdirs[d]
-                    
-                    if f.startswith('.') or f.startswith('_'):
-                        # skip dot-files and pod files written by MIDAS
-                        continue
-
-                    datafiles[os.path.join(reldir, f)] = os.path.join(dir, f)
+            datafiles.update(srcindex.index_for(root).locations())
 
         return datafiles
 
@@ -617,6 +608,14 @@ class MIDASMetadataBagger(SIPBagger):
         # path to its location on disk.
         self.datafiles = None
 
+        # an index of the positions of the file components in self.sip.nerd by 
+        # their filepaths (see _component_positions())
+        self._cmpidx = None
+
+        # filepaths to be marked as synced once the current batch of metadata 
+        # updates is written to the bag
+        self._synced_in_batch = []
+
         # A PrepService is used to cache the AIP metadata from the last publication
         # of this dataset
         self.prepsvc = None
@@ -627,6 +626,8 @@ class MIDASMetadataBagger(SIPBagger):
                 self.cfg['repo_access']['store_dir'] = self.cfg['store_dir']
             if 'restricted_store_dir' not in self.cfg['repo_access'] and 'restricted_store_dir' in self.cfg:
                 self.cfg['repo_access']['restricted_store_dir'] = self.cfg['restricted_store_dir']
+            if 'store_catalog_dir' not in self.cfg['repo_access'] and 'store_catalog_dir' in self.cfg:
+                self.cfg['repo_access']['store_catalog_dir'] = self.cfg['store_catalog_dir']
 
             self.prepsvc = UpdatePrepService(self.cfg['repo_access'],
                                              os.path.join("metadata", self.BGRMD_FILENAME))
@@ -914,9 +915,7 @@ class MIDASMetadataBagger(SIPBagger):
         # validate the given POD (raises exception if not valid)
         if validate:
             if self.schemadir:
-                valid8r = create_validator(self.schemadir, pod)
-                valid8r.validate(pod, schemauri=DEF_POD_DATASET_SCHEMA,
-                                 strict=True, raiseex=True)
+                schemas.validate(pod, self.schemadir, DEF_POD_DATASET_SCHEMA, raiseex=True)
             else:
                 self.log.warning("Unable to validate submitted POD data")
         else:
@@ -1035,21 +1034,32 @@ class MIDASMetadataBagger(SIPBagger):
             'last_file_examine_datetime': datetime.fromtimestamp(now).isoformat(' ')
         })
 
-        for destpath, srcpath in self.datafiles.items():
-            fforce = force
-            if not fforce:
-                dfmd = self.bagbldr.bag.nerd_metadata_for(destpath)
-                fforce = 'size' not in dfmd or 'checksum' not in dfmd
-
-            if srcpath and moddate_of(srcpath) > lasttime:
-                fforce = True
-                self.fileExaminer.add(srcpath, destpath)
-
-            self.ensure_file_metadata(srcpath, destpath, fforce, False)
-
-            if not nodata:
-                self.bagbldr.add_data_file(destpath, srcpath, False,
-                                           self.hardlinkdata)
+        # write the file metadata updates to the bag in one pass.  A previously
+        # launched examiner thread writes file metadata directly to the bag; let
+        # it finish first so that its updates are not overwritten by the batch.
+        self.fileExaminer.waitForCompletion(None)
+        self.bagbldr.begin_batch()
+        try:
+            for destpath, srcpath in self.datafiles.items():
+                fforce = force
+                if not fforce:
+                    dfmd = self.bagbldr.bag.nerd_metadata_for(destpath)
+                    fforce = 'size' not in dfmd or 'checksum' not in dfmd
+
+                if srcpath and moddate_of(srcpath) > lasttime:
+                    fforce = True
+                    self.fileExaminer.add(srcpath, destpath)
+
+                self.ensure_file_metadata(srcpath, destpath, fforce, False)
+
+                if not nodata:
+                    self.bagbldr.add_data_file(destpath, srcpath, False,
+                                               self.hardlinkdata)
+        finally:
+            self.bagbldr.end_batch()
+            synced, self._synced_in_batch = self._synced_in_batch, []
+            for destpath in synced:
+                self._mark_filepath_synced(destpath)
 
         # re-examine the files that have changed.
         if examine and len(self.fileExaminer.files) > 0:
@@ -1203,21 +1213,40 @@ class MIDASMetadataBagger(SIPBagger):
             # now save the metadata 
             md = self.bagbldr.update_metadata_for(destpath, md)
             if not self.fileExaminer:
-                self._mark_filepath_synced(destpath)
+                if self.bagbldr.batching:
+                    # wait until the metadata is actually written
+                    self._synced_in_batch.append(destpath)
+                else:
+                    self._mark_filepath_synced(destpath)
 
             # update self.resmd; this is cheaper than recreating it from scratch
             # with nerdm_record()
             if self.sip.nerd:
-                cmps = self.sip.nerd.get('components',[])
-                for i in range(len(cmps)):
-                    if md['@id'] == cmps[i]['@id']:
-                        cmps[i] = md
-                        break
-                if i >= len(cmps):
-                    if len(cmps) == 0:
-                        self.sip.nerd['components'] = [md]
-                    else:
-                        self.sip.nerd['components'].append(md)
+                cmps = self.sip.nerd.setdefault('components', [])
+                pos = self._component_positions()
+                i = pos.get(md.get('filepath'), -1)
+                if i >= 0 and cmps[i].get('@id') != md['@id']:
+                    # the list was rearranged behind our back
+                    pos = self._component_positions(True)
+                    i = pos.get(md.get('filepath'), -1)
+                if i >= 0:
+                    cmps[i] = md
+                else:
+                    pos[md.get('filepath')] = len(cmps)
+                    cmps.append(md)
+                    self._cmpidx = (cmps, len(cmps), pos)
+
+    def _component_positions(self, rebuild=False):
+        # return a map of the filepaths of the components in self.sip.nerd to their
+        # positions in its components list.  The map is rebuilt when the list has 
+        # been replaced or has otherwise changed length.
+        cmps = self.sip.nerd.setdefault('components', [])
+        if rebuild or self._cmpidx is None or self._cmpidx[0] is not cmps or \
+           self._cmpidx[1] != len(cmps):
+            pos = dict((c['filepath'], i) for i, c in enumerate(cmps)
+                                          if 'filepath' in c)
+            self._cmpidx = (cmps, len(cmps), pos)
+        return self._cmpidx[2]
 
 
     def _check_checksum_files(self):
@@ -1526,6 +1555,7 @@ class MIDASMetadataBagger(SIPBagger):
                 # time.sleep(0.1)
                 while self.exif.files:
                     self.exif.examine_next()
+                self.exif.bagger.bagbldr.cksumr.save_cache()
 
                 try:
                     if self.on_finish:
@@ -1833,11 +1863,14 @@ class PreservationBagger(SIPBagger):
         self.bagbldr.ensure_bagdir()
         if not os.path.exists(self.bagbldr.bag.data_dir):
             os.mkdir(self.bagbldr.bag.data_dir);
+        # need to do a final re-examine of all files as the metadata building
+        # stage may have been looking at files in upload that were never
+        # accepted into review.  Checksum them as a batch first.
+        csums = self.bagbldr.checksums_of(self.datafiles.values())
+
         for dfile, srcpath in self.datafiles.items():
-            # need to do a final re-examine of all files as the metadata building
-            # stage may have been looking at files in upload that were never
-            # accepted into review.
-            md = self.bagbldr.describe_data_file(srcpath, dfile, True)
+            md = self.bagbldr.describe_data_file(srcpath, dfile, True,
+                                                 checksum=csums.get(srcpath))
             ct = md.get('@type')
             if ct:
                 ct = re.sub(r'^[^:]*:', '', ct[0])
@@ -2009,7 +2042,8 @@ class PreservationBagger(SIPBagger):
         config = {
             "repo_access": self.cfg.get('repo_access', {}),
             "store_dir":  self.cfg.get('store_dir'),
-            "restricted_store_dir":  self.cfg.get('restricted_store_dir')
+            "restricted_store_dir":  self.cfg.get('restricted_store_dir'),
+            "store_catalog_dir":  self.cfg.get('store_catalog_dir')
         }
         config.update( deepcopy(data_checker_config) )
 
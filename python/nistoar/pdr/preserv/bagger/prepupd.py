@@ -3,7 +3,7 @@ This bagger submodule provides functions for preparing an update to a previously
 preserved collection.  This includes a service client for retrieving previous
 head bags from cache or long-term storage.  
 """
-import os, shutil, json, logging, re, time
+import os, shutil, json, logging, re, time, threading, zlib
 from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import OrderedDict
 from zipfile import ZipFile
@@ -13,9 +13,11 @@ from .base import sys as _sys
 from .. import (ConfigurationException, StateException, CorruptedBagError,
                 NERDError)
 from . import utils as bagutils
+from .storecat import catalog_for
 from ...config import merge_config
 from ...describe import rmm
 from ... import distrib
+from ...distrib.client import PART_EXT
 from ...exceptions import IDNotFound
 from ... import utils
 from ..bagit.builder import BagBuilder, ARK_NAAN
@@ -29,8 +31,28 @@ ARK_PFX = "ark:/{0}/".format(ARK_NAAN)
 class HeadBagCacher(object):
     """
     a helper class that manages serialized head bags in a local cache.
+
+    The cache can be bounded in total size and in the age of its bags:  each time
+    a bag is added, the least recently used bags are evicted until the cache
+    satisfies the limits given in the cache policy.  (A bag's last use is recorded
+    as its file's modification time.)  The cacher ensures that a bag is fetched 
+    only once even if it is requested by multiple threads or processes at the 
+    same time; while one fetches the bag, the others wait for it to complete.
+
+    The cache policy is a dictionary that supports the following properties:
+
+    :prop max_size int (0):  the maximum total size, in bytes, of the cached bags;
+                             a value of zero or less means no limit.  The bag 
+                             most recently requested is never evicted, even if 
+                             it alone exceeds the limit.
+    :prop max_age int (0):   the maximum number of seconds since a bag was last 
+                             used that it should remain in the cache; a value of
+                             zero or less means no limit.
     """
-    def __init__(self, distrib_service, cachedir, infodir=None):
+    LOCK_DIR = "_locks"
+    LOCK_STRIPES = 32
+
+    def __init__(self, distrib_service, cachedir, infodir=None, policy=None):
         """
         set up the cache
         :param RESTServiceClient distrib_service:  the distribution service 
@@ -40,6 +62,8 @@ class HeadBagCacher(object):
         :param str infodir:    the path to the directory where bag metadata 
                                will be stored.  If not provided, a subdirectory
                                of cachedir, "_info", will be used.
+        :param dict policy:    the cache policy (see the class documentation);
+                               if not provided, the cache is unbounded.
         """
         self.distsvc = distrib_service
         self.cachedir = cachedir
@@ -47,6 +71,25 @@ class HeadBagCacher(object):
             infodir = os.path.join(self.cachedir, "_info")
         self.infodir = infodir
 
+        if not policy:
+            policy = {}
+        try:
+            self.max_size = int(policy.get('max_size', 0))
+            self.max_age = float(policy.get('max_age', 0))
+        except (TypeError, ValueError) as ex:
+            raise ConfigurationException("HeadBagCacher: policy: max_size and "+
+                                         "max_age must be numbers", cause=ex)
+
+        self._statlock = threading.Lock()
+        self._stats = OrderedDict([
+            ("hits", 0),
+            ("misses", 0),
+            ("coalesced", 0),
+            ("evictions", 0),
+            ("bytes_fetched", 0),
+            ("bytes_evicted", 0)
+        ])
+
         if not os.path.exists(self.cachedir):
             os.mkdir(self.cachedir)
         if not os.path.isdir(self.cachedir):
@@ -57,7 +100,127 @@ class HeadBagCacher(object):
         if not os.path.isdir(self.infodir):
             raise StateException("HeadBagCacher: not a directory: "+
                                  self.cachedir)
-        
+        self._lockdir = os.path.join(self.cachedir, self.LOCK_DIR)
+        if not os.path.exists(self._lockdir):
+            try:
+                os.mkdir(self._lockdir)
+            except OSError:
+                if not os.path.isdir(self._lockdir):
+                    raise
+
+    def _count(self, stat, incr=1):
+        with self._statlock:
+            self._stats[stat] += incr
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing this cacher's activity:  the 
+        number of requests satisfied from the cache ("hits"), the number that 
+        required a fetch ("misses"), the number that waited on a fetch by another
+        requester ("coalesced"), the number of bags evicted, and the bytes fetched
+        and evicted.
+        """
+        with self._statlock:
+            out = OrderedDict(self._stats)
+        reqs = out['hits'] + out['misses'] + out['coalesced']
+        out['hit_rate'] = (reqs and float(out['hits'] + out['coalesced']) / reqs) or 0.0
+        return out
+
+    def _fetch_lock(self, bagname):
+        # bags share a fixed set of lock files to keep them from accumulating
+        stripe = (zlib.crc32(bagname) & 0xffffffff) % self.LOCK_STRIPES
+        return utils.ExclusiveFileLock(os.path.join(self._lockdir, "fetch-%02d" % stripe))
+
+    def _evict_lock(self):
+        return utils.ExclusiveFileLock(os.path.join(self._lockdir, "evict"))
+
+    def _touch(self, bagfile):
+        # record the bag's use; return False if the bag is not in the cache
+        try:
+            os.utime(bagfile, None)
+            return True
+        except OSError:
+            return False
+
+    def _fetch(self, bagcli, bagname):
+        # download the bag and return its SHA-256 hash if calculated during the
+        # transfer.  The distribution client writes the bag under a temporary 
+        # name and then moves it into place, so the cached file is never seen 
+        # partially written; an interrupted download can be resumed.
+        csum = bagcli.save_bag(bagname, self.cachedir)
+        self._count('bytes_fetched', os.stat(os.path.join(self.cachedir, bagname)).st_size)
+        return csum
+
+    def _cached_bags(self):
+        # return (path, size, last-used time) for each bag in the cache
+        out = []
+        for f in os.listdir(self.cachedir):
+            if f.startswith('_') or f.startswith('.'):
+                continue
+            path = os.path.join(self.cachedir, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                out.append((path, st.st_size, st.st_mtime))
+        return out
+
+    def enforce_policy(self, keep=None):
+        """
+        evict bags from the cache as necessary to satisfy the cache policy.  
+        Bags are evicted in order of least recent use.
+        :param str keep:  the path to a cached bag that should not be evicted
+        :return list:  the paths of the bags that were evicted
+        """
+        if self.max_size <= 0 and self.max_age <= 0:
+            return []
+
+        evicted = []
+        with self._evict_lock():
+            bags = sorted(self._cached_bags(), key=lambda b: b[2])
+            total = sum([b[1] for b in bags])
+            now = time.time()
+            for (path, size, used) in bags:
+                if path == keep:
+                    continue
+                bagname = os.path.basename(path)
+                partial = bagname.endswith(PART_EXT)
+                expired = self.max_age > 0 and now - used > self.max_age
+                if partial:
+                    # an interrupted download that may yet be resumed; only
+                    # remove it once it has gone stale.
+                    if not expired:
+                        continue
+                    bagname = bagname[:-len(PART_EXT)]
+                elif not expired and (self.max_size <= 0 or total <= self.max_size):
+                    continue
+                with self._fetch_lock(bagname):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                if not partial:
+                    self._forget_bag(bagname)
+                total -= size
+                evicted.append(path)
+                self._count('evictions')
+                self._count('bytes_evicted', size)
+
+        return evicted
+
+    def _forget_bag(self, bagname):
+        # remove the info describing an evicted bag
+        try:
+            aipid = bagutils.BagName(bagname).aipid
+        except ValueError:
+            return
+        info = self._recall_head_info(aipid)
+        vers = [v for v in info if info[v].get('name') == bagname]
+        if vers:
+            for v in vers:
+                del info[v]
+            self._save_head_info(aipid, info)
 
     def cache_headbag(self, aipid, version=None, confirm=True):
         """
@@ -88,22 +251,46 @@ class HeadBagCacher(object):
 
         # look for bag in cache; if not there, fetch a copy
         bagfile = os.path.join(self.cachedir, hinfo['name'])
-        if not os.path.exists(bagfile):
-            bagcli.save_bag(hinfo['name'], self.cachedir)
+        csum = None
+        if self._touch(bagfile):
+            self._count('hits')
+        else:
+            with self._fetch_lock(hinfo['name']):
+                if self._touch(bagfile):
+                    # fetched by another requester while we waited
+                    self._count('coalesced')
+                else:
+                    self._count('misses')
+                    csum = self._fetch(bagcli, hinfo['name'])
         if confirm:
-            self.confirm_bagfile(hinfo)
+            self.confirm_bagfile(hinfo, checksum=csum)
 
+        self.enforce_policy(keep=bagfile)
         return bagfile
 
-    def confirm_bagfile(self, baginfo, purge_on_error=True):
+    def confirm_bagfile(self, baginfo, purge_on_error=True, checksum=None):
         """
         Make sure the cached bag described by bag metadata was transfered
         correctly by checking it checksum.  
+        :param dict baginfo:  the bag's description from the distribution service
+        :param bool purge_on_error:  if True, remove the bag from the cache if 
+                              an error is detected.
+        :param str checksum:  the SHA-256 hash of the bag calculated when it was 
+                              transfered; if not provided, it will be calculated 
+                              from the cached file.
         :raise CorruptedBagError: if an error was detected.
         """
         bagfile = os.path.join(self.cachedir, baginfo['name'])
+        algo = baginfo['checksum'].get('algorithm', 'sha256')
+        if isinstance(algo, dict):
+            algo = algo.get('tag', 'sha256')
+        if str(algo).lower().replace('-', '') != 'sha256':
+            # the transfer hash is not comparable
+            checksum = None
         try:
-            if utils.checksum_of(bagfile) != baginfo['checksum']['hash']:
+            if not checksum:
+                checksum = utils.checksum_of(bagfile)
+            if checksum != baginfo['checksum']['hash']:
                 if purge_on_error:
                     # bag file looks corrupted; purge it from the cache
                     self._clear_from_cache(bagfile, baginfo)
@@ -148,6 +335,11 @@ class HeadBagCacher(object):
 class UpdatePrepService(object):
     """
     a factory class that creates UpdatePrepper instances
+
+    The head bags retrieved from the repository are cached in the directory given 
+    by the headbag_cache configuration property; the optional 
+    headbag_cache_policy property sets the limits on the cache (see 
+    HeadBagCacher).
     """
     def __init__(self, config, bgrmdf=None):
         self.cfg = config
@@ -159,8 +351,10 @@ class UpdatePrepService(object):
         self.storedir = self.cfg.get('store_dir')
         self.restricted_storedir = self.cfg.get('restricted_store_dir')
         scfg = self.cfg.get('distrib_service', {})
-        self.distsvc = distrib.RESTServiceClient(scfg.get('service_endpoint'))
-        self.cacher = HeadBagCacher(self.distsvc, self.sercache)
+        self.distsvc = distrib.RESTServiceClient(scfg.get('service_endpoint'),
+                                                 scfg.get('download_chunk_size'), resume=True)
+        self.cacher = HeadBagCacher(self.distsvc, self.sercache,
+                                    policy=self.cfg.get('headbag_cache_policy'))
 
         self.mdsvc = None
         scfg = self.cfg.get('metadata_service', {})
@@ -207,6 +401,7 @@ class UpdatePrepper(object):
         self.storedir = storedir
         self.version = version
         self.mdcli = pubmdclient
+        self._catdir = (config or {}).get('store_catalog_dir')
         self.mdcache = os.path.join(self.cacher.cachedir, "_nerd")
         if not os.path.exists(self.mdcache):
             os.mkdir(self.mdcache)
@@ -285,12 +480,12 @@ class UpdatePrepper(object):
             return None
 
         indir = self.storedir
-        foraip = [f for f in os.listdir(indir)
-                    if f.startswith(aipid+'.') and not f.endswith('.sha256')]
+        foraip = []
+        if indir:
+            foraip = catalog_for(indir, self._catdir).bag_files(aipid)
         if not foraip and self.restricted_storedir:
             indir = self.restricted_storedir
-            foraip = [f for f in os.listdir(indir)
-                        if f.startswith(aipid+'.') and not f.endswith('.sha256')]
+            foraip = catalog_for(indir, self._catdir).bag_files(aipid)
 
         foraip = bagutils.select_version(foraip, version)
         if len(foraip) == 0:
@@ -307,11 +502,13 @@ class UpdatePrepper(object):
         """
         return self.cache_nerdm_rec(shallow=not deep) is not None
         
-    def _unpack_bag_as(self, bagfile, destbag):
+    def _unpack_bag_as(self, bagfile, destbag, metadata_only=False):
+        # if metadata_only is True, the bag's data payload is not unpacked;
+        # only an empty data directory is created.
         destdir = os.path.dirname(destbag)
 
         if bagfile.endswith('.zip'):
-            root = self._unpack_zip_into(bagfile, destdir)
+            root = self._unpack_zip_into(bagfile, destdir, metadata_only)
         else:
             raise StateException("Don't know how to unpack serialized bag: "+
                                  os.path.basename(bagfile))
@@ -322,7 +519,7 @@ class UpdatePrepper(object):
                                    "not created: "+tmpname)
         os.rename(tmpname, destbag)
         
-    def _unpack_zip_into(self, bagfile, destdir):
+    def _unpack_zip_into(self, bagfile, destdir, metadata_only=False):
         if not os.path.exists(destdir):
             raise StateException("Bag destination directory not found: "+destdir)
                                  
@@ -344,6 +541,12 @@ class UpdatePrepper(object):
                 raise StateException("Bag appears to be empty: "+bagfile)
 
             for entry in zip.infolist():
+                if metadata_only:
+                    # skip over the data payload; everything else (the tag
+                    # files, metadata and multibag directories) is kept
+                    parts = entry.filename.split('/', 2)
+                    if len(parts) > 2 and parts[1] == "data":
+                        continue
                 zip.extract(entry, destdir)
                 extracted = os.path.join(destdir, entry.filename)
                 date_time = time.mktime(entry.date_time + (0, 0, -1))
@@ -353,6 +556,11 @@ class UpdatePrepper(object):
                 else:
                     os.utime(extracted, (date_time, date_time))
 
+        if metadata_only:
+            datadir = os.path.join(destdir, root, "data")
+            if not os.path.exists(datadir):
+                os.mkdir(datadir)
+
         for name in dirs:
             os.utime(name, (dirs[name], dirs[name]))
 
@@ -448,16 +656,19 @@ class UpdatePrepper(object):
             raise StateException("metadata bag working space does not exist: "+
                                  parent)
 
+        # the data payload is not needed (and can be large), so it is not copied
         if os.path.isdir(headbag):
             # unserialized bag
-            shutil.copytree(headbag, mdbag)
+            shutil.copytree(headbag, mdbag,
+                            ignore=lambda d, names: (d == headbag and ["data"]) or [])
+            os.mkdir(os.path.join(mdbag, "data"))
             
         elif not os.path.isfile(headbag):
             raise ValueError("UpdatePrepper: head bag does not exist: "+headbag)
 
         else:
             # serialized bag file
-            self._unpack_bag_as(headbag, mdbag)
+            self._unpack_bag_as(headbag, mdbag, metadata_only=True)
 
         # save the the bag-info.txt as deprecated-info.txt for later use
         mbdir = os.path.join(mdbag, "multibag")
@@ -626,13 +837,10 @@ class UpdatePrepper(object):
         return self._latest_version_from_nerdmfile(nerdf)
 
     def _latest_version_from_dir(self, bagparent):
-        foraip = [f for f in os.listdir(bagparent)
-                    if f.startswith(self.aipid+'.') and
-                       not f.endswith('.sha256')        ]
+        catalog = catalog_for(bagparent, self._catdir)
+        foraip = catalog.bag_files(self.aipid)
         if not foraip and self._prevaipid and self._prevaipid != self.aipid:
-            foraip = [f for f in os.listdir(bagparent)
-                        if f.startswith(self._prevaipid+'.') and
-                           not f.endswith('.sha256')        ]
+            foraip = catalog.bag_files(self._prevaipid)
         if not foraip:
             return "0"
         latest = bagutils.find_latest_head_bag(foraip)
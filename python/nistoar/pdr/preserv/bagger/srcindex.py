@@ -0,0 +1,242 @@
+"""
+An index of the data files found in a MIDAS submission (SIP) input directory.
+
+Finding the data files available for a dataset requires walking its review and upload
+directories, and the metadata bagger, the metadata web service, and the file-metadata
+fixing command each do this repeatedly for the same dataset.  A :class:`SourceIndex`
+walks a directory once, recording for each file its location, size, and modification
+time, and thereafter keeps itself current incrementally:  on each refresh, it checks
+the modification time of each directory it has indexed and re-lists only those that
+have changed (i.e. that have had entries added, removed, or renamed).  As a
+directory can change again within the resolution of its modification time, one
+whose modification time is within a couple of seconds of when it was last listed
+is always re-listed.  Note that modifying a file in place does not change its directory's modification time; thus,
+the size and modification time recorded for a file reflect when its directory was
+last listed.
+
+Files and subdirectories whose names begin with "." or "_" (e.g. the POD files written
+by MIDAS) are not indexed.
+
+Indexes are shared within a process (see :func:`index_for`); a limited number are
+held in memory.  An index's :meth:`~SourceIndex.stamp` (or :func:`stamp_for` for
+several directories) identifies the set of files currently found, allowing results
+derived from that set to be cached.
+"""
+import os, time, threading, hashlib
+from collections import OrderedDict
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# the maximum number of directory indexes to hold in memory
+DEF_CACHE_SIZE = 100
+
+# a directory modified within this many seconds of being listed may have changed
+# since without its modification time changing
+RACY_WINDOW = 2.0
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+_cache_size = DEF_CACHE_SIZE
+
+def index_for(rootdir):
+    """
+    return the shared index for the given input directory.
+
+    :param str rootdir:  the directory to be indexed
+    :rtype: SourceIndex
+    """
+    key = os.path.abspath(rootdir)
+    with _indexes_lock:
+        idx = _indexes.pop(key, None)
+        if idx is None:
+            idx = SourceIndex(rootdir)
+        _indexes[key] = idx    # mark as recently used
+        while len(_indexes) > max(_cache_size, 1):
+            _indexes.popitem(last=False)
+        return idx
+
+def set_cache_size(size):
+    """
+    set the maximum number of directory indexes that will be held in memory.
+    """
+    global _cache_size
+    with _indexes_lock:
+        _cache_size = size
+        while len(_indexes) > max(_cache_size, 1):
+            _indexes.popitem(last=False)
+
+def clear_indexes():
+    """
+    discard all of the shared indexes held in memory
+    """
+    with _indexes_lock:
+        _indexes.clear()
+
+def stamp_for(rootdirs):
+    """
+    return a stamp identifying the set of files currently found below the given
+    input directories, as a string that changes whenever a file is added to, or
+    removed from, any of them.  An empty string is returned if no directories are
+    given.
+
+    :param list rootdirs:  the directories to be indexed
+    """
+    if not rootdirs:
+        return ''
+    if len(rootdirs) == 1:
+        return index_for(rootdirs[0]).stamp()
+    return hashlib.md5(":".join(_utf8(index_for(d).stamp()) for d in rootdirs)) \
+                  .hexdigest()[:16]
+
+def _utf8(path):
+    # hashlib needs bytes; unicode paths may contain non-ASCII characters
+    if isinstance(path, unicode):
+        return path.encode('utf-8')
+    return path
+
+def _ignorable(name):
+    return name.startswith('.') or name.startswith('_')
+
+def _list_dir(dirpath):
+    # return the names of the (non-ignorable) subdirectories to descend into and a map of
+    # the (non-ignorable) files to their (size, mtime) found in the given directory
+    subdirs = []
+    files = {}
+    if scandir:
+        for entry in scandir(dirpath):
+            if _ignorable(entry.name):
+                continue
+            try:
+                if entry.is_dir():
+                    # like os.walk(), do not follow links to directories
+                    if not entry.is_symlink():
+                        subdirs.append(entry.name)
+                    continue
+                st = entry.stat()
+                files[entry.name] = (st.st_size, st.st_mtime)
+            except OSError:
+                # e.g. a broken link
+                files[entry.name] = (None, None)
+    else:
+        for name in os.listdir(dirpath):
+            if _ignorable(name):
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.isdir(path):
+                if not os.path.islink(path):
+                    subdirs.append(name)
+                continue
+            try:
+                st = os.stat(path)
+                files[name] = (st.st_size, st.st_mtime)
+            except OSError:
+                files[name] = (None, None)
+    return (sorted(subdirs), files)
+
+class SourceIndex(object):
+    """
+    an incrementally updated index of the data files below an input directory.
+    """
+
+    def __init__(self, rootdir):
+        """
+        :param str rootdir:  the directory to be indexed
+        """
+        self.rootdir = rootdir.rstrip('/')
+        self._lock = threading.RLock()
+        self._dirs = {}
+        self._files = None
+        self._stamp = None
+
+    def _scan(self, reldir, dirs):
+        # add to dirs the entries for reldir and all of its subdirectories, reusing
+        # entries for directories that have not changed; return True if any did.
+        path = os.path.join(self.rootdir, reldir) if reldir else self.rootdir
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return True
+
+        # an entry is (mtime, subdirs, files, time listed)
+        changed = False
+        entry = self._dirs.get(reldir)
+        if entry is None or entry[0] != mtime or mtime > entry[3] - RACY_WINDOW:
+            try:
+                listed = time.time()
+                new = (mtime,) + _list_dir(path) + (listed,)
+            except OSError:
+                return True
+            changed = entry is None or new[:3] != entry[:3]
+            entry = new
+        dirs[reldir] = entry
+
+        for sub in entry[1]:
+            if self._scan(os.path.join(reldir, sub), dirs):
+                changed = True
+        return changed
+
+    def refresh(self):
+        """
+        bring the index up to date with the directory's current contents.
+        """
+        with self._lock:
+            dirs = {}
+            changed = self._scan('', dirs)
+            if changed or len(dirs) != len(self._dirs):
+                self._files = None
+                self._stamp = None
+            # (keep the entries of directories re-listed without changing, too)
+            self._dirs = dirs
+
+    def _flatten(self):
+        out = {}
+        for reldir, entry in self._dirs.items():
+            for name, info in entry[2].items():
+                relpath = os.path.join(reldir, name)
+                out[relpath] = (os.path.join(self.rootdir, relpath),) + info
+        return out
+
+    def files(self, refresh=True):
+        """
+        return a map of the paths of the files (relative to the root directory) to
+        tuples giving their location (i.e. full path), size, and modification time.
+
+        :param bool refresh:  if True (default), refresh the index before answering
+        """
+        with self._lock:
+            if refresh or self._files is None:
+                self.refresh()
+            if self._files is None:
+                self._files = self._flatten()
+            return self._files
+
+    def locations(self, refresh=True):
+        """
+        return a map of the paths of the files (relative to the root directory) to
+        their locations (i.e. full paths).
+
+        :param bool refresh:  if True (default), refresh the index before answering
+        """
+        return dict((p, f[0]) for p, f in self.files(refresh).items())
+
+    def stamp(self, refresh=True):
+        """
+        return a stamp identifying the set of files currently indexed:  a string
+        derived from the files' paths that changes whenever a file is added or
+        removed (but not when a file is modified in place).
+
+        :param bool refresh:  if True (default), refresh the index before answering
+        """
+        with self._lock:
+            files = self.files(refresh)
+            if self._stamp is None:
+                self._stamp = hashlib.md5("\n".join(sorted(_utf8(p)
+                                                           for p in files))) \
+                                     .hexdigest()[:16]
+            return self._stamp
@@ -0,0 +1,318 @@
+"""
+A catalog of the serialized preservation bags in a long-term storage directory.
+
+A store directory can hold tens of thousands of serialized bags; finding the bags
+for a particular AIP by listing the directory and parsing every file name on each
+request is slow.  A :class:`StoreCatalog` maintains an index of the serialized bags
+in a directory organized by AIP identifier and version, recording for each bag
+file its member bag name, size, and (when known) SHA-256 checksum.  The catalog is
+kept in sync with the directory:  it is updated directly when a SIP handler
+delivers new bag files (see :meth:`StoreCatalog.record_delivery`), and whenever the
+directory's modification time shows that it has otherwise changed, only the files
+that have been added or removed since the last look are (re-)examined.  Because a
+bag file can also be rewritten in place under the same name (which need not change
+the directory), an entry's size and checksum are only trusted while the file's own
+modification time and size match those recorded with it.
+
+Catalogs are shared within a process (see :func:`catalog_for`) and can optionally
+be persisted to a file so that new processes need not rescan the directory.
+"""
+import os, re, threading, logging
+from collections import OrderedDict
+
+from . import utils as bagutils
+from ...utils import read_json, write_json
+from ...exceptions import StateException
+
+log = logging.getLogger(__name__)
+
+CSUM_EXT = ".sha256"
+REMOVED_EXT = ".removed"
+PART_EXT = ".part"
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+def catalog_for(storedir, catdir=None):
+    """
+    return the shared catalog for the given store directory.
+
+    :param str storedir:  the store directory to be cataloged
+    :param str catdir:    a directory where the catalog should be persisted; if
+                          None, the catalog is only kept in memory.
+    :rtype: StoreCatalog
+    """
+    key = os.path.abspath(storedir)
+    with _catalogs_lock:
+        cat = _catalogs.get(key)
+        if not cat or (catdir and not cat.catfile):
+            catfile = None
+            if catdir:
+                catfile = os.path.join(catdir, "storecat-%s.json" %
+                                       re.sub(r'[^\w\-]+', '_', key).strip('_'))
+            cat = StoreCatalog(storedir, catfile)
+            _catalogs[key] = cat
+        return cat
+
+def clear_catalogs():
+    """
+    discard all of the shared catalogs held in memory
+    """
+    with _catalogs_lock:
+        _catalogs.clear()
+
+def _stamp_of(path):
+    try:
+        st = os.stat(path)
+        return [st.st_mtime, st.st_size]
+    except OSError:
+        return None
+
+def _read_checksum(csumfile):
+    try:
+        with open(csumfile) as fd:
+            return (fd.read().strip().split() or [None])[0]
+    except (IOError, OSError):
+        return None
+
+class StoreCatalog(object):
+    """
+    an index of the serialized bags in a store directory.
+
+    Each serialized bag file is described by an entry--a dictionary with the
+    properties "aipid", "version", "bag" (the member bag name without the
+    serialization extension), "size", "mtime" (the file's modification time),
+    "sha256" (None if not yet known), and "removed" (True if the bag has been
+    marked as removed from public access).
+    """
+
+    def __init__(self, storedir, catfile=None):
+        """
+        :param str storedir:  the store directory to be cataloged
+        :param str catfile:   a file where the catalog should be persisted; if
+                              None, the catalog is only kept in memory.
+        """
+        self.storedir = storedir
+        self.catfile = catfile
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._files = {}
+        self._byaip = {}
+        self._bybag = {}
+        self._loaded = False
+
+    def _index(self, fname, entry):
+        self._files[fname] = entry
+        self._byaip.setdefault(entry['aipid'], set()).add(fname)
+        self._bybag.setdefault(entry['bag'], set()).add(fname)
+
+    def _unindex(self, fname):
+        entry = self._files.pop(fname, None)
+        if entry:
+            for idx, key in ((self._byaip, entry['aipid']), (self._bybag, entry['bag'])):
+                names = idx.get(key)
+                if names is not None:
+                    names.discard(fname)
+                    if not names:
+                        del idx[key]
+
+    def _make_entry(self, fname, csum=None):
+        # return None if fname is not the name of a serialized bag
+        if fname.endswith(CSUM_EXT) or fname.endswith(REMOVED_EXT) or \
+           fname.endswith(PART_EXT) or \
+           not bagutils.is_legal_bag_name(fname):
+            return None
+        try:
+            bagname = bagutils.BagName(fname)
+        except ValueError:
+            return None
+        if not bagname.serialization:
+            return None
+        stamp = _stamp_of(os.path.join(self.storedir, fname))
+        if stamp is None:
+            return None
+        return OrderedDict([
+            ("aipid", bagname.aipid), ("version", bagname.version),
+            ("bag", fname[:-len(bagname.serialization)-1]), ("size", stamp[1]),
+            ("mtime", stamp[0]), ("sha256", csum), ("removed", False)
+        ])
+
+    def _revalidate(self, fname, entry):
+        # return the entry for fname, remade if the file has been rewritten (or
+        # removed) since the entry was made
+        stamp = _stamp_of(os.path.join(self.storedir, fname))
+        if stamp == [entry.get('mtime'), entry.get('size')]:
+            return entry
+        removed = entry.get('removed', False)
+        self._unindex(fname)
+        entry = stamp and self._make_entry(fname)
+        if entry:
+            entry['removed'] = removed
+            self._index(fname, entry)
+        self._save()
+        return entry
+
+    def _load(self):
+        # restore the catalog from its persisted file, if available
+        self._loaded = True
+        if not self.catfile or not os.path.exists(self.catfile):
+            return
+        try:
+            data = read_json(self.catfile)
+        except Exception:
+            # corrupted; it will be rebuilt
+            return
+        if data.get('storedir') != os.path.abspath(self.storedir):
+            return
+        for fname, entry in data.get('files', {}).items():
+            self._index(fname, entry)
+        self._stamp = data.get('stamp')
+
+    def _save(self):
+        # write the catalog to its file atomically.  Failing to persist the catalog is
+        # not fatal:  it is still usable from memory.
+        if not self.catfile:
+            return
+        data = OrderedDict([
+            ("storedir", os.path.abspath(self.storedir)),
+            ("stamp", self._stamp),
+            ("files", self._files)
+        ])
+        tmpfile = "%s.%d.tmp" % (self.catfile, os.getpid())
+        try:
+            catdir = os.path.dirname(self.catfile)
+            if catdir and not os.path.isdir(catdir):
+                os.makedirs(catdir)
+            write_json(data, tmpfile, None)
+            os.rename(tmpfile, self.catfile)
+        except (StateException, OSError) as ex:
+            log.warning("Unable to save store catalog to %s: %s", self.catfile, str(ex))
+
+    def _sync(self, full=False):
+        # reconcile the catalog with the current contents of the directory
+        stamp = _stamp_of(self.storedir)
+        if stamp is None:
+            self._files, self._byaip, self._bybag = {}, {}, {}
+            self._stamp = None
+            return
+        if full:
+            self._files, self._byaip, self._bybag = {}, {}, {}
+
+        names = set(os.listdir(self.storedir))
+        for fname in [f for f in self._files if f not in names]:
+            self._unindex(fname)
+        for fname in names:
+            entry = self._files.get(fname)
+            if entry is None:
+                entry = self._make_entry(fname)
+                if entry is None:
+                    continue
+                self._index(fname, entry)
+            entry['removed'] = (fname + REMOVED_EXT) in names
+
+        self._stamp = stamp
+        self._save()
+
+    def refresh(self):
+        """
+        update the catalog if the store directory has changed since it was last
+        examined.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if self._stamp is None or self._stamp != _stamp_of(self.storedir):
+                self._sync()
+
+    def rebuild(self):
+        """
+        rebuild the catalog from a full scan of the store directory
+        """
+        with self._lock:
+            self._loaded = True
+            self._sync(True)
+
+    def record_delivery(self, filepaths):
+        """
+        update the catalog to include bag files that have just been written into
+        the store directory.  Checksum files (with a ".sha256" extension) delivered
+        along with their bag files supply the bags' recorded checksums.
+
+        :param list filepaths:  the paths to the delivered files; only the base
+                                names of the files are used.
+        """
+        names = set(os.path.basename(f) for f in filepaths)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            for fname in names:
+                entry = self._make_entry(fname)
+                if entry is None:
+                    continue
+                if fname + CSUM_EXT in names:
+                    entry['sha256'] = _read_checksum(os.path.join(self.storedir,
+                                                                  fname + CSUM_EXT))
+                self._unindex(fname)
+                self._index(fname, entry)
+
+            # the directory has changed; let the next refresh confirm there were no
+            # other changes before trusting the directory's new modification time.
+            self._save()
+
+    def bag_files(self, aipid):
+        """
+        return the names of the serialized bag files for the AIP with the given
+        identifier, sorted from earliest to latest.
+        """
+        self.refresh()
+        with self._lock:
+            return sorted(self._byaip.get(aipid, []), key=bagutils.BagName)
+
+    def has_aip(self, aipid):
+        """
+        return True if the store contains any bags for the AIP with the given
+        identifier.
+        """
+        self.refresh()
+        with self._lock:
+            return aipid in self._byaip
+
+    def versions(self, aipid):
+        """
+        return a dictionary mapping the versions of the AIP with the given identifier
+        to the list of entries for the bag files that were created for that version.
+        The versions and entries are ordered from earliest to latest.
+        """
+        out = OrderedDict()
+        for fname in self.bag_files(aipid):
+            entry = self.entry(fname)
+            if entry:
+                out.setdefault(entry['version'], []).append(entry)
+        return out
+
+    def serializations_of(self, bagname):
+        """
+        return the names of the files in the store directory that are
+        serializations of the member bag with the given name.
+        """
+        self.refresh()
+        with self._lock:
+            return sorted(self._bybag.get(bagname, []))
+
+    def entry(self, fname):
+        """
+        return a copy of the catalog entry for the serialized bag file with the
+        given name, or None if the file is not in the catalog.  If its checksum is
+        not yet known, it will be read from its checksum file (if it exists).  If
+        the file has been rewritten since it was cataloged, its entry is remade.
+        """
+        with self._lock:
+            entry = self._files.get(fname)
+            if entry is not None:
+                entry = self._revalidate(fname, entry)
+            if entry is None:
+                return None
+            if entry.get('sha256') is None:
+                entry['sha256'] = _read_checksum(os.path.join(self.storedir,
+                                                              fname + CSUM_EXT))
+            return OrderedDict(entry)
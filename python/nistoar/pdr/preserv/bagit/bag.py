@@ -4,13 +4,15 @@ Tools for reading data from a bag
 
 import os, logging, re, json, hashlib
 from collections import OrderedDict
+from copy import deepcopy
 
 from .. import PreservationSystem, read_nerd, read_pod
 from .. import NERDError, PODError, StateException
 from .exceptions import BadBagRequest, ComponentNotFound, BagFormatError
+from .compindex import ComponentIndex
 from ... import def_jq_libdir, def_merge_etcdir
 from ....nerdm.merge import MergerFactory, Merger
-from ....nerdm.convert import ComponentCounter, HierarchyBuilder
+from .convert import make_component_counter, make_hierarchy_builder
 
 POD_FILENAME = "pod.json"
 NERDMD_FILENAME = "nerdm.json"
@@ -28,7 +30,8 @@ class NISTBag(PreservationSystem):
     # NOTE: this is an incomplete implementation
     # (what's missing?)
 
-    def __init__(self, rootdir, merge_annots=False, merge_conf_dir=None):
+    def __init__(self, rootdir, merge_annots=False, merge_conf_dir=None,
+                 nerdm_engine=None):
         if not os.path.isdir(rootdir):
             raise StateException("Bag directory does not exist as a directory: "+
                                  rootdir, sys=self)
@@ -43,12 +46,17 @@ class NISTBag(PreservationSystem):
 
         self._mergeannots = merge_annots
 
+        # the engine used to calculate inventories and hierarchies ("jq" or
+        # "native"; None means the default)
+        self.nerdm_engine = nerdm_engine
+
         # this is the directory containing schemas annotated with merging
         # directives
         self._mergeconf = merge_conf_dir
         if not self._mergeconf:
             self._mergeconf = MERGECONF
         self._mergerfact = None
+        self._index = None
 
     @property
     def dir(self):
@@ -81,6 +89,16 @@ class NISTBag(PreservationSystem):
         """
         return self._metadir
 
+    @property
+    def index(self):
+        """
+        the ComponentIndex used to assemble the bag's NERDm record (see 
+        nerdm_record()).  
+        """
+        if self._index is None:
+            self._index = ComponentIndex(self._dir)
+        return self._index
+
     @property
     def bagit_version(self):
         """
@@ -227,75 +245,83 @@ class NISTBag(PreservationSystem):
         if merge_annots:
             compmerger = self._make_merger(merge_annots, 'Component')
 
-        out = None
         if not os.path.isdir(self._metadir):
             raise BadBagRequest(self.name +
                                 ": Bag does not contain NERDm metadata")
-        for root, subdirs, files in os.walk(self._metadir):
-            if root == self._metadir:
-                out = self.nerd_metadata_for("")
-                if 'components' not in out:
-                    out['components'] = []
-
-                if merge_annots:
-                    annotfile = os.path.join(root,ANNOTS_FILENAME)
-                    if os.path.exists(annotfile):
-                        annots = self.read_nerd(annotfile)
-                        merger = self._make_merger(merge_annots, 'Resource')
-                        out = merger.merge(out, annots)
-
-            elif NERDMD_FILENAME in files:
-                comp = self.read_nerd(os.path.join(root, NERDMD_FILENAME))
-
-                # remove properties that support standalone use/validation
-                for key in "_schema $schema @context".split():
-                    if key in comp:
-                        del comp[key]
-
-                if merge_annots:
-                    annotfile = os.path.join(root,ANNOTS_FILENAME)
-                    if os.path.exists(annotfile):
-                        annots = self.read_nerd(annotfile)
-                        comp = compmerger.merge(comp, annots)
-
-                out['components'].append(comp)
+
+        # the component metadata are pulled from an index that only re-reads the
+        # metadata files that have changed since the last time they were read.
+        entries = self.index.refresh()
+        if "" not in entries:
+            bagname = os.path.basename(self._name)
+            raise ComponentNotFound("Component not found: resource-level metadata in "
+                                    + bagname, bagname)
+
+        ent = entries[""]
+        out = deepcopy(ent['nerdm'])
+        if 'components' not in out:
+            out['components'] = []
+        if merge_annots and ent['annot'] is not None:
+            merger = self._make_merger(merge_annots, 'Resource')
+            out = merger.merge(out, deepcopy(ent['annot']))
+
+        for comppath, ent in entries.items():
+            if comppath == "":
+                continue
+            comp = deepcopy(ent['nerdm'])
+
+            # remove properties that support standalone use/validation
+            for key in "_schema $schema @context".split():
+                if key in comp:
+                    del comp[key]
+
+            if merge_annots and ent['annot'] is not None:
+                comp = compmerger.merge(comp, deepcopy(ent['annot']))
+
+            out['components'].append(comp)
 
         if incl_inventory and 'inventory' not in out:
-            self.update_inventory_in(out)
+            self.update_inventory_in(out, self.nerdm_engine)
         if incl_hierarchy:
-            self.update_hierarchy_in(out)
+            self.update_hierarchy_in(out, self.nerdm_engine)
         
         return out
 
     @classmethod
-    def update_inventory_in(cls, resmd):
+    def update_inventory_in(cls, resmd, engine=None):
         """
         For the given NERDm record, add or update its 'inventory' 
         property to reflect its current set of components.
+
+        :param str engine:  the engine to calculate the inventory with ("jq" or 
+                            "native"); if None, the default engine is used.
         """
         resmd['inventory'] = {}
 
         if 'components' in resmd:
             components = resmd['components']
-            cc = ComponentCounter(JQLIB)
+            cc = make_component_counter(engine, JQLIB)
             resmd['inventory'] = cc.inventory(components)
 
         return resmd
 
     @classmethod
-    def update_hierarchy_in(cls, resmd):
+    def update_hierarchy_in(cls, resmd, engine=None):
         """
         For the given NERDm record, add or update its 'dataHierarchy' 
         property to reflect its current set of components.  If the 
         components do not include any DataFile or Subcollection components,
         the 'dataHierarchy' property will be remove from the given record (or
         otherwise not added).  
+
+        :param str engine:  the engine to build the hierarchy with ("jq" or 
+                            "native"); if None, the default engine is used.
         """
         hier = []
         if 'dataHierarchy' in resmd:
             del resmd['dataHierarchy']
         if 'components' in resmd:
-            hb = HierarchyBuilder(JQLIB)
+            hb = make_hierarchy_builder(engine, JQLIB)
             hier = hb.build_hierarchy(resmd['components'])
         if hier:
             resmd['dataHierarchy'] = hier
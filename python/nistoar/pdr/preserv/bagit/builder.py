@@ -3,7 +3,7 @@ Tools for building a NIST Preservation bags
 """
 from __future__ import print_function, absolute_import
 from __future__ import print_function, absolute_import
-import os, errno, logging, re, pkg_resources, textwrap, datetime
+import os, errno, logging, re, pkg_resources, textwrap, datetime, threading
 import pynoid as noid
 from shutil import copy as filecopy, rmtree
 from copy import deepcopy
@@ -15,18 +15,20 @@ from .. import ConfigurationException, StateException, PODError
 from .exceptions import (BagProfileError, BagWriteError, BadBagRequest,
                          ComponentNotFound)
 from ....nerdm.exceptions import (NERDError, NERDTypeError)
-from ....nerdm.convert import PODds2Res
 from ....nerdm.constants import core_schema_base, schema_versions
 from ....id import PDRMinter
-from ...utils import (build_mime_type_map, checksum_of, measure_dir_size,
+from ...utils import (build_mime_type_map, measure_dir_size,
                       read_nerd, read_pod, write_json)
 
 from ....id import PDRMinter
 from ... import def_jq_libdir, def_etc_dir
 from ...config import load_from_file, merge_config
 from .bag import NISTBag
+from .convert import make_pod_converter
 from .exceptions import BadBagRequest
 from .validate.nist import NISTAIPValidator
+from ..checksum import ChecksumEngine, ChecksumCache
+from .journal import ChangeJournal, CREATED, UPDATED, REMOVED
 
 from multibag import open_headbag
 
@@ -43,6 +45,9 @@ FILEMD_FILENAME = NERDMD_FILENAME
 RESMD_FILENAME  = NERDMD_FILENAME
 COLLMD_FILENAME = NERDMD_FILENAME
 
+CHECKSUM_CACHE_FILENAME = "__checksums.json"
+CHANGE_JOURNAL_FILENAME = "__changes.json"
+
 ANNOT_FILENAME = "annot.json"
 FILEANNOT_FILENAME = ANNOT_FILENAME
 RESANNOT_FILENAME  = ANNOT_FILENAME
@@ -70,6 +75,29 @@ NERDM_CONTEXT = "https://data.nist.gov/od/dm/nerdm-pub-context.jsonld"
 DISTSERV = "https://" + PDR_PUBLIC_SERVER + "/od/ds/"
 DEF_MERGE_CONV = "midas0"
 
+
+def format_bytes(nbytes):
+    """
+    format a number of bytes as a human-friendly string (e.g. "34.57 kB") for use 
+    as a Bag-Size value.
+    """
+    prefs = ["", "k", "M", "G", "T"]
+    ordr = 0
+    while nbytes >= 1000.0 and ordr < 4:
+        nbytes /= 1000.0
+        ordr += 1
+    pref = prefs[ordr]
+    ordr = 0
+    while nbytes >= 10.0:
+        nbytes /= 10.0
+        ordr += 1
+    nbytes = str(round(nbytes, 3) * 10**ordr)
+    if '.' in nbytes:
+        nbytes = re.sub(r"0+$", "", nbytes)
+    if nbytes.endswith('.'):
+        nbytes = nbytes[:-1]    
+    return "{0} {1}B".format(nbytes, pref)
+
 class BagBuilder(PreservationSystem):
     """
     A class for building up and populating a BagIt bag compliant with the 
@@ -83,7 +111,11 @@ class BagBuilder(PreservationSystem):
     compliant with the NIST Bag Profile.  
 
     One key feature is that the updates are recorded via log 
-    messages in a log file inside the bag ("preserv.log").  A word of warning
+    messages in a log file inside the bag ("preserv.log").  When many file 
+    components are to be updated at once, the updates can be batched (see 
+    begin_batch() and end_batch()) so that each component's metadata is 
+    written only once and the batch is recorded in the log with a single 
+    summary message.  A word of warning
     regarding this feature:  if two BagBuilder instances updating different 
     bags have an internal logger with the same name, the internal log files 
     will likely collect log messages that do not belong to it.  Be default, 
@@ -118,6 +150,13 @@ class BagBuilder(PreservationSystem):
     :prop jq_lib       str:  the full path to the JQ transform library 
                               directory; if not set, the directory is 
                               searched for in a few typical places.
+    :prop nerdm_engine str:  the engine to use to convert POD records to NERDm 
+                              and to calculate inventories: either "jq", which 
+                              uses the JQ transform library, or "native", a pure 
+                              Python implementation that avoids running an 
+                              external jq process for each conversion.  If not 
+                              set, the default engine is used (see 
+                              nistoar.pdr.preserv.bagit.convert).
     :prop merge_etc    str:  the full path to directory containing the NERDm
                               merger annotated schemas;  if not set, the 
                               directory is searched for in a few typical places.
@@ -155,6 +194,31 @@ class BagBuilder(PreservationSystem):
                               the bag from the Distribution Service.  
     :prop validator dict:     a set of properties for configuring the bag validation;
                               see nistoar.pdr.preserv.bagit.validate for details.
+    :prop checksum dict:      a set of properties for configuring how data files are 
+                              checksummed (e.g. the number of concurrent workers); 
+                              see nistoar.pdr.preserv.checksum.ChecksumEngine for details.
+                              In addition, if the sub-property 'cache' is True, 
+                              calculated checksums are cached (in the bag's 
+                              top-level "__checksums.json" file) so that they can 
+                              be reused by later stages without re-reading the files.
+                              (This file is removed by finalize_bag().)
+    :prop change_journal bool (False):  if True, the components created, updated, 
+                              or removed via this builder are recorded in a 
+                              journal so that finalize_bag() can, when requested, 
+                              only re-process the components that have changed 
+                              since the bag was last finalized.  The journal is 
+                              kept outside of the bag, in a hidden file alongside 
+                              it (".BAGNAME__changes.json"), and it is saved after
+                              each batch of updates (see end_batch()), when the 
+                              bag is finalized, and when the builder is exited.
+    :prop component_index bool (False):  if True, the index of component metadata 
+                              that the bag uses to assemble its full NERDm record 
+                              (see NISTBag.nerdm_record()) is saved in the bag's 
+                              top-level "__nerdm_index.json" file so that it can 
+                              be shared with other processes.  (This file is 
+                              removed by finalize_bag().)  Regardless of this 
+                              setting, the builder keeps the index up to date 
+                              as it writes metadata.
     """
 
     nistprofile = "0.4"
@@ -206,7 +270,18 @@ class BagBuilder(PreservationSystem):
             self._distbase += '/'
 
         jqlib = self.cfg.get('jq_lib', def_jq_libdir)
-        self.pod2nrd = PODds2Res(jqlib)
+        self.pod2nrd = make_pod_converter(self.cfg.get('nerdm_engine'), jqlib)
+        cscfg = self.cfg.get('checksum', {})
+        cache = None
+        if cscfg.get('cache', False):
+            cache = ChecksumCache(os.path.join(self._bagdir, CHECKSUM_CACHE_FILENAME))
+        self.cksumr = ChecksumEngine(cscfg, self.log, cache)
+        self._batch = None
+        self._batch_thread = None
+        self._journal = None
+        if self.cfg.get('change_journal', False):
+            self._journal = ChangeJournal(self._journal_file_for(self._name),
+                                          os.path.join(self._bagdir, "data"))
 
         self._create_defmd_fn = {
             "Resource": self._create_def_res_md,
@@ -242,6 +317,8 @@ class BagBuilder(PreservationSystem):
     def __enter__(self):
         return self
     def __exit__(self, exc_type, exc_value, tb):
+        self.save_journal()
+        self.cksumr.save_cache()
         self.disconnect_logfile()
         return False
 
@@ -380,6 +457,140 @@ class BagBuilder(PreservationSystem):
         """
         return self._bag
 
+    @property
+    def journal(self):
+        """
+        the ChangeJournal recording the changes made to the bag since it was last
+        finalized, or None if change journaling is not enabled.
+        """
+        return self._journal
+
+    def _journal_file_for(self, bagname):
+        # the journal is kept outside of the bag so that it is never preserved
+        return os.path.join(self._pdir, "." + bagname + CHANGE_JOURNAL_FILENAME)
+
+    def save_journal(self):
+        """
+        save any changes recorded in the change journal since it was last saved.
+        This has no effect if change journaling is not enabled.
+        """
+        if self._journal is not None and self._journal.dirty:
+            self._journal.save()
+
+    def _journal_change(self, destpath, change=UPDATED):
+        if self._journal is not None:
+            self._journal.record(destpath, change)
+
+    def _journal_data_change(self, destpath):
+        if self._journal is not None:
+            self._journal.note_data_change(destpath)
+
+    def begin_batch(self):
+        """
+        start accumulating updates to file component metadata in memory.  Until 
+        end_batch() is called, the updates made from the calling thread via 
+        update_metadata_for() to the metadata of file components (i.e. not to the
+        resource-level metadata or to non-file components) are merged in memory
+        rather than written to the bag.  Note that the updated metadata are not 
+        visible via the bag (e.g. via bag.nerd_metadata_for()) until the batch is
+        ended.  Calling this while a batch is already in progress has no effect.
+        """
+        if self._batch is None:
+            self._batch = OrderedDict()
+            self._batch_thread = threading.current_thread()
+
+    @property
+    def batching(self):
+        """
+        True if updates to file component metadata are currently being batched
+        (see begin_batch())
+        """
+        return self._batch is not None
+
+    def end_batch(self, message=None):
+        """
+        write out the file component metadata updates accumulated since 
+        begin_batch() was called and stop batching.  The metadata for each 
+        updated component is written once, and a single message summarizing the 
+        updates is recorded in the bag's log.  
+
+        :param str message:  message to record in the bag's log summarizing the
+                             updates.  A value of None (default) causes a default
+                             message to be recorded.  To suppress a message, 
+                             provide an empty string.
+        :return int:  the number of components whose metadata were written
+        """
+        batch = self._batch
+        self._batch = None
+        self._batch_thread = None
+        if not batch:
+            return 0
+
+        created = 0
+        colls = set()
+        for destpath, mdata in batch.items():
+            outfile = self.bag.nerd_file_for(destpath)
+            isnew = not os.path.exists(outfile)
+            try:
+                self.ensure_metadata_dirs(destpath)
+                self._write_json(mdata, outfile)
+                self._journal_change(destpath, (isnew and CREATED) or UPDATED)
+                self._index_component(destpath, outfile, mdata)
+                collpath = os.path.dirname(destpath)
+                if collpath not in colls:
+                    self.ensure_ansc_collmd(destpath)
+                    colls.add(collpath)
+            except Exception as ex:
+                self.log.exception("Trouble saving metadata for %s: %s",
+                                   destpath, str(ex))
+                raise
+            if isnew:
+                created += 1
+            self.log.debug("%s metadata for %s", (isnew and "Created") or "Updated",
+                           destpath)
+
+        if message is None:
+            message = "Updated metadata for %d file component%s (%d new)" % \
+                      (len(batch), (len(batch) != 1 and "s") or "", created)
+        if message:
+            self.record(message)
+        self.save_journal()
+        self.cksumr.save_cache()
+        return len(batch)
+
+    def _batch_for_caller(self):
+        # return the batch of pending updates if the calling thread is batching
+        batch = self._batch
+        if batch is not None and self._batch_thread is threading.current_thread():
+            return batch
+        return None
+
+    def _discard_batched(self, destpath):
+        # drop any pending batched updates for the component at destpath and (if it
+        # is a subcollection) its descendents; they are about to be superseded
+        batch = self._batch
+        if not batch:
+            return
+        pfx = destpath.rstrip('/') + '/'
+        for path in [p for p in batch.keys() if p == destpath or p.startswith(pfx)]:
+            batch.pop(path, None)
+
+    def _index_component(self, destpath, mdfile=None, mdata=None):
+        # update the bag's component index with metadata just written to mdfile
+        if not self._bag:
+            return
+        if mdfile and mdfile == self._bag.annotations_file_for(destpath):
+            self._bag.index.update(destpath, annot=mdata)
+        elif mdfile and mdfile == self._bag.nerd_file_for(destpath):
+            self._bag.index.update(destpath, nerdm=mdata)
+        else:
+            self._bag.index.update(destpath)
+
+    def _open_bag(self):
+        self._bag = NISTBag(self._bagdir, nerdm_engine=self.cfg.get('nerdm_engine'))
+        if self.cfg.get('component_index', False):
+            self._bag.index.persist = True
+
     @property
     def id(self):
         """
@@ -417,6 +628,8 @@ class BagBuilder(PreservationSystem):
                     elif 'ediid' in mdata:
                         del mdata['ediid']
                     self._write_json(mdata, mdfile)
+                    self._journal_change("")
+                    self._index_component("", mdfile, mdata)
         return old
 
     def _upd_downloadurl(self, ediid):
@@ -438,6 +651,8 @@ class BagBuilder(PreservationSystem):
                         else:
                             del mdata["downloadURL"]
                         self._write_json(mdata, mdfile)
+                        self._journal_change(mdata['filepath'])
+                        self._index_component(dir[len(mdtree)+1:], mdfile, mdata)
 
     def _download_url(self, ediid, destpath):
         path = "/".join(destpath.split(os.sep))
@@ -536,9 +751,18 @@ class BagBuilder(PreservationSystem):
 
         self._name = name
         self._bagdir = newdir
+        if self.cksumr.cache is not None and self.cksumr.cache.cachefile:
+            self.cksumr.cache.cachefile = os.path.join(newdir, CHECKSUM_CACHE_FILENAME)
+        if self._journal is not None:
+            if self._journal.journalfile:
+                newjfile = self._journal_file_for(name)
+                if os.path.exists(self._journal.journalfile):
+                    os.rename(self._journal.journalfile, newjfile)
+                self._journal.journalfile = newjfile
+            self._journal.datadir = os.path.join(newdir, "data")
 
         if self._bag:
-            self._bag = NISTBag(self._bagdir)
+            self._open_bag()
 
     def ensure_bagdir(self):
         """
@@ -561,7 +785,7 @@ class BagBuilder(PreservationSystem):
         self.connect_logfile()
         if didit:
             self.record("Created bag with name, %s", self.bagname)
-        self._bag = NISTBag(self.bagdir)
+        self._open_bag()
         if (not self._id or not self._ediid) and \
            os.path.exists(self._bag.nerd_file_for("")):
             # load the resource-level metadata that's already there
@@ -738,7 +962,13 @@ class BagBuilder(PreservationSystem):
             return out
 
     def _define_file_comp_md(self, destpath, comptype, msg=None):
-        if os.path.exists(self.bag.nerd_file_for(destpath)):
+        if self._batch and destpath in self._batch:
+            # already defined via a pending batched update
+            md = deepcopy(self._batch[destpath])
+            if not metadata_matches_type(md, comptype):
+                raise StateException("Existing component not a "+comptype+
+                                     ": "+str(md.get('@type',[])))
+        elif os.path.exists(self.bag.nerd_file_for(destpath)):
             md = self.bag.nerd_metadata_for(destpath, True)
             if not metadata_matches_type(md, comptype):
                 raise StateException("Existing component not a "+comptype+
@@ -804,6 +1034,7 @@ class BagBuilder(PreservationSystem):
     def _remove_file_component(self, destpath, trimcolls=False):
         # this removes subcollection components as well
         removed = False
+        self._discard_batched(destpath)
 
         # First look for metadata
         target = os.path.join(self.bag.metadata_dir, destpath)
@@ -817,6 +1048,8 @@ class BagBuilder(PreservationSystem):
 
         # remove the data file if it exists
         target = os.path.join(self.bag.data_dir, destpath)
+        if os.path.exists(target):
+            self._journal_data_change(destpath)
         if os.path.isfile(target):
             removed = True
             os.remove(target)
@@ -824,6 +1057,10 @@ class BagBuilder(PreservationSystem):
             removed = True
             rmtree(target)
 
+        if removed:
+            self._journal_change(destpath, REMOVED)
+            self.bag.index.remove(destpath)
+
         if destpath and trimcolls:
             destpath = os.path.dirname(destpath)
 
@@ -889,6 +1126,7 @@ class BagBuilder(PreservationSystem):
             return self._replace_file_metadata(destpath, mdata, message)
 
     def _replace_file_metadata(self, destpath, mdata, msg=None, outfile=None):
+        self._discard_batched(destpath)
         if not outfile:
             outfile = self.bag.nerd_file_for(destpath)
             
@@ -901,11 +1139,14 @@ class BagBuilder(PreservationSystem):
             else:
                 msg += "resource-level metadata"
 
+        created = not os.path.exists(self.bag.nerd_file_for(destpath))
         try:
             self.ensure_metadata_dirs(destpath)
             if msg:
                 self.record(msg)
             self._write_json(mdata, outfile)
+            self._journal_change(destpath, (created and CREATED) or UPDATED)
+            self._index_component(destpath, outfile, mdata)
             self.ensure_ansc_collmd(destpath)
         except Exception, ex:
             self.log.exception("Trouble saving metadata for %s: %s",
@@ -1032,6 +1273,10 @@ class BagBuilder(PreservationSystem):
         replaced with corresponding arrays from the input metadata; the 
         arrays are not combined in any way.
 
+        If a batch of updates is in progress (see begin_batch()), an update to a 
+        file component is held in memory until the batch is ended, and the 
+        given message is not recorded.
+
         :param str filepath:   the filepath to the component to update.  An
                                empty string ("") updates the resource-level
                                metadata.  If the filepath begins with a '@id:',
@@ -1089,9 +1334,21 @@ class BagBuilder(PreservationSystem):
         return comps[found]
 
     def _update_file_metadata(self, destpath, mdata, comptype, msg=None):
-        
-        if os.path.exists(self.bag.nerd_file_for(destpath)):
-            orig = self.bag.nerd_metadata_for(destpath)
+        batch = None
+        if destpath:
+            batch = self._batch_for_caller()
+
+        if batch is not None and destpath in batch:
+            # merge into the pending update; it stays in the batch (and is
+            # replaced by a copy of the merged result) should this update fail
+            orig = batch[destpath]
+            exists = True
+        else:
+            exists = os.path.exists(self.bag.nerd_file_for(destpath))
+            if exists:
+                orig = self.bag.nerd_metadata_for(destpath)
+
+        if exists:
             if comptype and '@type' in orig and \
                not metadata_matches_type(orig, comptype):
                 raise StateException("Existing component not a "+comptype+
@@ -1110,7 +1367,11 @@ class BagBuilder(PreservationSystem):
                     msg = "Creating new %s: %s" % (comptype, destpath)
 
         mdata = self._update_md(orig, mdata)
-        self._replace_file_metadata(destpath, mdata, msg)
+        if batch is not None:
+            # the message is superseded by the batch's summary message
+            batch[destpath] = deepcopy(mdata)
+        else:
+            self._replace_file_metadata(destpath, mdata, msg)
         return mdata
 
     def _update_md(self, orig, updates):
@@ -1318,6 +1579,7 @@ class BagBuilder(PreservationSystem):
         action = "Added"
         if os.path.exists(os.path.join(self.bag.data_dir, destpath)):
             action = "Replaced"
+        self._journal_data_change(destpath)
 
         # insert the file into the data directory...
         outfile = os.path.join(self.bag.data_dir, destpath)
@@ -1348,6 +1610,8 @@ class BagBuilder(PreservationSystem):
                 self.log.exception(msg, exc_info=True)
                 raise BagWriteError(msg, cause=ex, sys=self)
 
+        self._journal_change(destpath)
+
         # Now set its metadata
         if register:
             self.register_data_file(destpath, srcpath, True, comptype,
@@ -1394,7 +1658,7 @@ class BagBuilder(PreservationSystem):
         return self.replace_metadata_for(destpath, mdata, message)
 
     def describe_data_file(self, srcpath, destpath=None, examine=True,
-                           comptype=None, asupdate=True):
+                           comptype=None, asupdate=True, checksum=None):
         """
         examine the given file and return a metadata description of it.  
 
@@ -1421,6 +1685,10 @@ class BagBuilder(PreservationSystem):
                                returned will not take into account previous metadata
                                as if assuming the file is being examined for the first
                                time.  
+        :param str checksum:   the already calculated SHA-256 checksum of the file 
+                               (e.g. via checksums_of()); if provided and examine 
+                               is True, this value will be used rather than 
+                               recalculating it.  
         """
         if not destpath:
             destpath = os.path.basename(srcpath)
@@ -1438,7 +1706,9 @@ class BagBuilder(PreservationSystem):
         try:
             self._add_file_specs(srcpath, mdata)
             if examine:
-                self._add_checksum(checksum_of(srcpath), mdata)
+                if not checksum:
+                    checksum = self.cksumr.checksum_of(srcpath)
+                self._add_checksum(checksum, mdata)
                 self._add_extracted_metadata(srcpath, mdata)
         except OSError as ex:
             raise BagWriteError("Unable to examine data file for metadata: "+
@@ -1481,7 +1751,21 @@ class BagBuilder(PreservationSystem):
         out = OrderedDict()
         self._add_file_specs(datafile, out)
         if checksum:
-            self._add_checksum(checksum_of(datafile), out)
+            self._add_checksum(self.cksumr.checksum_of(datafile), out)
+        return out
+
+    def checksums_of(self, filepaths, force=False):
+        """
+        calculate the SHA-256 checksums of a batch of files.  Depending on the 
+        'checksum' configuration, the files may be checksummed concurrently.
+
+        :param list filepaths:  the paths to the files to checksum
+        :param bool force:      if True, re-read the files even if their checksums
+                                have been cached.
+        :return OrderedDict:  a mapping of each given path to its checksum
+        """
+        out = self.cksumr.checksums_of(filepaths, 'sha256', force)
+        self.cksumr.save_cache()
         return out
 
     def _add_file_specs(self, datafile, mdata):
@@ -1846,6 +2130,17 @@ class BagBuilder(PreservationSystem):
                     directories
           :prop 'confirm_checksums' bool (False):  if True, double check that 
                     recorded checksums are correct (by checksumming the data files)
+          :prop 'force_rehash' bool (False):  if True, checksums confirmed via 
+                    'confirm_checksums' will be recalculated by re-reading the 
+                    data files, even if they have been cached.
+          :prop 'incremental' bool (False):  if True and the bag has been 
+                    finalized before with change journaling enabled (see the 
+                    'change_journal' configuration property), only the components 
+                    that have changed since then will be re-examined and have 
+                    their annotations merged, and the manifest and Payload-Oxum 
+                    will be updated in place.  Otherwise, the entire bag is 
+                    processed.  Note that changes made to the bag without using
+                    this builder will not be noticed.
 
         :param dict finalcfg:      the 'finalize' configuration properties
         :param bool stop_logging:  turn off logging to the bag-internal log file; 
@@ -1859,6 +2154,23 @@ class BagBuilder(PreservationSystem):
         """
         if finalcfg is None:
             finalcfg = self.cfg.get('finalize', {})
+        if not self.bag:
+            self.ensure_bagdir()
+
+        # determine if we can limit the processing to the components that have
+        # changed since the last finalization
+        changed = None
+        removed = None
+        if finalcfg.get('incremental', False):
+            if self._journal is not None and self._journal.has_baseline and \
+               os.path.exists(os.path.join(self.bagdir, "manifest-sha256.txt")):
+                changed = self._journal.dirty_components()
+                removed = self._journal.removed_components()
+                self.log.info("Finalizing bag incrementally (%d changed, %d removed "
+                              "components)", len(changed), len(removed))
+            else:
+                self.log.info("No record of changes since last finalization; "
+                              "finalizing the entire bag")
 
         # Start by trimming the empty data folders
         trim = finalcfg.get('trim_folders', False)
@@ -1867,15 +2179,16 @@ class BagBuilder(PreservationSystem):
 
         # Make sure all remaining components have metadata
         if finalcfg.get('ensure_component_metadata', True):
-            self.ensure_comp_metadata(updstats=True, extract=False)
-        self.ensure_merged_annotations()
+            self.ensure_comp_metadata(updstats=True, extract=False, comps=changed)
+        self.ensure_merged_annotations(comps=changed)
 
         # Now trim empty metadata folders
         if trim:
             self.trim_metadata_folders()
 
         self.ensure_bagit_ver()
-        self.write_data_manifest(finalcfg.get('confirm_checksums', False))
+        self.write_data_manifest(finalcfg.get('confirm_checksums', False),
+                                 finalcfg.get('force_rehash', False), changed, removed)
         self.write_mbag_files()
         # write_ore_file
         # write_pidmapping_file
@@ -1884,7 +2197,26 @@ class BagBuilder(PreservationSystem):
 
         self.log.error("Implementation of Bag finalization is not complete!")
         self.log.info("Bag does not include PREMIS and ORE files")
-        self.ensure_baginfo()
+
+        # the checksum cache must not be preserved with the bag
+        if self.cksumr.cache is not None:
+            self.cksumr.cache.unpersist()
+        # ...nor the component index
+        self.bag.index.unpersist()
+        # ...nor a change journal written inside the bag by older versions
+        oldjournal = os.path.join(self.bagdir, CHANGE_JOURNAL_FILENAME)
+        if os.path.exists(oldjournal):
+            os.remove(oldjournal)
+
+        oxum = None
+        if changed is not None:
+            oxum = self._journal.payload_oxum()
+            self._remove_baginfo_items(['Bagging-Date', 'Payload-Oxum',
+                                        'Bag-Oxum', 'Bag-Size'])
+        oxum = self.ensure_baginfo(payload_oxum=oxum)
+
+        if self._journal is not None:
+            self._journal.reset(oxum)
 
         if stop_logging:
             self._unset_logfile()
@@ -1928,6 +2260,7 @@ class BagBuilder(PreservationSystem):
                             # rm metadata directory if it's empty or rmmeta=True
                             if len(mcont) == 0 or rmmeta:
                                 rmtree(mdir)
+                                self._journal_change(ddir[len(droot)+1:], REMOVED)
 
                         else:
                             self.log.error("NIST bag profile error: not a " +
@@ -1953,7 +2286,7 @@ class BagBuilder(PreservationSystem):
                     self.log.exception("Failed to remove empty metadata dir: " +
                                        mdir + ": " + str(ex))
 
-    def ensure_comp_metadata(self, updstats=False, extract=False):
+    def ensure_comp_metadata(self, updstats=False, extract=False, comps=None):
         """
         iterate through all the data files found under the data directory
         and ensure there is metadata describing them.  
@@ -1965,33 +2298,54 @@ class BagBuilder(PreservationSystem):
         :param bool extract:  if True, examine the file and extract metadata
                               from its contents.  If False, no metadata is 
                               extracted.  
+        :param list comps:    if provided, only the data files among the given
+                              component filepaths will be examined (rather than 
+                              all files under the data directory).
         """
         if not self.bag:
             self.ensure_bagdir()
-        for dfile in self.bag.iter_data_files():
+
+        if comps is None:
+            datafiles = self.bag.iter_data_files()
+        else:
+            datafiles = [c for c in comps
+                           if c and os.path.isfile(os.path.join(self.bag.data_dir, c))]
+
+        # first determine which files need (re-)checksumming so that they can
+        # be checksummed together as a batch
+        dfiles = OrderedDict()
+        for dfile in datafiles:
             mdfile = self.bag.nerd_file_for(dfile)
-            dfpath = os.path.join(self.bag.data_dir, dfile)
             if not os.path.exists(mdfile):
+                dfiles[dfile] = None
+            else:
+                md = self.bag.nerd_metadata_for(dfile)
+                dfiles[dfile] = bool(updstats) or 'size' not in md or \
+                                'mediaType' not in md or 'checksum' not in md
+        csums = self.checksums_of([os.path.join(self.bag.data_dir, f)
+                                   for f in dfiles if dfiles[f] is not False])
+
+        for dfile, updcstats in dfiles.items():
+            dfpath = os.path.join(self.bag.data_dir, dfile)
+            if updcstats is None:
                 # no metadata found; start from scratch
                 comptype = self._determine_file_comp_type(dfile)
-                self.register_data_file(dfile, dfpath, extract, comptype)
-                if not extract:
-                    # register does not do checksum when examine=False;
-                    # get it now
-                    md = OrderedDict()
-                    self._add_checksum(checksum_of(dfpath), md)
-                    self.update_metadata_for(dfile, md,
+                self.register_data_file(dfile, dfpath, False, comptype)
+
+                # register does not do checksum when examine=False;
+                # add the one we calculated above
+                md = OrderedDict()
+                self._add_checksum(csums[dfpath], md)
+                if extract:
+                    self._add_extracted_metadata(dfpath, md)
+                self.update_metadata_for(dfile, md,
                                          message="Updating checksum for "+dfile)
 
             else:
-                updcstats = updstats
-                md = self.bag.nerd_metadata_for(dfile)
-                if 'size' not in md or 'mediaType' not in md or \
-                   'checksum' not in md:
-                    updcstats = True
                 md = None
                 if updcstats:
-                    md = self.get_file_specs(dfpath, True)
+                    md = self.get_file_specs(dfpath, False)
+                    self._add_checksum(csums[dfpath], md)
 
                 if extract:
                     if not md:
@@ -2002,26 +2356,35 @@ class BagBuilder(PreservationSystem):
                     self.update_metadata_for(dfile, md)
                 self.ensure_ansc_collmd(dfile)
 
-    def ensure_merged_annotations(self):
+    def ensure_merged_annotations(self, comps=None):
         """
         ensure that the annotations have been merged into the primary 
         NERDm metadata.
+
+        :param list comps:  if provided, only the annotations for the given 
+                            component filepaths (where "" refers to the 
+                            resource-level metadata) will be merged.
         """
         # this implementation assumes that merging can be applied multiple
-        # times and give the same result.  (It would be better to determine
-        # if the annotation's already been applied and not repeat it, for
-        # performance reasons.)
+        # times and give the same result.  (When comps is given--i.e. via an
+        # incremental finalization--merges are not repeated for components 
+        # that have not changed.)
 
         mergeconv = self.cfg.get('merge_convention', DEF_MERGE_CONV)
-        self.record("Merging in annotations into all metdata")
+        if comps is None:
+            self.record("Merging in annotations into all metdata")
+            dfiles = self._bag.iter_data_components()
+        else:
+            dfiles = [c for c in comps if c and self._bag.comp_exists(c)]
 
         # update the resource-level metadata
-        if os.path.exists(self.bag.annotations_file_for("")):
+        if (comps is None or "" in comps) and \
+           os.path.exists(self.bag.annotations_file_for("")):
             nerd = self.bag.nerd_metadata_for("", mergeconv)
             self.replace_metadata_for("", nerd, message="")
 
         # update the file metadata
-        for dfile in self._bag.iter_data_components():
+        for dfile in dfiles:
             if os.path.exists(self.bag.annotations_file_for(dfile)):
                 nerd = self.bag.nerd_metadata_for(dfile, mergeconv)
                 self.replace_metadata_for(dfile, nerd, message="")
@@ -2048,7 +2411,8 @@ class BagBuilder(PreservationSystem):
         except OSError, ex:
             raise BagWriteError("Error writing bagit.txt: "+str(ex), cause=ex)
 
-    def write_data_manifest(self, confirm=False):
+    def write_data_manifest(self, confirm=False, rehash=False, comps=None,
+                            removed=None):
         """
         Write the manifest-<algorithm>.txt file based on the data files that 
         are currently in the data directory.  Each datafile must have a 
@@ -2059,13 +2423,39 @@ class BagBuilder(PreservationSystem):
                               correct and added to the manifest file.  If 
                               True, the checksum will be calculated to ensure
                               the value in the metadata file is correct.
+        :param rehash bool:   if True (and confirm is True), the data files will
+                              be re-read to calculate their checksums even if 
+                              they have been cached.  
+        :param comps list:    if provided (and the manifest file already exists),
+                              update the existing manifest with entries for only 
+                              the given component filepaths; entries for other 
+                              data files are retained as is.  
+        :param removed list:  when comps is provided, the filepaths of components
+                              that have been removed; their entries (including 
+                              those for any files below them) will be dropped from
+                              the manifest.
         """
         # the checksum should not be part of annotations (?).
         # self.ensure_merged_annotations()
         manfile = os.path.join(self.bagdir, "manifest-sha256.txt")
+        entries = OrderedDict()
+        if comps is not None and os.path.exists(manfile):
+            entries = self._read_manifest(manfile)
+            for path in [_utf8(p) for p in removed or []]:
+                pfx = path + '/'
+                for datapath in [d for d in entries if d == path or d.startswith(pfx)]:
+                    del entries[datapath]
+            for path in [_utf8(p) for p in comps]:
+                entries.pop(path, None)
+            update = [_utf8(c) for c in comps
+                        if c and os.path.isfile(os.path.join(self.bag.data_dir, c))]
+        else:
+            update = self.bag.iter_data_files()
+
         try:
           with open(manfile, 'w') as fd:
-            for datapath in self.bag.iter_data_files():
+            updated = OrderedDict()
+            for datapath in update:
                 md = self.bag.nerd_metadata_for(datapath, merge_annots=False)
                 checksum = md.get('checksum')
                 if not checksum or 'hash' not in checksum:
@@ -2075,11 +2465,17 @@ class BagBuilder(PreservationSystem):
                 if algo != 'sha256':
                     raise BagProfileError("Unexpected checksum algorithm found: "+
                                           str(algo))
-                checksum = checksum['hash']
-                if confirm:
-                    if checksum_of(self._bag._full_dpath(datapath)) != checksum:
+                updated[datapath] = checksum['hash']
+
+            if confirm:
+                csums = self.checksums_of([self._bag._full_dpath(p) for p in updated],
+                                          rehash)
+                for datapath, checksum in updated.items():
+                    if csums[self._bag._full_dpath(datapath)] != checksum:
                         raise BagProfileError("Checksum failure for "+datapath)
 
+            entries.update(updated)
+            for datapath, checksum in entries.items():
                 self._record_manifest_checksum(fd, checksum,
                                                os.path.join('data', datapath))
 
@@ -2088,17 +2484,38 @@ class BagBuilder(PreservationSystem):
                 os.remove(manfile)
             raise
 
+    def _read_manifest(self, manfile):
+        # return the entries of a payload manifest as a mapping of data 
+        # directory-relative filepaths to checksums
+        out = OrderedDict()
+        with open(manfile) as fd:
+            for line in fd:
+                parts = line.rstrip('\n').split(' ', 1)
+                if len(parts) < 2:
+                    continue
+                datapath = parts[1].strip()
+                if datapath.startswith('data/'):
+                    datapath = datapath[len('data/'):]
+                out[datapath] = parts[0]
+        return out
+
     def _record_manifest_checksum(self, fd, checksum, filepath):
         fd.write(checksum)
         fd.write(' ')
         fd.write(filepath)
         fd.write('\n')        
                        
-    def ensure_baginfo(self, overwrite=False, merge_annots=False):
+    def ensure_baginfo(self, overwrite=False, merge_annots=False, payload_oxum=None):
         """
         ensure that a complete bag-info.txt file is written out to the bag.
         Any data that has already been written out will remain, and any missing
         default information will be added.
+
+        :param list payload_oxum:  the size of the payload (as a pair of numbers 
+                            giving the total number of bytes and files) to record
+                            as the Payload-Oxum; if None, the payload will be 
+                            measured.  
+        :return list:  the size of the payload that was recorded
         """
         if not self._bag:
             self.ensure_bagdir()
@@ -2131,7 +2548,9 @@ format(nerdm['title'].replace('\n', ' '))
             initdata['External-Identifier'].append(nerdm['doi'])
 
         # Calculate the payload Oxum
-        oxum = self._measure_oxum(self._bag._datadir)
+        if payload_oxum is None:
+            payload_oxum = self._measure_oxum(self._bag._datadir)
+        oxum = list(payload_oxum)
         initdata['Payload-Oxum'] = "{0}.{1}".format(oxum[0], oxum[1])
 
         # update the multibag version, deprecation
@@ -2140,8 +2559,19 @@ format(nerdm['title'].replace('\n', ' '))
         # write everything except Bag-Size
         self.write_baginfo_data(initdata, overwrite=overwrite)
 
-        # calculate and write the size of the bag 
-        oxum = self._measure_oxum(self.bagdir)
+        # calculate and write the size of the bag; the payload has been 
+        # measured already, so only the tag files need to be.
+        for name in os.listdir(self.bagdir):
+            path = os.path.join(self.bagdir, name)
+            if path == self._bag._datadir:
+                continue
+            if os.path.isdir(path):
+                tagoxum = self._measure_oxum(path)
+                oxum[0] += tagoxum[0]
+                oxum[1] += tagoxum[1]
+            else:
+                oxum[0] += os.stat(path).st_size
+                oxum[1] += 1
         size = self._format_bytes(oxum[0])
         oxum[0] += len("Bag-Size: {0} ".format(size))
         oxum[0] += len("Bag-Oxum: {0}.{1} ".format(oxum[0], oxum[1]))
@@ -2152,6 +2582,17 @@ format(nerdm['title'].replace('\n', ' '))
         ])
         self.write_baginfo_data(szdata, overwrite=False)
 
+        return list(payload_oxum)
+
+    def _remove_baginfo_items(self, names):
+        # remove all values for the given names from the bag-info.txt file
+        info = self._bag.get_baginfo()
+        if any(n in info for n in names):
+            for name in names:
+                if name in info:
+                    del info[name]
+            self._write_baginfo_data(info, overwrite=True)
+
     def update_head_version(self, baginfo, version):
         """
         update the given bag info metadata with values for 
@@ -2193,22 +2634,7 @@ format(nerdm['title'].replace('\n', ' '))
         return measure_dir_size(rootdir)
 
     def _format_bytes(self, nbytes):
-        prefs = ["", "k", "M", "G", "T"]
-        ordr = 0
-        while nbytes >= 1000.0 and ordr < 4:
-            nbytes /= 1000.0
-            ordr += 1
-        pref = prefs[ordr]
-        ordr = 0
-        while nbytes >= 10.0:
-            nbytes /= 10.0
-            ordr += 1
-        nbytes = str(round(nbytes, 3) * 10**ordr)
-        if '.' in nbytes:
-            nbytes = re.sub(r"0+$", "", nbytes)
-        if nbytes.endswith('.'):
-            nbytes = nbytes[:-1]    
-        return "{0} {1}B".format(nbytes, pref)
+        return format_bytes(nbytes)
 
     def write_baginfo_data(self, data, altfile=None, overwrite=False):
         """
@@ -2568,7 +2994,15 @@ format(nerdm['title'].replace('\n', ' '))
         if not destfile:
             destfile = self.bag.nerd_file_for("")
         self._write_json(resmd, destfile)
+        self._journal_change("")
+        self._index_component("", destfile, resmd)
+
 
+def _utf8(path):
+    # manifest filepaths are handled as encoded strings
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    return path
 
 def metadata_matches_type(mdata, nodetype):
     """
@@ -0,0 +1,259 @@
+"""
+An index of the NERDm metadata for the components of a bag.
+
+Assembling a complete NERDm record for a bag (see NISTBag.nerdm_record()) requires
+reading the metadata for every component, each stored in its own file.  A
+:class:`ComponentIndex` holds the contents of these files so that they need not be
+re-read and re-parsed on every request.  Each index entry records the modification
+time, size, and status-change time of the files it was loaded from; when the index
+is refreshed, only the component files that have changed since are re-read.  An
+index may be updated from several threads (e.g. those examining data files).
+
+Indexes are cached in memory (for a limited number of bags) so that they can be
+shared by the NISTBag instances in a process.  An index can also be persisted in a
+single sidecar file within the bag (see INDEX_FILENAME) so that it can be shared
+across processes.
+"""
+import os, json, threading
+from collections import OrderedDict
+
+from ...utils import read_json, write_json, read_nerd
+
+INDEX_FILENAME = "__nerdm_index.json"
+NERDMD_FILENAME = "nerdm.json"
+ANNOTS_FILENAME = "annot.json"
+
+# the maximum number of bag indexes to hold in memory
+DEF_CACHE_SIZE = 8
+
+_cache = OrderedDict()
+_cache_lock = threading.RLock()
+_cache_size = DEF_CACHE_SIZE
+
+def set_cache_size(size):
+    """
+    set the maximum number of bag indexes that will be cached in memory.  A value
+    of zero or less turns off in-memory caching.
+    """
+    global _cache_size
+    with _cache_lock:
+        _cache_size = size
+        while len(_cache) > max(_cache_size, 0):
+            _cache.popitem(last=False)
+
+def clear_cache():
+    """
+    remove all indexes cached in memory
+    """
+    with _cache_lock:
+        _cache.clear()
+
+def _stamp(filepath):
+    # return a signature of the file's current state, or None if it does not exist.
+    # The ctime catches a rewrite within the resolution of the mtime (as files are
+    # written by replacing them) or one that restores the mtime.
+    try:
+        st = os.stat(filepath)
+        return [st.st_mtime, st.st_size, st.st_ctime]
+    except OSError:
+        return None
+
+def _copy(jsdata):
+    # copy the data as it would be read back from a JSON file
+    return json.loads(json.dumps(jsdata), object_pairs_hook=OrderedDict)
+
+class ComponentIndex(object):
+    """
+    an index of the NERDm metadata (and annotations) of the components of a bag.
+
+    The index maps each component filepath (where "" refers to the resource-level
+    metadata) to an entry containing the component's NERDm metadata (as "nerdm"),
+    its annotations (as "annot", None if there are none), and the signatures of
+    the files they were read from.  The entry objects returned by this index
+    are shared and should not be modified; callers should make copies as
+    necessary.
+    """
+
+    def __init__(self, bagdir, persist=None):
+        """
+        :param str bagdir:   the path to the bag's root directory
+        :param bool persist: if True, save the index to a file within the bag
+                             (INDEX_FILENAME) whenever it is updated.  If None, the
+                             index will be persisted only if that file already
+                             exists.
+        """
+        self.bagdir = bagdir
+        self.indexfile = os.path.join(bagdir, INDEX_FILENAME)
+        self._metadir = os.path.join(bagdir, "metadata")
+        if persist is None:
+            persist = os.path.exists(self.indexfile)
+        self.persist = persist
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def _load(self):
+        # initialize the entries from the in-memory cache or the index file
+        stamp = _stamp(self.indexfile)
+        with _cache_lock:
+            cached = _cache.get(self.bagdir)
+            if cached is not None:
+                _cache[self.bagdir] = _cache.pop(self.bagdir)   # mark as recently used
+        if cached is not None and (not stamp or cached[0] == stamp):
+            return OrderedDict(cached[1])
+
+        if stamp:
+            try:
+                return OrderedDict(read_json(self.indexfile).get('components', {}))
+            except (ValueError, IOError):
+                # corrupted; we'll rebuild it
+                pass
+        return OrderedDict()
+
+    def _entries_(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return self._entries
+
+    def _read_entry(self, comppath, mdstamp=None, anstamp=None):
+        mddir = os.path.join(self._metadir, comppath)
+        nerdfile = os.path.join(mddir, NERDMD_FILENAME)
+        annotfile = os.path.join(mddir, ANNOTS_FILENAME)
+        if mdstamp is None:
+            mdstamp = _stamp(nerdfile)
+        if mdstamp is None:
+            return None
+        if anstamp is None:
+            anstamp = _stamp(annotfile)
+        out = OrderedDict([("nerdm_stamp", mdstamp), ("annot_stamp", anstamp),
+                           ("nerdm", read_nerd(nerdfile)), ("annot", None)])
+        if anstamp:
+            out['annot'] = read_nerd(annotfile)
+        return out
+
+    def refresh(self):
+        """
+        bring the index up to date with the metadata files currently in the bag,
+        re-reading only those files that have changed since they were indexed.
+        The index is saved if anything has changed.
+
+        :return OrderedDict:  the up-to-date index entries, mapping component
+                              filepaths to entries in the order that they are found
+                              in the bag's metadata directory.
+        """
+        with self._lock:
+            old = self._entries_()
+            entries = OrderedDict()
+            for root, subdirs, files in os.walk(self._metadir):
+                if NERDMD_FILENAME not in files:
+                    continue
+                comppath = root[len(self._metadir)+1:]
+                mdstamp = _stamp(os.path.join(root, NERDMD_FILENAME))
+                anstamp = (ANNOTS_FILENAME in files and
+                           _stamp(os.path.join(root, ANNOTS_FILENAME))) or None
+
+                ent = old.get(comppath)
+                if ent is None or ent['nerdm_stamp'] != mdstamp or \
+                   ent['annot_stamp'] != anstamp:
+                    ent = self._read_entry(comppath, mdstamp, anstamp)
+                    if ent is None:
+                        continue
+                    self._dirty = True
+                entries[comppath] = ent
+
+            if len(entries) != len(old):
+                self._dirty = True
+            self._entries = entries
+            self.save()
+
+            # a copy, as the index may be updated while the caller uses it
+            return OrderedDict(entries)
+
+    def update(self, comppath, nerdm=None, annot=None):
+        """
+        (re-)index the metadata for the given component; this should be called
+        after the component's metadata files have been written.  The change is
+        not saved until save() or refresh() is called.
+
+        :param str comppath:  the filepath of the component that was updated
+        :param dict nerdm:    the NERDm metadata just written to the component's
+                              metadata file; if None, it will be read from the 
+                              file (unless it has not changed since last indexed).
+        :param dict annot:    the annotations just written to the component's 
+                              annotation file; if None, they will be read from 
+                              the file as necessary.
+        """
+        with self._lock:
+            entries = self._entries_()
+            mddir = os.path.join(self._metadir, comppath)
+            mdstamp = _stamp(os.path.join(mddir, NERDMD_FILENAME))
+            if mdstamp is None:
+                if entries.pop(comppath, None) is not None:
+                    self._dirty = True
+                return
+            anstamp = _stamp(os.path.join(mddir, ANNOTS_FILENAME))
+
+            old = entries.get(comppath)
+            if nerdm is not None:
+                nerdm = _copy(nerdm)
+            elif old is not None and old['nerdm_stamp'] == mdstamp:
+                nerdm = old['nerdm']
+            else:
+                nerdm = read_nerd(os.path.join(mddir, NERDMD_FILENAME))
+            if not anstamp:
+                annot = None
+            elif annot is not None:
+                annot = _copy(annot)
+            elif old is not None and old['annot_stamp'] == anstamp:
+                annot = old['annot']
+            else:
+                annot = read_nerd(os.path.join(mddir, ANNOTS_FILENAME))
+
+            entries[comppath] = OrderedDict([("nerdm_stamp", mdstamp),
+                                             ("annot_stamp", anstamp),
+                                             ("nerdm", nerdm), ("annot", annot)])
+            self._dirty = True
+
+    def remove(self, comppath):
+        """
+        remove the given component and any components below it from the index.
+        The change is not saved until save() or refresh() is called.
+        """
+        with self._lock:
+            entries = self._entries_()
+            pfx = comppath + '/'
+            for path in [p for p in entries if p == comppath or p.startswith(pfx)]:
+                del entries[path]
+                self._dirty = True
+
+    def save(self):
+        """
+        save any updates to the index to the in-memory cache and, if the index
+        is persisted, to its file.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.persist and os.path.isdir(self.bagdir):
+                write_json(OrderedDict([("components", self._entries)]), self.indexfile, None)
+            self._dirty = False
+
+            with _cache_lock:
+                if _cache_size > 0:
+                    _cache.pop(self.bagdir, None)
+                    _cache[self.bagdir] = (_stamp(self.indexfile), OrderedDict(self._entries))
+                    while len(_cache) > _cache_size:
+                        _cache.popitem(last=False)
+
+    def unpersist(self):
+        """
+        remove the index's file from the bag; the index will subsequently only be
+        cached in memory.
+        """
+        with self._lock:
+            self.persist = False
+            if os.path.exists(self.indexfile):
+                os.remove(self.indexfile)
+            with _cache_lock:
+                _cache.pop(self.bagdir, None)
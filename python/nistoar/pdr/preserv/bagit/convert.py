@@ -0,0 +1,415 @@
+"""
+Engines for converting POD records to NERDm and for computing NERDm inventories
+and data hierarchies.
+
+The conversions have traditionally been carried out by the jq-based classes from
+:py:mod:`nistoar.nerdm.convert` which pipe the metadata through an external
+``jq`` process on every call.  This module provides pure-Python implementations of
+the same computations--:py:class:`PODds2Res`, :py:class:`ComponentCounter`, and
+:py:class:`HierarchyBuilder`--which avoid the process start-up and JSON
+serialization costs.  The factory functions, :py:func:`make_pod_converter`,
+:py:func:`make_component_counter`, and :py:func:`make_hierarchy_builder`, return
+an instance for a requested engine, either ``"jq"`` or ``"native"``.  Instances are
+reusable; the factories return the same instance for the same engine and jq
+library.
+
+The default engine is ``"jq"``; it can be changed either by setting the
+``OAR_NERDM_ENGINE`` environment variable or by calling
+:py:func:`set_default_engine`.
+"""
+import os, re, json, threading, urllib
+from collections import OrderedDict
+from copy import deepcopy
+
+from .. import ConfigurationException
+from ....nerdm.constants import core_schema_base, schema_versions
+
+JQ_ENGINE = "jq"
+NATIVE_ENGINE = "native"
+ENGINES = (JQ_ENGINE, NATIVE_ENGINE)
+
+NERDM_SCH_VER = schema_versions[0]
+NERDM_SCH_ID = core_schema_base + NERDM_SCH_VER + "#"
+NERDMPUB_SCH_ID = core_schema_base + "pub/" + NERDM_SCH_VER + "#"
+NERDMBIB_SCH_ID = core_schema_base + "bib/" + NERDM_SCH_VER + "#"
+NERDM_CONTEXT = "https://data.nist.gov/od/dm/nerdm-pub-context.jsonld"
+THEME_SCHEME = "https://data.nist.gov/od/dm/nist-themes/v1.1"
+
+CHECKSUM_EXTS = OrderedDict([ ("sha256", "SHA-256"), ("sha512", "SHA-512"),
+                              ("md5", "MD5") ])
+
+SUBCOLL_TYPE = "nrdp:Subcollection"
+
+_def_engine = os.environ.get('OAR_NERDM_ENGINE', JQ_ENGINE)
+_instances = {}
+_instances_lock = threading.Lock()
+
+def set_default_engine(engine):
+    """
+    set the engine that will be used when one is not explicitly requested.
+
+    :param str engine:  the name of the engine, one of "jq" or "native"
+    :raise ConfigurationException:  if the engine name is not recognized
+    """
+    global _def_engine
+    _def_engine = _check_engine(engine)
+
+def default_engine():
+    """
+    return the name of the engine used when one is not explicitly requested.
+    """
+    return _def_engine
+
+def _check_engine(engine):
+    if engine is None:
+        engine = _def_engine
+    if engine not in ENGINES:
+        raise ConfigurationException("Unrecognized NERDm conversion engine: " +
+                                     str(engine) + " (expected one of " +
+                                     str(ENGINES) + ")")
+    return engine
+
+def _get_instance(kind, engine, jqlib):
+    engine = _check_engine(engine)
+    key = (kind, engine, (engine == JQ_ENGINE and jqlib) or None)
+    with _instances_lock:
+        if key not in _instances:
+            if engine == NATIVE_ENGINE:
+                _instances[key] = globals()[kind]()
+            else:
+                from ....nerdm import convert as jqconvert
+                _instances[key] = getattr(jqconvert, kind)(jqlib)
+        return _instances[key]
+
+def make_pod_converter(engine=None, jqlib=None):
+    """
+    return a POD-to-NERDm converter, an object with the methods, convert(podjson, id),
+    and convert_data(pod, id).
+
+    :param str engine:  the engine to use, "jq" or "native"; if None, the default
+                        will be used.
+    :param str jqlib:   the directory containing the jq conversion library (used
+                        only by the jq engine).
+    """
+    return _get_instance("PODds2Res", engine, jqlib)
+
+def make_component_counter(engine=None, jqlib=None):
+    """
+    return an inventory calculator, an object with the method, inventory(components).
+
+    :param str engine:  the engine to use, "jq" or "native"; if None, the default
+                        will be used.
+    :param str jqlib:   the directory containing the jq conversion library (used
+                        only by the jq engine).
+    """
+    return _get_instance("ComponentCounter", engine, jqlib)
+
+def make_hierarchy_builder(engine=None, jqlib=None):
+    """
+    return a data hierarchy builder, an object with the method,
+    build_hierarchy(components).
+
+    :param str engine:  the engine to use, "jq" or "native"; if None, the default
+                        will be used.
+    :param str jqlib:   the directory containing the jq conversion library (used
+                        only by the jq engine).
+    """
+    return _get_instance("HierarchyBuilder", engine, jqlib)
+
+
+_distsvcurl = re.compile(r"^https?://[\w\.:]+/od/ds/(ark:/\w+/)?[\w\-\.]+/")
+_otherurl = re.compile(r"^https?://[^/]+/[^/]+/[^/]+/")
+_doiurl = re.compile(r"^(https?://(dx\.)?doi\.org/|doi:)")
+_themesep = re.compile(r"\s*:\s*")
+
+def _filepath_for(url):
+    # extract a component filepath from a download URL
+    if _distsvcurl.match(url):
+        path = _distsvcurl.sub('', url)
+    else:
+        path = _otherurl.sub('', url)
+    path = urllib.unquote(path.encode('utf-8') if isinstance(path, unicode) else path)
+    try:
+        return path.decode('utf-8')
+    except UnicodeDecodeError:
+        return path
+
+def _doi_for(url):
+    # convert a DOI resolver URL into the "doi:" form
+    return "doi:" + _doiurl.sub('', url)
+
+class PODds2Res(object):
+    """
+    a pure-Python converter of POD Dataset records into NERDm Resource records
+    following the same rules as :py:class:`nistoar.nerdm.convert.PODds2Res`.
+    """
+
+    def __init__(self, themes=None):
+        """
+        :param themes:  the recognized theme terms; the POD themes that are not in
+                        this list will not be included in the NERDm topics.  If None,
+                        all themes are converted.
+        """
+        self.themes = themes
+        if themes is not None:
+            self.themes = set([self._norm_theme(t) for t in themes])
+
+    def convert(self, podjson, id):
+        """
+        convert the JSON-encoded POD Dataset record into a NERDm Resource record
+
+        :param str podjson:  the POD record as a JSON-encoded string
+        :param str id:       the identifier to assign to the resource
+        :rtype: OrderedDict
+        """
+        return self.convert_data(json.loads(podjson, object_pairs_hook=OrderedDict), id)
+
+    def convert_file(self, podfile, id):
+        """
+        convert the POD Dataset record in the given file into a NERDm Resource record
+        """
+        with open(podfile) as fd:
+            return self.convert(fd.read(), id)
+
+    def convert_data(self, pod, id):
+        """
+        convert the POD Dataset record into a NERDm Resource record
+
+        :param dict pod:  the POD record
+        :param str  id:   the identifier to assign to the resource
+        :rtype: OrderedDict
+        """
+        out = OrderedDict()
+        if id:
+            out['@context'] = [ NERDM_CONTEXT, OrderedDict([("@base", id)]) ]
+        else:
+            out['@context'] = NERDM_CONTEXT
+        out['_schema'] = NERDM_SCH_ID
+        out['_extensionSchemas'] = [ NERDMPUB_SCH_ID + "/definitions/PublicDataResource" ]
+        out['@type'] = [ "nrdp:PublicDataResource" ]
+        out['@id'] = id
+
+        dists = pod.get('distribution') or []
+        doi = pod.get('doi')
+        if not doi:
+            doi = [d['accessURL'] for d in dists
+                   if d.get('accessURL') and _doiurl.match(d['accessURL'])]
+            doi = (doi and doi[0]) or None
+        if doi:
+            out['doi'] = _doi_for(doi)
+
+        for prop in "title contactPoint issued modified".split():
+            if pod.get(prop) is not None:
+                out[prop] = deepcopy(pod[prop])
+        if pod.get('identifier') is not None:
+            out['ediid'] = pod['identifier']
+        if pod.get('landingPage') is not None:
+            out['landingPage'] = pod['landingPage']
+        if pod.get('description') is not None:
+            out['description'] = [ pod['description'] ]
+        if pod.get('keyword') is not None:
+            out['keyword'] = list(pod['keyword'])
+        if pod.get('theme') is not None:
+            out['theme'] = list(pod['theme'])
+            out['topic'] = self._themes2topics(pod['theme'])
+        if pod.get('references') is not None:
+            out['references'] = [self._ref2nerdm(r) for r in pod['references']]
+        for prop in "accessLevel license rights".split():
+            if pod.get(prop) is not None:
+                out[prop] = pod[prop]
+        if 'distribution' in pod:
+            out['components'] = self.dists2comps(dists)
+        for prop in "publisher language bureauCode programCode dataQuality " \
+                    "describedBy describedByType conformsTo systemOfRecords "   \
+                    "primaryITInvestmentUII".split():
+            if pod.get(prop) is not None:
+                out[prop] = deepcopy(pod[prop])
+
+        return out
+
+    @staticmethod
+    def _norm_theme(theme):
+        return _themesep.sub(": ", theme.strip())
+
+    def _themes2topics(self, themes):
+        out = []
+        for theme in themes:
+            theme = self._norm_theme(theme)
+            if self.themes is not None and theme not in self.themes:
+                continue
+            out.append(OrderedDict([("@type", "Concept"), ("scheme", THEME_SCHEME),
+                                    ("tag", theme)]))
+        return out
+
+    def _ref2nerdm(self, url):
+        return OrderedDict([
+            ("@type", ["deo:BibliographicReference"]),
+            ("@id", "#ref:" + _doiurl.sub('', url)),
+            ("refType", "IsReferencedBy"),
+            ("location", url),
+            ("_extensionSchemas", [ NERDMBIB_SCH_ID + "/definitions/DCiteReference" ])
+        ])
+
+    def dists2comps(self, dists):
+        """
+        convert a list of POD distributions into NERDm components.  Subcollection
+        components are inserted for the folders implied by the file paths, each
+        placed just before the first component it contains.
+        """
+        out = []
+        colls = set()
+        for dist in dists:
+            comp = self.dist2comp(dist)
+            if 'filepath' in comp:
+                parts = comp['filepath'].split('/')
+                for i in range(1, len(parts)):
+                    coll = '/'.join(parts[:i])
+                    if coll not in colls:
+                        colls.add(coll)
+                        out.append(self._subcoll(coll))
+                if SUBCOLL_TYPE in comp['@type']:
+                    colls.add(comp['filepath'])
+            out.append(comp)
+        return out
+
+    def _subcoll(self, filepath):
+        return OrderedDict([
+            ("@id", "cmps/" + filepath),
+            ("@type", [ SUBCOLL_TYPE ]),
+            ("filepath", filepath),
+            ("_extensionSchemas", [ NERDMPUB_SCH_ID + "/definitions/Subcollection" ])
+        ])
+
+    def dist2comp(self, dist):
+        """
+        convert a single POD distribution into a NERDm component
+        """
+        comp = deepcopy(OrderedDict(dist))
+        if comp.get('downloadURL'):
+            filepath = _filepath_for(comp['downloadURL'])
+            ext = filepath.rsplit('.', 1)
+            ext = (len(ext) > 1 and ext[1]) or None
+            comp['@id'] = "cmps/" + filepath
+            comp['filepath'] = filepath
+            if ext in CHECKSUM_EXTS:
+                target = filepath[:-(len(ext)+1)]
+                comp['@type'] = [ "nrdp:ChecksumFile", "nrdp:DownloadableFile",
+                                  "dcat:Distribution" ]
+                comp['algorithm'] = OrderedDict([("@type", "Thing"), ("tag", ext)])
+                comp['describes'] = "cmps/" + target
+                if not comp.get('description'):
+                    comp['description'] = "{0} checksum value for {1}" \
+                                          .format(CHECKSUM_EXTS[ext], target.split('/')[-1])
+                comp['_extensionSchemas'] = [ NERDMPUB_SCH_ID+"/definitions/ChecksumFile" ]
+            else:
+                comp['@type'] = [ "nrdp:DataFile", "nrdp:DownloadableFile",
+                                  "dcat:Distribution" ]
+                comp['_extensionSchemas'] = [ NERDMPUB_SCH_ID + "/definitions/DataFile" ]
+
+        elif comp.get('accessURL'):
+            if _doiurl.match(comp['accessURL']):
+                comp['@type'] = [ "nrd:Hidden", "dcat:Distribution" ]
+                comp['@id'] = "#" + _doi_for(comp['accessURL'])
+            else:
+                comp['@type'] = [ "nrdp:AccessPage", "dcat:Distribution" ]
+                comp['@id'] = "#" + re.sub(r'^\w+://', '', comp['accessURL'])
+                comp['_extensionSchemas'] = [ NERDMPUB_SCH_ID + "/definitions/AccessPage" ]
+
+        else:
+            comp.setdefault('@type', [ "dcat:Distribution" ])
+
+        return comp
+
+
+def _is_subcoll(comp):
+    return any([t.endswith(":Subcollection") for t in comp.get('@type', [])])
+
+def _parent_of(filepath, colls):
+    # return the filepath of the nearest collection containing the given path
+    while '/' in filepath:
+        filepath = filepath.rsplit('/', 1)[0]
+        if filepath in colls:
+            return filepath
+    return ""
+
+class ComponentCounter(object):
+    """
+    a pure-Python calculator of NERDm inventories, a replacement for 
+    :py:class:`nistoar.nerdm.convert.ComponentCounter`.
+    """
+
+    def inventory(self, components):
+        """
+        return the inventory of the given components:  a list with an entry for
+        each collection (starting with the top-level, "") giving the number of
+        components it contains, directly ("childCount") and at any depth
+        ("descCount"), both in total and by component type.
+        """
+        colls = set([c['filepath'] for c in components
+                     if 'filepath' in c and _is_subcoll(c)])
+        counts = OrderedDict([("", OrderedDict())])
+        for coll in sorted(colls):
+            counts[coll] = OrderedDict()
+        totals = OrderedDict([(c, [0, 0]) for c in counts])
+        children = OrderedDict([(c, []) for c in counts])
+
+        for comp in components:
+            parent = ""
+            if 'filepath' in comp:
+                parent = _parent_of(comp['filepath'], colls)
+                if _is_subcoll(comp):
+                    children[parent].append(comp['filepath'])
+            types = comp.get('@type', [])
+
+            # credit the component to its parent and all ancestors
+            coll = parent
+            direct = True
+            while True:
+                totals[coll][1] += 1
+                if direct:
+                    totals[coll][0] += 1
+                for t in types:
+                    cnt = counts[coll].setdefault(t, [0, 0])
+                    cnt[1] += 1
+                    if direct:
+                        cnt[0] += 1
+                if coll == "":
+                    break
+                coll = _parent_of(coll, colls)
+                direct = False
+
+        out = []
+        for coll in counts:
+            out.append(OrderedDict([
+                ("forCollection", coll),
+                ("childCount", totals[coll][0]),
+                ("descCount", totals[coll][1]),
+                ("byType", [ OrderedDict([("forType", t), ("childCount", n[0]),
+                                          ("descCount", n[1])])
+                             for t, n in sorted(counts[coll].items()) ]),
+                ("childCollections", children[coll])
+            ]))
+        return out
+
+class HierarchyBuilder(object):
+    """
+    a pure-Python builder of NERDm data hierarchies (the deprecated "dataHierarchy"
+    property), a replacement for :py:class:`nistoar.nerdm.convert.HierarchyBuilder`.
+    """
+
+    def build_hierarchy(self, components):
+        """
+        return the hierarchy of the data components (those with filepaths) as a
+        list of nodes, each with a "filepath" and, for subcollections, "children".
+        """
+        colls = set([c['filepath'] for c in components
+                     if 'filepath' in c and _is_subcoll(c)])
+        nodes = OrderedDict([("", [])])
+        for comp in components:
+            if 'filepath' not in comp:
+                continue
+            node = OrderedDict([("filepath", comp['filepath'])])
+            if comp['filepath'] in colls:
+                node['children'] = nodes.setdefault(comp['filepath'], [])
+            nodes.setdefault(_parent_of(comp['filepath'], colls), []).append(node)
+        return nodes[""]
@@ -0,0 +1,230 @@
+"""
+A journal of the changes made to a bag's components.
+
+A :class:`ChangeJournal` is used by the :class:`~nistoar.pdr.preserv.bagit.builder.BagBuilder`
+to record which components have been created, updated, or removed since the bag
+was last finalized.  This allows a subsequent finalization to only re-process the
+components that have changed (see BagBuilder.finalize_bag()).
+"""
+import os
+from collections import OrderedDict
+
+from ...utils import read_json, write_json, measure_dir_size
+
+CREATED = "created"
+UPDATED = "updated"
+REMOVED = "removed"
+
+class ChangeJournal(object):
+    """
+    a record of the components of a bag that have changed since the last time it
+    was finalized.
+
+    Components are identified by their filepaths relative to the bag's data
+    directory, where the empty string ("") represents the resource-level
+    metadata (including non-file components).  In addition to the type of change,
+    the journal can keep track of the size of the data under a filepath as it was
+    when the bag was last finalized (see note_data_change()); this allows the
+    bag's Payload-Oxum to be updated without re-measuring the entire payload.
+
+    The journal only has a *baseline*--and, thus, can support an incremental
+    finalization--after reset() has been called at the end of a finalization.
+
+    To avoid rewriting its file with every change, a persisted journal is only 
+    written when the first change since the last save is recorded (at which point 
+    the file is marked as incomplete) and when save() is called.  If a journal is 
+    loaded from a file marked as incomplete (because the process that recorded 
+    changes to it did not save it), it is given no baseline.
+    """
+
+    def __init__(self, journalfile=None, datadir=None):
+        """
+        :param str journalfile:  the path to the file where the journal should be
+                                 persisted.  If the file exists, the journal will
+                                 be initialized with its contents.  If None, the
+                                 journal is kept only in memory.
+        :param str datadir:      the path to the bag's data directory; this is
+                                 needed to track payload sizes.
+        """
+        self.journalfile = journalfile
+        self.datadir = datadir
+        self._baseline = None
+        self._changes = OrderedDict()
+        self._dirty = False
+        if self.journalfile and os.path.exists(self.journalfile):
+            data = read_json(self.journalfile)
+            self._changes = OrderedDict(data.get('changes', {}))
+            if not data.get('incomplete'):
+                self._baseline = data.get('baseline')
+
+    @property
+    def has_baseline(self):
+        """
+        True if the journal has been tracking changes since the last finalization
+        """
+        return self._baseline is not None
+
+    @property
+    def changes(self):
+        """
+        a copy of the recorded changes as a dictionary mapping filepaths to the
+        type of change (CREATED, UPDATED, or REMOVED)
+        """
+        return OrderedDict((p, c['change']) for p, c in self._changes.items())
+
+    def __len__(self):
+        return len(self._changes)
+
+    def record(self, comppath, change=UPDATED):
+        """
+        record a change to a component
+
+        :param str comppath:  the filepath of the component that changed (or "" for
+                              the resource-level metadata)
+        :param str change:    the type of change: one of CREATED, UPDATED, or REMOVED
+        """
+        if change not in (CREATED, UPDATED, REMOVED):
+            raise ValueError("ChangeJournal.record(): unrecognized change type: " +
+                             str(change))
+        ent = self._changes.get(comppath)
+        if ent is None:
+            self._changes[comppath] = OrderedDict([("change", change)])
+        elif ent['change'] == change or (ent['change'] == CREATED and change == UPDATED):
+            return
+        elif ent['change'] == REMOVED and change != REMOVED:
+            ent['change'] = UPDATED
+        else:
+            ent['change'] = change
+        self._mark_dirty()
+
+    def note_data_change(self, comppath):
+        """
+        note that the data under the given filepath is about to change.  If it
+        has not already been noted since the last finalization, the current size
+        of the data is recorded for use by payload_oxum().  This should be called
+        before the data file (or directory) is changed.
+        """
+        if not self.datadir:
+            return
+        parts = comppath.split('/')
+        for i in range(1, len(parts)+1):
+            ent = self._changes.get('/'.join(parts[:i]))
+            if ent is not None and 'data' in ent:
+                # already noted (possibly via an ancestor)
+                return
+
+        base = self._measure(comppath)
+
+        # fold in the sizes noted for any descendents
+        pfx = comppath + '/'
+        for path, ent in self._changes.items():
+            if 'data' in ent and path.startswith(pfx):
+                curr = self._measure(path)
+                base = [base[0] - curr[0] + ent['data'][0],
+                        base[1] - curr[1] + ent['data'][1]]
+                del ent['data']
+
+        self._changes.setdefault(comppath, OrderedDict([("change", UPDATED)]))
+        self._changes[comppath]['data'] = base
+        self._mark_dirty()
+
+    def _mark_dirty(self):
+        if not self._dirty:
+            # let other processes know that the persisted journal is now out of date
+            self._dirty = True
+            self._write(True)
+
+    def _measure(self, comppath):
+        path = os.path.join(self.datadir, comppath)
+        if os.path.isfile(path):
+            return [os.stat(path).st_size, 1]
+        if os.path.isdir(path):
+            return measure_dir_size(path)
+        return [0, 0]
+
+    def dirty_components(self):
+        """
+        return a list of the filepaths of components that have been created or
+        updated (and not subsequently removed) since the last finalization
+        """
+        return [p for p, c in self._changes.items() if c['change'] != REMOVED]
+
+    def removed_components(self):
+        """
+        return a list of the filepaths of components that have been removed since
+        the last finalization
+        """
+        return [p for p, c in self._changes.items() if c['change'] == REMOVED]
+
+    def payload_oxum(self):
+        """
+        return the current payload size of the bag--a pair of numbers giving the
+        total number of bytes and files--calculated from the size at the last
+        finalization and the changes noted since.  None is returned if the
+        journal has no baseline.
+        """
+        if self._baseline is None:
+            return None
+        oxum = list(self._baseline['payload_oxum'])
+        for path, ent in self._changes.items():
+            if 'data' in ent:
+                curr = self._measure(path)
+                oxum[0] += curr[0] - ent['data'][0]
+                oxum[1] += curr[1] - ent['data'][1]
+        return oxum
+
+    def reset(self, payload_oxum=None):
+        """
+        clear the recorded changes and, if payload_oxum is given, set a new
+        baseline; this should be called at the end of a finalization.
+
+        :param list payload_oxum:  the size of the bag's payload as a pair of
+                                   numbers giving the total number of bytes and
+                                   files.  If None, the journal will have no
+                                   baseline.
+        """
+        self._changes = OrderedDict()
+        self._baseline = None
+        if payload_oxum is not None:
+            self._baseline = OrderedDict([("payload_oxum", list(payload_oxum))])
+        self.save()
+
+    def invalidate(self):
+        """
+        drop the journal's baseline so that the next finalization will re-process
+        all components.  This should be called when the bag is changed in a way
+        that is not tracked by the journal.
+        """
+        self.reset(None)
+
+    @property
+    def dirty(self):
+        """
+        True if changes have been recorded since the journal was last saved
+        """
+        return self._dirty
+
+    def save(self):
+        """
+        write the journal to its file.  Nothing is written if the journal is not
+        persisted or the directory that should contain the file does not exist.
+        """
+        self._write(False)
+        self._dirty = False
+
+    def _write(self, incomplete):
+        if not self.journalfile or \
+           not os.path.isdir(os.path.dirname(self.journalfile)):
+            return
+        data = OrderedDict([("baseline", self._baseline), ("changes", self._changes)])
+        if incomplete:
+            data['incomplete'] = True
+        write_json(data, self.journalfile, None)
+
+    def unpersist(self):
+        """
+        remove the journal's file; subsequent changes will only be recorded in memory.
+        """
+        if self.journalfile and os.path.exists(self.journalfile):
+            os.remove(self.journalfile)
+        self.journalfile = None
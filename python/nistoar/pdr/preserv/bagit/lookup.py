@@ -0,0 +1,190 @@
+"""
+A hashed index of a multibag head bag's file lookup table.
+
+A head bag's ``file-lookup.tsv`` file (in its multibag tag directory) maps each file
+path in the aggregation to the name of the member bag that contains it.  Looking up
+a path by scanning this file costs time proportional to the number of files in the
+aggregation, so checking every file in a large dataset this way is quadratic.  A
+:class:`FileLookupIndex` reads the file once into a dictionary so that each lookup
+takes constant time.
+
+Indexes are cached in memory (for a limited number of head bags) so that they can
+be shared within a process; an entry is reused only as long as the lookup file has
+not changed.  For very large aggregations, an index can also be persisted to a
+compact sidecar file (outside of the bag) so that other processes can load it
+without re-parsing the lookup file.
+"""
+import os, io, json, threading
+from collections import OrderedDict
+
+from ...utils import write_json
+from ...exceptions import StateException
+from .bag import NISTBag
+
+LOOKUP_FILENAME = "file-lookup.tsv"
+DEF_MBAG_TAGDIR = "multibag"
+DEF_ENC = "utf-8"
+
+# the maximum number of indexes to hold in memory
+DEF_CACHE_SIZE = 4
+
+_cache = OrderedDict()
+_cache_lock = threading.RLock()
+_cache_size = DEF_CACHE_SIZE
+
+def set_cache_size(size):
+    """
+    set the maximum number of lookup indexes that will be cached in memory.  A
+    value of zero or less turns off in-memory caching.
+    """
+    global _cache_size
+    with _cache_lock:
+        _cache_size = size
+        while len(_cache) > max(_cache_size, 0):
+            _cache.popitem(last=False)
+
+def clear_cache():
+    """
+    remove all indexes cached in memory
+    """
+    with _cache_lock:
+        _cache.clear()
+
+def _stamp(filepath):
+    # return a signature of the file's current state, or None if it does not exist
+    try:
+        st = os.stat(filepath)
+        return [st.st_mtime, st.st_size]
+    except OSError:
+        return None
+
+class FileLookupIndex(object):
+    """
+    an index of the file lookup table of a multibag head bag.
+
+    This class provides the same lookup_file() method as the multibag package's
+    head bag classes, so it can be used in their place where only file lookups are
+    needed.
+    """
+
+    def __init__(self, bagdir, sidecar=None, tagdir=None):
+        """
+        :param str bagdir:   the path to the head bag's root directory
+        :param str sidecar:  the path to a file where the index should be persisted;
+                             if None, the index is only cached in memory.  The
+                             sidecar should not be located inside the bag.
+        :param str tagdir:   the path to the bag's multibag tag directory; if None,
+                             it is determined from the bag's bag-info.txt file.
+        """
+        self.bagdir = bagdir
+        self.sidecar = sidecar
+        if not tagdir:
+            tagdir = NISTBag(bagdir).multibag_dir or os.path.join(bagdir, DEF_MBAG_TAGDIR)
+        self.lookupfile = os.path.join(tagdir, LOOKUP_FILENAME)
+        self._files = None
+        self._bags = None
+
+    def _read_lookup_file(self):
+        # parse the lookup file into a list of bag names and a map of file paths
+        # to indexes into that list
+        bags = []
+        bagidx = {}
+        files = {}
+        with io.open(self.lookupfile, encoding=DEF_ENC) as fd:
+            for line in fd:
+                parts = line.rstrip('\r\n').split('\t')
+                if len(parts) < 2 or not parts[0]:
+                    continue
+                if parts[1] not in bagidx:
+                    bagidx[parts[1]] = len(bags)
+                    bags.append(parts[1])
+                # a path should only be listed once; if it is repeated, honor the
+                # first listing as a sequential scan would.
+                files.setdefault(parts[0], bagidx[parts[1]])
+        return (bags, files)
+
+    def _read_sidecar(self, stamp):
+        try:
+            with open(self.sidecar) as fd:
+                data = json.load(fd)
+            if data.get('source') == stamp:
+                return (data['bags'], data['files'])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            # missing, corrupted, or out of date; we'll rebuild it
+            pass
+        return None
+
+    def _write_sidecar(self, stamp, bags, files):
+        data = OrderedDict([("source", stamp), ("bags", bags), ("files", files)])
+        try:
+            write_json(data, self.sidecar, None)
+        except StateException:
+            # not fatal: the index is still usable from memory
+            pass
+
+    def _load(self):
+        stamp = _stamp(self.lookupfile)
+        if stamp is None:
+            return ([], {})
+
+        with _cache_lock:
+            cached = _cache.get(self.lookupfile)
+            if cached is not None:
+                _cache[self.lookupfile] = _cache.pop(self.lookupfile)   # mark as recently used
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        loaded = None
+        if self.sidecar:
+            loaded = self._read_sidecar(stamp)
+        if loaded is None:
+            loaded = self._read_lookup_file()
+            if self.sidecar:
+                self._write_sidecar(stamp, *loaded)
+
+        with _cache_lock:
+            if _cache_size > 0:
+                _cache.pop(self.lookupfile, None)
+                _cache[self.lookupfile] = (stamp, loaded)
+                while len(_cache) > _cache_size:
+                    _cache.popitem(last=False)
+        return loaded
+
+    def _ensure_loaded(self):
+        if self._files is None:
+            (self._bags, self._files) = self._load()
+
+    def refresh(self):
+        """
+        reload the index if the lookup file has changed since it was loaded.
+        """
+        self._files = None
+        self._ensure_loaded()
+
+    def lookup_file(self, filepath):
+        """
+        return the name of the member bag that contains the file with the given
+        path (relative to the bag's root directory), or None if the file is not
+        listed in the lookup table.
+        """
+        self._ensure_loaded()
+        idx = self._files.get(filepath)
+        if idx is None:
+            return None
+        return self._bags[idx]
+
+    def bag_names(self):
+        """
+        return the names of the member bags referred to in the lookup table, in the
+        order they first appear.
+        """
+        self._ensure_loaded()
+        return list(self._bags)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._files)
+
+    def __contains__(self, filepath):
+        self._ensure_loaded()
+        return filepath in self._files
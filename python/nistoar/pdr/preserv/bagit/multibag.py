@@ -3,8 +3,9 @@ Support for the multibag BagIt profile.  In particular, this module can split
 a single bag into multiple output multbags for preservation.  
 """
 from __future__ import print_function, absolute_import
-import os, logging, re, json, shutil
+import os, logging, re, json, shutil, errno, tempfile
 from functools import cmp_to_key
+from collections import Mapping
 
 import multibag
 from multibag.restore import restore_bag
@@ -12,6 +13,10 @@ from multibag.restore import restore_bag
 from .. import ConfigurationException, StateException, AIPValidationError
 from ... import utils
 from .bag import NISTBag
+from .builder import format_bytes
+from .lookup import FileLookupIndex
+
+SPLIT_MODES = ("copy", "link")
 
 class MultibagSplitter(object):
     """
@@ -62,6 +67,13 @@ class MultibagSplitter(object):
                                  multibags.  Default: False
     :prop replace bool:          When splitting, replace the input bag if 
                                  output directory is the same as the input's.
+    :prop split_mode str:        how the payload files are placed into the 
+                                 output bags:  "copy" (the default) copies each
+                                 file; "link" hard-links each file to the 
+                                 source's copy (falling back to copying when 
+                                 the output directory is on a different 
+                                 filesystem), so that splitting does not 
+                                 double the disk space used by the payload.
     """
 
     def __init__(self, source_bagdir, config=None):
@@ -102,6 +114,10 @@ class MultibagSplitter(object):
         if prob:
             raise ConfigurationException("Properties not interpretable as " +
                                          "integers: " + ", ".join(prob))
+        if self.cfg.get('split_mode', "copy") not in SPLIT_MODES:
+            raise ConfigurationException("split_mode: not one of " +
+                                         ", ".join(SPLIT_MODES) + ": " +
+                                         str(self.cfg['split_mode']))
 
     def check(self, log=None):
         """
@@ -198,8 +214,11 @@ class MultibagSplitter(object):
 
         try:
             spltr = OARSplitter(self.maxsz, self.trgsz, self.maxhbsz)
-            out = spltr.split(self.srcdir, destdir, nameiter, ['Bag-Oxum'],
-                              logger=log)
+            if self.cfg.get('split_mode') == "link":
+                out = self._split_linked(spltr, destdir, nameiter, log)
+            else:
+                out = spltr.split(self.srcdir, destdir, nameiter, ['Bag-Oxum'],
+                                  logger=log)
         except:
             # error occurred: restore the original name to the source bag
             if origsrc != self.srcdir:
@@ -228,11 +247,38 @@ class MultibagSplitter(object):
 
         return out
 
+    def _split_linked(self, spltr, destdir, nameiter, log=None):
+        # split a stand-in for the source bag whose payload files are empty (so
+        # that the splitter does not copy them), then fill in the output bags'
+        # payloads with links to the source's files.
+        workdir = tempfile.mkdtemp(prefix="_split",
+                                   dir=os.path.dirname(self.srcdir))
+        try:
+            standin = os.path.join(workdir, os.path.basename(self.srcdir))
+            spltr.sizes = _make_standin(self.srcdir, standin)
+            out = spltr.split(standin, destdir, nameiter, ['Bag-Oxum'],
+                              logger=log)
+
+            if log:
+                log.debug("Linking payload files into %d multibags", len(out))
+            sums = _read_manifests(self.srcdir)
+            for bagdir in out:
+                if _fill_payload(bagdir, self.srcdir):
+                    _update_bag_sizes(bagdir, sums)
+            return out
+
+        finally:
+            shutil.rmtree(workdir)
+
     def _verify_complete(self, srcdir, multidirs):
         headbag = multibag.open_headbag(multidirs[-1])
         if not headbag.is_head_multibag():
             raise AIPValidationError("Expected to be a head bag: "+multidirs[-1])
 
+        # load the lookup table once rather than scanning it for every file
+        lookup = FileLookupIndex(multidirs[-1])
+        bagdirs = self._bagdirs_by_name(multidirs)
+
         # walk through all data and metadata files found in source bag
         errors = []
         datadir = os.path.join(srcdir, "data")
@@ -240,7 +286,7 @@ class MultibagSplitter(object):
             dir = dir[len(datadir)-4:]   # = "data/..."
             for file in files:
                 file = os.path.join(dir, file)
-                error = self._confirm_found(file, multidirs, headbag)
+                error = self._confirm_found(file, bagdirs, lookup)
                 if error:
                     errors.append(error)
 
@@ -249,15 +295,26 @@ class MultibagSplitter(object):
             dir = dir[len(datadir)-8:]   # = "metadata/..."
             for file in files:
                 file = os.path.join(dir, file)
-                error = self._confirm_found(file, multidirs, headbag)
+                error = self._confirm_found(file, bagdirs, lookup)
                 if error:
                     errors.append(error)
 
         if len(errors) > 0:
             raise AIPValidationError("Output multibags look incomplete", errors)
 
+    def _bagdirs_by_name(self, multidirs):
+        # map the names of the output multibags to their directories
+        out = {}
+        for bagdir in multidirs:
+            out.setdefault(os.path.basename(bagdir.rstrip('/')), bagdir)
+        return out
+
     def _confirm_found(self, filepath, multidirs, headbag):
-        # confirm that we can find the given file path in the output multibags
+        # confirm that we can find the given file path in the output multibags.
+        # multidirs can be a list of the bag directories or a map of bag names to
+        # directories; headbag can be a head bag or a FileLookupIndex.
+        if not isinstance(multidirs, Mapping):
+            multidirs = self._bagdirs_by_name(multidirs)
         
         # is it listed in the lookup file?
         location = headbag.lookup_file(filepath)
@@ -265,10 +322,9 @@ class MultibagSplitter(object):
             return  "Failed to find input file in output multibag: " + filepath
         
         # is the designated location one of our multibags?
-        bagdir = [b for b in multidirs if b.endswith("/"+location)]
-        if len(bagdir) == 0:
+        bagdir = multidirs.get(location)
+        if not bagdir:
             return "Unrecognized location for " + filepath + ": "+location
-        bagdir = bagdir[0]
 
         # is the file in the output multibag it's supposed to be in?
         if not os.path.isfile(os.path.join(bagdir, filepath)):
@@ -309,7 +365,7 @@ class OARSplitter(multibag.NeighborlySplitter):
     "the OAR way".  
     """
     def __init__(self, maxsize=60000, targetsize=None, maxhdsize=None,
-                 hbslop=0.05):
+                 hbslop=0.05, sizes=None):
         """
         Create the splitter based on the "neighborly" algorithm
 
@@ -325,16 +381,23 @@ class OARSplitter(multibag.NeighborlySplitter):
                              typically smaller than maxsize (for faster 
                              retrieval and cheaper storage).  If not provided
                              (or out of range), it defaults to maxsize.
+        :param dict sizes:   the sizes to assume for payload files when 
+                             planning, keyed by their paths relative to the 
+                             payload directory (e.g. "/trial1.json"); files not 
+                             listed are measured.
         """
         if not maxhdsize or maxhdsize > maxsize:
             maxhdsize = maxsize
         super(OARSplitter, self).__init__(maxsize, targetsize)
         self.maxhdsz = maxhdsize
         self.hbslop = float(hbslop)
+        self.sizes = sizes
 
     def _sorted_files(self, bag):
         datafs = bag._root.subfspath("data")
-        finfos = [{"path": "/data"+p, "size": f.size, "name": p.split('/')[-1]}
+        sizes = self.sizes or {}
+        finfos = [{"path": "/data"+p, "size": sizes.get(p, f.size),
+                   "name": p.split('/')[-1]}
                    for p,f in datafs.fs.walk.info(namespaces=['details'])
                        if not f.is_dir and p not in self.forhead]
                           
@@ -403,3 +466,143 @@ class _OARNamer(object):
 
 
     
+
+
+def _link_or_copy(srcfile, destfile):
+    # hard-link destfile to srcfile, or copy it if it cannot be linked (e.g. it
+    # is on another filesystem)
+    try:
+        os.link(srcfile, destfile)
+    except OSError as ex:
+        if ex.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copy2(srcfile, destfile)
+
+def _make_standin(srcdir, destdir):
+    # recreate the source bag as destdir, copying all of its files except for
+    # the payload files, which are created empty.  (The tag and metadata files are
+    # copied rather than linked, as they may be updated in the output bags; only
+    # the payload files, which are never modified, are later linked by
+    # _fill_payload().)  The sizes of the payload files are returned, keyed by
+    # their paths relative to the payload directory.
+    sizes = {}
+    datadir = os.path.join(srcdir, "data")
+    for dir, subdirs, files in os.walk(srcdir):
+        outdir = os.path.join(destdir, os.path.relpath(dir, srcdir))
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        inpayload = dir == datadir or dir.startswith(datadir+os.sep)
+        for f in files:
+            if inpayload:
+                path = os.path.join(dir, f)
+                sizes['/'+os.path.relpath(path, datadir).replace(os.sep, '/')] = \
+                    os.stat(path).st_size
+                with open(os.path.join(outdir, f), 'w'):
+                    pass
+            else:
+                shutil.copy2(os.path.join(dir, f), os.path.join(outdir, f))
+    return sizes
+
+def _fill_payload(bagdir, srcdir):
+    # replace the empty stand-ins for payload files in an output bag with links
+    # to the source bag's files; return the number of files replaced
+    count = 0
+    datadir = os.path.join(bagdir, "data")
+    for dir, subdirs, files in os.walk(datadir):
+        for f in files:
+            path = os.path.join(dir, f)
+            srcfile = os.path.join(srcdir, os.path.relpath(path, bagdir))
+            if os.stat(path).st_size > 0 or not os.path.isfile(srcfile):
+                continue
+            os.remove(path)
+            _link_or_copy(srcfile, path)
+            count += 1
+    return count
+
+_manifest_re = re.compile(r'^(\S+)(\s+)(.*?)\r?\n?$')
+_oxum_re = re.compile(r'^(Payload-Oxum|Bag-Oxum)\s*:')
+
+def _read_manifests(bagdir):
+    # load the payload checksums from a bag's manifests, keyed by algorithm and
+    # then by file path
+    out = {}
+    for name in os.listdir(bagdir):
+        if name.startswith("manifest-") and name.endswith(".txt"):
+            sums = {}
+            with open(os.path.join(bagdir, name)) as fd:
+                for line in fd:
+                    m = _manifest_re.match(line)
+                    if m:
+                        sums[m.group(3)] = m.group(1)
+            out[name[len("manifest-"):-4]] = sums
+    return out
+
+def _rewrite(filepath, lines):
+    # replace a file's contents without disturbing any other links to it
+    tmpfile = filepath + ".tmp"
+    with open(tmpfile, 'w') as fd:
+        fd.writelines(lines)
+    os.rename(tmpfile, filepath)
+
+def _update_bag_sizes(bagdir, sums):
+    # bring an output bag's manifests and size information up to date with its
+    # linked payload.
+    names = os.listdir(bagdir)
+
+    # restore the source's checksums for payload files in case the splitter
+    # calculated them from the stand-ins
+    for name in names:
+        if name.startswith("manifest-") and name.endswith(".txt"):
+            srcsums = sums.get(name[len("manifest-"):-4], {})
+            filepath = os.path.join(bagdir, name)
+            with open(filepath) as fd:
+                lines = fd.readlines()
+            for i in range(len(lines)):
+                m = _manifest_re.match(lines[i])
+                if m and m.group(3) in srcsums:
+                    lines[i] = srcsums[m.group(3)] + m.group(2) + m.group(3) + '\n'
+            _rewrite(filepath, lines)
+
+    # update the Oxums and Bag-Size in bag-info.txt; the bag size includes that
+    # of bag-info.txt itself.
+    infofile = os.path.join(bagdir, "bag-info.txt")
+    if os.path.exists(infofile):
+        with open(infofile) as fd:
+            lines = fd.readlines()
+        payload = utils.measure_dir_size(os.path.join(bagdir, "data"))
+        total = utils.measure_dir_size(bagdir)
+        total[0] -= sum(len(l) for l in lines)
+
+        infolen = 0
+        newlines = lines
+        for i in range(5):
+            bagsz = total[0] + infolen
+            newlines = []
+            for line in lines:
+                m = _oxum_re.match(line)
+                if m and m.group(1) == "Payload-Oxum":
+                    line = "Payload-Oxum: {0}.{1}\n".format(*payload)
+                elif m:
+                    line = "Bag-Oxum: {0}.{1}\n".format(bagsz, total[1])
+                elif line.startswith("Bag-Size:"):
+                    line = "Bag-Size: {0}\n".format(format_bytes(bagsz))
+                newlines.append(line)
+            if sum(len(l) for l in newlines) == infolen:
+                break
+            infolen = sum(len(l) for l in newlines)
+        _rewrite(infofile, newlines)
+
+    # update the tag manifests for the changed tag files
+    for name in names:
+        if name.startswith("tagmanifest-") and name.endswith(".txt"):
+            alg = name[len("tagmanifest-"):-4]
+            filepath = os.path.join(bagdir, name)
+            with open(filepath) as fd:
+                lines = fd.readlines()
+            for i in range(len(lines)):
+                m = _manifest_re.match(lines[i])
+                if m and (m.group(3) == "bag-info.txt" or
+                          m.group(3).startswith("manifest-")):
+                    csum = utils.checksum_of(os.path.join(bagdir, m.group(3)), alg)
+                    lines[i] = csum + m.group(2) + m.group(3) + '\n'
+            _rewrite(filepath, lines)
@@ -4,8 +4,10 @@ Tools for serializing and running checksums on bags
 import subprocess as sp
 from cStringIO import StringIO
 import logging, os
+from functools import partial
 
 from .exceptions import BagSerializationError
+from .zipstream import ZipStreamWriter, HashingWriter, should_compress, DEF_STORE_EXTENSIONS
 from ...exceptions import StateException
 from .. import sys as _sys
 
@@ -117,23 +119,118 @@ def zip7_serialize(bagdir, destdir, log, destfile=None):
 
     return destfile
 
+def zipstream_serialize(bagdir, destdir, log, destfile=None, teedir=None,
+                        store_extensions=None, compresslevel=6):
+    """
+    serialize a bag into a zip file natively (i.e. without an external program), 
+    calculating the SHA-256 checksum of the output as it is written.  Files 
+    that are already compressed (judged by their extensions) are stored without
+    compression.  
+
+    :param bagdir   str:  path to the bag root directory to be serialized
+    :param destdir  str:  path to the output directory to write serialized 
+                             file to.  
+    :param log   Logger:  a logger to write messages to
+    :param destfile str:  the name to give to the serialized file.  If not 
+                             provided, one will be constructed from the 
+                             bag directory name (and an appropriate extension)
+    :param teedir   str:  a directory to simultaneously write a second copy of the
+                             serialized file to (e.g. the long-term storage 
+                             directory).  This copy is written to a hidden 
+                             file whose name starts with "." and ends with ".part";
+                             it is up to the caller to rename it when ready.
+    :param store_extensions list:  the extensions of files that should be stored 
+                             without compression; if None, a default list is used.
+    :param compresslevel int:  the zlib compression level to use for compressed
+                             files.
+    :return tuple:  a 3-tuple containing the path to the output file, its SHA-256 
+                    checksum, and the path to the tee copy (or None if teedir was
+                    not provided).
+    """
+    parent, name = os.path.split(bagdir)
+    if not destfile:
+        destfile = name+'.zip'
+    teefile = None
+    if teedir:
+        teefile = os.path.join(teedir, '.' + destfile + ".part")
+    destfile = os.path.join(destdir, destfile)
+
+    if not os.path.isdir(bagdir):
+        raise StateException("Can't serialize missing bag directory: "+bagdir)
+    if not os.path.exists(destdir):
+        raise StateException("Can't serialize to missing destination directory: "
+                             +destdir)
+    if teedir and not os.path.isdir(teedir):
+        raise StateException("Can't serialize to missing tee directory: "+teedir)
+    if store_extensions is None:
+        store_extensions = DEF_STORE_EXTENSIONS
+
+    log.info("serializing bag natively: %s", destfile)
+    outs = []
+    try:
+        outs.append(open(destfile, 'wb'))
+        if teefile:
+            outs.append(open(teefile, 'wb'))
+        hout = HashingWriter(outs)
+
+        zipw = ZipStreamWriter(hout, compresslevel)
+        for root, dirs, files in os.walk(bagdir):
+            dirs.sort()
+            arcdir = os.path.relpath(root, parent).replace(os.sep, '/')
+            zipw.add_dir(arcdir, os.stat(root).st_mode & 0o7777, os.stat(root).st_mtime)
+            for f in sorted(files):
+                zipw.add_file(os.path.join(root, f), arcdir+'/'+f,
+                              should_compress(f, store_extensions))
+        zipw.close()
+
+        for out in outs:
+            out.close()
+        
+    except Exception as ex:
+        for out in outs:
+            try:
+                out.close()
+                os.remove(out.name)
+            except Exception:
+                pass
+        log.exception("native zip serialization failed: "+str(ex))
+        raise BagSerializationError("Bag serialization failure using native zip: "+
+                                    str(ex), name, ex, sys=_sys)
+
+    log.debug("wrote %d bytes to %s", hout.tell(), destfile)
+    return (destfile, hout.hexdigest(), teefile)
+
 class Serializer(object):
     """
     a class that serialize a bag using the archiving technique identified 
     by a given name.  
     """
 
-    def __init__(self, typefunc=None, log=None):
+    def __init__(self, typefunc=None, log=None, streaming=None):
         """
+        :param dict typefunc:  a mapping of format names to serialization functions
+        :param Logger   log:   the logger to send messages to
+        :param list streaming: the names of formats (from typefunc) whose functions
+                               are streaming serializers (see register()).
         """
         self._map = {}
+        self._streaming = set()
         if typefunc:
             self._map.update(typefunc)
+        if streaming:
+            self._streaming.update(streaming)
         self.log = log
 
     def setLog(self, log):
         self.log = log
 
+    def __getstate__(self):
+        # loggers cannot be pickled; this allows a serializer to be handed to 
+        # another process (which will fall back to the default logger).
+        state = self.__dict__.copy()
+        state['log'] = None
+        return state
+
     @property
     def formats(self):
         """
@@ -141,28 +238,61 @@ class Serializer(object):
         """
         return self._map.keys()
 
-    def register(self, format, serfunc):
+    def register(self, format, serfunc, streaming=False):
         """
         register a serialization function to make available via this serializer.
         The provided function must take 3 arguments:
           bagdir -- the root directory of the bag to serialize
           destination -- the path to the desired output bagfile.  
           log -- a logger object to send messages to.
+        and return the path to the output bagfile.  
+
+        A streaming serialization function additionally accepts a teedir keyword
+        argument (see zipstream_serialize()) and returns a 3-tuple containing the 
+        path to the output bagfile, its SHA-256 checksum, and the path to the tee 
+        copy (or None).  
 
         :param format str:   the name users can use to select the serialization
                              format.
         :param serfunc func:  the serializaiton function to associate with this
                            name.  
+        :param streaming bool:  True if serfunc is a streaming serialization function
         """
-        if not isinstance(serfunc, func):
+        if not callable(serfunc):
             raise TypeError("Serializer.register(): serfunc is not a function: "+
-                            str(func))
+                            str(serfunc))
         self._map[format] = serfunc
+        if streaming:
+            self._streaming.add(format)
+        else:
+            self._streaming.discard(format)
+
+    def is_streaming(self, format):
+        """
+        return True if the named format is serialized with a streaming serialization 
+        function that calculates the output's checksum as it is written.
+        """
+        return format in self._streaming
 
     def serialize(self, bagdir, destdir, format, log=None):
         """
         serialize a bag using the named serialization format
         """
+        return self.serialize_and_checksum(bagdir, destdir, format, log)[0]
+
+    def serialize_and_checksum(self, bagdir, destdir, format, log=None, teedir=None):
+        """
+        serialize a bag using the named serialization format, returning, when 
+        possible, the checksum of the output calculated while it was written.  
+
+        :param str teedir:  a directory to simultaneously write a copy of the 
+                            output to; this is ignored if the format is not 
+                            serialized with a streaming function.
+        :return tuple:  a 3-tuple containing the path to the output bagfile, its
+                        SHA-256 checksum (or None if the format is not streaming),
+                        and the path to the hidden tee copy of the output (or 
+                        None if one was not written).
+        """
         if format not in self._map:
             raise BagSerializationError("Serialization format not supported: "+
                                         str(format))
@@ -172,15 +302,37 @@ class Serializer(object):
             else:
                 log = logging.getLogger(_sys.system_abbrev).\
                               getChild(_sys.subsystem_abbrev)
-        return self._map[format](bagdir, destdir, log)
+        if format in self._streaming:
+            return self._map[format](bagdir, destdir, log, teedir=teedir)
+        return (self._map[format](bagdir, destdir, log), None, None)
 
 class DefaultSerializer(Serializer):
     """
     a Serializer configured for some default serialization formats: zip, 7z.
+
+    This class supports the following configuration parameters:
+    :prop native_zip bool (False):  if True, the "zip" format will be serialized 
+                            natively (via zipstream_serialize()) rather than with 
+                            the external zip program.  
+    :prop store_extensions list:  when native_zip is True, the extensions of files
+                            to store without compression (see 
+                            zipstream.DEF_STORE_EXTENSIONS for the default).
+    :prop compress_level int (6):  when native_zip is True, the zlib compression 
+                            level to use.
     """
 
-    def __init__(self, log=None):
+    def __init__(self, log=None, config=None):
+        if config is None:
+            config = {}
+        streaming = []
+        zipfunc = zip_serialize
+        if config.get('native_zip', False):
+            zipfunc = partial(zipstream_serialize,
+                              store_extensions=config.get('store_extensions'),
+                              compresslevel=config.get('compress_level', 6))
+            streaming.append("zip")
+
         super(DefaultSerializer, self).__init__({
-            "zip": zip_serialize,
+            "zip": zipfunc,
             "7z": zip7_serialize
-        }, log)
+        }, log, streaming)
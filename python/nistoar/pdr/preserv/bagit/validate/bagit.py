@@ -4,6 +4,7 @@ This module implements a validator for the base BagIt standard
 import os, re
 from collections import OrderedDict
 from urlparse import urlparse
+from multiprocessing.pool import ThreadPool
 
 from .base import (Validator, ValidatorBase, ALL, ValidationResults,
                    ERROR, WARN, REC, ALL, PROB)
@@ -16,7 +17,15 @@ csfunctions = {
 
 class BagItValidator(ValidatorBase):
     """
-    A validator that runs tests for compliance to the base BagIt standard
+    A validator that runs tests for compliance to the base BagIt standard.
+
+    The test_manifest configuration property can contain the following 
+    sub-properties:
+
+    :prop check_checksums bool (True):  if False, recorded checksums will not be
+                          verified against the files
+    :prop checksum_workers int (1):  the maximum number of files to calculate 
+                          checksums for at once
     """
     profile = ("BagIt", "v0.97")
 
@@ -84,7 +93,8 @@ class BagItValidator(ValidatorBase):
 
         tcfg = self.cfg.get("test_manifest", {})
         check = tcfg.get('check_checksums', True)
-        return self._test_manifest(bag, "manifest", check, out, want)
+        return self._test_manifest(bag, "manifest", check, out, want,
+                                   tcfg.get('checksum_workers', 1))
 
     def test_tagmanifest(self, bag, want=ALL, results=None):
         out = results
@@ -93,9 +103,25 @@ class BagItValidator(ValidatorBase):
 
         tcfg = self.cfg.get("test_manifest", {})
         check = tcfg.get('check_checksums', True)
-        return self._test_manifest(bag, "tagmanifest", check, out, want)
-
-    def _test_manifest(self, bag, basename, check, out, want=ALL):
+        return self._test_manifest(bag, "tagmanifest", check, out, want,
+                                   tcfg.get('checksum_workers', 1))
+
+    def _verify_checksums(self, tocheck, csfunc, workers=1):
+        # return the paths of the files whose checksums do not match the 
+        # recorded ones; tocheck is a list of (path, filepath, checksum) tuples.
+        check = lambda c: csfunc(c[1]) == c[2]
+        if workers > 1 and len(tocheck) > 1:
+            pool = ThreadPool(min(workers, len(tocheck)))
+            try:
+                ok = pool.map(check, tocheck)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            ok = [check(c) for c in tocheck]
+        return [c[0] for c, passed in zip(tocheck, ok) if not passed]
+
+    def _test_manifest(self, bag, basename, check, out, want=ALL, workers=1):
         manire = re.compile(r'^{0}-(\w+).txt$'.format(basename))
         manifests = [f for f in os.listdir(bag.dir) if manire.match(f)]
 
@@ -164,9 +190,9 @@ class BagItValidator(ValidatorBase):
             notafile = []
             for datap in paths:
                 fp = os.path.join(bag.dir, datap)
-                if not os.path.exists(fp):
+                if not self._exists(bag, fp):
                     missing.append(datap)
-                elif not os.path.isfile(fp):
+                elif not self._isfile(bag, fp):
                     notafile.append(datap)
 
             t = self._issue("2.1.3-7", "Manifest must list only files")
@@ -191,9 +217,10 @@ class BagItValidator(ValidatorBase):
             # check that all files in the payload are listed in the manifest
             notfound = []
             failed = []
+            tocheck = []
             if check or basename == "manifest":
               top = (basename == "manifest" and bag.data_dir) or bag.dir
-              for root, subdirs, files in os.walk(top):
+              for root, subdirs, files in self._walk(bag, top):
                 for f in files:
                     fp = os.path.join(root, f)
                     assert fp.startswith(bag.dir+'/')
@@ -202,8 +229,10 @@ class BagItValidator(ValidatorBase):
                     if datap not in paths:
                         if basename == "manifest":
                             notfound.append(datap)
-                    elif check and csfunc and csfunc(fp) != paths[datap]:
-                        failed.append(datap)
+                    elif check and csfunc:
+                        tocheck.append((datap, fp, paths[datap]))
+              if tocheck:
+                failed = self._verify_checksums(tocheck, csfunc, workers)
 
             t = self._issue("2.1.3-4",
                      "All payload files must be listed in at least one manifest")
@@ -1,9 +1,10 @@
 """
 This module provides the base validator class
 """
-import sys, traceback
+import os, sys, time, traceback
 from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import Sequence, OrderedDict
+from multiprocessing.pool import ThreadPool
 
 ERROR = 1
 WARN  = 2
@@ -76,6 +77,10 @@ class ValidationResults(object):
             REC:   []
         }
 
+        # the time in seconds it took to run each test method, keyed by 
+        # "PROFILE:METHOD" (e.g. "BagIt:test_manifest")
+        self.timings = OrderedDict()
+
     def applied(self, issuetype=ALL):
         """
         return a list of the validation tests that were applied of the
@@ -162,6 +167,22 @@ class ValidationResults(object):
                                (issue.comments and list(issue.comments)) or None)
         self.results[type].append(issue)
 
+    def _record_time(self, label, secs):
+        """
+        record the time it took to run a test method
+        """
+        self.timings[label] = self.timings.get(label, 0.0) + secs
+
+    def _merge(self, other):
+        """
+        append the issues and timings collected in another ValidationResults 
+        instance to this one.
+        """
+        for type in issuetypes:
+            self.results[type].extend(other.results[type])
+        for label, secs in other.timings.items():
+            self._record_time(label, secs)
+
     def _err(self, issue, passed, comments=None):
         """
         add an issue to this result.  The issue will be updated with its 
@@ -364,23 +385,164 @@ class ValidationIssue(object):
         return ValidationIssue(data[1], data[2], data[3], data[0], 
                                data[4], data[5], data[6])
 
+class BagInventory(object):
+    """
+    an in-memory listing of the directories and files in a bag, gathered with 
+    a single scan of the bag's directory tree.  Validation tests can consult it 
+    (via ValidatorBase._walk(), etc.) rather than each scanning the bag 
+    themselves.  Paths outside of the bag are looked up on disk.
+    """
+
+    def __init__(self, bagdir):
+        """
+        scan the given bag directory
+        """
+        self.bagdir = bagdir
+        self._tree = {}       # relative directory path -> (subdirs, files)
+        self._dirs = set([''])
+        self._files = set()
+        for root, subdirs, files in os.walk(bagdir):
+            rel = root[len(bagdir)+1:]
+            self._tree[rel] = (list(subdirs), list(files))
+            self._dirs.update([os.path.join(rel, d) for d in subdirs])
+            self._files.update([os.path.join(rel, f) for f in files])
+
+    def _relpath(self, path):
+        # return the path relative to the bag's root, or None if it is not
+        # in the bag
+        if path == self.bagdir:
+            return ''
+        if path.startswith(self.bagdir + os.sep):
+            return os.path.normpath(path[len(self.bagdir)+1:])
+        return None
+
+    def walk(self, top):
+        """
+        iterate through the directory tree below top as os.walk() does (top-down)
+        """
+        rel = self._relpath(top)
+        if rel is None:
+            for item in os.walk(top):
+                yield item
+            return
+        if rel not in self._tree:
+            return
+
+        stack = [(top, rel)]
+        while stack:
+            root, rel = stack.pop()
+            subdirs, files = self._tree[rel]
+            yield (root, list(subdirs), list(files))
+            stack.extend(reversed([(os.path.join(root, d), os.path.join(rel, d))
+                                   for d in subdirs
+                                   if os.path.join(rel, d) in self._tree]))
+
+    def isfile(self, path):
+        """
+        return True if the given path exists as a file
+        """
+        rel = self._relpath(path)
+        if rel is None:
+            return os.path.isfile(path)
+        return rel in self._files
+
+    def isdir(self, path):
+        """
+        return True if the given path exists as a directory
+        """
+        rel = self._relpath(path)
+        if rel is None:
+            return os.path.isdir(path)
+        return rel in self._dirs
+
+    def exists(self, path):
+        """
+        return True if the given path exists
+        """
+        rel = self._relpath(path)
+        if rel is None:
+            return os.path.exists(path)
+        return rel in self._files or rel in self._dirs
+
+class InventoriedBag(object):
+    """
+    a wrapper around a NISTBag that carries a BagInventory of its contents
+    """
+
+    def __init__(self, bag, inventory=None):
+        self._bag = bag
+        if not inventory:
+            inventory = BagInventory(bag.dir)
+        self.inventory = inventory
+
+    def __getattr__(self, name):
+        return getattr(self._bag, name)
+
 class AggregatedValidator(Validator):
     """
-    a Validator class that combines several validators together
+    a Validator class that combines several validators together.
+
+    By default, the validators are run one after the other.  If workers is 
+    greater than 1, the bag's contents are scanned once into a BagInventory 
+    shared by all of the tests, and the test methods of all of the validators 
+    are run concurrently.  The results are reported in the same order as they 
+    would be when run sequentially.
     """
-    def __init__(self, *validators):
+    def __init__(self, *validators, **kw):
+        """
+        :param validators:   the Validators to combine
+        :param int workers:  the maximum number of test methods to run at once
+                             (default: 1)
+        """
         super(AggregatedValidator, self).__init__()
         self._vals = list(validators)
+        self.workers = int(kw.get('workers', 1) or 1)
 
     def validate(self, bag, want=ALL, results=None, **kw):
         out = results
         if not out:
             out = ValidationResults(bag.name, want)
 
+        if self.workers > 1:
+            return self._validate_concurrently(bag, want, out)
+
         for v in self._vals:
             v.validate(bag, want, out)
         return out
 
+    def _validate_concurrently(self, bag, want, out):
+        if not getattr(bag, 'inventory', None):
+            bag = InventoriedBag(bag)
+
+        jobs = []
+        for v in self._vals:
+            if isinstance(v, ValidatorBase):
+                jobs.extend([(v, t) for t in v.the_test_methods()])
+            else:
+                jobs.append((v, None))
+        if not jobs:
+            return out
+
+        def run(job):
+            (v, test) = job
+            res = ValidationResults(out.bagname, want)
+            if test:
+                v._run_test(test, bag, want, res)
+            else:
+                v.validate(bag, want, res)
+            return res
+
+        pool = ThreadPool(min(self.workers, len(jobs)))
+        try:
+            results = pool.map(run, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+        for res in results:
+            out._merge(res)
+        return out
+
 
 class ValidatorBase(Validator):
     """
@@ -432,19 +594,54 @@ class ValidatorBase(Validator):
             out = ValidationResults(bag.name, want)
 
         for test in self.the_test_methods():
-            try:
-                getattr(self, test)(bag, want, out) 
-            except Exception, ex:
-                out._err( ValidationIssue(self.profile[0], self.profile[1],
-                                          "validator failure", ERROR, 
-                                     "test method, {0}, raised an exception: {1}"
-                                            .format(test, _fmt_exc()), False),
-                          False )
+            self._run_test(test, bag, want, out)
         return out
 
+    def _run_test(self, test, bag, want, out):
+        # run the named test method, recording how long it took and whether
+        # it failed unexpectedly
+        start = time.time()
+        try:
+            getattr(self, test)(bag, want, out) 
+        except Exception, ex:
+            out._err( ValidationIssue(self.profile[0], self.profile[1],
+                                      "validator failure", ERROR, 
+                                 "test method, {0}, raised an exception: {1}"
+                                        .format(test, _fmt_exc()), False),
+                      False )
+        finally:
+            out._record_time("{0}:{1}".format(self.profile[0], test),
+                             time.time() - start)
+
+    def _walk(self, bag, top):
+        # walk the directory tree below top, using the bag's inventory if it
+        # has one
+        inv = getattr(bag, 'inventory', None)
+        if inv:
+            return inv.walk(top)
+        return os.walk(top)
+
+    def _isfile(self, bag, path):
+        inv = getattr(bag, 'inventory', None)
+        if inv:
+            return inv.isfile(path)
+        return os.path.isfile(path)
+
+    def _isdir(self, bag, path):
+        inv = getattr(bag, 'inventory', None)
+        if inv:
+            return inv.isdir(path)
+        return os.path.isdir(path)
+
+    def _exists(self, bag, path):
+        inv = getattr(bag, 'inventory', None)
+        if inv:
+            return inv.exists(path)
+        return os.path.exists(path)
+
     def _list_payload_files(self, bag):
         out = set()
-        for root, subdirs, files in os.walk(os.path.join(bag.dir, "data")):
+        for root, subdirs, files in self._walk(bag, os.path.join(bag.dir, "data")):
             root = root[len(bag.dir)+1:]
             out.update([os.path.join(root, f) for f in files])
         return out
@@ -5,14 +5,13 @@ import os, re, json
 from collections import OrderedDict, Mapping
 from urlparse import urlparse
 
-import ejsonschema as ejs
-
 from .base import (Validator, ValidatorBase, ALL, ValidationResults,
                    ERROR, WARN, REC, ALL, PROB, AggregatedValidator)
 from .bagit import BagItValidator
 from .multibag import MultibagValidator
 from ..bag import NISTBag
 from ..... import pdr
+from .... import schemas
 from .. import ConfigurationException
 
 DEF_BASE_NERDM_SCHEMA = "https://data.nist.gov/od/dm/nerdm-schema/v0.1#"
@@ -38,6 +37,7 @@ class NISTBagValidator(ValidatorBase):
         super(NISTBagValidator, self).__init__(config)
         self._validatemd = self.cfg.get('validate_metadata', True)
         self.mdval = None
+        self.schemadir = None
         self.profile = ("NIST", profver)
         if self._validatemd:
             schemadir = self.cfg.get('nerdm_schema_dir', pdr.def_schema_dir)
@@ -47,9 +47,10 @@ class NISTBagValidator(ValidatorBase):
             if not os.path.exists(schemadir):
                 raise ConfigurationException("nerdm_schema_dir directory does "+
                                              "exist: " + schemadir)
+            self.schemadir = schemadir
             self.mdval = {
-                "_": ejs.ExtValidator.with_schema_dir(schemadir, ejsprefix='_'),
-                "$": ejs.ExtValidator.with_schema_dir(schemadir, ejsprefix='$')
+                "_": schemas.get_validator(schemadir, '_'),
+                "$": schemas.get_validator(schemadir, '$')
             }
 
     def test_name(self, bag, want=ALL, results=None):
@@ -298,12 +299,7 @@ class NISTBagValidator(ValidatorBase):
         
         comm = None
         if self._validatemd:
-            flav = self._get_mdval_flavor(data)
-            schemauri = data.get(flav+"schema")
-            if not schemauri:
-                schemauri = DEF_POD_DATASET_SCHEMA
-            verrs = self.mdval[flav].validate(data, schemauri=schemauri,
-                                              strict=True, raiseex=False)
+            verrs = self._validate_metadata(data, DEF_POD_DATASET_SCHEMA)
             if verrs:
                 s = (len(verrs) > 1 and "s") or ""
                 comm = ["{0} validation error{1} detected"
@@ -316,6 +312,17 @@ class NISTBagValidator(ValidatorBase):
         out._err(t, "dcat:Dataset" in data.get("@type",[]))
         return out
 
+    def _schema_for(self, data, defschema):
+        # return the URI of the schema the given metadata declares, or defschema
+        return data.get(self._get_mdval_flavor(data)+"schema") or defschema
+
+    def _validate_metadata(self, data, defschema):
+        # validate the given metadata against the schema it declares (or 
+        # defschema), returning the list of errors found.  
+        return self.mdval[self._get_mdval_flavor(data)].validate(data,
+                                             schemauri=self._schema_for(data, defschema),
+                                             strict=True, raiseex=False)
+
     def _get_mdval_flavor(self, data):
         """
         return the prefix (or a default) used to identify meta-properties
@@ -354,12 +361,7 @@ class NISTBagValidator(ValidatorBase):
             return out
 
         if self._validatemd:
-            flav = self._get_mdval_flavor(data)
-            schemauri = data.get(flav+"schema")
-            if not schemauri:
-                schemauri = DEF_NERDM_RESOURCE_SCHEMA
-            verrs = self.mdval[flav].validate(data, schemauri=schemauri,
-                                              strict=True, raiseex=False)
+            verrs = self._validate_metadata(data, DEF_NERDM_RESOURCE_SCHEMA)
             comm = None
             if verrs:
                 s = (len(verrs) > 1 and "s") or ""
@@ -396,7 +398,7 @@ class NISTBagValidator(ValidatorBase):
         dnotadir = []
         fnotadir = []
         nonerd   = []
-        for root, subdirs, files in os.walk(datadir):
+        for root, subdirs, files in self._walk(bag, datadir):
             for dir in subdirs:
                 path = os.path.join(root[len(datadir)-5:], dir)
                 if dir.startswith('.'):
@@ -404,11 +406,11 @@ class NISTBagValidator(ValidatorBase):
                     continue
                 dir = os.path.join(root, dir)
                 mdir = os.path.join(metadir, dir[len(datadir)+1:])
-                if not os.path.exists(mdir):
+                if not self._exists(bag, mdir):
                     misngdir.append(path)
-                elif not os.path.isdir(mdir):
+                elif not self._isdir(bag, mdir):
                     dnotadir.append("meta"+path)
-                elif not os.path.exists(os.path.join(mdir,"nerdm.json")):
+                elif not self._exists(bag, os.path.join(mdir,"nerdm.json")):
                     nonerd.append("meta"+path)
 
             for f in files:
@@ -417,11 +419,11 @@ class NISTBagValidator(ValidatorBase):
                     dotfile.append(path)
                     continue
                 f = os.path.join(metadir, root[len(datadir)+1:], f)
-                if not os.path.exists(f):
+                if not self._exists(bag, f):
                     misngfil.append(path)
-                elif not os.path.isdir(f):
+                elif not self._isdir(bag, f):
                     fnotadir.append("meta"+path)
-                elif not os.path.exists(os.path.join(f,"nerdm.json")):
+                elif not self._exists(bag, os.path.join(f,"nerdm.json")):
                     nonerd.append("meta"+path)
 
         t = self._issue("4.1-4-5", "Data directory should not contain files "+
@@ -501,11 +503,15 @@ class NISTBagValidator(ValidatorBase):
                          "of @type=nrdp:Subcollection.")
         kt = self._issue("4.1-4-2e", "_schema and @context fields recommended "+
                          "for inclusion in component NERDm data file")
-        for root, subdirs, files in os.walk(datadir):
+
+        # the component metadata are collected so that they can be validated
+        # against their schemas in one batch
+        tovalidate = []
+        for root, subdirs, files in self._walk(bag, datadir):
             for f in files:
                 path = os.path.join(root[len(datadir):], f)
                 mdf = os.path.join(metadir, path, "nerdm.json")
-                if not os.path.isfile(mdf):
+                if not self._isfile(bag, mdf):
                     continue
 
                 data = self._check_comp_legal(mdf, path, out)
@@ -528,24 +534,12 @@ class NISTBagValidator(ValidatorBase):
                 out._rec(kt, ok, comm)
 
                 if self._validatemd:
-                    flav = self._get_mdval_flavor(data)
-                    schemauri = data.get(flav+"schema")
-                    if not schemauri:
-                        schemauri = DEF_NERDM_DATAFILE_SCHEMA
-                    verrs = self.mdval[flav].validate(data, schemauri=schemauri,
-                                                      strict=True, raiseex=False)
-                    comm = None
-                    if verrs:
-                        s = (len(verrs) > 1 and "s") or ""
-                        comm = ["{0} validation error{1} detected"
-                                .format(len(verrs), s)]
-                        comm += [str(e) for e in verrs]
-                    out._err(vt, not comm, comm)
+                    tovalidate.append((data, self._schema_for(data, DEF_NERDM_DATAFILE_SCHEMA)))
             
             for d in subdirs:
                 path = os.path.join(root[len(datadir):], d)
                 mdf = os.path.join(metadir, path, "nerdm.json")
-                if not os.path.isfile(mdf):
+                if not self._isfile(bag, mdf):
                     continue
 
                 data = self._check_comp_legal(mdf, path, out)
@@ -559,19 +553,17 @@ class NISTBagValidator(ValidatorBase):
                 out._err(ct, ok, comm)
 
                 if self._validatemd:
-                    flav = self._get_mdval_flavor(data)
-                    schemauri = data.get(flav+"schema")
-                    if not schemauri:
-                        schemauri = DEF_NERDM_SUBCOLL_SCHEMA
-                    verrs = self.mdval[flav].validate(data, schemauri=schemauri,
-                                                      strict=True, raiseex=False)
-                    comm = None
-                    if verrs:
-                        s = (len(verrs) > 1 and "s") or ""
-                        comm = ["{0} validation error{1} detected"
-                                .format(len(verrs), s)]
-                        comm += [str(e) for e in verrs]
-                    out._err(vt, not comm, comm)
+                    tovalidate.append((data, self._schema_for(data, DEF_NERDM_SUBCOLL_SCHEMA)))
+
+        if tovalidate:
+            for verrs in schemas.validate_all(tovalidate, self.schemadir):
+                comm = None
+                if verrs:
+                    s = (len(verrs) > 1 and "s") or ""
+                    comm = ["{0} validation error{1} detected"
+                            .format(len(verrs), s)]
+                    comm += [str(e) for e in verrs]
+                out._err(vt, not comm, comm)
             
         return out
 
@@ -609,17 +601,37 @@ class NISTAIPValidator(AggregatedValidator):
     """
     An AggregatedValidator that validates the complete profile for bags 
     created by the NIST preservation service.  
+
+    In addition to the "bagit", "multibag", and "nist" configuration sections 
+    for the component validators, the configuration supports:
+
+    :prop workers int (1):  the maximum number of validation tests to run at 
+                            once.  If greater than 1, the bag is scanned once 
+                            into an inventory shared by all the tests, and, 
+                            unless bagit.test_manifest.checksum_workers is set, 
+                            manifest checksums are verified with this many 
+                            workers as well.
     """
     def __init__(self, config=None):
         if not config:
             config = {}
-        bagit = BagItValidator(config=config.get("bagit", {}))
+        workers = int(config.get("workers", 1) or 1)
+
+        bagitcfg = config.get("bagit", {})
+        if workers > 1 and \
+           'checksum_workers' not in bagitcfg.get('test_manifest', {}):
+            bagitcfg = dict(bagitcfg)
+            bagitcfg['test_manifest'] = dict(bagitcfg.get('test_manifest', {}))
+            bagitcfg['test_manifest']['checksum_workers'] = workers
+            
+        bagit = BagItValidator(config=bagitcfg)
         multibag = MultibagValidator(config=config.get("multibag", {}))
         nist = NISTBagValidator(config=config.get("nist", {}))
 
         super(NISTAIPValidator, self).__init__(
             bagit,
             multibag,
-            nist
+            nist,
+            workers=workers
         )
 
@@ -0,0 +1,286 @@
+"""
+A streaming writer for zip archives.
+
+Unlike the standard library's zipfile module, the :class:`ZipStreamWriter` never
+seeks backward in its output:  each entry's CRC and sizes are written after its
+data in a *data descriptor* record.  This allows the archive to be written to
+several destinations at once and to be checksummed as it is written (see
+:class:`HashingWriter`), so that no extra pass over the archive is needed after it
+is created.  ZIP64 extensions are used as needed to support entries and archives
+larger than 4 GB, and files can either be compressed (DEFLATE) or stored as is
+(e.g. when they are already compressed).
+"""
+import os, struct, time, zlib, hashlib
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+DEF_BUFSIZE = 1048576   # 1 MB
+
+# file extensions of formats that are already compressed; by default, files with
+# these extensions will be stored without compression.
+DEF_STORE_EXTENSIONS = [ "zip", "gz", "tgz", "bz2", "tbz2", "xz", "txz", "7z", "zst",
+                         "rar", "jar", "jpg", "jpeg", "png", "gif",
+                         "mp3", "mp4", "m4v", "mov", "avi", "mkv", "webm" ]
+
+_ZIP32_MAX = 0xFFFFFFFF
+_ZIP16_MAX = 0xFFFF
+
+_FLAG_DATADESC = 0x08
+_FLAG_UTF8 = 0x800
+
+_LOCAL_HDR = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HDR = struct.Struct("<IHHHHHHIIIHHHHHII")
+_DATADESC32 = struct.Struct("<IIII")
+_DATADESC64 = struct.Struct("<IIQQ")
+_END_HDR = struct.Struct("<IHHHHIIH")
+_END64_HDR = struct.Struct("<IQHHIIQQQQ")
+_END64_LOC = struct.Struct("<IIQI")
+
+_LOCAL_SIG = 0x04034b50
+_CENTRAL_SIG = 0x02014b50
+_DATADESC_SIG = 0x08074b50
+_END_SIG = 0x06054b50
+_END64_SIG = 0x06064b50
+_END64_LOC_SIG = 0x07064b50
+
+_VERSION_20 = 20    # deflate, directories
+_VERSION_45 = 45    # ZIP64
+_MADE_BY_UNIX = 3 << 8
+
+class HashingWriter(object):
+    """
+    a write-only file-like object that passes its bytes on to one or more
+    output file objects while keeping track of the number of bytes written and
+    calculating a running checksum.
+    """
+
+    def __init__(self, outputs, algorithm="sha256"):
+        """
+        :param list outputs:   the writable file objects to send bytes to
+        :param str algorithm:  the name of the hash algorithm to apply; if None,
+                               no checksum is calculated.
+        """
+        self._outs = list(outputs)
+        self._hash = (algorithm and hashlib.new(algorithm)) or None
+        self._count = 0
+
+    def write(self, data):
+        if self._hash:
+            self._hash.update(data)
+        for out in self._outs:
+            out.write(data)
+        self._count += len(data)
+
+    def tell(self):
+        """
+        return the number of bytes written so far
+        """
+        return self._count
+
+    def hexdigest(self):
+        """
+        return the checksum of the bytes written so far
+        """
+        return (self._hash and self._hash.hexdigest()) or None
+
+    def flush(self):
+        for out in self._outs:
+            out.flush()
+
+def _dos_datetime(mtime):
+    tm = time.localtime(mtime)
+    if tm.tm_year < 1980:
+        return (0, 1 << 5 | 1)    # 1980-01-01 00:00
+    dtime = tm.tm_hour << 11 | tm.tm_min << 5 | (tm.tm_sec // 2)
+    ddate = (tm.tm_year - 1980) << 9 | tm.tm_mon << 5 | tm.tm_mday
+    return (dtime, ddate)
+
+def _encode_name(name):
+    # return the name as UTF-8 bytes and the flags that describe its encoding
+    if not isinstance(name, bytes):
+        name = name.encode('utf-8')
+    try:
+        name.decode('ascii')
+        return name, 0
+    except UnicodeDecodeError:
+        return name, _FLAG_UTF8
+
+class ZipStreamWriter(object):
+    """
+    a class for writing a zip archive sequentially to a file-like object.  The
+    output object only needs to support write(); this writer keeps track of
+    the output position itself.
+    """
+
+    def __init__(self, out, compresslevel=6, bufsize=DEF_BUFSIZE):
+        """
+        :param out:    a writable file-like object to write the archive to
+        :param int compresslevel:  the zlib compression level to apply to
+                                   compressed entries
+        :param int bufsize:        the number of bytes to read from input files
+                                   at a time
+        """
+        self._out = out
+        self._pos = 0
+        self._level = compresslevel
+        self._bufsz = bufsize
+        self._entries = []
+        self._closed = False
+
+    def _write(self, data):
+        self._out.write(data)
+        self._pos += len(data)
+
+    def add_dir(self, arcname, mode=0o755, mtime=None):
+        """
+        add a directory entry to the archive
+
+        :param str arcname:  the name of the directory within the archive
+        :param int mode:     the directory's permission bits
+        :param float mtime:  the directory's modification time; if None, the
+                             current time is used.
+        """
+        if not arcname.endswith('/'):
+            arcname += '/'
+        if mtime is None:
+            mtime = time.time()
+        name, flags = _encode_name(arcname)
+        dtime, ddate = _dos_datetime(mtime)
+
+        offset = self._pos
+        self._write(_LOCAL_HDR.pack(_LOCAL_SIG, _VERSION_20, flags, ZIP_STORED,
+                                    dtime, ddate, 0, 0, 0, len(name), 0))
+        self._write(name)
+        self._entries.append({
+            "name": name, "flags": flags, "method": ZIP_STORED, "dtime": dtime,
+            "ddate": ddate, "crc": 0, "csize": 0, "usize": 0, "offset": offset,
+            "extattr": ((0o40000 | mode) & 0xFFFF) << 16 | 0x10
+        })
+
+    def add_file(self, filepath, arcname, compress=True):
+        """
+        add the contents of a file to the archive
+
+        :param str filepath:  the path to the file to add
+        :param str arcname:   the name to give the file within the archive
+        :param bool compress: if True, compress the contents with DEFLATE;
+                              otherwise, store the contents as is.
+        """
+        st = os.stat(filepath)
+        name, flags = _encode_name(arcname)
+        flags |= _FLAG_DATADESC
+        method = (compress and ZIP_DEFLATED) or ZIP_STORED
+        dtime, ddate = _dos_datetime(st.st_mtime)
+
+        # we will not know the compressed size until the end; deflate can make
+        # incompressible data slightly larger, so allow some headroom.
+        zip64 = st.st_size > _ZIP32_MAX - (st.st_size // 1000 + 1024)
+        extra = b''
+        if zip64:
+            extra = struct.pack("<HHQQ", 1, 16, 0, 0)
+        version = (zip64 and _VERSION_45) or _VERSION_20
+        szfld = (zip64 and _ZIP32_MAX) or 0
+
+        offset = self._pos
+        self._write(_LOCAL_HDR.pack(_LOCAL_SIG, version, flags, method, dtime, ddate,
+                                    0, szfld, szfld, len(name), len(extra)))
+        self._write(name)
+        self._write(extra)
+
+        crc = 0
+        usize = 0
+        csize = 0
+        comp = None
+        if method == ZIP_DEFLATED:
+            comp = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        with open(filepath, 'rb') as fd:
+            while True:
+                buf = fd.read(self._bufsz)
+                if not buf:
+                    break
+                usize += len(buf)
+                crc = zlib.crc32(buf, crc)
+                if comp:
+                    buf = comp.compress(buf)
+                csize += len(buf)
+                self._write(buf)
+        if comp:
+            buf = comp.flush()
+            csize += len(buf)
+            self._write(buf)
+        crc &= 0xFFFFFFFF
+
+        if zip64:
+            self._write(_DATADESC64.pack(_DATADESC_SIG, crc, csize, usize))
+        elif csize > _ZIP32_MAX or usize > _ZIP32_MAX:
+            raise ValueError(filepath + ": file grew too large while being archived")
+        else:
+            self._write(_DATADESC32.pack(_DATADESC_SIG, crc, csize, usize))
+
+        self._entries.append({
+            "name": name, "flags": flags, "method": method, "dtime": dtime,
+            "ddate": ddate, "crc": crc, "csize": csize, "usize": usize,
+            "offset": offset, "extattr": (st.st_mode & 0xFFFF) << 16
+        })
+
+    def close(self):
+        """
+        write the archive's central directory.  The output object is not closed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        cdstart = self._pos
+        for ent in self._entries:
+            extra = b''
+            usize, csize, offset = ent['usize'], ent['csize'], ent['offset']
+            if usize >= _ZIP32_MAX:
+                extra += struct.pack("<Q", usize)
+                usize = _ZIP32_MAX
+            if csize >= _ZIP32_MAX:
+                extra += struct.pack("<Q", csize)
+                csize = _ZIP32_MAX
+            if offset >= _ZIP32_MAX:
+                extra += struct.pack("<Q", offset)
+                offset = _ZIP32_MAX
+            if extra:
+                extra = struct.pack("<HH", 1, len(extra)) + extra
+            version = (extra and _VERSION_45) or _VERSION_20
+
+            self._write(_CENTRAL_HDR.pack(_CENTRAL_SIG, _MADE_BY_UNIX | version, version,
+                                          ent['flags'], ent['method'], ent['dtime'],
+                                          ent['ddate'], ent['crc'], csize, usize,
+                                          len(ent['name']), len(extra), 0, 0, 0,
+                                          ent['extattr'], offset))
+            self._write(ent['name'])
+            self._write(extra)
+        cdsize = self._pos - cdstart
+
+        count = len(self._entries)
+        if count >= _ZIP16_MAX or cdstart >= _ZIP32_MAX or cdsize >= _ZIP32_MAX:
+            end64 = self._pos
+            self._write(_END64_HDR.pack(_END64_SIG, 44, _MADE_BY_UNIX | _VERSION_45,
+                                        _VERSION_45, 0, 0, count, count, cdsize, cdstart))
+            self._write(_END64_LOC.pack(_END64_LOC_SIG, 0, end64, 1))
+            count = min(count, _ZIP16_MAX)
+            cdsize = min(cdsize, _ZIP32_MAX)
+            cdstart = min(cdstart, _ZIP32_MAX)
+        self._write(_END_HDR.pack(_END_SIG, 0, 0, count, count, cdsize, cdstart, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not exc_type:
+            self.close()
+        return False
+
+def should_compress(filename, store_extensions=DEF_STORE_EXTENSIONS):
+    """
+    return True if the given file should be compressed when added to a zip
+    archive, based on its extension.
+    """
+    fname = filename.lower()
+    return not any(fname.endswith('.'+ext) for ext in store_extensions)
@@ -0,0 +1,447 @@
+"""
+Support for calculating the checksums of many files efficiently.
+
+Calculating checksums of data files is one of the most time consuming steps of
+preservation, particularly for datasets with many files or very large files.  The
+:class:`ChecksumEngine` allows callers to submit batches of files to be checksummed
+concurrently by a pool of workers (either threads or processes) and then collect the
+results.  It can also calculate several different digests in a single pass through
+a file's bytes.  When configured with a single worker (the default), files are
+checksummed serially in the calling thread, just as
+:func:`~nistoar.pdr.utils.checksum_of` does.
+
+During preservation, the same file can be checksummed at several different stages
+(e.g. when it is first examined for metadata, when it is added to the preservation
+bag, and when the bag manifest is written).  An engine can be attached to a
+:class:`ChecksumCache`, which remembers the checksums it has calculated keyed on
+the file's identity--its device, inode, size, and modification time--so that later
+stages can reuse a digest without re-reading the bytes (even via a different path,
+such as a hard link).  Callers can force a file to be re-read (e.g. for an audit)
+via the ``force`` parameter of the engine's methods.  Newly cached checksums are
+only written to a persisted cache when the engine's :meth:`~ChecksumEngine.save_cache`
+(or the cache's :meth:`~ChecksumCache.save`) is called, so that checksumming many
+files one at a time does not rewrite the cache file for each of them.
+"""
+import os, logging, threading
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from ..utils import digests_of, DEF_CHECKSUM_BUFSIZE, read_json, write_json
+from ..exceptions import ConfigurationException
+from . import sys as _sys
+
+DEF_CHECKSUM_ALG = "sha256"
+
+deflog = logging.getLogger(_sys.system_abbrev).getChild(_sys.subsystem_abbrev) \
+                .getChild("checksum")
+
+def _digest_file(args):
+    # the worker function; it must be module-level so that it can be sent to
+    # another process.
+    filepath, algorithms, bufsize = args
+    return digests_of(filepath, algorithms, bufsize)
+
+class ChecksumEngine(object):
+    """
+    a class for calculating the checksums of files, possibly many at a time.
+
+    This class supports the following configuration parameters:
+    :prop workers     int (1):  the maximum number of files to checksum
+                                  concurrently.  A value of 1 or less causes files
+                                  to be processed serially in the calling thread.
+    :prop pool_type   str ("thread"):  the type of worker to use, either "thread"
+                                  or "process".  Because hashing releases the
+                                  interpreter lock, threads are usually sufficient;
+                                  processes may help on hosts with many cores.
+    :prop buffer_size int (10240000):  the number of bytes to read from a file
+                                  at a time
+    :prop algorithms  list (["sha256"]):  the names of the hash algorithms that
+                                  are calculated for each file.  The first is the
+                                  default algorithm returned by checksums_of().
+
+    Note that the cache (when provided) is not consulted by batches created via
+    batch().
+    """
+
+    def __init__(self, config=None, log=None, cache=None):
+        """
+        create the engine
+
+        :param dict config:  the configuration for the engine (see class
+                             documentation for supported parameters)
+        :param Logger  log:  the Logger to send messages to
+        :param ChecksumCache cache:  a cache to consult for previously calculated
+                             checksums and to record newly calculated ones to.
+        """
+        if config is None:
+            config = {}
+        self.cfg = config
+        if not log:
+            log = deflog
+        self.log = log
+
+        self._workers = self.cfg.get('workers', 1)
+        if not isinstance(self._workers, int):
+            raise ConfigurationException("checksum.workers: not an integer: " +
+                                         str(self._workers))
+        self._ptype = self.cfg.get('pool_type', "thread")
+        if self._ptype not in ("thread", "process"):
+            raise ConfigurationException("checksum.pool_type: unsupported value: " +
+                                         str(self._ptype))
+        self._bufsz = self.cfg.get('buffer_size', DEF_CHECKSUM_BUFSIZE)
+        self._algs = list(self.cfg.get('algorithms', [DEF_CHECKSUM_ALG]))
+        if not self._algs:
+            raise ConfigurationException("checksum.algorithms: no algorithms given")
+        self.cache = cache
+
+    @property
+    def workers(self):
+        """
+        the maximum number of files that will be checksummed concurrently
+        """
+        return self._workers
+
+    @property
+    def algorithms(self):
+        """
+        the names of the hash algorithms calculated for each file
+        """
+        return list(self._algs)
+
+    def _algs_for(self, algorithm):
+        if not algorithm or algorithm in self._algs:
+            return self._algs
+        return [algorithm]
+
+    def _create_pool(self, size):
+        if self._ptype == "process":
+            return Pool(size)
+        return ThreadPool(size)
+
+    def digests_of(self, filepath, force=False):
+        """
+        return the checksums of the given file for all of the configured
+        algorithms.
+
+        :param bool force:  if True, recalculate the checksums even if they are
+                            available from the cache.
+        :return OrderedDict:  a mapping of algorithm names to hex-encoded checksums
+        """
+        return self.digests_for([filepath], force=force)[filepath]
+
+    def checksum_of(self, filepath, algorithm=None, force=False):
+        """
+        return the checksum of a single file
+
+        :param str filepath:   the path to the file to checksum
+        :param str algorithm:  the hash algorithm to apply; if not given, the
+                               first configured algorithm is assumed.
+        :param bool force:     if True, recalculate the checksum even if it is
+                               available from the cache.
+        """
+        return self.checksums_of([filepath], algorithm, force)[filepath]
+
+    def digests_for(self, filepaths, algorithm=None, force=False):
+        """
+        calculate the checksums for a batch of files, concurrently if so
+        configured.
+
+        :param list filepaths:  the paths to the files to checksum
+        :param str  algorithm:  the hash algorithm to apply; if not given, all
+                                configured algorithms are applied.
+        :param bool     force:  if True, recalculate the checksums even if they
+                                are available from the cache.
+        :return OrderedDict:  a mapping of each given file path, in the given
+                              order, to a dictionary of its checksums keyed by
+                              algorithm name.
+        :raise IOError:  if any of the files cannot be read
+        """
+        out = OrderedDict.fromkeys(filepaths)
+        algs = self._algs_for(algorithm)
+
+        # determine which files we need to read
+        keys = {}
+        todo = []
+        for f in out:
+            if self.cache is not None:
+                keys[f] = self.cache.key_for(f)
+                if not force:
+                    out[f] = self.cache.lookup(keys[f], algs)
+            if out[f] is None:
+                todo.append(f)
+        if self.cache is not None and len(todo) < len(out):
+            self.log.debug("Reusing cached checksums for %d files",
+                           len(out) - len(todo))
+
+        args = [(f, algs, self._bufsz) for f in todo]
+        nworkers = min(self._workers, len(todo))
+        if nworkers <= 1:
+            sums = [_digest_file(a) for a in args]
+        else:
+            self.log.debug("Checksumming %d files with %d %s workers",
+                           len(todo), nworkers, self._ptype)
+            pool = self._create_pool(nworkers)
+            try:
+                sums = pool.map(_digest_file, args)
+            finally:
+                pool.terminate()
+                pool.join()
+        out.update(zip(todo, sums))
+
+        if self.cache is not None and todo:
+            for f in todo:
+                self.cache.store(keys[f], f, out[f])
+
+        return out
+
+    def save_cache(self):
+        """
+        write any checksums newly added to the engine's cache to its file (if the
+        engine has a persisted cache).
+        """
+        if self.cache is not None:
+            self.cache.save()
+
+    def checksums_of(self, filepaths, algorithm=None, force=False):
+        """
+        calculate the checksums for a batch of files, concurrently if so
+        configured.
+
+        :param list filepaths:  the paths to the files to checksum
+        :param str  algorithm:  the hash algorithm to apply; if not given, the
+                                first configured algorithm is assumed.
+        :param bool     force:  if True, recalculate the checksums even if they
+                                are available from the cache.
+        :return OrderedDict:  a mapping of each given file path, in the given
+                              order, to its hex-encoded checksum
+        :raise IOError:  if any of the files cannot be read
+        """
+        if not algorithm:
+            algorithm = self._algs[0]
+        out = self.digests_for(filepaths, algorithm, force)
+        for f in out:
+            out[f] = out[f][algorithm]
+        return out
+
+    def batch(self):
+        """
+        return a ChecksumBatch that can be used to submit files for checksumming
+        in the background (as they become available) and to later collect the
+        results.
+        """
+        return ChecksumBatch(self)
+
+class ChecksumBatch(object):
+    """
+    a set of files submitted to a ChecksumEngine for checksumming in the
+    background.  Files are submitted one at a time via submit(), and their
+    checksums are retrieved via results().  This allows a caller to, say, create
+    a series of files and have each checksummed while the next is being created.
+    If the engine is configured for only one worker, the checksums are instead
+    calculated when results() is called.
+
+    The batch should be used only once:  after results() is called, the
+    background workers are shut down.
+    """
+
+    def __init__(self, engine):
+        self._eng = engine
+        self._pool = None
+        self._jobs = OrderedDict()
+
+    def submit(self, filepath, key=None):
+        """
+        submit a file for checksumming
+
+        :param str filepath:  the path to the file to checksum
+        :param str key:       the key to associate with the file's result; if not
+                              provided, the filepath is used.
+        """
+        if key is None:
+            key = filepath
+        args = (filepath, self._eng._algs, self._eng._bufsz)
+        if self._eng.workers > 1:
+            if not self._pool:
+                self._pool = self._eng._create_pool(self._eng.workers)
+            self._jobs[key] = self._pool.apply_async(_digest_file, (args,))
+        else:
+            self._jobs[key] = args
+
+    def results(self, algorithm=None):
+        """
+        wait for all submitted files to be checksummed and return the results
+
+        :param str algorithm:  if provided, return only the checksum for this
+                               algorithm for each file; otherwise, return all of
+                               the configured checksums.
+        :return OrderedDict:  a mapping of the submission keys, in submission
+                              order, to either a checksum string (when algorithm
+                              is provided) or a dictionary of checksums keyed by
+                              algorithm name.
+        :raise IOError:  if any of the files could not be read
+        """
+        out = OrderedDict()
+        try:
+            for key, job in self._jobs.items():
+                if self._pool:
+                    out[key] = job.get()
+                else:
+                    out[key] = _digest_file(job)
+                if algorithm:
+                    out[key] = out[key][algorithm]
+        finally:
+            self.close()
+        return out
+
+    def close(self):
+        """
+        shut down any background workers.  Any checksums not yet collected
+        will be lost.
+        """
+        if self._pool:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __len__(self):
+        return len(self._jobs)
+
+class ChecksumCache(object):
+    """
+    a cache of file checksums keyed on the identity of the file's contents:  its
+    device, inode, size, and modification time.  Because the key does not depend
+    on the file's path, a checksum calculated for a file is also found via any
+    hard link to it.  A change to the file's contents (which updates its
+    modification time) invalidates its entry.
+
+    The cache can optionally be persisted to a JSON file so that it can be shared
+    with other processes and later preservation stages.
+    """
+
+    def __init__(self, cachefile=None):
+        """
+        create the cache
+
+        :param str cachefile:  the path to the file where the cache is persisted;
+                               if None, the cache is held in memory only.  If the
+                               file exists, the cache will be loaded from it.
+        """
+        self.cachefile = cachefile
+        self._data = None
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def key_for(cls, filepath):
+        """
+        return the key that identifies the current state of the given file or
+        None if the file does not exist.  The modification time is expressed in
+        nanoseconds, but it is derived from the floating-point st_mtime (as that
+        is all Python 2 provides), so it is only precise to about a microsecond.
+        """
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        return "%d:%d:%d:%d" % (st.st_dev, st.st_ino, st.st_size,
+                                int(st.st_mtime * 1000000000))
+
+    def _ensure_loaded(self):
+        if self._data is None:
+            self._data = self._read()
+
+    def _read(self):
+        if self.cachefile and os.path.exists(self.cachefile):
+            try:
+                return read_json(self.cachefile)
+            except ValueError as ex:
+                deflog.warning("%s: ignoring corrupted checksum cache: %s",
+                               self.cachefile, str(ex))
+        return OrderedDict()
+
+    def lookup(self, key, algorithms=(DEF_CHECKSUM_ALG,)):
+        """
+        return the cached checksums for the file with the given key (see key_for())
+        or None if checksums for all of the requested algorithms are not
+        available.
+
+        :param str key:         the file's key as returned by key_for()
+        :param list algorithms: the names of the hash algorithms of interest
+        :return OrderedDict:  a mapping of the requested algorithms to checksums
+        """
+        if not key:
+            return None
+        with self._lock:
+            self._ensure_loaded()
+            ent = self._data.get(key)
+            if not ent or any(a not in ent for a in algorithms):
+                return None
+            return OrderedDict([(a, ent[a]) for a in algorithms])
+
+    def checksum_for(self, filepath, algorithm=DEF_CHECKSUM_ALG):
+        """
+        return the cached checksum for the current state of the given file or
+        None if it is not known.
+        """
+        out = self.lookup(self.key_for(filepath), [algorithm])
+        return out and out[algorithm]
+
+    def store(self, key, filepath, digests):
+        """
+        record the checksums calculated for a file.  
+
+        :param str key:       the file's key as returned by key_for() (before
+                              its checksums were calculated).  
+        :param str filepath:  the path to the file that was checksummed
+        :param dict digests:  a mapping of algorithm names to checksums
+        """
+        if not key:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            ent = self._data.setdefault(key, OrderedDict())
+            ent['path'] = filepath
+            ent.update(digests)
+            self._dirty = True
+
+    def save(self):
+        """
+        write any newly cached checksums to the cache file (if one is set).  
+        Entries saved by other processes since this cache was loaded are retained.
+        """
+        with self._lock:
+            if not self.cachefile or not self._dirty or \
+               not os.path.isdir(os.path.dirname(os.path.abspath(self.cachefile))):
+                return
+            data = self._read()
+            data.update(self._data)
+            write_json(data, self.cachefile, None)
+            self._data = data
+            self._dirty = False
+
+    def unpersist(self):
+        """
+        remove the cache file (if one is set) and hold the cache in memory only 
+        from now on.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self.cachefile and os.path.exists(self.cachefile):
+                os.remove(self.cachefile)
+            self.cachefile = None
+
+    def clear(self):
+        """
+        forget all cached checksums
+        """
+        with self._lock:
+            self._data = OrderedDict()
+            self._dirty = False
+            if self.cachefile and os.path.exists(self.cachefile):
+                os.remove(self.cachefile)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._data)
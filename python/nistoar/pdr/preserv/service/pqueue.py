@@ -0,0 +1,212 @@
+"""
+This module provides a persistent queue of pending preservation requests.
+
+The :class:`PreservationQueue` is used by the
+:class:`~nistoar.pdr.preserv.service.service.MultiprocPreservationService` to
+limit the number of preservation processes that run at one time:  requests that
+cannot be started right away wait in the queue until a worker slot becomes
+available.  The queue is kept on disk--one small JSON file per request--so that
+it survives a restart of the service and can be shared by multiple service
+processes.  Requests are ordered by priority (lower values first) and then by
+the time they were submitted.
+"""
+import os, re, time, errno
+from collections import OrderedDict
+
+from ...utils import read_json, write_json, ExclusiveFileLock
+
+PENDING_DIR = "pending"
+RUNNING_DIR = "running"
+LOCK_FILE = ".lock"
+
+def _pid_is_alive(pid):
+    if not pid or pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        if ex.errno == errno.ESRCH:
+            return False
+        elif ex.errno == errno.EPERM:
+            return True
+        raise
+    return True
+
+class PreservationQueue(object):
+    """
+    a persistent, prioritized queue of preservation requests waiting for a
+    worker, along with a record of the requests that currently have one.
+
+    Each request is represented by a dictionary with the properties, "id" (the
+    SIP identifier), "siptype", "asupdate", "priority", "seq" (the submission
+    time in epoch seconds), "requested" (the submission time as a string), and,
+    optionally, "logfile".  Running requests also include "claimed", "pid", and
+    "started".
+    """
+
+    def __init__(self, qdir, claim_timeout=60):
+        """
+        :param str qdir:           the directory where the queue is stored; it will
+                                   be created if it does not exist.
+        :param int claim_timeout:  the number of seconds that a claimed request may
+                                   go without an assigned process ID before it is
+                                   considered abandoned.
+        """
+        self.qdir = qdir
+        self.claim_timeout = claim_timeout
+        self._pdir = os.path.join(qdir, PENDING_DIR)
+        self._rdir = os.path.join(qdir, RUNNING_DIR)
+        for d in (self.qdir, self._pdir, self._rdir):
+            if not os.path.exists(d):
+                try:
+                    os.mkdir(d)
+                except OSError as ex:
+                    if ex.errno != errno.EEXIST:
+                        raise
+        self._lockfile = os.path.join(qdir, LOCK_FILE)
+
+    def _entry_file(self, dir, sipid):
+        return os.path.join(dir, re.sub(r'^ark:/\d+/', '', sipid).replace('/', '_') +
+                                 ".json")
+
+    def _read_entries(self, dir):
+        out = []
+        for f in os.listdir(dir):
+            if not f.endswith(".json") or f.startswith('.'):
+                continue
+            try:
+                out.append(read_json(os.path.join(dir, f)))
+            except (IOError, OSError, ValueError):
+                # removed or incomplete; skip it
+                pass
+        return out
+
+    def lock(self):
+        """
+        return a context manager that holds an exclusive lock on the queue across
+        threads and processes.  The lock is not reentrant.
+        """
+        return ExclusiveFileLock(self._lockfile)
+
+    def add(self, sipid, siptype, asupdate=False, priority=0, logfile=None):
+        """
+        add a request to the queue.  If the SIP is already queued, its entry is
+        replaced but keeps its original place among requests of equal priority.
+
+        :param str  sipid:     the identifier of the SIP to preserve
+        :param str  siptype:   the SIP type name
+        :param bool asupdate:  True if the request is an update to a previously
+                               preserved SIP
+        :param priority:       the request's priority; requests with lower values
+                               are started first.
+        :param str  logfile:   the file where the worker should write its log
+        :return dict: the queue entry
+        """
+        entfile = self._entry_file(self._pdir, sipid)
+        with self.lock():
+            seq = time.time()
+            if os.path.exists(entfile):
+                seq = read_json(entfile).get('seq', seq)
+            entry = OrderedDict([
+                ("id", sipid), ("siptype", siptype), ("asupdate", bool(asupdate)),
+                ("priority", priority), ("seq", seq), ("requested", time.ctime(seq))
+            ])
+            if logfile:
+                entry['logfile'] = logfile
+            write_json(entry, entfile)
+        return entry
+
+    def remove(self, sipid):
+        """
+        remove a request from the queue of pending requests
+        :return bool:  True if the request was found in the queue
+        """
+        with self.lock():
+            try:
+                os.remove(self._entry_file(self._pdir, sipid))
+                return True
+            except OSError:
+                return False
+
+    def pending(self):
+        """
+        return the list of pending requests in the order that they will be started
+        """
+        return sorted(self._read_entries(self._pdir),
+                      key=lambda e: (e.get('priority', 0), e.get('seq', 0)))
+
+    def position(self, sipid):
+        """
+        return the position (starting with 1) of the given SIP in the queue of
+        pending requests, or None if it is not queued.
+        """
+        for i, ent in enumerate(self.pending()):
+            if ent['id'] == sipid:
+                return i + 1
+        return None
+
+    def running(self):
+        """
+        return the list of requests that currently have a worker.  Entries for
+        requests whose worker process has died are removed.
+        """
+        out = []
+        now = time.time()
+        for ent in self._read_entries(self._rdir):
+            if ent.get('pid'):
+                alive = _pid_is_alive(ent['pid'])
+            else:
+                alive = now - ent.get('claimed', 0) < self.claim_timeout
+            if alive:
+                out.append(ent)
+            else:
+                try:
+                    os.remove(self._entry_file(self._rdir, ent['id']))
+                except OSError:
+                    pass
+        return out
+
+    def claim_next(self, max_running=0):
+        """
+        move the highest priority pending request to the list of running
+        requests and return it.  None is returned if there are no pending
+        requests or if max_running requests are already running.  The caller
+        should hold the lock (see lock()) and call set_pid() once the request's
+        worker is started.
+
+        :param int max_running:  the maximum number of requests that may be running
+                                 at once; if 0 or less, no limit is applied.
+        """
+        if max_running > 0 and len(self.running()) >= max_running:
+            return None
+        for ent in self.pending():
+            pfile = self._entry_file(self._pdir, ent['id'])
+            rfile = self._entry_file(self._rdir, ent['id'])
+            try:
+                os.rename(pfile, rfile)
+            except OSError:
+                # claimed by someone else
+                continue
+            ent['claimed'] = time.time()
+            write_json(ent, rfile)
+            return ent
+        return None
+
+    def set_pid(self, sipid, pid):
+        """
+        record the process ID of the worker handling a claimed request
+        """
+        rfile = self._entry_file(self._rdir, sipid)
+        ent = read_json(rfile)
+        ent['pid'] = pid
+        ent['started'] = time.ctime()
+        write_json(ent, rfile)
+
+    def finish(self, sipid):
+        """
+        remove a request from the list of running requests
+        """
+        try:
+            os.remove(self._entry_file(self._rdir, sipid))
+        except OSError:
+            pass
@@ -25,6 +25,7 @@ submit the metadata to the PDR metadata database.
 """
 from __future__ import print_function
 from copy import deepcopy
+from collections import OrderedDict
 from abc import ABCMeta, abstractmethod, abstractproperty
 import os, sys, logging, threading, multiprocessing, time, errno, re
 
@@ -34,6 +35,7 @@ from .. import (PDRException, StateException, IDNotFound,
 from ....id import PDRMinter
 from . import status
 from . import siphandler as hndlr
+from .pqueue import PreservationQueue
 from ...notify import NotificationService
 from ..bagger.prepupd import UpdatePrepService
 from ..bagger.midas3 import midasid_to_bagname
@@ -122,7 +124,7 @@ class PreservationService(object):
     def _get_def_siptype(self):
         return 'midas3'
 
-    def preserve(self, sipid, siptype=None, timeout=None):
+    def preserve(self, sipid, siptype=None, timeout=None, priority=None):
         """
         request that an SIP with a given ID is preserved into long-term 
         storage and ingested into the target repository.  The SIP-ID implies 
@@ -140,6 +142,11 @@ class PreservationService(object):
                              with an interim status dictionary.  (The
                              preservation process will continue in another 
                              thread.)
+        :param priority int: the priority of the request if it must wait to be 
+                             started (lower values start first); if None, a 
+                             default is determined according to the service's 
+                             configuration.  This is ignored by implementations
+                             that do not queue requests.
         :return dict:  a dictionary with metadata describing the status of 
                        preservation effort.
         """
@@ -204,9 +211,9 @@ class PreservationService(object):
                                         hdlr.status.message)
 
         # we're good to go; launch the handler asynchronously
-        return self._launch_handler(hdlr, timeout)[0]
+        return self._launch_handler(hdlr, timeout, priority=priority)[0]
 
-    def update(self, sipid, siptype=None, timeout=None):
+    def update(self, sipid, siptype=None, timeout=None, priority=None):
         """
         request that an updating SIP with a given ID is preserved into long-term 
         storage and ingested into the target repository.  The SIP-ID implies 
@@ -224,6 +231,11 @@ class PreservationService(object):
                              with an interim status dictionary.  (The
                              preservation process will continue in another 
                              thread.)
+        :param priority int: the priority of the request if it must wait to be 
+                             started (lower values start first); if None, a 
+                             default is determined according to the service's 
+                             configuration.  This is ignored by implementations
+                             that do not queue requests.
         :return dict:  a dictionary wiht metadata describing the status of 
                        preservation effort.
         """
@@ -286,15 +298,16 @@ class PreservationService(object):
                                         hdlr.status.message)
 
         # we're good to go; launch the handler asynchronously
-        return self._launch_handler(hdlr, timeout)[0]
+        return self._launch_handler(hdlr, timeout, priority=priority)[0]
 
         
     @abstractmethod
-    def _launch_handler(self, handler, timeout=None):
+    def _launch_handler(self, handler, timeout=None, priority=None):
         """
         launch the given handler in a separate thread.  After launching, 
         this function will join with the thread for a maximum time given by 
-        the timeout value.  
+        the timeout value.  An implementation that queues requests should use
+        the priority to order them.
         """
         raise NotImplementedError()
         
@@ -378,6 +391,18 @@ class PreservationService(object):
         return out
 
 
+    def queued(self):
+        """
+        return descriptions of the preservation requests that are waiting to be 
+        started, in the order that they will be started.  This implementation 
+        does not queue requests, so the list is always empty.
+
+        :return list:  a list of dictionaries, each describing a request, 
+                       including its SIP identifier ("id") and position in the
+                       queue ("queue_position").
+        """
+        return []
+
     def _make_handler(self, sipid, siptype=None, asupdate=False):
         """
         create an SIPHandler of the given type for the given ID.
@@ -422,6 +447,8 @@ class PreservationService(object):
             pcfg['store_dir'] = self.cfg.get('store_dir')
         if 'restricted_store_dir' not in pcfg and 'restricted_store_dir' in self.cfg:
             pcfg['restricted_store_dir'] = self.cfg.get('restricted_store_dir')
+        if 'store_catalog_dir' not in pcfg and 'store_catalog_dir' in self.cfg:
+            pcfg['store_catalog_dir'] = self.cfg.get('store_catalog_dir')
         if 'id_registry_dir' not in pcfg:
             pcfg['id_registry_dir'] = self.idregdir
         if 'metadata_bags_dir' not in pcfg:
@@ -491,7 +518,7 @@ class ThreadedPreservationService(PreservationService):
                                               desc=msg, formatted=fmtd,
                                               id=self._hdlr._sipid)
 
-    def _launch_handler(self, handler, timeout=None):
+    def _launch_handler(self, handler, timeout=None, priority=None):
         """
         launch the given handler in a separate thread.  After launching, 
         this function will join with the thread for a maximum time given by 
@@ -502,6 +529,8 @@ class ThreadedPreservationService(PreservationService):
         :param timeout        int:  the time in seconds to wait for the 
                                       handler to finish before returning an 
                                       asynchronous response.
+        :param priority       int:  ignored, as this implementation does not
+                                      queue requests
         """
         t = None
         try: 
@@ -544,18 +573,67 @@ class MultiprocPreservationService(PreservationService):
     simultaneously. 
 
     This implementation launches preservation requests via a child process
-    (running a standalone bagging script).  
+    (running a standalone bagging script).  By default, a process is launched 
+    as soon as a request is made; alternatively, the number of simultaneous 
+    preservation processes can be limited by configuring a worker pool.  In 
+    this case, requests that cannot be started right away are saved to a 
+    persistent queue (see :class:`~nistoar.pdr.preserv.service.pqueue.PreservationQueue`)
+    and started in order of priority as running processes finish.  
+
+    In addition to the parameters supported by the 
+    :class:`PreservationService`, this class supports the following:
+
+    :prop worker_pool dict ({}):  parameters that configure the limit on the 
+                           number of simultaneous preservation processes. 
+                           The supported sub-properties are:
+      :prop max_workers int (0):  the maximum number of preservation processes
+                           that may run at once (across all service processes
+                           sharing the same queue); 0 means no limit.
+      :prop queue_dir str:  the directory where requests waiting to be started 
+                           are persisted; default: working_dir/preserv_queue.
+      :prop priority str ("fifo"):  the policy for setting the default priority
+                           of a request:  "fifo" starts requests in the order 
+                           they were made; "size" starts smaller SIPs first.  
+      :prop poll_interval float (2):  the number of seconds to wait between 
+                           checks for available worker slots.
     """
+    PRIORITY_POLICIES = ("fifo", "size")
+
     def __init__(self, config):
         """
         initialize the service based on the given configuration.
         """
+        self._queue = None
+        self._procs = {}
+        self._dispatcher = None
+        self._qlock = threading.RLock()
         super(MultiprocPreservationService, self).__init__(config)
         self._oldlogfile = None
         deflogdir = configmod.global_logdir or configmod.determine_default_logdir()
         self.combinedlog = os.path.join(self.cfg.get('logdir', deflogdir),
                                         self.cfg.get('logfile', 'preservation.log'))
 
+        poolcfg = self.cfg.get('worker_pool', {})
+        try:
+            self.max_workers = int(poolcfg.get('max_workers', 0))
+            self._poll_interval = float(poolcfg.get('poll_interval', 2))
+        except (TypeError, ValueError) as ex:
+            raise ConfigurationException("worker_pool: max_workers and poll_interval "+
+                                         "must be numbers: "+str(ex), sys=self)
+        self._priority_policy = poolcfg.get('priority', "fifo")
+        if self._priority_policy not in self.PRIORITY_POLICIES:
+            raise ConfigurationException("worker_pool: unsupported priority policy: "+
+                                         str(self._priority_policy), sys=self)
+
+        if self.max_workers > 0:
+            self._queue = PreservationQueue(poolcfg.get('queue_dir',
+                                            os.path.join(self.workdir, 'preserv_queue')))
+            if self._queue.pending():
+                # requests left over from a previous run of the service
+                log.info("Resuming %d queued preservation requests",
+                         len(self._queue.pending()))
+                self._ensure_dispatcher()
+
     def _pid_is_alive(self, pid):
         if pid <= 0:
             return False
@@ -607,11 +685,13 @@ class MultiprocPreservationService(PreservationService):
                                        desc=str(e), id=handler.sipid)
 
 
-    def _launch_handler(self, handler, timeout=None, sync=None):
+    def _launch_handler(self, handler, timeout=None, sync=None, priority=None):
         """
         launch the given handler in a separate thread.  After launching, 
         this function will join with the thread for a maximum time given by 
-        the timeout value.  
+        the timeout value.  If a worker pool is configured and all workers are
+        busy, the request is queued according to the given priority (or a 
+        default determined by the configured priority policy).  
         """
         if sync is None:
             sync = mp_sync
@@ -619,58 +699,220 @@ class MultiprocPreservationService(PreservationService):
         if timeout is None:
             timeout = self.cfg.get('sync_timeout', 5)
 
-        proc = None
-        if not sync:
+        if sync:
+            # this is the child
+            self._in_child_handle(handler, sync=True)  # (handles exceptions)
+            return (handler.status, None)
+
+        if not self._queue:
+            proc = None
             try:
-                # work out where the log in the subprocess will go
-                hlog = os.path.join(handler.name, midasid_to_bagname(handler.sipid) + ".log")
-                hlogd = handler.cfg.get('logdir')
-                if hlogd:
-                    if not os.path.exists(os.path.join(hlogd, handler.name)):
-                        os.makedirs(os.path.join(hlogd, handler.name))
-                    hlog = os.path.join(hlogd, hlog)
-            
-                # launch a subprocess
-                proc = multiprocessing.Process(target=_subprocess_handle,
-                                               args=(self.cfg, hlog, handler.sipid, handler.name,
-                                                     handler._asupdate, timeout))
-                proc.start()
-                proc.join(timeout)
+                proc = self._start_process(handler.sipid, handler.name, handler._asupdate,
+                                           timeout, self._handler_logfile(handler))
+            except Exception, e:
+                log.exception("Failed to launch preservation process: %s",str(e))
+                handler.set_state(status.FAILED, "Failed to launch preservation process")
+                return (handler.status, None)
+            return (self._await_process(handler, proc, timeout), proc)
+
+        # a worker pool is in effect:  queue the request and start it if a 
+        # worker is available
+        if priority is None:
+            priority = self._default_priority(handler)
+        try:
+            self._queue.add(handler.sipid, handler.name, handler._asupdate, priority,
+                            self._handler_logfile(handler))
+            self._dispatch(timeout)
+        except Exception, e:
+            log.exception("Failed to queue preservation request: %s",str(e))
+            self._queue.remove(handler.sipid)
+            handler.set_state(status.FAILED, "Failed to launch preservation process")
+            return (handler.status, None)
+
+        with self._qlock:
+            proc = self._procs.get(handler.sipid, (None,))[0]
+        if proc:
+            return (self._await_process(handler, proc, timeout), proc)
+
+        log.info("%s: preservation request queued (priority=%s)", handler.sipid, priority)
+        self._ensure_dispatcher()
+        handler.refresh_state()
+        return (self._add_queue_info(handler.status, handler.sipid), None)
+
+    def _handler_logfile(self, handler):
+        # work out where the log in the subprocess will go
+        hlog = os.path.join(handler.name, midasid_to_bagname(handler.sipid) + ".log")
+        hlogd = handler.cfg.get('logdir')
+        if hlogd:
+            if not os.path.exists(os.path.join(hlogd, handler.name)):
+                os.makedirs(os.path.join(hlogd, handler.name))
+            hlog = os.path.join(hlogd, hlog)
+        return hlog
+
+    def _start_process(self, sipid, siptype, asupdate, timeout, logfile):
+        # launch a subprocess
+        proc = multiprocessing.Process(target=_subprocess_handle,
+                                       args=(self.cfg, logfile, sipid, siptype,
+                                             asupdate, timeout))
+        proc.start()
+        return proc
+
+    def _await_process(self, handler, proc, timeout):
+        # wait up to timeout seconds for the preservation process to finish
+        try:
+            proc.join(timeout)
                     
-                if not proc.is_alive():
-                    handler.refresh_state()
-                    origstate = handler.state
-                    if handler.state == status.IN_PROGRESS:
-                        handler.set_state(status.FAILED,
-                                     "preservation thread died for unknown reasons")
-                    elif handler.state == status.READY:
-                        handler.set_state(status.FAILED,
-                                 "preservation failed to start for unknown reasons")
-                    if handler.state == status.FAILED:
-                        log.error("%s: preservation process completed synchronously (%s)",
-                                  handler._sipid, origstate)
-                    else:
-                        log.info("%s: preservation completed synchronously (%s)",
-                                 handler._sipid, origstate)
+            if not proc.is_alive():
+                handler.refresh_state()
+                origstate = handler.state
+                self._fail_if_unfinished(handler)
+                if handler.state == status.FAILED:
+                    log.error("%s: preservation process completed synchronously (%s)",
+                              handler._sipid, origstate)
                 else:
-                    log.info("%s: preservation running asynchronously",
-                             handler._sipid)
-                return (handler.status, proc)
+                    log.info("%s: preservation completed synchronously (%s)",
+                             handler._sipid, origstate)
+            else:
+                log.info("%s: preservation running asynchronously",
+                         handler._sipid)
 
-            except Exception, e:
-                if proc is None:
-                    log.exception("Failed to launch preservation process: %s",str(e))
-                    handler.set_state(status.FAILED, "Failed to launch preservation process")
-                    return (handler.status, None)
-                else:
-                    log.exception("Unexpected failure while monitoring "+
-                                  "preservation process: %s", str(e))
-                    return (handler.status, proc)
-        else:
-            # this is the child
-            self._in_child_handle(handler, sync=True)  # (handles exceptions)
-            return (handler.status, None)
-                
+        except Exception, e:
+            log.exception("Unexpected failure while monitoring "+
+                          "preservation process: %s", str(e))
+        return handler.status
+
+    def _fail_if_unfinished(self, handler):
+        # update the state of a handler whose process has exited without 
+        # recording a final state
+        if handler.state == status.IN_PROGRESS:
+            handler.set_state(status.FAILED,
+                              "preservation thread died for unknown reasons")
+        elif handler.state == status.READY or handler.state == status.PENDING:
+            handler.set_state(status.FAILED,
+                              "preservation failed to start for unknown reasons")
+
+    def _default_priority(self, handler):
+        # determine the priority of a request according to the configured policy
+        if self._priority_policy == "size":
+            try:
+                size = handler.estimate_size()
+                if size is not None:
+                    return size
+            except Exception as ex:
+                log.warning("%s: Unable to estimate SIP size: %s", handler.sipid, str(ex))
+            return sys.maxsize
+        return 0
+
+    def _dispatch(self, timeout=None):
+        """
+        start processes for queued requests as long as workers are available, 
+        and clean up after processes that have finished.  
+        :return bool:  True if there remain requests either running in a 
+                       process owned by this service or waiting to be started
+        """
+        if timeout is None:
+            timeout = self.cfg.get('sync_timeout', 5)
+
+        with self._qlock:
+            for sipid, (proc, siptype) in list(self._procs.items()):
+                if not proc.is_alive():
+                    proc.join()
+                    del self._procs[sipid]
+                    self._queue.finish(sipid)
+                    self._check_finished(sipid, siptype)
+
+            with self._queue.lock():
+                while True:
+                    req = self._queue.claim_next(self.max_workers)
+                    if not req:
+                        break
+                    try:
+                        proc = self._start_process(req['id'], req['siptype'], req['asupdate'],
+                                                   timeout, req.get('logfile'))
+                    except Exception as ex:
+                        log.exception("Failed to launch preservation process: %s", str(ex))
+                        self._queue.finish(req['id'])
+                        self._check_finished(req['id'], req['siptype'])
+                        continue
+                    self._queue.set_pid(req['id'], proc.pid)
+                    self._procs[req['id']] = (proc, req['siptype'])
+                    log.info("%s: preservation process started from queue", req['id'])
+
+            return bool(self._procs) or bool(self._queue.pending())
+
+    def _check_finished(self, sipid, siptype):
+        # make sure the state of a request whose process has ended is final
+        try:
+            handler = self._make_handler(sipid, siptype)
+            self._fail_if_unfinished(handler)
+        except Exception as ex:
+            log.exception("%s: Unable to check final preservation state: %s",
+                          sipid, str(ex))
+
+    def _ensure_dispatcher(self):
+        # make sure there is a thread that will start queued requests as workers
+        # become available
+        with self._qlock:
+            if self._dispatcher:
+                return
+            self._dispatcher = threading.Thread(target=self._run_dispatcher,
+                                                name="preservation-dispatcher")
+            self._dispatcher.daemon = True
+            self._dispatcher.start()
+
+    def _run_dispatcher(self):
+        while True:
+            time.sleep(self._poll_interval)
+            try:
+                busy = self._dispatch()
+            except Exception as ex:
+                log.exception("Preservation queue dispatch failure: %s", str(ex))
+                busy = True
+            if not busy:
+                with self._qlock:
+                    if not self._procs and not self._queue.pending():
+                        self._dispatcher = None
+                        return
+
+    def status(self, sipid, siptype=None):
+        """
+        report on the current status of the preservation of a dataset with
+        the given SIP identifier.  If the request is waiting in the queue for 
+        a worker, the returned dictionary will include a "queue_position" 
+        property giving its place in line (starting with 1).  
+        """
+        out = super(MultiprocPreservationService, self).status(sipid, siptype)
+        return self._add_queue_info(out, sipid)
+
+    def _add_queue_info(self, stat, sipid):
+        if self._queue and stat.get('state') == status.PENDING:
+            pos = self._queue.position(sipid)
+            if pos:
+                stat['queue_position'] = pos
+                stat['message'] = "Preservation requested; waiting to start " + \
+                                  "(queue position: {0})".format(pos)
+        return stat
+
+    def queued(self):
+        """
+        return descriptions of the preservation requests that are waiting to be 
+        started, in the order that they will be started.  
+
+        :return list:  a list of dictionaries, each describing a request, 
+                       including its SIP identifier ("id") and position in the
+                       queue ("queue_position").
+        """
+        if not self._queue:
+            return []
+        out = []
+        for i, req in enumerate(self._queue.pending()):
+            out.append(OrderedDict([
+                ("id", req['id']), ("siptype", req.get('siptype')),
+                ("asupdate", req.get('asupdate', False)),
+                ("priority", req.get('priority', 0)),
+                ("requested", req.get('requested')), ("queue_position", i+1)
+            ]))
+        return out
 
     def _save_preserv_log(self, sipid, forlog=None):
         mylog = forlog
@@ -742,6 +984,10 @@ def _subprocess_handle(config, logfile, sipid, siptype, asupdate, timeout):
         if shout:
             print("{0} preservation process for {1} started".format(siptype, sipid))
         configmod.configure_log(logfile, config=config)
+
+        # the child does its work directly; it never queues
+        config = dict(config)
+        config.pop('worker_pool', None)
         svc = MultiprocPreservationService(config)
         handler = svc._make_handler(sipid, siptype, asupdate)
         svc._launch_handler(handler, timeout, sync=True)
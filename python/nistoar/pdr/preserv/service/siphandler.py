@@ -14,17 +14,19 @@ as well as how to orchestrate the preservation with the context of a
 controlling process (e.g. a web service).  
 """
 from __future__ import print_function
-import os, sys, re, shutil, logging, errno
+import os, sys, re, shutil, logging, errno, multiprocessing
 from abc import ABCMeta, abstractmethod, abstractproperty
 from collections import OrderedDict
 from copy import deepcopy
 
 from ..bagit.serialize import DefaultSerializer
+from ..bagit.exceptions import BagSerializationError
 from ..bagit.bag import NISTBag
 from ..bagit.validate import NISTAIPValidator
 from ..bagit.multibag import MultibagSplitter, restore_bag
 from ..bagger import utils as bagutils
-from ..bagger.base import checksum_of
+from ..bagger.storecat import catalog_for
+from ..checksum import ChecksumEngine
 from ..bagger.midas import PreservationBagger, midasid_to_bagname, _midadid_to_dirname
 from ..bagger.midas3 import PreservationBagger as PreservationM3Bagger 
 from .. import (ConfigurationException, StateException, PODError, PreservationException, 
@@ -34,7 +36,8 @@ from . import status
 from ... import distrib
 from ...ingest.rmm import IngestClient
 from ...doimint import DOIMintingClient
-from ...utils import write_json
+from ...utils import write_json, measure_dir_size, checksum_of as _checksum_of
+from ...sessions import get_session
 from ....nerdm import utils as nerdutils
 from ... import distrib
 
@@ -61,6 +64,23 @@ class SIPHandler(object):
                                  the sub-property 'cachedir' will be set to
                                  a directory call 'preserv_status' just below
                                  the working directory ('working_dir').  
+    :prop checksum dict ({}):    configuration properties for the ChecksumEngine
+                                 used to checksum the serialized bags (e.g. the
+                                 number of concurrent workers).
+    :prop serializer dict ({}):  configuration properties for the DefaultSerializer
+                                 used when a serializer is not provided at 
+                                 construction (e.g. 'native_zip').
+    :prop multibag dict ({}):    configuration properties for splitting large bags
+                                 into multibags (see MultibagSplitter).  In 
+                                 addition to the splitter's properties, this 
+                                 supports 'serialize_workers' (int, default: 1), 
+                                 the maximum number of processes to use to 
+                                 serialize and checksum the member bags in 
+                                 parallel.
+    :prop store_catalog_dir str: a directory where catalogs of the bags in the
+                                 store directories can be persisted (see 
+                                 storecat.StoreCatalog); if not set, catalogs
+                                 are only kept in memory.
     """
     __metaclass__ = ABCMeta
 
@@ -92,9 +112,11 @@ class SIPHandler(object):
         self.cfg = deepcopy(config)
         self._minter = minter
         if not serializer:
-            serializer = DefaultSerializer()
+            serializer = DefaultSerializer(config=self.cfg.get('serializer', {}))
         self._ser = serializer
+        self._teed = {}
         self._asupdate = asupdate
+        self._cksumr = ChecksumEngine(self.cfg.get('checksum', {}), log)
 
         self.workdir = self.cfg['working_dir']
         assert self.workdir
@@ -173,6 +195,15 @@ class SIPHandler(object):
         """
         raise NotImplementedError()
 
+    def estimate_size(self):
+        """
+        return an estimate of the amount of data (in bytes) that must be 
+        processed to preserve the SIP, or None if an estimate is not available.
+        A preservation service may use this to prioritize its requests.  This 
+        implementation always returns None.
+        """
+        return None
+
     @property
     def sipid(self):
         """
@@ -211,7 +242,7 @@ class SIPHandler(object):
         """
         self._status.update(state, message, cache)
 
-    def _serialize(self, bagdir, destdir, format=None):
+    def _serialize(self, bagdir, destdir, format=None, teedir=None):
         """
         serialize a given bag into a given destination directory.
 
@@ -223,6 +254,12 @@ class SIPHandler(object):
                                 must be a name recognized by the system.  
                                 If not provided a default serialization 
                                 will be applied (as given in the configuration).
+        :param teedir str:      a directory (usually the long-term storage directory)
+                                to simultaneously write copies of the serialized 
+                                bags to, if the serializer supports it.  The 
+                                hidden copies are recorded in self._teed (keyed 
+                                by the returned file paths) for later delivery 
+                                via _deliver_file().
         """
         srcbags = [ bagdir ]
 
@@ -244,12 +281,40 @@ class SIPHandler(object):
 
         self._status.data['user']['bagfiles'] = []
         outfiles = []
-        for bagd in srcbags:
-            bagfile = self._ser.serialize(bagd, destdir, format)
+
+        # checksum each bag file (in the background, if so configured) while 
+        # the next one is being serialized--unless the serializer calculated it
+        # while writing it.  If so configured, member bags are serialized in 
+        # parallel.
+        workers = mbcfg.get('serialize_workers', 1)
+        if not isinstance(workers, int):
+            raise ConfigurationException("multibag.serialize_workers: not an integer: "+
+                                         str(workers))
+        workers = min(workers, len(srcbags))
+        if workers > 1:
+            csums = self._serialize_members(srcbags, destdir, format, teedir, workers)
+        else:
+            csums = OrderedDict()
+            batch = self._cksumr.batch()
+            try:
+                for bagd in srcbags:
+                    (bagfile, csum, teefile) = \
+                        self._ser.serialize_and_checksum(bagd, destdir, format,
+                                                         teedir=teedir)
+                    csums[bagfile] = csum
+                    if teefile:
+                        self._teed[bagfile] = teefile
+                    if not csum:
+                        batch.submit(bagfile)
+            except Exception:
+                batch.close()
+                raise
+            csums.update(batch.results('sha256'))
+
+        for bagfile, csum in csums.items():
             outfiles.append(bagfile)
 
             csumfile = bagfile + ".sha256"
-            csum = checksum_of(bagfile)
             with open(csumfile, 'w') as fd:
                 fd.write(csum)
                 fd.write('\n')
@@ -273,6 +338,48 @@ class SIPHandler(object):
         
         return outfiles
 
+    def _serialize_members(self, srcbags, destdir, format, teedir, workers):
+        """
+        serialize and checksum the given (multibag member) bags concurrently with a 
+        pool of processes.  
+
+        :return OrderedDict:  the output bag files mapped to their SHA-256 checksums,
+                              in the same order as srcbags (so that the head bag 
+                              remains last).
+        """
+        log.info("Serializing %d bags using %d processes", len(srcbags), workers)
+        pool = multiprocessing.Pool(workers)
+        try:
+            jobs = [pool.apply_async(_serialize_member,
+                                     [(self._ser, bagd, destdir, format, teedir)])
+                    for bagd in srcbags]
+            pool.close()
+
+            # let all jobs finish (so that no copies are still being written to 
+            # teedir) before collecting the results
+            pool.join()
+        except:
+            pool.terminate()
+            raise
+
+        csums = OrderedDict()
+        failure = None
+        for bagd, job in zip(srcbags, jobs):
+            try:
+                (bagfile, csum, teefile) = job.get()
+            except Exception as ex:
+                log.error("Failed to serialize %s: %s", os.path.basename(bagd), str(ex))
+                if not failure:
+                    failure = ex
+                continue
+            csums[bagfile] = csum
+            if teefile:
+                self._teed[bagfile] = teefile
+
+        if failure:
+            raise failure
+        return csums
+
     def _serialize_restricted(self, headbagdir, aipid, destdir, format=None, workdir=None):
         """
         serialize a given bag for distribution through the restricted public gateway.
@@ -336,9 +443,10 @@ class SIPHandler(object):
 
         restore_bag(headbagdir, outbag, destdir, fetch)
 
-        bagfile = self._ser.serialize(outbag, destdir, format)
+        (bagfile, csum, teefile) = self._ser.serialize_and_checksum(outbag, destdir, format)
         csumfile = bagfile + ".sha256"
-        csum = checksum_of(bagfile)
+        if not csum:
+            csum = self._cksumr.checksum_of(bagfile, 'sha256')
         with open(csumfile, 'w') as fd:
             fd.write(csum)
             fd.write('\n')
@@ -352,6 +460,38 @@ class SIPHandler(object):
         
         return [bagfile, csumfile]
 
+    def _store_catalog(self, storedir):
+        """
+        return the catalog of the bags in the given store directory
+        """
+        return catalog_for(storedir, self.cfg.get('store_catalog_dir'))
+
+    def _deliver_file(self, srcfile, destdir):
+        """
+        copy a serialized bag file into the given destination (long-term storage)
+        directory.  If a copy was already written there during serialization 
+        (see _serialize()), that copy is simply renamed into place.
+        """
+        teefile = self._teed.pop(srcfile, None)
+        if teefile and os.path.isfile(teefile) and \
+           os.path.abspath(os.path.dirname(teefile)) == os.path.abspath(destdir):
+            os.rename(teefile, os.path.join(destdir, os.path.basename(srcfile)))
+        else:
+            shutil.copy(srcfile, destdir)
+
+    def _discard_teed_files(self):
+        """
+        remove any copies of serialized bag files written during serialization that 
+        were not delivered.
+        """
+        for teefile in self._teed.values():
+            try:
+                if os.path.exists(teefile):
+                    os.remove(teefile)
+            except OSError as ex:
+                log.warn("Unable to remove undelivered bag copy, %s: %s", teefile, str(ex))
+        self._teed = {}
+
     def _is_ingested(self):
         """
         return True if some version of this SIP has been ingested into the PDR already.
@@ -491,10 +631,15 @@ class MIDASSIPHandler(SIPHandler):
             bgrcfg['store_dir'] = config['store_dir']
         if 'restricted_store_dir' not in bgrcfg and 'restricted_store_dir' in config:
             bgrcfg['restricted_store_dir'] = config['restricted_store_dir']
+        if 'store_catalog_dir' not in bgrcfg and 'store_catalog_dir' in config:
+            bgrcfg['store_catalog_dir'] = config['store_catalog_dir']
         if 'repo_access' not in bgrcfg and 'repo_access' in config:
             bgrcfg['repo_access'] = config['repo_access']
             if 'store_dir' not in bgrcfg['repo_access'] and 'store_dir' in bgrcfg:
                 bgrcfg['repo_access']['store_dir'] = bgrcfg['store_dir']
+            if 'store_catalog_dir' not in bgrcfg['repo_access'] and \
+               'store_catalog_dir' in bgrcfg:
+                bgrcfg['repo_access']['store_catalog_dir'] = bgrcfg['store_catalog_dir']
             if 'restricted_store_dir' not in bgrcfg['repo_access'] and 'restricted_store_dir' in bgrcfg:
                 bgrcfg['repo_access']['restricted_store_dir'] = bgrcfg['restricted_store_dir']
             
@@ -647,6 +792,8 @@ class MIDASSIPHandler(SIPHandler):
                 shutil.copy(f, destdir)
                 saved.append(f)
 
+            self._store_catalog(destdir).record_delivery(saved)
+
         except OSError, ex:
             log.error("Failed to copy preservation file: %s\n" +
                       "  to long-term storage: %s", f, destdir)
@@ -791,8 +938,7 @@ class MIDASSIPHandler(SIPHandler):
         """
         # look for files in the serialized bag store with names that start
         # with the SIP identifier
-        return len([f for f in os.listdir(self.storedir)
-                      if f.startswith(self.bagger.name+'.')]) > 0
+        return self._store_catalog(self.storedir).has_aip(self.bagger.name)
     
 class MIDAS3SIPHandler(SIPHandler):
     """
@@ -825,6 +971,11 @@ class MIDAS3SIPHandler(SIPHandler):
                                  PreservationBagger instance used to create the
                                  output bag.  
     :prop review_dir str #req:  an existing directory containing MIDAS SIPs
+    :prop tee_to_store bool (False):  if True and the serializer supports it (see 
+                                 the 'serializer' property's 'native_zip'), the 
+                                 serialized bags are written to the long-term 
+                                 storage directory at the same time they are 
+                                 written to the staging directory.
     
     """
     name = "MIDAS3-SIP"
@@ -893,10 +1044,15 @@ class MIDAS3SIPHandler(SIPHandler):
             bgrcfg['store_dir'] = config['store_dir']
         if 'restricted_store_dir' not in bgrcfg and 'restricted_store_dir' in config:
             bgrcfg['restricted_store_dir'] = config['restricted_store_dir']
+        if 'store_catalog_dir' not in bgrcfg and 'store_catalog_dir' in config:
+            bgrcfg['store_catalog_dir'] = config['store_catalog_dir']
         if 'repo_access' not in bgrcfg and 'repo_access' in config:
             bgrcfg['repo_access'] = config['repo_access']
             if 'store_dir' not in bgrcfg['repo_access'] and 'store_dir' in bgrcfg:
                 bgrcfg['repo_access']['store_dir'] = bgrcfg['store_dir']
+            if 'store_catalog_dir' not in bgrcfg['repo_access'] and \
+               'store_catalog_dir' in bgrcfg:
+                bgrcfg['repo_access']['store_catalog_dir'] = bgrcfg['store_catalog_dir']
 
         isrel = bgrcfg.get('relative_to_indir')
         bagparent = self.cfg.get('bagparent_dir')
@@ -998,6 +1154,15 @@ class MIDAS3SIPHandler(SIPHandler):
                                cache=(self.state == status.NOT_READY))
             
         return True
+
+    def estimate_size(self):
+        """
+        return the total size (in bytes) of the files in the SIP's data 
+        directory, or None if that directory does not exist.
+        """
+        if not self.datadir or not os.path.isdir(self.datadir):
+            return None
+        return measure_dir_size(self.datadir)[0]
                 
     def bagit(self, serialtype=None, destdir=None, params=None):
         """
@@ -1085,14 +1250,22 @@ class MIDAS3SIPHandler(SIPHandler):
             aipid = re.sub(r'^ark:/\d+/', '', nerdm['ediid'])
             savefiles += self._serialize_restricted(bagdir, aipid, self.stagedir, serialtype)
 
-        # zip it up; this may split the bag into multibags
-        savefiles += self._serialize(bagdir, self.stagedir, serialtype)
-
-        # copy the zipped files to long-term storage ("public" or "restricted-public" directory)
+        # determine the long-term storage ("public" or "restricted-public" directory)
         if not destdir:
             destdir = self.storedir
             if nerdm.get('accessLevel', 'public') != 'public':
                 destdir = self.cfg['restricted_store_dir']
+
+        # zip it up; this may split the bag into multibags.  If so configured (and
+        # supported by the serializer), copies are written to storage at the same time.
+        teedir = (self.cfg.get('tee_to_store', False) and destdir) or None
+        try:
+            savefiles += self._serialize(bagdir, self.stagedir, serialtype, teedir)
+        except Exception:
+            self._discard_teed_files()
+            raise
+
+        # copy the zipped files to long-term storage
         self._status.record_progress("Delivering preservation artifacts")
         log.debug("writing files to %s", destdir)
         errors = []
@@ -1105,9 +1278,13 @@ class MIDAS3SIPHandler(SIPHandler):
                    bagutils.is_legal_bag_name(re.sub(r'.sha256$', '', os.path.basename(f))):
                     raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), destfile)
 
-                shutil.copy(f, destdir)
+                self._deliver_file(f, destdir)
                 saved.append(f)
+
+            self._store_catalog(destdir).record_delivery(saved)
+
         except OSError, ex:
+            self._discard_teed_files()
             log.error("Failed to copy preservation file: %s\n" +
                       "  to long-term storage: %s", f, destdir)
             log.exception("Reason: %s", str(ex))
@@ -1264,8 +1441,8 @@ class MIDAS3SIPHandler(SIPHandler):
                           "dir:\n  %s\nReason: %s", f, str(ex))
 
         if self.cfg.get('signal_done'):
-            requests.get(self.cfg.get('signal_done'),
-                         headers={'Authorization': "Bearer "+self.cfg.get('auth_key')})
+            get_session().get(self.cfg.get('signal_done'),
+                              headers={'Authorization': "Bearer "+self.cfg.get('auth_key')})
 
         log.info("Completed preservation of SIP %s", self.bagger.name)
 
@@ -1296,10 +1473,7 @@ class MIDAS3SIPHandler(SIPHandler):
         # there may be additional bags that have been copied to local LTS but which have
         # not yet migrated to the AWS bucket that the distribution service sees; merge in
         # the bags/versions found locally.
-        pfx = aipid+"."
-        localbags = [bagutils.BagName(b) for b in os.listdir(destdir)
-                                         if b.startswith(pfx) and bagutils.is_legal_bag_name(b)
-                                                              and not b.endswith(".sha256")]
+        localbags = [bagutils.BagName(b) for b in self._store_catalog(destdir).bag_files(aipid)]
         rmvers.update([b.version for b in localbags if b.version.startswith(majver)])
 
         def touch_file(filepath):
@@ -1337,7 +1511,7 @@ class MIDAS3SIPHandler(SIPHandler):
 
         # look for files in the serialized bag store with names that start
         # with the SIP identifier
-        return len([f for f in os.listdir(self.storedir) if f.startswith(bagname+'.')]) > 0
+        return self._store_catalog(self.storedir).has_aip(bagname)
     
     def _midasid_to_bagname(self, id):
         return midasid_to_bagname(id)
@@ -1346,6 +1520,21 @@ class MIDAS3SIPHandler(SIPHandler):
         return _midadid_to_dirname(id)
 
 
+def _serialize_member(args):
+    # serialize and checksum a single bag; this is run in a separate process via
+    # SIPHandler._serialize_members()
+    (serializer, bagdir, destdir, format, teedir) = args
+    try:
+        (bagfile, csum, teefile) = \
+            serializer.serialize_and_checksum(bagdir, destdir, format, teedir=teedir)
+        if not csum:
+            csum = _checksum_of(bagfile, 'sha256')
+        return (bagfile, csum, teefile)
+    except Exception as ex:
+        # ensure that the error can be passed back to the parent process
+        raise BagSerializationError("Failed to serialize bag: " + str(ex),
+                                    os.path.basename(bagdir))
+
 def _explain_error(ex):
     if hasattr(ex, 'errdata') and hasattr(ex.errdata, 'explain'):
         return ex.errdata.explain()
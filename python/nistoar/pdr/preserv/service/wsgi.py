@@ -13,6 +13,7 @@ from .service import (ThreadedPreservationService, RerequestException,
                       ConfigurationException, PreservationStateError)
 from . import status
 from .. import PreservationSystem
+from ... import sessions
 
 log = logging.getLogger(PreservationSystem().subsystem_abbrev).getChild("preserve")
 
@@ -30,6 +31,10 @@ class PreservationRequestApp(object):
             raise ConfigurationException("Missing required config param: "+
                                          key)
 
+        # set the connection pooling and retry policy for service clients
+        if 'http_session' in config:
+            sessions.configure(config['http_session'])
+
         self.preserv = ThreadedPreservationService(config)
         self.siptype = 'midas'
         authkey = config.get('auth_key')
@@ -8,7 +8,7 @@ from nistoar.pdr.exceptions import ConfigurationException, PDRException, PDRServ
 from nistoar.pdr.preserv.bagit import NISTBag, BagBuilder
 from nistoar.pdr.cli import PDRCommandFailure
 from nistoar.pdr import def_schema_dir
-from nistoar.nerdm.validate import validate
+from nistoar.pdr.schemas import validate
 import nistoar.pdr.preserv.bagit.validate as vald8
 from . import define_pub_opts, determine_bag_path
 
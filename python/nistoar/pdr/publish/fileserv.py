@@ -0,0 +1,234 @@
+"""
+Support for sending data files from a WSGI application.
+
+The web services that provide access to files before publication normally hand off the
+delivery of files to the front-end web server (via nginx's X-Accel-Redirect header).  When
+that is not set up (e.g. in review and test deployments), the application must send the
+file itself.  A :class:`FileSender` does this efficiently:  it lets the WSGI server send
+whole files via ``wsgi.file_wrapper`` (which servers like uwsgi implement with the
+sendfile system call), it supports single- and multi-range requests (via the HTTP
+``Range`` header, returning ``206 Partial Content``), and it provides ``Last-Modified``
+and ``ETag`` validators so that clients can make conditional requests and resume
+interrupted downloads (via ``If-Range``).
+"""
+import os, re
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+DEF_BLOCK_SIZE = 1024 * 1024
+
+# more ranges than this in a single request are ignored (the whole file is sent)
+MAX_RANGES = 50
+
+_rangespec_re = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+def parse_range(header, size):
+    """
+    interpret the value of an HTTP Range header requesting bytes from a file.
+
+    :param str header:  the value of the Range header
+    :param int size:    the size of the file in bytes
+    :return:  None if the header cannot be interpreted (and so should be ignored), or a
+              list of (first, last) tuples giving the inclusive byte positions of the
+              satisfiable ranges requested (which will be empty if none are
+              satisfiable).
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    specs = specs.split(',')
+    if len(specs) > MAX_RANGES:
+        return None
+
+    out = []
+    for spec in specs:
+        m = _rangespec_re.match(spec)
+        if not m or not (m.group(1) or m.group(2)):
+            return None
+        if not m.group(1):
+            # a suffix range: the last N bytes
+            n = int(m.group(2))
+            if n > 0 and size > 0:
+                out.append((max(size - n, 0), size - 1))
+            continue
+        first = int(m.group(1))
+        last = size - 1
+        if m.group(2):
+            last = int(m.group(2))
+            if last < first:
+                return None
+            last = min(last, size - 1)
+        if first < size:
+            out.append((first, last))
+    return out
+
+def _parse_date(value):
+    try:
+        return mktime_tz(parsedate_tz(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+def make_etag(mtime, size, variant=None):
+    """
+    return an entity tag (including its surrounding quotes) for a resource based on the
+    modification time (to the microsecond) and size of the file it is derived from.
+
+    :param float mtime:  the file's modification time (in epoch seconds)
+    :param int size:     the file's size
+    :param str variant:  a string identifying any other state that the resource is
+                         derived from (e.g. when the resource is a transformation of
+                         the file); if provided, it is included in the tag.
+    """
+    out = "{0:x}-{1:x}".format(int(mtime * 1000000), size)
+    if variant:
+        out += "-" + variant
+    return '"' + out + '"'
+
+def not_modified(wsgienv, etag, mtime):
+    """
+    return True if the conditional headers of a request (If-None-Match or, in its
+    absence, If-Modified-Since) indicate that the client's copy of a resource with the
+    given validators is current.
+
+    :param dict wsgienv:  the WSGI environment of the request
+    :param str etag:      the resource's current entity tag
+    :param mtime:         the resource's last modification time (in epoch seconds)
+    """
+    inm = wsgienv.get('HTTP_IF_NONE_MATCH')
+    if inm:
+        tags = [t.strip() for t in inm.split(',')]
+        return '*' in tags or etag in tags or ('W/'+etag) in tags
+    ims = wsgienv.get('HTTP_IF_MODIFIED_SINCE')
+    if ims:
+        since = _parse_date(ims)
+        return since is not None and int(mtime) <= since
+    return False
+
+class FileSender(object):
+    """
+    a preparer of an HTTP response delivering a file in answer to a GET or HEAD request.
+
+    On construction, the sender examines the file and the request's headers to determine
+    the response's status (``code`` and ``reason``) and ``headers``; the caller should
+    include these in its response before returning the response's content from
+    :meth:`body`.
+    """
+
+    def __init__(self, filepath, wsgienv, mediatype="application/octet-stream",
+                 blocksize=DEF_BLOCK_SIZE):
+        """
+        :param str filepath:   the path to the file to send
+        :param dict wsgienv:   the WSGI environment of the request
+        :param str mediatype:  the MIME type of the file's contents
+        :param int blocksize:  the number of bytes to read from the file at a time
+        """
+        self.filepath = filepath
+        self.mediatype = str(mediatype)
+        self.blocksize = blocksize
+        self._env = wsgienv
+
+        st = os.stat(filepath)
+        self.size = st.st_size
+        self.etag = make_etag(st.st_mtime, st.st_size)
+        self.modified = formatdate(int(st.st_mtime), usegmt=True)
+        self._mtime = int(st.st_mtime)
+
+        self.ranges = None
+        self.boundary = None
+        self.headers = [
+            ("Accept-Ranges", "bytes"),
+            ("ETag", self.etag),
+            ("Last-Modified", self.modified)
+        ]
+        self._prepare()
+
+    def _prepare(self):
+        if not_modified(self._env, self.etag, self._mtime):
+            self.code, self.reason = 304, "Not Modified"
+            return
+
+        if self._env.get('REQUEST_METHOD', 'GET') in ('GET', 'HEAD') and \
+           self._range_applies():
+            self.ranges = parse_range(self._env.get('HTTP_RANGE'), self.size)
+
+        if self.ranges is None:
+            self.code, self.reason = 200, "OK"
+            self.headers += [("Content-Type", self.mediatype),
+                             ("Content-Length", str(self.size))]
+
+        elif len(self.ranges) == 0:
+            self.code, self.reason = 416, "Requested Range Not Satisfiable"
+            self.headers += [("Content-Range", "bytes */{0}".format(self.size)),
+                             ("Content-Length", "0")]
+
+        elif len(self.ranges) == 1:
+            self.code, self.reason = 206, "Partial Content"
+            first, last = self.ranges[0]
+            self.headers += [("Content-Type", self.mediatype),
+                             ("Content-Range", self._content_range(first, last)),
+                             ("Content-Length", str(last - first + 1))]
+
+        else:
+            self.code, self.reason = 206, "Partial Content"
+            self.boundary = "{0:x}{1:x}".format(self._mtime, id(self))
+            self.headers += [
+                ("Content-Type", "multipart/byteranges; boundary="+self.boundary),
+                ("Content-Length", str(sum(len(self._part_header(f, l)) + l - f + 1
+                                           for f, l in self.ranges) +
+                                       len(self._closing())))
+            ]
+
+    def _range_applies(self):
+        # return False if an If-Range header indicates that the client's partial copy
+        # is out of date (so that the whole file should be sent)
+        ifrange = self._env.get('HTTP_IF_RANGE')
+        if not ifrange:
+            return True
+        ifrange = ifrange.strip()
+        if ifrange.startswith('"') or ifrange.startswith('W/'):
+            return ifrange == self.etag
+        since = _parse_date(ifrange)
+        return since is not None and self._mtime <= since
+
+    def _content_range(self, first, last):
+        return "bytes {0}-{1}/{2}".format(first, last, self.size)
+
+    def _part_header(self, first, last):
+        return "\r\n--{0}\r\nContent-Type: {1}\r\nContent-Range: {2}\r\n\r\n".\
+               format(self.boundary, self.mediatype, self._content_range(first, last))
+
+    def _closing(self):
+        return "\r\n--{0}--\r\n".format(self.boundary)
+
+    def body(self):
+        """
+        return an iterable over the content of the response.  When the whole file is
+        being sent, the WSGI server's file_wrapper is used if it is available.
+        """
+        if self.code not in (200, 206):
+            return []
+        if self.ranges is None and 'wsgi.file_wrapper' in self._env:
+            return self._env['wsgi.file_wrapper'](open(self.filepath, 'rb'),
+                                                  self.blocksize)
+        return self._iter_ranges()
+
+    def _iter_ranges(self):
+        ranges = self.ranges
+        if ranges is None:
+            ranges = [(0, self.size - 1)]
+        with open(self.filepath, 'rb') as fd:
+            for first, last in ranges:
+                if self.boundary:
+                    yield self._part_header(first, last)
+                fd.seek(first)
+                left = last - first + 1
+                while left > 0:
+                    buf = fd.read(min(left, self.blocksize))
+                    if not buf:
+                        break
+                    left -= len(buf)
+                    yield buf
+            if self.boundary:
+                yield self._closing()
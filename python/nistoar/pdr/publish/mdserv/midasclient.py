@@ -9,6 +9,7 @@ import requests
 
 from ...exceptions import (PDRException, PDRServiceException, PDRServerError,
                            ConfigurationException)
+from ...sessions import get_session
 
 _arkpre = re.compile(r'^ark:/\d+/')
 def _stripark(id):
@@ -51,6 +52,7 @@ class MIDASClient(object):
         if not logger:
             logger = logging.getLogger("MIDASClient")
         self.log = logger
+        self._sesscfg = self.cfg.get('http_session')
 
     def _get_json(self, relurl, resp):
         try:
@@ -102,7 +104,7 @@ class MIDASClient(object):
         try:
             self.log.debug("Retrieving latest POD record from MIDAS for rec="
                            +midasrecn);
-            resp = requests.get(self.baseurl + midasrecn, headers=hdrs)
+            resp = get_session(self._sesscfg).get(self.baseurl + midasrecn, headers=hdrs)
             return self._extract_pod(self._get_json(midasrecn, resp), midasrecn)
         except requests.RequestException as ex:
             raise MIDASServerError(midasrecn, cause=ex)
@@ -131,7 +133,7 @@ class MIDASClient(object):
             self.log.debug("Submitting POD record update to MIDAS for rec="
                            +midasrecn);
             data = {"dataset": pod}
-            resp = requests.put(self.baseurl+midasrecn, json=data,
+            resp = get_session(self._sesscfg).put(self.baseurl+midasrecn, json=data,
                                 headers=hdrs)
             return self._extract_pod(self._get_json(midasrecn, resp), midasrecn)
         except requests.RequestException as ex:
@@ -156,7 +158,7 @@ class MIDASClient(object):
             self.log.warn("No Authorization header included!")
         
         try:
-            resp = requests.post(url, headers=hdrs, json={'user': userid})
+            resp = get_session(self._sesscfg).post(url, headers=hdrs, json={'user': userid})
             if resp.status_code == 200:
                 body = resp.json()
                 if ("editable" in body):
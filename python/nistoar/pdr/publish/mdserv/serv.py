@@ -14,8 +14,8 @@ from ...preserv.bagger import (MIDASMetadataBagger, UpdatePrepService,
                                midasid_to_bagname)
 from ...preserv.bagit import NISTBag, BagBuilder
 from ...utils import build_mime_type_map, read_nerd
+from ... import schemas
 from ....id import PDRMinter
-from ....nerdm import validate_nerdm
 from ....nerdm.convert import Res2PODds
 from .... import pdr
 from . import midasclient as midas
@@ -533,7 +533,7 @@ class PrePubMetadataService(PublishSystem):
                                              "exist as a directory: " +
                                              self._schemadir)
 
-        return [str(e) for e in validate_nerdm(nerdm, self._schemadir)]
+        return [str(e) for e in schemas.validate(nerdm, self._schemadir)]
         
                                            
     def locate_data_file(self, id, filepath):
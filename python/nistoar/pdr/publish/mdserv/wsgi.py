@@ -13,6 +13,7 @@ from .. import PublishSystem
 from .serv import (PrePubMetadataService, SIPDirectoryNotFound, IDNotFound,
                    ConfigurationException, StateException, InvalidRequest)
 from . import midasclient as midas
+from ..fileserv import FileSender
 from ... import ARK_NAAN
 
 log = logging.getLogger(PublishSystem().subsystem_abbrev).getChild("mdserv")
@@ -228,6 +229,7 @@ class Handler(object):
         if not loc:
             self.send_error(404, "Dataset (ID={0}) does not contain file={1}".
                                  format(id, filepath))
+            return []
 
         xsend = None
         prfx = [p for p in self._fmap.keys() if loc.startswith(p+'/')]
@@ -235,22 +237,26 @@ class Handler(object):
             xsend = self._fmap[prfx[0]] + loc[len(prfx[0]):]
             log.debug("Sending file via X-Accel-Redirect: %s", xsend)
 
-        self.set_response(200, "Data file found")
-        self.add_header('Content-Type', mtype)
+        sender = None
+        if xsend:
+            self.set_response(200, "Data file found")
+            self.add_header('Content-Type', mtype)
+        else:
+            sender = FileSender(loc, self._env, mtype)
+            if sender.code == 200:
+                self.set_response(200, "Data file found")
+            else:
+                self.set_response(sender.code, sender.reason)
+            for name, value in sender.headers:
+                self.add_header(name, value)
         self.add_header('Content-Disposition', os.path.basename(filepath))
         if xsend:
             self.add_header('X-Accel-Redirect', xsend)
         self.end_headers()
 
-        if xsend:
+        if xsend or self._meth == "HEAD":
             return []
-        return self.iter_file(loc)
-
-    def iter_file(self, loc):
-        # this is the backup, inefficient way to send a file
-        with open(loc, 'rb') as fd:
-            buf = fd.read(5000000)
-            yield buf
+        return sender.body()
 
     def test_permission(self, dsid, action, user=None):
         def answer(data):
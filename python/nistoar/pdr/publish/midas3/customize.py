@@ -9,6 +9,7 @@ import requests
 
 from ...exceptions import (PDRServiceException, PDRServiceAuthFailure, PDRServerError,
                            PDRServiceClientError, IDNotFound, ConfigurationException)
+from ...sessions import get_session
 
 class CustomizationServiceClient(object):
     """
@@ -37,6 +38,7 @@ class CustomizationServiceClient(object):
         if not logger:
             logger = logging.getLogger("CustomizationClient")
         self.log = logger
+        self._sesscfg = self.cfg.get('http_session')
 
     def _get_json(self, relurl, resp):
         svcnm = self._service_name
@@ -93,7 +95,7 @@ class CustomizationServiceClient(object):
         resp = None
         try:
             self.log.debug("Retrieving draft NERDm record from customization service for id="+id)
-            resp = requests.get(self.baseurl + id + args, headers=self._headers())
+            resp = get_session(self._sesscfg).get(self.baseurl + id + args, headers=self._headers())
             return self._get_json(id, resp)
         except requests.RequestException as ex:
             raise PDRServerError(svcnm, id, cause=ex)
@@ -106,7 +108,7 @@ class CustomizationServiceClient(object):
         id = self._arkprfx.sub('', id)
         try:
             self.log.debug("Deleting draft NERDm record from customization service for id="+id)
-            resp = requests.delete(self.baseurl + id, headers=self._headers())
+            resp = get_session(self._sesscfg).delete(self.baseurl + id, headers=self._headers())
             if resp.status_code >= 500:
                 raise PDRServerError(svcnm, relurl, resp.status_code, resp.reason)
             if resp.status_code == 404:
@@ -137,7 +139,7 @@ class CustomizationServiceClient(object):
         resp = None
         try:
             self.log.debug("Creating draft in customization service for id="+ nerdm['ediid'])
-            resp = requests.put(self.baseurl + id, json=nerdm,
+            resp = get_session(self._sesscfg).put(self.baseurl + id, json=nerdm,
                                 headers=self._headers())
 
             if resp.status_code >= 500:
@@ -164,7 +166,7 @@ class CustomizationServiceClient(object):
         svcnm = self._service_name
         id = self._arkprfx.sub('', id)
         try:
-            resp = requests.head(self.baseurl + id, headers=self._headers())
+            resp = get_session(self._sesscfg).head(self.baseurl + id, headers=self._headers())
             if resp.status_code == 404:
                 return False
             if resp.status_code == 200:
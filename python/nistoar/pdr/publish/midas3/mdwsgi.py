@@ -6,11 +6,12 @@ the MIDAS3 convention, the MIDAS3PublishingService handles updates to the metada
 This web service provides the public access to the metadata and the data files provided 
 by the author to MIDAS.  
 """
-import os, sys, logging, json, re, urllib
+import os, sys, logging, json, re, urllib, threading
 from wsgiref.headers import Headers
 from cgi import parse_qs, escape as escape_qp
 from collections import OrderedDict
 from cStringIO import StringIO
+from email.utils import formatdate
 
 from .. import PublishSystem
 from ...exceptions import (SIPDirectoryNotFound, IDNotFound,
@@ -18,7 +19,9 @@ from ...exceptions import (SIPDirectoryNotFound, IDNotFound,
 from ...utils import read_json, build_mime_type_map
 from . import midasclient as midas
 from ..readme import ReadmeGenerator
+from ..fileserv import FileSender, make_etag, not_modified
 from ...preserv.bagger.midas3 import MIDASSIP
+from ...preserv.bagger import srcindex
 from ... import ARK_NAAN
 
 pdrsys = PublishSystem()
@@ -27,11 +30,74 @@ log = logging.getLogger(pdrsys.system_abbrev)   \
              .getChild("m3mdserv")
 
 DEF_BASE_PATH = "/midas/"
+DEF_RECORD_CACHE_SIZE = 100
+
+class RecordCache(object):
+    """
+    an in-memory, least-recently-used cache of the serialized NERDm records served by 
+    the MIDAS3DataAccessApp (after their download URLs have been transformed).  Each 
+    record is keyed by the path to the file it was read from and is reused only as 
+    long as that file's modification time and size are unchanged.  (As the 
+    transformation also depends on the files found in the SIP's input directories, 
+    the MIDAS3DataAccessApp caches, along with the record, the stamp of those 
+    directories (see srcindex.stamp_for()) that it must also check.)
+    """
+
+    def __init__(self, size=DEF_RECORD_CACHE_SIZE):
+        """
+        :param int size:  the maximum number of records to hold; a value of zero or 
+                          less turns off caching.
+        """
+        self.size = size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, mdfile, stamp):
+        """
+        return the cached serialization of the record read from the given file, or 
+        None if it is not cached or the file has since changed.
+
+        :param str mdfile:  the path to the record's file
+        :param tuple stamp: the file's current (modification time, size)
+        """
+        with self._lock:
+            cached = self._cache.pop(mdfile, None)
+            if cached is None:
+                return None
+            if cached[0] != stamp:
+                return None
+            self._cache[mdfile] = cached    # mark as recently used
+            return cached[1]
+
+    def put(self, mdfile, stamp, data):
+        """
+        cache the serialization of the record read from the given file.
+        """
+        with self._lock:
+            if self.size <= 0:
+                return
+            self._cache.pop(mdfile, None)
+            self._cache[mdfile] = (stamp, data)
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        """
+        remove all cached records
+        """
+        with self._lock:
+            self._cache.clear()
 
 class MIDAS3DataAccessApp(object):
     """
     A WSGI-compliant service app for accessing data and metadata associated with a
     Submission Information Package (SIP).
+
+    In addition to the directory and service settings, this app supports the following
+    configuration property:
+
+    :prop record_cache_size int (100):  the maximum number of (transformed) metadata
+                               records to cache in memory; zero turns off caching.
     """
     def __init__(self, config):
         self.cfg = config
@@ -84,6 +150,8 @@ class MIDAS3DataAccessApp(object):
         mimefiles = self.cfg.get('mimetype_files', [])
         self.mimetypes = build_mime_type_map(mimefiles)
 
+        self.records = RecordCache(self.cfg.get('record_cache_size', DEF_RECORD_CACHE_SIZE))
+
     def handle_request(self, env, start_resp):
         handler = Handler(self, env, start_resp)
         return handler.handle()
@@ -272,21 +340,32 @@ class Handler(object):
         return self.test_permission(dsid, parts[1], query.get('user'))
         
             
+    def find_metadata_file(self, dsid):
+        """
+        return the path to the file containing the metadata record for the given ID, 
+        or None if it is not found.  A record found in the post-publication directory
+        takes precedence over one in the pre-publication directory.
+        """
+        out = None
+        for dir in self._dirs:
+            if not dir:
+                continue
+            mdfile = os.path.join(dir, dsid+".json")
+            if os.path.isfile(mdfile):
+                out = mdfile
+        return out
+
     def get_metadata(self, dsid):
         mdata = None
-        mdfile = None
-        try:
-            for dir in self._dirs:
-                if not dir:
-                    continue
-                mdfile = os.path.join(dir, dsid+".json")
-                if os.path.isfile(mdfile):
-                    mdata = read_json(mdfile)
-                    log.info("Retrieving metadata record for id=%s from %s", dsid, mdfile)
-
-        except ValueError as ex:
-            log.exception("Internal error while parsing JSON file, %s: %s", mdfile, str(ex))
-            raise ex
+        mdfile = self.find_metadata_file(dsid)
+        if mdfile:
+            try:
+                mdata = read_json(mdfile)
+                log.info("Retrieving metadata record for id=%s from %s", dsid, mdfile)
+            except ValueError as ex:
+                log.exception("Internal error while parsing JSON file, %s: %s",
+                              mdfile, str(ex))
+                raise ex
 
         return mdata
 
@@ -322,51 +401,85 @@ class Handler(object):
         
     def send_metadata(self, dsid):
 
-        mdata = None
+        out = None
         try:
-            mdata = self.get_metadata(dsid)
-            if mdata is None:
+            mdfile = self.find_metadata_file(dsid)
+            if not mdfile:
                 log.info("Metadata record not found for ID="+dsid)
                 return self.send_error(404,
                                        "Dataset with ID={0} not being edited".format(dsid))
+            st = os.stat(mdfile)
+
+            # the cached record is current only if neither the record file nor the
+            # set of files in the SIP's input directories has changed
+            stamp = (st.st_mtime, st.st_size)
+            cached = self.app.records.get(mdfile, stamp)
+            if cached is not None and cached[1] != srcindex.stamp_for(cached[0]):
+                cached = None
+            if cached is None:
+                mdata = read_json(mdfile)
+                log.info("Retrieving metadata record for id=%s from %s", dsid, mdfile)
+                sip = self._sip_for(mdata)
+                srcdirs = (sip and sip.input_dirs) or ()
+                srcstamp = srcindex.stamp_for(srcdirs)
+                mdata = self._transform_dlurls(mdata, sip)
+                out = json.dumps(mdata, indent=4, separators=(',', ': '))
+                cached = (srcdirs, srcstamp, out)
+                self.app.records.put(mdfile, stamp, cached)
+            out = cached[2]
+
+            # the client's copy may be current
+            etag = make_etag(st.st_mtime, st.st_size, cached[1])
+            if not_modified(self._env, etag, st.st_mtime):
+                self.set_response(304, "Not Modified")
+                self.add_header('ETag', etag)
+                self.end_headers()
+                return []
+
         except ValueError as ex:
+            log.exception("Internal error while parsing JSON file, %s: %s", mdfile, str(ex))
             return self.send_error(500, "Internal parsing error")
         except Exception as ex:
             log.exception("Internal error: "+str(ex))
             return self.send_error(500, "Internal error")
 
-        mdata = self._transform_dlurls(mdata)
-        out = json.dumps(mdata, indent=4, separators=(',', ': '))
-
         self.set_response(200, "Identifier found")
         self.add_header('Content-Type', 'application/json')
         self.add_header('Content-Length', str(len(out)))
+        self.add_header('ETag', etag)
+        self.add_header('Last-Modified', formatdate(int(st.st_mtime), usegmt=True))
         self.end_headers()
 
         return [ out ]
 
-    def _transform_dlurls(self, mdata):
+    def _sip_for(self, mdata):
+        # return the SIP that the given record describes, or None if it has no input
+        # directories
         try: 
-            sip = MIDASSIP.fromNERD(mdata, self.app.revdir, self.app.upldir)
-            datafiles = sip.registered_files()
-            
-            pat = self._distsvc
-            if self._baseurl and 'components' in mdata:
-                for comp in mdata['components']:
-                    # do a download URL substitution if 1) it looks like a
-                    # distribution service URL, and 2) the file exists in our
-                    # SIP areas.  
-                    if 'downloadURL' in comp and pat.search(comp['downloadURL']):
-                        # it matches
-                        filepath = comp.get('filepath', pat.sub('',comp['downloadURL']))
-                        if filepath in datafiles:
-                            # it exists
-                            comp['downloadURL'] = pat.sub(self._baseurl, comp['downloadURL'])
-
+            return MIDASSIP.fromNERD(mdata, self.app.revdir, self.app.upldir)
         except SIPDirectoryNotFound as ex:
             # (probably) because the record came from the post-pub cache
-            log.debug("NOTE: No SIP directories found for ID=%s", str(midas.get('ediid')))
-        
+            log.debug("NOTE: No SIP directories found for ID=%s", str(mdata.get('ediid')))
+            return None
+
+    def _transform_dlurls(self, mdata, sip):
+        if not sip:
+            return mdata
+        datafiles = sip.registered_files()
+            
+        pat = self._distsvc
+        if self._baseurl and 'components' in mdata:
+            for comp in mdata['components']:
+                # do a download URL substitution if 1) it looks like a
+                # distribution service URL, and 2) the file exists in our
+                # SIP areas.  
+                if 'downloadURL' in comp and pat.search(comp['downloadURL']):
+                    # it matches
+                    filepath = comp.get('filepath', pat.sub('',comp['downloadURL']))
+                    if filepath in datafiles:
+                        # it exists
+                        comp['downloadURL'] = pat.sub(self._baseurl, comp['downloadURL'])
+
         return mdata
 
     def send_datafile(self, id, filepath):
@@ -410,8 +523,18 @@ class Handler(object):
             xsend = self._fmap[prfx[0]] + loc[len(prfx[0]):]
             log.debug("Sending file via X-Accel-Redirect: %s", xsend)
 
-        self.set_response(200, "Data file found")
-        self.add_header('Content-Type', mtype)
+        sender = None
+        if xsend:
+            self.set_response(200, "Data file found")
+            self.add_header('Content-Type', mtype)
+        else:
+            sender = FileSender(loc, self._env, mtype)
+            if sender.code == 200:
+                self.set_response(200, "Data file found")
+            else:
+                self.set_response(sender.code, sender.reason)
+            for name, value in sender.headers:
+                self.add_header(name, value)
         outname = os.path.basename(filepath)
         try:
             outname.encode("ISO-8859-1")
@@ -430,15 +553,9 @@ class Handler(object):
                 self.add_header('X-Accel-Redirect', xsend)
         self.end_headers()
 
-        if xsend:
+        if xsend or self._meth == "HEAD":
             return []
-        return self.iter_file(loc)
-
-    def iter_file(self, loc):
-        # this is the backup, inefficient way to send a file
-        with open(loc, 'rb') as fd:
-            buf = fd.read(5000000)
-            yield buf
+        return sender.body()
 
     def test_permission(self, dsid, action, user=None):
         def answer(data):
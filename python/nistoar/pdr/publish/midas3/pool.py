@@ -0,0 +1,242 @@
+"""
+This module provides a fixed-size pool of threads that the MIDAS3 publishing service uses to
+process POD updates for many datasets at once.
+
+Work is submitted to the :class:`BaggingPool` by dataset identifier.  A dataset appears in the
+pool's queue at most once, no matter how many times work is submitted for it; the work function
+is responsible for draining whatever updates are pending for that dataset (e.g. the current/next
+POD files).  To keep a dataset with a long stream of updates from starving the others, the work
+function can do a limited amount of work per turn and indicate that more remains; the dataset
+is then returned to the back of the queue.
+"""
+import threading, time, logging
+from collections import deque, OrderedDict
+
+class WorkTicket(object):
+    """
+    a handle on the work being done for a particular dataset.  It supports the subset of the
+    ``threading.Thread`` interface--``is_alive()`` and ``join()``--that callers use to check
+    on and wait for a dataset's updates to be processed.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.thread = None
+        self._done = threading.Event()
+        self._done.set()
+
+    def is_alive(self):
+        """
+        return True if the dataset is either waiting in the queue or is being processed
+        """
+        return not self._done.is_set()
+
+    def join(self, timeout=None):
+        """
+        wait until the dataset's work is complete (i.e. it is no longer queued or in process).
+        """
+        self._done.wait(timeout)
+
+    def in_current_thread(self):
+        """
+        return True if the caller is running in the pool thread currently processing
+        this dataset.
+        """
+        return self.thread is threading.current_thread()
+
+class BaggingPool(object):
+    """
+    a fixed-size pool of threads that processes work for datasets in the order they were
+    submitted, giving each dataset a turn in round-robin fashion.
+
+    Threads are started as work becomes available (up to the maximum pool size) and exit when
+    the queue is empty.  The pool keeps running statistics on its queue depth and on the time
+    work spends waiting for and being processed by a thread; see :meth:`stats`.
+    """
+
+    def __init__(self, size=4, name="bagger", log=None):
+        """
+        :param int size:  the maximum number of threads that may be processing work at once
+        :param str name:  a name to use as a prefix for the names of pool threads
+        :param Logger log:  the logger to send messages to
+        """
+        if size < 1:
+            raise ValueError("BaggingPool: size must be a positive integer: "+str(size))
+        self.size = size
+        self.name = name
+        self.log = log
+        if not self.log:
+            self.log = logging.getLogger("BaggingPool")
+
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._queued = {}       # key -> (work function, time queued)
+        self._active = set()
+        self._again = set()     # keys resubmitted while they were active
+        self._tickets = {}      # key -> WorkTicket, for work queued or in process
+        self._threads = []
+        self._count = 0
+
+        self._stats = OrderedDict([
+            ("max_queue_depth", 0),
+            ("turns", 0),
+            ("failures", 0),
+            ("total_wait_time", 0.0),
+            ("max_wait_time", 0.0),
+            ("total_processing_time", 0.0),
+            ("max_processing_time", 0.0)
+        ])
+
+    def submit(self, key, work):
+        """
+        request that work be done for the dataset with the given key.  If the dataset is
+        already queued, it keeps its place; if it is currently being processed, it will be
+        queued again after its current turn.
+
+        :param str key:   the dataset's identifier
+        :param work:      a function that takes no arguments and does a turn's worth of
+                          work for the dataset.  It should return True if more work remains
+                          to be done.
+        :return WorkTicket:  a handle that can be used to wait for the work to be done
+        """
+        with self._cond:
+            ticket = self._tickets.get(key)
+            if not ticket:
+                ticket = WorkTicket(key)
+                self._tickets[key] = ticket
+            ticket._done.clear()
+
+            if key in self._active:
+                self._again.add(key)
+                self._queued[key] = (work, time.time())
+            elif key not in self._queued:
+                self._queued[key] = (work, time.time())
+                self._queue.append(key)
+                self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'],
+                                                     len(self._queue))
+                self._ensure_threads()
+            else:
+                # keep its place, but use the latest work function
+                self._queued[key] = (work, self._queued[key][1])
+
+            return ticket
+
+    def ticket_for(self, key):
+        """
+        return the WorkTicket for the dataset with the given key or None if no work is
+        currently queued or in process for it.
+        """
+        with self._cond:
+            return self._tickets.get(key)
+
+    def _ensure_threads(self):
+        # caller should hold self._cond
+        self._threads = [t for t in self._threads if t.is_alive()]
+        idle = len(self._threads) - len(self._active)
+        while len(self._queue) > idle and len(self._threads) < self.size:
+            self._count += 1
+            t = threading.Thread(target=self._run, name="%s-%d" % (self.name, self._count))
+            t.daemon = True
+            self._threads.append(t)
+            t.start()
+            idle += 1
+
+    def _next(self):
+        # pull the next key off the queue
+        with self._cond:
+            if not self._queue:
+                self._threads = [t for t in self._threads
+                                   if t is not threading.current_thread()]
+                return None
+            key = self._queue.popleft()
+            (work, queued) = self._queued.pop(key)
+            self._active.add(key)
+            self._tickets[key].thread = threading.current_thread()
+
+            wait = time.time() - queued
+            self._stats['total_wait_time'] += wait
+            self._stats['max_wait_time'] = max(self._stats['max_wait_time'], wait)
+            self.log.debug("%s: starting turn after waiting %.3f s (queue depth: %d)",
+                           key, wait, len(self._queue))
+            return (key, work)
+
+    def _finish(self, key, work, more):
+        with self._cond:
+            self._active.discard(key)
+            ticket = self._tickets[key]
+            ticket.thread = None
+            if key in self._again:
+                # resubmitted while it was being processed
+                self._again.discard(key)
+                more = True
+            if more:
+                if key not in self._queued:
+                    self._queued[key] = (work, time.time())
+                self._queue.append(key)
+                self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'],
+                                                     len(self._queue))
+            else:
+                # done; forget the ticket (holders of it can still check it)
+                ticket._done.set()
+                del self._tickets[key]
+
+    def _run(self):
+        while True:
+            nxt = self._next()
+            if not nxt:
+                return
+            (key, work) = nxt
+
+            more = False
+            start = time.time()
+            try:
+                more = bool(work())
+            except Exception as ex:
+                self.log.exception("%s: failure while processing work: %s", key, str(ex))
+                with self._cond:
+                    self._stats['failures'] += 1
+            finally:
+                dur = time.time() - start
+                with self._cond:
+                    self._stats['turns'] += 1
+                    self._stats['total_processing_time'] += dur
+                    self._stats['max_processing_time'] = max(self._stats['max_processing_time'],
+                                                             dur)
+                self._finish(key, work, more)
+
+    def queue_depth(self):
+        """
+        return the number of datasets waiting for a thread
+        """
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """
+        return a dictionary of statistics describing the pool's activity.  In addition to
+        running totals and maximums, this includes the current queue depth and number of
+        active threads as well as the mean waiting and processing times per turn.
+        """
+        with self._cond:
+            out = OrderedDict([
+                ("pool_size", self.size),
+                ("queue_depth", len(self._queue)),
+                ("active", len(self._active)),
+                ("threads", len([t for t in self._threads if t.is_alive()]))
+            ])
+            out.update(self._stats)
+            turns = self._stats['turns']
+            out['mean_wait_time'] = (turns and self._stats['total_wait_time'] / turns) or 0.0
+            out['mean_processing_time'] = \
+                (turns and self._stats['total_processing_time'] / turns) or 0.0
+            return out
+
+    def join(self, timeout=None):
+        """
+        wait for all submitted work to complete
+        """
+        with self._cond:
+            tickets = list(self._tickets.values())
+        for ticket in tickets:
+            if not ticket.in_current_thread():
+                ticket.join(timeout)
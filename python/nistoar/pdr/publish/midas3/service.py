@@ -18,12 +18,13 @@ from ...preserv.service import status as ps
 from ...preserv.service.service import MultiprocPreservationService
 from ...utils import build_mime_type_map, read_nerd, write_json, read_pod
 from ... import config as _configmod
+from ... import schemas
 from ....id import PDRMinter
 from ....nerdm.convert import Res2PODds, topics2themes
 from ....nerdm.taxonomy import ResearchTopicsTaxonomy
-from ....nerdm import validate
 from .... import pdr
 from .customize import CustomizationServiceClient
+from .pool import BaggingPool
 
 import ejsonschema as ejs
 from ejsonschema import schemaloader
@@ -75,6 +76,12 @@ class MIDAS3PublishingService(PublishSystem):
     :prop bagger dict ({}):  a dictionary for configuring the SIPBagger instance
                       used to process the SIP (see SIPBagger implementation 
                       documentation for supported sub-properties).  
+    :prop bagging_pool dict ({}):  a dictionary for configuring the pool of threads
+                      that process POD updates.  The supported sub-properties are:
+      :prop max_workers int (4):  the maximum number of datasets whose updates may be 
+                      processed at once.  
+      :prop pods_per_turn int (1):  the number of queued POD updates for a dataset 
+                      to process before giving other waiting datasets a turn.
     """
 
     def __init__(self, config, workdir=None, reviewdir=None, uploaddir=None,
@@ -148,7 +155,7 @@ class MIDAS3PublishingService(PublishSystem):
         if self.cfg.get('require_valid_pod', True):
             if not self._schemadir:
                 raise ConfigurationException("'require_valid_pod' is set but cannot find schema dir")
-            self._podvalid8r = validate.create_validator(self._schemadir, "_")
+            self._podvalid8r = schemas.get_validator(self._schemadir, "_")
 
 
         # used to convert NERDm to POD
@@ -161,6 +168,15 @@ class MIDAS3PublishingService(PublishSystem):
         self._custclient = CustomizationServiceClient(self.cfg.get('customization_service'),
                                                       logger=self.log.getChild("customclient"))
 
+        poolcfg = self.cfg.get('bagging_pool', {})
+        try:
+            self._pods_per_turn = int(poolcfg.get('pods_per_turn', 1))
+            self._pool = BaggingPool(int(poolcfg.get('max_workers', 4)), "bagger",
+                                     self.log.getChild("pool"))
+        except (TypeError, ValueError) as ex:
+            raise ConfigurationException("bagging_pool: bad max_workers or pods_per_turn "+
+                                         "value: "+str(ex), sys=self)
+
         self._bagging_workers = {}
         self.pressvc = MultiprocPreservationService(self._presv_config())
 
@@ -268,7 +284,7 @@ class MIDAS3PublishingService(PublishSystem):
             worker = self._bagging_workers.get(key)
             if not worker:
                 continue
-            if worker.is_working() and worker._thread is not threading.current_thread():
+            if worker.is_working() and not worker._thread.in_current_thread():
                 worker._thread.join()
             if worker.bagger.fileExaminer.running():
                 worker.bagger.fileExaminer.waitForCompletion(timeout)
@@ -354,8 +370,16 @@ class MIDAS3PublishingService(PublishSystem):
         if os.path.exists(nerdf):
             os.remove(nerdf)
 
+    def bagging_stats(self):
+        """
+        return a dictionary of statistics describing the activity of the pool of threads
+        that process POD updates, including the current queue depth and the mean and 
+        maximum times that datasets have waited for and spent being processed.
+        """
+        return self._pool.stats()
+
     def _drop_bagging_worker(self, worker, timeout=None):
-        if worker.is_working() and worker._thread is not threading.current_thread():
+        if worker.is_working() and not worker._thread.in_current_thread():
             worker._thread.join()
         worker.bagger.fileExaminer.waitForCompletion(timeout)
         worker.bagger.done()
@@ -835,7 +859,7 @@ class MIDAS3PublishingService(PublishSystem):
                                              "exist as a directory: " +
                                              self._schemadir)
 
-        return [str(e) for e in validate.validate(nerdm, self._schemadir)]
+        return [str(e) for e in schemas.validate(nerdm, self._schemadir)]
         
     def get_customized_pod(self, ediid):
         """
@@ -1017,6 +1041,14 @@ class MIDAS3PublishingService(PublishSystem):
         """
         return self.pressvc.requests()
 
+    def preservation_queue(self):
+        """
+        return descriptions of the preservation requests that are waiting for 
+        a worker to become available, in the order that they will be started.
+        Each description includes the request's position in the queue.
+        """
+        return self.pressvc.queued()
+
 
     class BaggingWorker(object):
 
@@ -1025,7 +1057,7 @@ class MIDAS3PublishingService(PublishSystem):
             self.bagger = bagger
             self.service = service
             self.name = midasid_to_bagname(id)
-            self._thread = None
+            self._thread = service._pool.ticket_for(id)
             
             lgnm = self.name
             if len(lgnm) > 11:
@@ -1049,21 +1081,13 @@ class MIDAS3PublishingService(PublishSystem):
             self.halt_sema   = os.path.join(halt_dir, self.name+".txt")
             self.qlock = None
 
-        class _Thread(threading.Thread):
-            def __init__(self, worker):
-                self.worker = worker
-                super(MIDAS3PublishingService.BaggingWorker._Thread, self). \
-                    __init__(name="bagger:"+worker.bagger.name)
-            def run(self):
-                self.worker.run()
-        
         def is_working(self):
-            return self._thread and self._thread.is_alive()
+            return bool(self._thread and self._thread.is_alive())
 
         def launch(self):
-            self._thread = self._Thread(self)
-            self.log.debug("Starting worker thread %s", self._thread.name)
-            self._thread.start()
+            # queue this dataset for processing by the service's pool of threads
+            self.log.debug("Queuing %s for bagging", self.name)
+            self._thread = self.service._pool.submit(self.id, self.run_turn)
 
         def queue_POD(self, pod):
             self.ensure_qlock()
@@ -1121,7 +1145,17 @@ class MIDAS3PublishingService(PublishSystem):
             # remove this thread from bagger threads
             # del self.service._bagging_workers[self.id]
 
-        def process_queue(self):
+        def run_turn(self):
+            # process this dataset's next queued POD(s) within the pool; return True if 
+            # more remain
+            return self.process_queue(self.service._pods_per_turn)
+
+        def process_queue(self, limit=None):
+            """
+            process the queued POD updates.  If limit is given, return after that many 
+            PODs have been processed.  
+            :return bool:  True if there remain PODs in the queue that were not processed
+            """
             self.ensure_qlock()
             pod = None
             i = 0
@@ -1176,14 +1210,20 @@ class MIDAS3PublishingService(PublishSystem):
                 if os.path.exists(self.halt_sema):
                     break
 
+                i += 1
+                if limit and i >= limit and \
+                   (os.path.exists(self.next_pod) or os.path.exists(self.presv_pod)):
+                    # give other datasets a turn
+                    return True
+
                 # let other threads have a chance
                 time.sleep(0.1)
-                i += 1
 
             if pod and not pod.get('_preserve'):
                 # the last POD we processed did not have the preserve flag; if it did,
                 # then metadata enhancement would have already been done.
                 self.bagger.enhance_metadata(examine="sync")
+            return False
 
         def halt_pod_processing(self, reason):
             try:
@@ -1312,7 +1352,7 @@ class MIDAS3PublishingService(PublishSystem):
             return usebagger.finalize_version()
 
         def full_wait(self, timeout):
-            if self.is_working() and worker._thread is not threading.current_thread():
+            if self.is_working() and not self._thread.in_current_thread():
                 self._thread.join()
             if self.bagger.fileExaminer and self.bagger.fileExaminer.running():
                 self.bagger.fileExaminer.waitForCompletion(timeout)
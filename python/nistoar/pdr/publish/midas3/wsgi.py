@@ -19,6 +19,7 @@ from ...preserv.service.service import RerequestException, PreservationStateErro
 from .webrecord import WebRecorder
 from ejsonschema import ValidationError
 from ... import config as cfgmod
+from ... import sessions
 from ... import ARK_NAAN
 
 from .. import sys as pdrsys
@@ -64,6 +65,10 @@ class MIDAS3PublishingApp(object):
         if level:
             log.setLevel(level)
 
+        # set the connection pooling and retry policy for service clients
+        if 'http_session' in config:
+            sessions.configure(config['http_session'])
+
         # log input messages
         self._recorder = None
         wrlogf = config.get('record_to')
@@ -529,6 +534,8 @@ class PreserveHandler(Handler):
             if (len(steps) > 2 and steps[1] != "ark:") or len(steps) > 4:
                 self.send_error(400, "Unsupported SIP identifier: "+path)
                 return []
+            elif len(steps) == 2 and steps[1] == "_queue":
+                return self.queue()
             elif len(steps) > 1:
                 if steps[1].startswith("_") or steps[1].startswith(".") or \
                    self.badidre.search(steps[1]):
@@ -567,6 +574,22 @@ class PreserveHandler(Handler):
         self.end_headers()
         return [out]
 
+    def queue(self):
+        """
+        return descriptions of the preservation requests waiting to be started
+        """
+        try: 
+            out = json.dumps(self._svc.preservation_queue())
+        except Exception, ex:
+            log.exception("Internal error: "+str(ex))
+            self.send_error(500, "Internal error")
+            return ['[]']
+
+        self.set_response(200, "Queued preservation requests")
+        self.add_header('Content-Type', 'application/json')
+        self.end_headers()
+        return [out]
+
     def request_status(self, sipid):
         """
         return the status of a particular preservation request
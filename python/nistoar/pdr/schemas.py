@@ -0,0 +1,177 @@
+"""
+This module provides a process-wide cache of the JSON schema validators used to validate POD
+and NERDm metadata.
+
+Creating a validator for a schema directory (via :func:`nistoar.nerdm.validate.create_validator`)
+loads and parses every schema in the directory, which can take longer than the validation itself.
+:func:`get_validator` returns a shared validator for a schema directory, creating it only the
+first time it is requested.  Validators are keyed by the absolute path to the schema directory
+and the prefix used to mark the validation meta-properties in the records they validate ("_" for
+``_schema`` and ``_extensionSchemas``, "$" for ``$schema``, etc.).  Each time a shared validator
+is used, it checks whether the schema files in its directory have changed (by their modification
+times and sizes) and, if so, reloads them.
+
+Shared validators may be used from several threads; validation with a particular validator is
+serialized.  :func:`validate_all` and :func:`validate_components` validate a batch of records in
+one call, checking the schema directory only once for the whole batch.
+"""
+import os, threading
+from collections import Mapping, OrderedDict
+
+from ..nerdm.validate import create_validator
+
+_validators = {}
+_lock = threading.Lock()
+
+def _dir_stamp(schemadir):
+    # return a signature of the current state of the schema files in a directory, or None
+    # if it does not exist
+    try:
+        out = []
+        for f in sorted(os.listdir(schemadir)):
+            st = os.stat(os.path.join(schemadir, f))
+            out.append((f, st.st_mtime, st.st_size))
+        return tuple(out)
+    except OSError:
+        return None
+
+def prefix_for(data, default="_"):
+    """
+    return the prefix used to identify the validation meta-properties (e.g. "_" for
+    ``_schema``) in the given record, or the default if none are found.
+    """
+    for prop in "schema extensionSchemas".split():
+        mpfxs = [k[0] for k in data.keys() if k[1:] == prop and k[0] in "_$"]
+        if len(mpfxs) > 0:
+            return mpfxs[0]
+    return default
+
+class SchemaValidator(object):
+    """
+    a shared handle on an (ejsonschema-based) validator loaded with the schemas in a
+    directory.  The underlying validator is reloaded whenever the schema files change.
+    """
+
+    def __init__(self, schemadir, ejsprefix="_"):
+        """
+        :param str schemadir:  the directory containing the schemas to load
+        :param str ejsprefix:  the prefix used to mark validation meta-properties in the
+                               records to be validated
+        """
+        self.schemadir = schemadir
+        self.ejsprefix = ejsprefix
+        self._valid8r = None
+        self._stamp = None
+        self._lock = threading.RLock()
+
+    def _current(self):
+        # the caller should hold self._lock
+        stamp = _dir_stamp(self.schemadir)
+        if self._valid8r is None or stamp != self._stamp:
+            self._valid8r = create_validator(self.schemadir, self.ejsprefix)
+            self._stamp = stamp
+        return self._valid8r
+
+    def validate(self, instance, **kw):
+        """
+        validate the given record.  The keyword arguments (e.g. schemauri, strict, and
+        raiseex) are passed to the underlying ejsonschema validator's validate() method.
+        :return list:  the validation errors found (if raiseex=False)
+        """
+        with self._lock:
+            return self._current().validate(instance, **kw)
+
+    def validate_all(self, items, strict=True):
+        """
+        validate a batch of records.
+
+        :param list items:  a list of (record, schemauri) pairs; if the schemauri is None,
+                            the schema declared in the record is used.
+        :param bool strict: if True, the validation is strict (see ejsonschema)
+        :return list:  a list--parallel to items--of lists of the validation errors found
+                       for each record.
+        """
+        with self._lock:
+            valid8r = self._current()
+            return [valid8r.validate(rec, schemauri=uri, strict=strict, raiseex=False)
+                    for rec, uri in items]
+
+def get_validator(schemadir, forprefix="_"):
+    """
+    return the shared validator for the schemas in the given directory.
+
+    :param str schemadir:  the directory containing the schemas to load
+    :param forprefix:      either the prefix (str) used to mark validation meta-properties,
+                           or a record (dict) to determine it from
+    :rtype: SchemaValidator
+    """
+    if isinstance(forprefix, Mapping):
+        forprefix = prefix_for(forprefix)
+    key = (os.path.abspath(schemadir), forprefix)
+    with _lock:
+        out = _validators.get(key)
+        if not out:
+            out = SchemaValidator(schemadir, forprefix)
+            _validators[key] = out
+        return out
+
+def clear_cache():
+    """
+    discard all of the shared validators
+    """
+    with _lock:
+        _validators.clear()
+
+def validate(instance, schemadir, schemauri=None, strict=True, raiseex=False):
+    """
+    validate a record using the shared validator for the given schema directory.
+
+    :param dict instance:  the record to validate
+    :param str schemadir:  the directory containing the schemas
+    :param str schemauri:  the URI of the schema to validate against; if None, the schema
+                           declared in the record is used.
+    :param bool strict:    if True, the validation is strict (see ejsonschema)
+    :param bool raiseex:   if True, raise a ValidationError on the first error found
+    :return list:  the validation errors found
+    """
+    return get_validator(schemadir, instance).validate(instance, schemauri=schemauri,
+                                                       strict=strict, raiseex=raiseex)
+
+def validate_all(items, schemadir, strict=True):
+    """
+    validate a batch of records using the shared validators for the given schema directory.
+
+    :param list items:     a list of (record, schemauri) pairs; if the schemauri is None,
+                           the schema declared in the record is used.
+    :param str schemadir:  the directory containing the schemas
+    :param bool strict:    if True, the validation is strict (see ejsonschema)
+    :return list:  a list--parallel to items--of lists of the validation errors found for
+                   each record.
+    """
+    out = [None] * len(items)
+    byprefix = OrderedDict()
+    for i, item in enumerate(items):
+        byprefix.setdefault(prefix_for(item[0]), []).append(i)
+    for pfx, idxs in byprefix.items():
+        errs = get_validator(schemadir, pfx).validate_all([items[i] for i in idxs], strict)
+        for i, e in zip(idxs, errs):
+            out[i] = e
+    return out
+
+def validate_components(bag, schemadir, filepaths=None, merge_annots=False, strict=True):
+    """
+    validate the NERDm metadata of the components of a bag in one call.
+
+    :param NISTBag bag:     the bag containing the components
+    :param str schemadir:   the directory containing the schemas
+    :param list filepaths:  the filepaths of the components to validate; if None, all of
+                            the components in the bag are validated.
+    :param bool merge_annots: if True, merge the components' annotations into their
+                            metadata before validating
+    :return OrderedDict:  a map of the component filepaths to the lists of validation
+                          errors found for them.
+    """
+    if filepaths is None:
+        filepaths = list(bag.iter_data_components())
+    items = [(bag.nerd_metadata_for(fp, merge_annots), None) for fp in filepaths]
+    return OrderedDict(zip(filepaths, validate_all(items, schemadir, strict)))
@@ -0,0 +1,167 @@
+"""
+This module provides shared, connection-pooling HTTP sessions for the PDR's clients of web
+services.
+
+The PDR's service clients (e.g. for the distribution service, the RMM, the MIDAS and
+customization services) get their sessions via :func:`get_session`.  A session keeps a pool
+of open (keep-alive) connections for each host it talks to, so that bulk operations--e.g.
+checking hundreds of download URLs or ingesting a backlog of records--reuse TCP/TLS
+connections rather than opening a new one for each request.  Sessions also apply a default
+timeout and a policy for retrying requests that fail to connect.
+
+The behavior of the default session can be set by an application at start-up via
+:func:`configure`, which takes a dictionary that supports the following properties:
+
+:prop pool_connections int (10):  the number of hosts to keep connection pools for
+:prop pool_maxsize int (10):  the maximum number of open connections to keep per host
+:prop connect_timeout float (30):  the number of seconds to wait for a connection to a
+                      server to be established
+:prop read_timeout float (None):  the number of seconds to wait for a server to send data
+                      before giving up; None means wait indefinitely.
+:prop retries int (2):  the maximum number of times to retry a request after failing to
+                      connect (or, for idempotent requests, after the connection drops)
+:prop backoff_factor float (0.3):  a factor for setting the delay before each retry:  the
+                      delay is backoff_factor * 2^(retry number - 1) seconds.
+:prop status_forcelist list of int ([]):  HTTP response status codes that should trigger
+                      a retry of an idempotent request (e.g. [502, 503, 504]).  If retries
+                      are exhausted, the last response is returned.
+
+A client that needs a different policy can pass its own dictionary of these properties to
+:func:`get_session`; sessions are shared among clients that use the same configuration.
+"""
+import threading
+from collections import Mapping
+
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry
+
+from .exceptions import ConfigurationException
+
+DEF_SESSION_CONFIG = {
+    "pool_connections": 10,
+    "pool_maxsize":     10,
+    "connect_timeout":  30,
+    "read_timeout":     None,
+    "retries":          2,
+    "backoff_factor":   0.3,
+    "status_forcelist": []
+}
+
+_defcfg = dict(DEF_SESSION_CONFIG)
+_sessions = {}
+_lock = threading.Lock()
+
+class PDRSession(requests.Session):
+    """
+    a requests Session that applies a default timeout to all of its requests
+    """
+
+    def __init__(self, timeout=None):
+        """
+        :param timeout:  the default timeout to apply to requests that do not specify one;
+                         this can be a single number or a (connect, read) tuple.
+        """
+        super(PDRSession, self).__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kw):
+        if kw.get('timeout') is None and self.timeout is not None:
+            kw['timeout'] = self.timeout
+        return super(PDRSession, self).request(method, url, **kw)
+
+def _merge_config(config):
+    cfg = dict(_defcfg)
+    if config:
+        if not isinstance(config, Mapping):
+            raise ConfigurationException("HTTP session config: not a dictionary: " +
+                                         str(config))
+        cfg.update(config)
+    return cfg
+
+def _key_for(cfg):
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                        for k, v in cfg.items() if k in DEF_SESSION_CONFIG))
+
+def create_session(config=None):
+    """
+    create a new session according to the given configuration.  Properties not specified
+    in the configuration are set from the defaults (see :func:`configure`).  Most clients
+    should use :func:`get_session` instead.
+
+    :param dict config:  the session configuration (see the module documentation for the
+                         supported properties)
+    :rtype: PDRSession
+    """
+    cfg = _merge_config(config)
+    try:
+        retry = Retry(total=int(cfg['retries']), read=int(cfg['retries']),
+                      connect=int(cfg['retries']), backoff_factor=float(cfg['backoff_factor']),
+                      status_forcelist=list(cfg.get('status_forcelist') or []),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=int(cfg['pool_connections']),
+                              pool_maxsize=int(cfg['pool_maxsize']), max_retries=retry)
+        timeout = cfg['connect_timeout']
+        if cfg['read_timeout'] is not None or timeout is not None:
+            timeout = (timeout, cfg['read_timeout'])
+    except (TypeError, ValueError) as ex:
+        raise ConfigurationException("HTTP session config: bad value: "+str(ex), cause=ex)
+
+    out = PDRSession(timeout)
+    out.mount("http://", adapter)
+    out.mount("https://", adapter)
+    return out
+
+def get_session(config=None):
+    """
+    return a shared session configured according to the given configuration.  Sessions are
+    cached so that all clients that request a session with the same configuration share
+    the same connection pools.  Properties not specified in the configuration are set from
+    the defaults (see :func:`configure`).
+
+    :param dict config:  the session configuration (see the module documentation for the
+                         supported properties); if None, the default session is returned.
+    :rtype: PDRSession
+    """
+    key = _key_for(_merge_config(config))
+    with _lock:
+        sess = _sessions.get(key)
+        if not sess:
+            sess = create_session(config)
+            _sessions[key] = sess
+        return sess
+
+def configure(config):
+    """
+    set the default session configuration.  Any sessions previously created are closed
+    and discarded so that subsequent calls to :func:`get_session` reflect the new
+    configuration.
+
+    :param dict config:  the session configuration (see the module documentation for the
+                         supported properties); properties not included are reset to
+                         their built-in defaults.
+    """
+    global _defcfg
+    if config is None:
+        config = {}
+    if not isinstance(config, Mapping):
+        raise ConfigurationException("HTTP session config: not a dictionary: "+str(config))
+    cfg = dict(DEF_SESSION_CONFIG)
+    cfg.update(config)
+    with _lock:
+        _defcfg = cfg
+    close_all()
+
+def close_all():
+    """
+    close all shared sessions, releasing their open connections.  New sessions will be
+    created as needed.
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for sess in sessions:
+        sess.close()
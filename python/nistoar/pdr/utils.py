@@ -2,13 +2,14 @@
 Utility functions useful across the pdr package
 """
 from collections import OrderedDict, Mapping
-import hashlib, json, re, shutil, os, time, subprocess, logging, threading
+import hashlib, re, shutil, os, time, subprocess, logging, threading
 try:
     import fcntl
 except ImportError:
     fcntl = None
 
 from .exceptions import (NERDError, PODError, StateException)
+from . import jsoncodec
 
 log = logging.getLogger("pdr.utils")
 BLAB = logging.DEBUG - 1
@@ -169,6 +170,37 @@ class LockedFile(object):
         if self._fo:
             self.close()
 
+class ExclusiveFileLock(object):
+    """
+    A context manager that holds an exclusive lock, across both threads and
+    processes, for the duration of a with statement.  The lock is taken on
+    the given lock file (created if necessary), whose contents are never
+    read or written.  The lock is not reentrant.
+    .. code-block:: python
+
+       with ExclusiveFileLock(lockfile):
+           # no other holder of lockfile's lock runs this at the same time
+    """
+    def __init__(self, lockfile):
+        self._lockfile = lockfile
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = open(self._lockfile, 'a')
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, ex_type, ex_val, ex_tb):
+        # explicitly unlock in case the descriptor was inherited by a child
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._fd.close()
+            self._fd = None
+        return False
+
 def read_nerd(nerdfile):
     """
     read the JSON-formatted NERDm metadata in the given file
@@ -211,9 +243,10 @@ def read_json(jsonfile, nolock=False):
                      the file contents
     :raise ValueError:  if JSON format errors are detected.
     """
+    codec = jsoncodec.default_codec()
     with LockedFile(jsonfile) as fd:
         blab(log, "Acquired shared lock for reading: "+jsonfile)
-        out = json.load(fd, object_pairs_hook=OrderedDict)
+        out = codec.load(fd)
     blab(log, "released SH")
     return out
 
@@ -224,16 +257,20 @@ def write_json(jsdata, destfile, indent=4, nolock=False):
     :param dict jsdata:    the JSON data to write 
     :param str  destfile:  the path to the file to write the data to
     :param int  indent:    the number of characters to use for indentation
-                           (default: 4).
+                           (default: 4).  If None, the data is written compactly 
+                           (on one line without extra whitespace); this is 
+                           intended for internal files that are not preserved.
     :param bool  nolock:   if False (default), an exclusive lock will be acquired
                            before writing to the file.  A True value writes the 
                            data without a lock
     """
     try:
+        # encode before truncating so that a failure leaves the file intact
+        text = jsoncodec.default_codec().dumps(jsdata, indent)
         with LockedFile(destfile, 'a') as fd:
             blab(log, "Acquired exclusive lock for writing: "+destfile)
             fd.truncate(0)
-            json.dump(jsdata, fd, indent=indent, separators=(',', ': '))
+            fd.write(text)
         blab(log, "released EX")
     except Exception, ex:
         raise StateException("{0}: Failed to write JSON data to file: {1}"
@@ -309,18 +346,41 @@ def build_mime_type_map(filelist):
         update_mimetypes_from_file(out, file)
     return out
 
-def checksum_of(filepath):
+DEF_CHECKSUM_BUFSIZE = 10240000   # 10 MB buffer
+
+def checksum_of(filepath, algorithm="sha256", bufsize=DEF_CHECKSUM_BUFSIZE):
     """
     return the checksum for the given file
+
+    :param str filepath:   the path to the file to checksum
+    :param str algorithm:  the name of the hash algorithm to apply (default: 
+                           "sha256"); this must be a name recognized by hashlib.
+    :param int bufsize:    the number of bytes to read from the file at a time
     """
-    bfsz = 10240000   # 10 MB buffer
-    sum = hashlib.sha256()
-    with open(filepath) as fd:
+    return digests_of(filepath, [algorithm], bufsize)[algorithm]
+
+def digests_of(filepath, algorithms=("sha256",), bufsize=DEF_CHECKSUM_BUFSIZE):
+    """
+    return the checksums of a file for several hash algorithms, calculated via
+    a single pass through the file's contents.  
+
+    :param str filepath:     the path to the file to checksum
+    :param list algorithms:  the names of the hash algorithms to apply; each 
+                             must be a name recognized by hashlib.
+    :param int bufsize:      the number of bytes to read from the file at a time
+    :return dict:  a mapping of each requested algorithm name to the 
+                   hex-encoded checksum
+    """
+    if not bufsize or bufsize < 1:
+        bufsize = DEF_CHECKSUM_BUFSIZE
+    sums = OrderedDict([(alg, hashlib.new(alg)) for alg in algorithms])
+    with open(filepath, 'rb') as fd:
         while True:
-            buf = fd.read(bfsz)
+            buf = fd.read(bufsize)
             if not buf: break
-            sum.update(buf)
-    return sum.hexdigest()
+            for sum in sums.values():
+                sum.update(buf)
+    return OrderedDict([(alg, sum.hexdigest()) for alg, sum in sums.items()])
 
 def measure_dir_size(dirpath):
     """
@@ -113,12 +113,28 @@ class TestRESTServiceClient(test.TestCase):
         wd = self.cli.retrieve_file("/_aip/pdr1010.mbag0_3-2.zip",out)
 
         self.assertTrue(os.path.isfile(out))
+        self.assertFalse(os.path.exists(out+".part"))
         dlcs = checksum_of(out)
         refcs = checksum_of(os.path.join(datadir,"pdr1010.mbag0_3-2.zip"))
         self.assertEqual(refcs, dlcs)
+        self.assertEqual(wd, refcs)
                 
         with self.assertRaises(dcli.DistribResourceNotFound):
             self.cli.retrieve_file("/_aip/goob.zip", out)
+        self.assertFalse(os.path.exists(out+".part"))
+
+    def test_retrieve_file_resume(self):
+        out = os.path.join(tmpdir(), "bag.zip")
+        refcs = checksum_of(os.path.join(datadir,"pdr1010.mbag0_3-2.zip"))
+        with open(os.path.join(datadir,"pdr1010.mbag0_3-2.zip"), 'rb') as fd:
+            head = fd.read(1000)
+        with open(out+".part", 'wb') as fd:
+            fd.write(head)
+
+        self.cli = dcli.RESTServiceClient(baseurl, chunk_size=512, resume=True)
+        self.assertEqual(self.cli.retrieve_file("/_aip/pdr1010.mbag0_3-2.zip", out), refcs)
+        self.assertEqual(checksum_of(out), refcs)
+        self.assertFalse(os.path.exists(out+".part"))
         
     def test_head(self):
         resp = self.cli.head("/_aip/pdr1010.mbag0_3-2.zip")
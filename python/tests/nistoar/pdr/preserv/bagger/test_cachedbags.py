@@ -0,0 +1,83 @@
+import os, sys, pdb, shutil, time
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagger.cachedbags as cb
+import nistoar.pdr.preserv.bagger.storecat as sc
+
+storedir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "distrib", "data")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestCachedBagIndex(test.TestCase):
+
+    def setUp(self):
+        cb.clear_cache()
+        sc.clear_catalogs()
+        self.tf = Tempfiles()
+        self.store = self.tf.mkdir("store")
+        self.rstore = self.tf.mkdir("rstore")
+        for f in "pdr2210.1_0.mbag0_3-1.zip pdr2210.2.mbag0_3-2.zip".split():
+            shutil.copy(os.path.join(storedir, f), self.store)
+        self.idx = cb.CachedBagIndex([self.store, None, self.rstore])
+
+    def tearDown(self):
+        cb.clear_cache()
+        sc.clear_catalogs()
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertEqual(self.idx.storedirs, [self.store, self.rstore])
+        self.assertEqual(cb.CachedBagIndex(self.store).storedirs, [self.store])
+
+    def test_serialized_bags(self):
+        self.assertEqual(self.idx.serialized_bags("pdr2210.1_0.mbag0_3-1"),
+                         [os.path.join(self.store, "pdr2210.1_0.mbag0_3-1.zip")])
+        self.assertEqual(self.idx.serialized_bags("pdr2210.1_0.mbag0_3"), [])
+        self.assertEqual(self.idx.serialized_bags("goob"), [])
+
+        # new bags are noticed
+        shutil.copy(os.path.join(storedir, "pdr2210.3_1_3.mbag0_3-5.zip"), self.rstore)
+        self.assertEqual(self.idx.serialized_bags("pdr2210.3_1_3.mbag0_3-5"),
+                         [os.path.join(self.rstore, "pdr2210.3_1_3.mbag0_3-5.zip")])
+
+    def test_contents(self):
+        bagfile = os.path.join(self.store, "pdr2210.1_0.mbag0_3-1.zip")
+        files = self.idx.contents(bagfile)
+        self.assertIn("trial2.json", files)
+        self.assertNotIn("trial1.json", files)
+        self.assertIn(bagfile, cb._contents)
+        self.assertIs(self.idx.contents(bagfile), files)
+
+        # a replaced bag is re-read
+        shutil.copy(os.path.join(storedir, "pdr2210.3_1_3.mbag0_3-5.zip"), bagfile)
+        st = os.stat(bagfile)
+        os.utime(bagfile, (st.st_atime, st.st_mtime + 5))
+        self.assertIn("trial1.json", self.idx.contents(bagfile))
+
+    def test_has_file(self):
+        self.assertTrue(self.idx.has_file("pdr2210.1_0.mbag0_3-1", "trial2.json"))
+        self.assertTrue(self.idx.has_file("pdr2210.2.mbag0_3-2", "trial3/trial3a.json"))
+        self.assertTrue(self.idx.has_file("pdr2210.2.mbag0_3-2", u"trial3/trial3a.json"))
+        self.assertFalse(self.idx.has_file("pdr2210.1_0.mbag0_3-1", "trial1.json"))
+        self.assertFalse(self.idx.has_file("pdr2210.1_0.mbag0_3-1", "trial3"))
+        self.assertFalse(self.idx.has_file("goob", "trial2.json"))
+
+    def test_cache_size(self):
+        self.assertTrue(self.idx.has_file("pdr2210.1_0.mbag0_3-1", "trial2.json"))
+        self.assertTrue(self.idx.has_file("pdr2210.2.mbag0_3-2", "trial3/trial3a.json"))
+        self.assertEqual(len(cb._contents), 2)
+        cb.set_cache_size(1)
+        try:
+            self.assertEqual(list(cb._contents.keys()),
+                             [os.path.join(self.store, "pdr2210.2.mbag0_3-2.zip")])
+        finally:
+            cb.set_cache_size(cb.DEF_CACHE_SIZE)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -1,5 +1,5 @@
 from __future__ import print_function
-import os, sys, pdb, shutil, logging, json, time, re
+import os, sys, pdb, shutil, logging, json, time, re, threading
 
 import unittest as test
 
@@ -179,6 +179,18 @@ class TestDataChecker(test.TestCase):
         self.assertTrue(self.ckr.bag_location("goob.txt"))
         self.assertFalse(self.ckr.available_in_cached_bag(cmp))
 
+    def test_available_in_restricted_cached_bag(self):
+        pubstore = self.tf.mkdir("pubstore")
+        rstore = self.tf.mkdir("rstore")
+        shutil.copy(os.path.join(storedir, "pdr2210.1_0.mbag0_3-1.zip"), rstore)
+        self.config = { 'store_dir': pubstore, 'restricted_store_dir': rstore }
+        self.ckr = dc.DataChecker(NISTBag(self.hbag), self.config,
+                                  logging.getLogger("datachecker"))
+
+        self.assertTrue(self.ckr.available_in_cached_bag('trial2.json'))
+        self.assertFalse(self.ckr.available_in_cached_bag('trial1.json'))
+        self.assertFalse(self.ckr.available_in_cached_bag('trial3/trial3a.json'))
+
     def test_has_pdr_url(self):
         self.assertTrue(self.ckr.has_pdr_url("http://localhost:8888/od/ds/blah"))
         self.assertFalse(self.ckr.has_pdr_url("http://localhost:8888/goob/blah"))
@@ -353,6 +365,79 @@ class TestDataCheckerWithService(test.TestCase):
     def test_unavailable_files(self):
         self.assertEqual(len(self.ckr.unavailable_files()), 0)
         self.assertTrue(self.ckr.all_files_available())
+
+        timings = self.ckr.timing_summary()
+        self.assertIn("in_bag", timings)
+        self.assertGreater(timings['in_bag']['count'], 0)
+        self.assertIn("mean_time", timings['in_bag'])
+
+    def test_unavailable_files_concurrent(self):
+        # add a file that is not available anywhere
+        shutil.copytree(os.path.join(self.ckr.bag.metadata_dir, "trial1.json"),
+                        os.path.join(self.ckr.bag.metadata_dir, "goob.json"))
+        nerdm = self.ckr.bag.nerd_metadata_for("goob.json")
+        nerdm['filepath'] = "goob.json"
+        nerdm['downloadURL'] = re.sub(r'trial1.json','goob.json',
+                                      nerdm['downloadURL'])
+        with open(os.path.join(self.ckr.bag.metadata_dir, "goob.json",
+                               "nerdm.json"), 'w') as fd:
+            json.dump(nerdm, fd, indent=2)
+
+        self.config['check_workers'] = 1
+        seq = dc.DataChecker(NISTBag(self.hbag), self.config,
+                             logging.getLogger("datachecker"))
+        self.config['check_workers'] = 4
+        self.config['max_per_host'] = 2
+        self.ckr = dc.DataChecker(NISTBag(self.hbag), self.config,
+                                  logging.getLogger("datachecker"))
+
+        self.assertEqual(seq.unavailable_files(), ['goob.json'])
+        for strict in (False, True):
+            for viadistrib in (True, False):
+                self.assertEqual(self.ckr.unavailable_files(strict, viadistrib),
+                                 seq.unavailable_files(strict, viadistrib))
+
+    def test_max_per_host(self):
+        self.config['check_workers'] = 6
+        self.config['max_per_host'] = 2
+        self.ckr = dc.DataChecker(NISTBag(self.hbag), self.config,
+                                  logging.getLogger("datachecker"))
+
+        # stand in for the HEAD request, recording how many are active at once
+        lock = threading.Lock()
+        active = {}
+        peak = {}
+        def head_url(url, session=None):
+            host = dc.urlparse(url).netloc
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+            return (200, "OK")
+        self.ckr.head_url = head_url
+
+        urls = ["http://localhost:9091/od/ds/goob%d.json" % i for i in range(6)] + \
+               ["http://otherhost/od/ds/goob%d.json" % i for i in range(6)]
+        threads = [threading.Thread(target=self.ckr.available_via_url, args=(u,))
+                   for u in urls]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(peak, {"localhost:9091": 2, "otherhost": 2})
+
+    def test_remote_bag_queries_deduped(self):
+        self.assertTrue(self.ckr.containing_bag_available("trial1.json"))
+        self.assertTrue(self.ckr.containing_bag_available("trial2.json"))
+        self.assertTrue(self.ckr.containing_bag_available("trial3/trial3a.json"))
+        self.assertEqual(len(self.ckr._baglists), 3)   # one per version
+
+        self.assertTrue(self.ckr.containing_bag_available("trial1.json"))
+        self.assertTrue(self.ckr.containing_bag_available("trial2.json"))
+        self.assertEqual(len(self.ckr._baglists), 3)
         
         
 
@@ -343,6 +343,25 @@ class TestUpdatePrepper(test.TestCase):
         self.assertIn("data", contents)
         self.assertIn("bagit.txt", contents)
         self.assertIn("bag-info.txt", contents)
+        self.assertTrue(os.path.isfile(os.path.join(root, "data", "trial1.json")))
+
+    def test_unpack_bag_as_metadata_only(self):
+        root = self.tf.track("goober")
+        bagzip = os.path.join(self.bagsdir, "ABCDEFG.2.mbag0_4-4.zip")
+
+        self.prepr._unpack_bag_as(bagzip, root, metadata_only=True)
+        self.assertTrue(os.path.exists(root))
+
+        contents = [f for f in os.listdir(root)]
+        self.assertIn("metadata", contents)
+        self.assertIn("multibag", contents)
+        self.assertIn("bagit.txt", contents)
+        self.assertIn("bag-info.txt", contents)
+        self.assertTrue(os.path.isfile(os.path.join(root, "metadata", "trial3",
+                                                    "trial3a.json", "nerdm.json")))
+        self.assertTrue(os.path.isfile(os.path.join(root, "multibag", "file-lookup.tsv")))
+        self.assertTrue(os.path.isdir(os.path.join(root, "data")))
+        self.assertEqual(os.listdir(os.path.join(root, "data")), [])
 
     def test_create_from_headbag(self):
         headbag = os.path.join(self.bagsdir, "ABCDEFG.1.mbag0_4-2.zip")
@@ -374,6 +393,31 @@ class TestUpdatePrepper(test.TestCase):
         info = bag.get_baginfo(depinfof)
         self.assertEquals(info['Multibag-Head-Version'], ["1.0"])
 
+    def test_create_from_unserialized_headbag(self):
+        headbag = os.path.join(self.tf.mkdir("unpacked"), "ABCDEFG.1.mbag0_4-2")
+        self.prepr._unpack_bag_as(os.path.join(self.bagsdir, "ABCDEFG.1.mbag0_4-2.zip"),
+                                  headbag)
+        self.assertTrue(os.path.isfile(os.path.join(headbag, "data", "trial1.json")))
+        root = os.path.join(self.tf.mkdir("update"), "goober")
+
+        self.prepr.create_from_headbag(headbag, root)
+        self.assertTrue(os.path.isdir(root))
+
+        contents = [f for f in os.listdir(root)]
+        self.assertIn("metadata", contents)
+        self.assertNotIn("manifest-sha256.txt", contents)
+        self.assertNotIn("bag-info.txt", contents)
+        self.assertTrue(os.path.isdir(os.path.join(root, "data")))
+        self.assertEqual(os.listdir(os.path.join(root, "data")), [])
+        self.assertTrue(os.path.isfile(os.path.join(root, "multibag",
+                                                    "deprecated-info.txt")))
+
+        # the head bag itself is left untouched
+        self.assertTrue(os.path.isfile(os.path.join(headbag, "data", "trial1.json")))
+
+        mdata = NISTBag(root).nerdm_record(True)
+        self.assertEquals(mdata['version'], "1.0+ (in edit)")
+
     def test_create_from_nerdm(self):
         headbag = os.path.join(self.nerddir, "ABCDEFG.json")
         root = os.path.join(self.tf.mkdir("update"), "goober")
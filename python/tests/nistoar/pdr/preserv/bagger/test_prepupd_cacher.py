@@ -1,5 +1,5 @@
 from __future__ import absolute_import
-import os, pdb, sys, json, requests, logging, time, re, hashlib, shutil
+import os, pdb, sys, json, requests, logging, time, re, hashlib, shutil, threading
 import unittest as test
 
 from nistoar.testing import *
@@ -214,6 +214,150 @@ class TestHeadBagCacher(test.TestCase):
 
         self.assertIsNone(self.cacher.cache_headbag("goober"))
 
+class FakeDistribService(object):
+    """
+    a stand-in for the distribution service client that serves bags from the
+    test data directory
+    """
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.fetched = []
+        self._lock = threading.Lock()
+
+    def retrieve_file(self, relurl, filepath):
+        with self._lock:
+            self.fetched.append(relurl)
+        time.sleep(self.delay)
+        shutil.copy(os.path.join(datadir, os.path.basename(relurl)), filepath)
+
+class TestHeadBagCacherPolicy(test.TestCase):
+
+    bags = {
+        "pdr1010": ("1", "pdr1010.mbag0_3-2.zip"),
+        "pdr2210": ("2", "pdr2210.2.mbag0_3-2.zip"),
+        "1491":    ("1.0", "1491.1_0.mbag0_4-0.zip")
+    }
+
+    def setUp(self):
+        self.cachedir = os.path.join(tmpdir(), "hbcache")
+        if os.path.isdir(self.cachedir):
+            shutil.rmtree(self.cachedir)
+        os.mkdir(self.cachedir)
+        self.svc = FakeDistribService()
+        self.cacher = self.create_cacher()
+
+    def create_cacher(self, policy=None):
+        out = prepupd.HeadBagCacher(self.svc, self.cachedir, policy=policy)
+        for aipid, (ver, name) in self.bags.items():
+            out._cache_head_info(aipid, ver, {"aipid": aipid, "name": name,
+                                              "sinceVersion": ver})
+        return out
+
+    def cache(self, aipid):
+        return self.cacher.cache_headbag(aipid, self.bags[aipid][0], False)
+
+    def size_of(self, aipid):
+        return os.stat(os.path.join(datadir, self.bags[aipid][1])).st_size
+
+    def test_stats(self):
+        bagfile = self.cache("pdr1010")
+        self.assertTrue(os.path.isfile(bagfile))
+        self.assertEqual(self.cache("pdr1010"), bagfile)
+        self.assertEqual(len(self.svc.fetched), 1)
+        self.assertEqual(os.listdir(self.cachedir).count("pdr1010.mbag0_3-2.zip"), 1)
+
+        stats = self.cacher.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['coalesced'], 0)
+        self.assertEqual(stats['evictions'], 0)
+        self.assertEqual(stats['bytes_fetched'], self.size_of("pdr1010"))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_max_size(self):
+        limit = self.size_of("pdr1010") + self.size_of("1491")
+        self.cacher = self.create_cacher({"max_size": limit})
+        b1 = self.cache("pdr1010")
+        b2 = self.cache("1491")
+        self.assertTrue(os.path.exists(b1))
+        self.assertTrue(os.path.exists(b2))
+
+        # make sure 1491 is the least recently used
+        os.utime(b2, (time.time()-100, time.time()-100))
+        b3 = self.cache("pdr2210")
+        self.assertTrue(os.path.exists(b3))
+        self.assertTrue(os.path.exists(b1))
+        self.assertFalse(os.path.exists(b2))
+        self.assertNotIn("1.0", self.cacher._recall_head_info("1491"))
+
+        stats = self.cacher.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['bytes_evicted'], self.size_of("1491"))
+
+        # the latest bag is kept even if it alone exceeds the limit
+        self.cacher.max_size = 1
+        self.assertEqual(self.cacher.enforce_policy(keep=b3), [b1])
+        self.assertTrue(os.path.exists(b3))
+
+    def test_max_age(self):
+        self.cacher = self.create_cacher({"max_age": 60})
+        b1 = self.cache("pdr1010")
+        os.utime(b1, (time.time()-100, time.time()-100))
+        b2 = self.cache("pdr2210")
+        self.assertFalse(os.path.exists(b1))
+        self.assertTrue(os.path.exists(b2))
+        self.assertEqual(self.cacher.enforce_policy(), [])
+
+    def test_bad_policy(self):
+        with self.assertRaises(prepupd.ConfigurationException):
+            self.create_cacher({"max_size": "big"})
+
+    def test_single_flight(self):
+        self.svc.delay = 0.3
+        results = []
+        def request():
+            results.append(self.cache("pdr1010"))
+        threads = [threading.Thread(target=request) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(self.svc.fetched), 1)
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(results), 4)
+        stats = self.cacher.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['coalesced'] + stats['hits'], 3)
+        self.assertEqual([f for f in os.listdir(self.cachedir) if f.endswith(".part")], [])
+
+    def test_stale_partial(self):
+        self.cacher = self.create_cacher({"max_age": 60})
+        part = os.path.join(self.cachedir, "pdr2210.2.mbag0_3-2.zip.part")
+        with open(part, 'w') as fd:
+            fd.write("partial")
+
+        # a fresh partial download is kept so that it can be resumed
+        self.cache("pdr1010")
+        self.assertTrue(os.path.exists(part))
+
+        os.utime(part, (time.time()-100, time.time()-100))
+        self.assertEqual(self.cacher.enforce_policy(), [part])
+        self.assertFalse(os.path.exists(part))
+
+    def test_confirm_with_transfer_checksum(self):
+        bagfile = self.cache("pdr1010")
+        hinfo = {"aipid": "pdr1010", "name": self.bags["pdr1010"][1], "sinceVersion": "1",
+                 "checksum": {"hash": "goob", "algorithm": "sha256"}}
+
+        # the checksum from the transfer is trusted over reading the file
+        self.cacher.confirm_bagfile(hinfo, checksum="goob")
+        self.assertTrue(os.path.exists(bagfile))
+
+        with self.assertRaises(prepupd.CorruptedBagError):
+            self.cacher.confirm_bagfile(hinfo, checksum="gurn")
+        self.assertFalse(os.path.exists(bagfile))
+
         
         
                     
@@ -0,0 +1,171 @@
+import os, sys, pdb, shutil, json, time
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagger.srcindex as si
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+def touch(path, content="x"):
+    with open(path, 'w') as fd:
+        fd.write(content)
+
+def bump_mtime(dirpath):
+    # make sure the directory's modification time changes (to a time old enough
+    # that the index will trust it)
+    st = os.stat(dirpath)
+    os.utime(dirpath, (st.st_atime, time.time() - 10))
+
+def age_mtimes(rootdir):
+    # set the modification time of the directories below rootdir well into the past
+    past = time.time() - 100
+    for dirpath, subdirs, files in os.walk(rootdir):
+        os.utime(dirpath, (past, past))
+
+class TestSourceIndex(test.TestCase):
+
+    def setUp(self):
+        si.clear_indexes()
+        self.tf = Tempfiles()
+        self.root = self.tf.mkdir("sip")
+        os.makedirs(os.path.join(self.root, "trial3", "deep"))
+        os.makedirs(os.path.join(self.root, "_preserv"))
+        touch(os.path.join(self.root, "trial1.json"), "{}")
+        touch(os.path.join(self.root, "_pod.json"))
+        touch(os.path.join(self.root, ".hidden"))
+        touch(os.path.join(self.root, "trial3", "trial3a.json"), "[ 1 ]")
+        touch(os.path.join(self.root, "trial3", "deep", "d.dat"))
+        touch(os.path.join(self.root, "_preserv", "bag.zip"))
+        age_mtimes(self.root)
+        self.idx = si.SourceIndex(self.root)
+
+    def tearDown(self):
+        si.clear_indexes()
+        self.tf.clean()
+
+    def test_files(self):
+        files = self.idx.files()
+        self.assertEqual(sorted(files.keys()),
+                         ["trial1.json", "trial3/deep/d.dat", "trial3/trial3a.json"])
+        loc, size, mtime = files["trial3/trial3a.json"]
+        self.assertEqual(loc, os.path.join(self.root, "trial3", "trial3a.json"))
+        self.assertEqual(size, 5)
+        self.assertEqual(mtime, os.stat(loc).st_mtime)
+
+        self.assertEqual(self.idx.locations()["trial1.json"],
+                         os.path.join(self.root, "trial1.json"))
+
+    def test_refresh(self):
+        files = self.idx.files()
+        self.assertIs(self.idx.files(), files)
+
+        # unchanged directories are not re-listed
+        save = si._list_dir
+        listed = []
+        def _list_dir(path):
+            listed.append(path)
+            return save(path)
+        si._list_dir = _list_dir
+        try:
+            self.idx.refresh()
+            self.assertEqual(listed, [])
+
+            deep = os.path.join(self.root, "trial3", "deep")
+            touch(os.path.join(deep, "e.dat"))
+            bump_mtime(deep)
+            files = self.idx.files()
+            self.assertEqual(listed, [deep])
+            self.assertIn("trial3/deep/e.dat", files)
+
+            del listed[:]
+            shutil.rmtree(deep)
+            bump_mtime(os.path.join(self.root, "trial3"))
+            files = self.idx.files()
+            self.assertEqual(listed, [os.path.join(self.root, "trial3")])
+            self.assertEqual(sorted(files.keys()), ["trial1.json", "trial3/trial3a.json"])
+        finally:
+            si._list_dir = save
+
+    def test_racy_mtime(self):
+        # a directory modified shortly before it was listed is re-listed, even if
+        # its modification time has not changed
+        mtime = float(int(time.time()))
+        os.utime(self.root, (mtime, mtime))
+        self.idx.files()
+
+        save = si._list_dir
+        listed = []
+        def _list_dir(path):
+            listed.append(path)
+            return save(path)
+        si._list_dir = _list_dir
+        try:
+            touch(os.path.join(self.root, "trial2.json"))
+            os.utime(self.root, (mtime, mtime))
+            self.assertIn("trial2.json", self.idx.files())
+            self.assertEqual(listed, [self.root])
+
+            # once the directory is old enough, it is trusted again
+            del listed[:]
+            bump_mtime(self.root)
+            self.idx.refresh()
+            self.assertEqual(listed, [self.root])
+            del listed[:]
+            self.idx.refresh()
+            self.assertEqual(listed, [])
+        finally:
+            si._list_dir = save
+
+    def test_missing(self):
+        idx = si.SourceIndex(os.path.join(self.root, "goob"))
+        self.assertEqual(idx.files(), {})
+
+    def test_stamp(self):
+        stamp = self.idx.stamp()
+        self.assertEqual(self.idx.stamp(), stamp)
+
+        # modifying a file in place does not change the stamp
+        touch(os.path.join(self.root, "trial1.json"), "[]")
+        self.assertEqual(self.idx.stamp(), stamp)
+
+        deep = os.path.join(self.root, "trial3", "deep")
+        touch(os.path.join(deep, "e.dat"))
+        bump_mtime(deep)
+        self.assertNotEqual(self.idx.stamp(), stamp)
+
+        self.assertEqual(si.stamp_for([]), '')
+        self.assertEqual(si.stamp_for([self.root]), si.index_for(self.root).stamp())
+        both = si.stamp_for([self.root, deep])
+        self.assertEqual(len(both), 16)
+        self.assertNotEqual(both, si.stamp_for([deep, self.root]))
+
+    def test_stamp_nonascii(self):
+        idx = si.SourceIndex(unicode(self.root))
+        stamp = idx.stamp()
+
+        trial3 = os.path.join(self.root, "trial3")
+        touch(os.path.join(trial3, u"trial3\u03b1.json".encode('utf-8')))
+        bump_mtime(trial3)
+        self.assertIn(u"trial3/trial3\u03b1.json", idx.files())
+        self.assertNotEqual(idx.stamp(), stamp)
+        self.assertEqual(len(si.stamp_for([unicode(self.root), trial3])), 16)
+
+    def test_index_for(self):
+        idx = si.index_for(self.root)
+        self.assertIs(si.index_for(self.root+'/'), idx)
+        self.assertIsNot(si.index_for(os.path.join(self.root, "trial3")), idx)
+
+        si.set_cache_size(1)
+        try:
+            si.index_for(os.path.join(self.root, "trial3"))
+            self.assertIsNot(si.index_for(self.root), idx)
+        finally:
+            si.set_cache_size(si.DEF_CACHE_SIZE)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,183 @@
+import os, sys, pdb, shutil, json, time
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagger.storecat as sc
+
+storedir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "distrib", "data")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestStoreCatalog(test.TestCase):
+
+    def setUp(self):
+        sc.clear_catalogs()
+        self.tf = Tempfiles()
+        self.store = self.tf.mkdir("store")
+        for f in os.listdir(storedir):
+            if f.startswith("pdr2210."):
+                shutil.copy(os.path.join(storedir, f), self.store)
+        with open(os.path.join(self.store, "pdr2210.2.mbag0_3-2.zip.sha256"), 'w') as fd:
+            fd.write("abcdef\n")
+        with open(os.path.join(self.store, "README.txt"), 'w') as fd:
+            fd.write("not a bag\n")
+        self.cat = sc.StoreCatalog(self.store)
+
+    def tearDown(self):
+        sc.clear_catalogs()
+        self.tf.clean()
+
+    def _touch_dir(self):
+        # make sure the directory's modification time changes
+        st = os.stat(self.store)
+        os.utime(self.store, (st.st_atime, st.st_mtime + 5))
+
+    def test_bag_files(self):
+        self.assertEqual(self.cat.bag_files("pdr2210"),
+                         ["pdr2210.1_0.mbag0_3-0.zip", "pdr2210.1_0.mbag0_3-1.zip",
+                          "pdr2210.2.mbag0_3-2.zip", "pdr2210.3_1_3.mbag0_3-5.zip"])
+        self.assertTrue(self.cat.has_aip("pdr2210"))
+        self.assertFalse(self.cat.has_aip("pdr1010"))
+        self.assertEqual(self.cat.bag_files("pdr1010"), [])
+
+    def test_versions(self):
+        vers = self.cat.versions("pdr2210")
+        self.assertEqual(list(vers.keys()), ["1.0", "2", "3.1.3"])
+        self.assertEqual([e['bag'] for e in vers["1.0"]],
+                         ["pdr2210.1_0.mbag0_3-0", "pdr2210.1_0.mbag0_3-1"])
+        ent = vers["2"][0]
+        self.assertEqual(ent['aipid'], "pdr2210")
+        self.assertEqual(ent['size'],
+                         os.stat(os.path.join(self.store, "pdr2210.2.mbag0_3-2.zip")).st_size)
+        self.assertEqual(ent['sha256'], "abcdef")
+        self.assertFalse(ent['removed'])
+        self.assertIsNone(vers["1.0"][0]['sha256'])
+
+    def test_serializations_of(self):
+        self.assertEqual(self.cat.serializations_of("pdr2210.2.mbag0_3-2"),
+                         ["pdr2210.2.mbag0_3-2.zip"])
+        self.assertEqual(self.cat.serializations_of("pdr2210.2"), [])
+
+    def test_refresh(self):
+        self.assertEqual(len(self.cat.bag_files("pdr2210")), 4)
+
+        os.remove(os.path.join(self.store, "pdr2210.1_0.mbag0_3-0.zip"))
+        shutil.copy(os.path.join(storedir, "pdr1010.mbag0_3-1.zip"), self.store)
+        with open(os.path.join(self.store, "pdr2210.2.mbag0_3-2.zip.removed"), 'w') as fd:
+            pass
+        self._touch_dir()
+
+        self.assertEqual(len(self.cat.bag_files("pdr2210")), 3)
+        self.assertEqual(self.cat.bag_files("pdr1010"), ["pdr1010.mbag0_3-1.zip"])
+        self.assertTrue(self.cat.entry("pdr2210.2.mbag0_3-2.zip")['removed'])
+        self.assertIsNone(self.cat.entry("pdr2210.2.mbag0_3-2.zip.removed"))
+
+    def test_rewritten_in_place(self):
+        bagf = os.path.join(self.store, "pdr2210.2.mbag0_3-2.zip")
+        self.assertEqual(len(self.cat.bag_files("pdr2210")), 4)
+        ent = self.cat.entry("pdr2210.2.mbag0_3-2.zip")
+        self.assertEqual(ent['size'], os.stat(bagf).st_size)
+        self.assertEqual(ent['mtime'], os.stat(bagf).st_mtime)
+        self.assertEqual(ent['sha256'], "abcdef")
+
+        # rewriting the files does not change the directory's modification time
+        dirst = os.stat(self.store)
+        with open(bagf, 'a') as fd:
+            fd.write("more")
+        with open(bagf+".sha256", 'w') as fd:
+            fd.write("fedcba\n")
+        os.utime(self.store, (dirst.st_atime, dirst.st_mtime))
+
+        ent = self.cat.entry("pdr2210.2.mbag0_3-2.zip")
+        self.assertEqual(ent['size'], os.stat(bagf).st_size)
+        self.assertEqual(ent['sha256'], "fedcba")
+        self.assertEqual(self.cat.versions("pdr2210")["2"][0]['sha256'], "fedcba")
+
+        # a change in modification time alone is also noticed
+        with open(bagf+".sha256", 'w') as fd:
+            fd.write("123456\n")
+        st = os.stat(bagf)
+        os.utime(bagf, (st.st_atime, st.st_mtime + 5))
+        os.utime(self.store, (dirst.st_atime, dirst.st_mtime))
+        self.assertEqual(self.cat.entry("pdr2210.2.mbag0_3-2.zip")['sha256'], "123456")
+
+        # as is the file's removal
+        os.remove(bagf)
+        os.utime(self.store, (dirst.st_atime, dirst.st_mtime))
+        self.assertIsNone(self.cat.entry("pdr2210.2.mbag0_3-2.zip"))
+        self.assertNotIn("2", self.cat.versions("pdr2210"))
+
+    def test_record_delivery(self):
+        self.assertEqual(self.cat.bag_files("pdr1010"), [])
+        stage = self.tf.mkdir("stage")
+        bagf = os.path.join(stage, "pdr1010.mbag0_3-2.zip")
+        shutil.copy(os.path.join(storedir, "pdr1010.mbag0_3-2.zip"), bagf)
+        with open(bagf+".sha256", 'w') as fd:
+            fd.write("123456\n")
+        shutil.copy(bagf, self.store)
+        shutil.copy(bagf+".sha256", self.store)
+
+        self.cat.record_delivery([bagf, bagf+".sha256"])
+        self.assertEqual(self.cat._files["pdr1010.mbag0_3-2.zip"]['sha256'], "123456")
+        self.assertEqual(self.cat.bag_files("pdr1010"), ["pdr1010.mbag0_3-2.zip"])
+        self.assertEqual(self.cat.entry("pdr1010.mbag0_3-2.zip")['version'], "")
+
+    def test_persist(self):
+        catfile = os.path.join(self.tf.mkdir("cat"), "cat.json")
+        self.cat = sc.StoreCatalog(self.store, catfile)
+        self.assertEqual(len(self.cat.bag_files("pdr2210")), 4)
+        self.assertTrue(os.path.isfile(catfile))
+
+        # a new catalog loads the persisted data without rescanning
+        with open(catfile) as fd:
+            data = json.load(fd)
+        del data['files']["pdr2210.1_0.mbag0_3-0.zip"]
+        with open(catfile, 'w') as fd:
+            json.dump(data, fd)
+        cat = sc.StoreCatalog(self.store, catfile)
+        self.assertEqual(len(cat.bag_files("pdr2210")), 3)
+
+        # ...until the directory changes or a rebuild is requested
+        cat.rebuild()
+        self.assertEqual(len(cat.bag_files("pdr2210")), 4)
+
+    def test_unwritable_catdir(self):
+        # a catalog that cannot be persisted still answers queries
+        notadir = self.tf("notadir")
+        self.tf.track("notadir")
+        with open(notadir, 'w') as fd:
+            fd.write("a file\n")
+        cat = sc.StoreCatalog(self.store, os.path.join(notadir, "cat", "cat.json"))
+        self.assertEqual(len(cat.bag_files("pdr2210")), 4)
+        self.assertTrue(cat.has_aip("pdr2210"))
+        cat.record_delivery([os.path.join(self.store, "pdr2210.3_0.mbag0_3-5.zip")])
+
+        # a missing catalog directory is created
+        catfile = os.path.join(self.tf.root, "newcat", "cat.json")
+        self.tf.track("newcat")
+        cat = sc.StoreCatalog(self.store, catfile)
+        self.assertEqual(len(cat.bag_files("pdr2210")), 4)
+        self.assertTrue(os.path.isfile(catfile))
+
+    def test_catalog_for(self):
+        cat = sc.catalog_for(self.store)
+        self.assertIs(sc.catalog_for(self.store), cat)
+        self.assertIsNone(cat.catfile)
+
+        catdir = self.tf.mkdir("cat")
+        cat = sc.catalog_for(self.store, catdir)
+        self.assertTrue(cat.catfile.startswith(catdir))
+        self.assertIs(sc.catalog_for(self.store), cat)
+
+    def test_missing_dir(self):
+        cat = sc.StoreCatalog(os.path.join(self.store, "goob"))
+        self.assertEqual(cat.bag_files("pdr2210"), [])
+        self.assertFalse(cat.has_aip("pdr2210"))
+
+
+if __name__ == '__main__':
+    test.main()
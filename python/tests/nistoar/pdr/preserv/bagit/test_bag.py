@@ -243,6 +243,36 @@ class TestNISTBag(test.TestCase):
         self.assertIn('previewURL', trial1)
         self.assertTrue(trial1['previewURL'].endswith("trial1.json/preview"))
 
+    def test_nerdm_record_changes(self):
+        tf = Tempfiles()
+        try:
+            bdir = os.path.join(tf.mkdir("bagcopy"), "samplembag")
+            shutil.copytree(bagdir, bdir)
+            self.bag = bag.NISTBag(bdir)
+            nerd = self.bag.nerdm_record()
+            self.assertEqual(len(nerd['components']), 5)
+            nerd['components'][0]['title'] = "Gurn"   # record is a copy
+
+            # changes to the metadata files are picked up
+            shutil.rmtree(os.path.join(bdir, "metadata", "trial3"))
+            mdfile = os.path.join(bdir, "metadata", "trial1.json", "nerdm.json")
+            with open(mdfile) as fd:
+                md = json.load(fd, object_pairs_hook=OrderedDict)
+            md['title'] = "Goober"
+            st = os.stat(mdfile)
+            with open(mdfile, 'w') as fd:
+                json.dump(md, fd, indent=4)
+            os.utime(mdfile, (st.st_atime, st.st_mtime + 5))
+
+            nerd = bag.NISTBag(bdir).nerdm_record()
+            self.assertEqual(len(nerd['components']), 3)
+            trial1 = [c for c in nerd['components']
+                        if c.get('filepath') == "trial1.json"][0]
+            self.assertEqual(trial1['title'], "Goober")
+            self.assertNotIn("Gurn", [c.get('title') for c in nerd['components']])
+        finally:
+            tf.clean()
+
     def test_comp_exists(self):
         self.assertTrue( self.bag.comp_exists("trial1.json") )
         self.assertTrue( self.bag.comp_exists("trial2.json") )
@@ -9,7 +9,7 @@ from collections import OrderedDict
 from nistoar.testing import *
 import nistoar.pdr.preserv.bagit.builder as bldr
 import nistoar.pdr.exceptions as exceptions
-from nistoar.pdr.utils import read_nerd
+from nistoar.pdr.utils import read_nerd, checksum_of
 from nistoar.nerdm.constants import CORE_SCHEMA_URI, PUB_SCHEMA_URI
 
 # datadir = tests/nistoar/pdr/preserv/data
@@ -702,6 +702,63 @@ class TestBuilder2(test.TestCase):
             self.bag.update_metadata_for("trial/readme.txt",
                                          {"hand": "ear"}, "ChecksumFile")
 
+    def test_batch_update_metadata(self):
+        self.bag.ensure_bag_structure()
+        self.bag.define_component("trial/readme.txt", "DataFile")
+        self.assertFalse(self.bag.batching)
+
+        self.bag.begin_batch()
+        self.assertTrue(self.bag.batching)
+        md = self.bag.update_metadata_for("trial/readme.txt", {"foo": "bar"})
+        self.assertEqual(md['foo'], "bar")
+        md = self.bag.update_metadata_for("trial/readme.txt", {"goob": "gurn"})
+        self.assertEqual(md['foo'], "bar")
+        self.assertEqual(md['goob'], "gurn")
+        md = self.bag.update_metadata_for("trial/data/a.dat", {"size": 3},
+                                          "DataFile")
+        self.assertEqual(md['filepath'], "trial/data/a.dat")
+        
+        # nothing written yet
+        self.assertNotIn("foo", self.bag.bag.nerd_metadata_for("trial/readme.txt"))
+        self.assertFalse(os.path.exists(self.bag.bag.nerd_file_for("trial/data/a.dat")))
+
+        # resource-level updates are not batched
+        self.bag.update_metadata_for("", {"title": "Goober"})
+        self.assertEqual(self.bag.bag.nerd_metadata_for("")['title'], "Goober")
+
+        # a rejected update does not lose the pending one
+        with self.assertRaises(exceptions.StateException):
+            self.bag.update_metadata_for("trial/readme.txt", {"foo": "gurn"},
+                                         "Subcollection")
+
+        self.assertEqual(self.bag.end_batch(), 2)
+        self.assertFalse(self.bag.batching)
+        written = read_nerd(self.bag.bag.nerd_file_for("trial/readme.txt"))
+        self.assertEqual(written['foo'], "bar")
+        self.assertEqual(written['goob'], "gurn")
+        written = read_nerd(self.bag.bag.nerd_file_for("trial/data/a.dat"))
+        self.assertEqual(written['size'], 3)
+        self.assertTrue(os.path.exists(self.bag.bag.nerd_file_for("trial/data")))
+        self.assertEqual(self.bag.end_batch(), 0)
+
+        # the batch is summarized in the bag's log
+        with open(os.path.join(self.bag.bagdir, "preserv.log")) as fd:
+            log = fd.read()
+        self.assertIn("Updated metadata for 2 file components (1 new)", log)
+        self.assertNotIn("Creating new DataFile: trial/data/a.dat", log)
+
+        # replacing metadata supersedes a pending update
+        self.bag.begin_batch()
+        self.bag.update_metadata_for("trial/readme.txt", {"foo": "gurn"})
+        md = self.bag.define_component("trial/readme.txt", "DataFile")
+        self.assertEqual(md['foo'], "gurn")
+        self.bag.replace_metadata_for("trial/readme.txt",
+                                      {"filepath": "trial/readme.txt", "hand": "eye"})
+        self.assertEqual(self.bag.end_batch(), 0)
+        md = self.bag.bag.nerd_metadata_for("trial/readme.txt")
+        self.assertNotIn("foo", md)
+        self.assertEqual(md['hand'], "eye")
+
     def test_update_metadata_for_nonfile(self):
         md = self.bag.define_component("@id:#readme.txt", "grn:Goober")
         self.assertEqual(md['@id'], "#readme.txt")
@@ -1557,7 +1614,7 @@ class TestBuilder2(test.TestCase):
                 dfp = os.path.join(self.bag.bagdir, parts[1])
                 self.assertTrue(os.path.exists(dfp),
                                 "Datafile not found: "+parts[1])
-                self.assertEqual(parts[0], bldr.checksum_of(dfp))
+                self.assertEqual(parts[0], checksum_of(dfp))
         self.assertEqual(c, len(datafiles))
 
         self.bag.write_data_manifest(True)
@@ -1577,7 +1634,7 @@ class TestBuilder2(test.TestCase):
                 dfp = os.path.join(self.bag.bagdir, parts[1])
                 self.assertTrue(os.path.exists(dfp),
                                 "Datafile not found: "+parts[1])
-                self.assertEqual(parts[0], bldr.checksum_of(dfp))
+                self.assertEqual(parts[0], checksum_of(dfp))
         self.assertEqual(c, len(datafiles))
 
     def test_write_baginfo_data(self):
@@ -1857,8 +1914,94 @@ class TestBuilder2(test.TestCase):
         self.assertTrue(os.path.isfile(os.path.join(self.bag.bagdir, "bag-info.txt")))
         self.assertTrue(os.path.isfile(os.path.join(self.bag.bagdir, "about.txt")))
         self.assertTrue(os.path.isdir(os.path.join(self.bag.bagdir, "multibag")))
-        
-        
+
+    def test_finalize_incremental(self):
+        self.cfg['change_journal'] = True
+        self.bag = bldr.BagBuilder(self.tf.root, "testbag", self.cfg)
+        podfile = os.path.join(datadir, "_pod.json")
+        manfile = os.path.join(self.bag.bagdir, "manifest-sha256.txt")
+        journalfile = os.path.join(self.tf.root, ".testbag"+bldr.CHANGE_JOURNAL_FILENAME)
+        self.tf.track(".testbag"+bldr.CHANGE_JOURNAL_FILENAME)
+
+        self.bag.assign_id("mds00kkd13")
+        self.bag.add_data_file("trial1.json", os.path.join(datadir, "trial1.json"))
+        path = os.path.join("trial3", "trial3a.json")
+        self.bag.add_data_file(path, os.path.join(datadir, path))
+        with open(podfile) as fd:
+            pod = json.load(fd)
+        self.bag.add_ds_pod(pod, convert=True, savefilemd=False)
+
+        self.assertIsNotNone(self.bag.journal)
+        self.assertIn("trial1.json", self.bag.journal.changes)
+        self.assertFalse(self.bag.journal.has_baseline)
+
+        # no baseline: the whole bag gets finalized
+        self.bag.finalize_bag({"incremental": True})
+        self.assertTrue(self.bag.journal.has_baseline)
+        self.assertEqual(len(self.bag.journal), 0)
+        self.assertTrue(os.path.isfile(journalfile))
+        self.assertFalse(os.path.exists(os.path.join(self.bag.bagdir,
+                                                     bldr.CHANGE_JOURNAL_FILENAME)))
+        self.assertNotIn(bldr.CHANGE_JOURNAL_FILENAME, os.listdir(self.bag.bagdir))
+        with open(manfile) as fd:
+            lines = [l.split()[1] for l in fd]
+        self.assertEqual(sorted(lines), ["data/trial1.json", "data/trial3/trial3a.json"])
+
+        # make some changes
+        self.bag.add_data_file("trial2.json", os.path.join(datadir, "trial2.json"))
+        self.bag.remove_component(path)
+        self.assertEqual(self.bag.journal.changes[path], "removed")
+        self.assertIn("trial2.json", self.bag.journal.dirty_components())
+
+        self.bag.finalize_bag({"incremental": True})
+        self.assertEqual(len(self.bag.journal), 0)
+        with open(manfile) as fd:
+            lines = [l.split() for l in fd]
+        self.assertEqual(sorted([l[1] for l in lines]),
+                         ["data/trial1.json", "data/trial2.json"])
+        md = self.bag.bag.nerd_metadata_for("trial2.json")
+        self.assertIn([md['checksum']['hash'], "data/trial2.json"], lines)
+
+        info = self.bag.bag.get_baginfo()
+        self.assertEqual(len(info['Payload-Oxum']), 1)
+        self.assertEqual(len(info['Bag-Oxum']), 1)
+        oxum = bldr.measure_dir_size(self.bag.bag.data_dir)
+        self.assertEqual(info['Payload-Oxum'][0], "{0}.{1}".format(*oxum))
+        self.assertFalse(os.path.exists(os.path.join(self.bag.bagdir,
+                                                     bldr.CHANGE_JOURNAL_FILENAME)))
+        self.assertFalse(self.bag.journal.dirty)
+
+    def test_component_index(self):
+        self.cfg['component_index'] = True
+        self.bag = bldr.BagBuilder(self.tf.root, "testbag", self.cfg)
+        indexfile = os.path.join(self.bag.bagdir, "__nerdm_index.json")
+
+        self.bag.assign_id("mds00kkd13")
+        self.bag.add_data_file("trial1.json", os.path.join(datadir, "trial1.json"))
+        with open(os.path.join(datadir, "_pod.json")) as fd:
+            pod = json.load(fd)
+        self.bag.add_ds_pod(pod, convert=True, savefilemd=False)
+        self.bag.update_annotations_for("trial1.json", {"title": "Goober"})
+        self.assertTrue(self.bag.bag.index.persist)
+        nerd = self.bag.bag.nerdm_record(True)
+        self.assertTrue(os.path.isfile(indexfile))
+        files = [c for c in nerd['components'] if 'filepath' in c]
+        self.assertEqual([c['filepath'] for c in files], ["trial1.json"])
+        self.assertEqual(files[0]['title'], "Goober")
+
+        self.bag.update_annotations_for("trial1.json", {"title": "Gurn"})
+        nerd = self.bag.bag.nerdm_record(True)
+        files = [c for c in nerd['components'] if 'filepath' in c]
+        self.assertEqual(files[0]['title'], "Gurn")
+
+        self.bag.remove_component("trial1.json")
+        nerd = self.bag.bag.nerdm_record(True)
+        self.assertEqual([c for c in nerd['components'] if 'filepath' in c], [])
+
+        self.bag.finalize_bag()
+        self.assertFalse(os.path.exists(indexfile))
+
+
 
     def test_matches_type(self):
         types = ["nrdp:DataFile", "Downloadable", "dcat:Distribution"]
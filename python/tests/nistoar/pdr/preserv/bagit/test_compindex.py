@@ -0,0 +1,178 @@
+import os, sys, pdb, shutil, json, time, threading
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagit.compindex as ci
+
+datadir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+bagsrc = os.path.join(datadir, "samplembag")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestComponentIndex(test.TestCase):
+
+    def setUp(self):
+        ci.clear_cache()
+        self.tf = Tempfiles()
+        self.bagdir = os.path.join(self.tf.mkdir("cibag"), "samplembag")
+        shutil.copytree(bagsrc, self.bagdir)
+        self.mddir = os.path.join(self.bagdir, "metadata")
+
+    def tearDown(self):
+        ci.clear_cache()
+        self.tf.clean()
+
+    def _rewrite(self, path, data):
+        # make sure the modification time changes
+        st = os.stat(path)
+        with open(path, 'w') as fd:
+            json.dump(data, fd, indent=2)
+        os.utime(path, (st.st_atime, st.st_mtime + 5))
+
+    def test_refresh(self):
+        idx = ci.ComponentIndex(self.bagdir)
+        self.assertFalse(idx.persist)
+        ents = idx.refresh()
+        self.assertEqual(set(ents.keys()),
+                         set(["", "trial1.json", "trial2.json", "trial3",
+                              "trial3/trial3a.json"]))
+        self.assertEqual(ents['trial1.json']['nerdm']['filepath'], "trial1.json")
+        self.assertIsNone(ents['trial1.json']['annot'])
+        self.assertIsNotNone(ents['trial2.json']['annot'])
+        self.assertFalse(os.path.exists(idx.indexfile))
+
+        # unchanged entries are not re-read
+        again = idx.refresh()
+        self.assertIs(again['trial1.json'], ents['trial1.json'])
+
+        # changed entries are
+        nfile = os.path.join(self.mddir, "trial1.json", "nerdm.json")
+        md = ents['trial1.json']['nerdm']
+        md = json.loads(json.dumps(md))
+        md['title'] = "Goober"
+        self._rewrite(nfile, md)
+        again = idx.refresh()
+        self.assertIsNot(again['trial1.json'], ents['trial1.json'])
+        self.assertEqual(again['trial1.json']['nerdm']['title'], "Goober")
+        self.assertIs(again['trial3'], ents['trial3'])
+
+        # removed components drop out
+        shutil.rmtree(os.path.join(self.mddir, "trial3"))
+        again = idx.refresh()
+        self.assertNotIn("trial3", again)
+        self.assertNotIn("trial3/trial3a.json", again)
+
+    def test_same_mtime(self):
+        # a rewrite that leaves the modification time and size unchanged is
+        # still detected
+        # (use whole-second times: py2 can round sub-second ones in os.utime())
+        nfile = os.path.join(self.mddir, "trial1.json", "nerdm.json")
+        mtime = int(os.stat(nfile).st_mtime)
+        os.utime(nfile, (mtime, mtime))
+        st = os.stat(nfile)
+        idx = ci.ComponentIndex(self.bagdir)
+        ents = idx.refresh()
+        with open(nfile) as fd:
+            text = fd.read()
+        time.sleep(0.01)
+        with open(nfile, 'w') as fd:
+            fd.write(text.replace('"trial1.json"', '"trial9.json"'))
+        os.utime(nfile, (mtime, mtime))
+        self.assertEqual(os.stat(nfile).st_mtime, st.st_mtime)
+        self.assertEqual(os.stat(nfile).st_size, st.st_size)
+
+        again = idx.refresh()
+        self.assertEqual(again['trial1.json']['nerdm']['filepath'], "trial9.json")
+
+    def test_concurrent_update(self):
+        idx = ci.ComponentIndex(self.bagdir, True)
+        ents = idx.refresh()
+        errors = []
+        def run():
+            try:
+                for i in range(20):
+                    for path in ents:
+                        idx.update(path)
+                    idx.save()
+            except Exception as ex:
+                errors.append(ex)
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for t in threads:
+            t.start()
+        for i in range(20):
+            self.assertEqual(len(idx.refresh()), len(ents))
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(set(idx.refresh().keys()), set(ents.keys()))
+
+    def test_memory_cache(self):
+        ents = ci.ComponentIndex(self.bagdir).refresh()
+        idx = ci.ComponentIndex(self.bagdir)
+        again = idx.refresh()
+        self.assertIs(again['trial1.json'], ents['trial1.json'])
+
+        ci.clear_cache()
+        again = ci.ComponentIndex(self.bagdir).refresh()
+        self.assertIsNot(again['trial1.json'], ents['trial1.json'])
+        self.assertEqual(again['trial1.json'], ents['trial1.json'])
+
+        ci.set_cache_size(0)
+        try:
+            ents = ci.ComponentIndex(self.bagdir).refresh()
+            again = ci.ComponentIndex(self.bagdir).refresh()
+            self.assertIsNot(again['trial1.json'], ents['trial1.json'])
+        finally:
+            ci.set_cache_size(ci.DEF_CACHE_SIZE)
+
+    def test_update_remove(self):
+        idx = ci.ComponentIndex(self.bagdir)
+        ents = idx.refresh()
+
+        nfile = os.path.join(self.mddir, "trial1.json", "nerdm.json")
+        md = json.loads(json.dumps(ents['trial1.json']['nerdm']))
+        md['title'] = "Goober"
+        self._rewrite(nfile, md)
+        idx.update("trial1.json", nerdm=md)
+        md['title'] = "Gurn"     # index holds a copy
+        again = idx.refresh()
+        self.assertEqual(again['trial1.json']['nerdm']['title'], "Goober")
+
+        # without the data, the update is read from the file
+        md['title'] = "Gurn"
+        self._rewrite(nfile, md)
+        idx.update("trial1.json")
+        self.assertEqual(idx.refresh()['trial1.json']['nerdm']['title'], "Gurn")
+
+        idx.remove("trial3")
+        ents = idx._entries_()
+        self.assertNotIn("trial3", ents)
+        self.assertNotIn("trial3/trial3a.json", ents)
+        self.assertIn("trial1.json", ents)
+
+    def test_persist(self):
+        idx = ci.ComponentIndex(self.bagdir, True)
+        ents = idx.refresh()
+        self.assertTrue(os.path.exists(idx.indexfile))
+
+        # a new index picks up the persisted one
+        idx = ci.ComponentIndex(self.bagdir)
+        self.assertTrue(idx.persist)
+        ci.clear_cache()
+        again = idx.refresh()
+        self.assertEqual(again, ents)
+
+        idx.unpersist()
+        self.assertFalse(os.path.exists(idx.indexfile))
+        idx.update("trial1.json")
+        idx.refresh()
+        self.assertFalse(os.path.exists(idx.indexfile))
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import os, sys, pdb, json
+import unittest as test
+from collections import OrderedDict
+from distutils.spawn import find_executable
+
+from nistoar.pdr import def_jq_libdir
+from nistoar.pdr.exceptions import ConfigurationException
+import nistoar.pdr.preserv.bagit.convert as cvt
+
+# datadir = nistoar/pdr/preserv/data
+datadir = os.path.join( os.path.dirname(os.path.dirname(__file__)), "data" )
+podfile = os.path.join(datadir, "midassip", "review", "1491", "_pod.json")
+nerdfile = os.path.join(datadir, "3A1EE2F169DD3B8CE0531A570681DB5D1491.json")
+
+def read_json(path):
+    with open(path) as fd:
+        return json.load(fd, object_pairs_hook=OrderedDict)
+
+def jq_available():
+    if not def_jq_libdir or not find_executable("jq"):
+        return False
+    try:
+        import nistoar.nerdm.convert
+    except ImportError:
+        return False
+    return True
+
+class TestPODds2Res(test.TestCase):
+
+    def setUp(self):
+        self.cvtr = cvt.PODds2Res()
+        self.pod = read_json(podfile)
+
+    def test_convert_data(self):
+        res = self.cvtr.convert_data(self.pod, "ark:/88434/mds00hw91v")
+        self.assertEqual(res['@id'], "ark:/88434/mds00hw91v")
+        self.assertEqual(res['@context'][1], {"@base": "ark:/88434/mds00hw91v"})
+        self.assertEqual(res['_schema'], cvt.NERDM_SCH_ID)
+        self.assertEqual(res['@type'], ["nrdp:PublicDataResource"])
+        self.assertEqual(res['ediid'], self.pod['identifier'])
+        self.assertEqual(res['title'], self.pod['title'])
+        self.assertEqual(res['description'], [self.pod['description']])
+        self.assertEqual(res['doi'], "doi:10.80443/pdrut-T4SW26")
+        self.assertEqual(res['keyword'], self.pod['keyword'])
+        self.assertEqual(res['publisher'], self.pod['publisher'])
+
+        self.assertEqual(len(res['references']), 1)
+        ref = res['references'][0]
+        self.assertEqual(ref['@type'], ["deo:BibliographicReference"])
+        self.assertEqual(ref['location'], self.pod['references'][0])
+        self.assertEqual(ref['refType'], "IsReferencedBy")
+        self.assertTrue(ref['_extensionSchemas'][0].endswith("#/definitions/DCiteReference"))
+
+        self.assertEqual(res['topic'][0]['@type'], "Concept")
+        self.assertEqual(res['topic'][0]['tag'], "Optical physics")
+        self.assertEqual(res['topic'][0]['scheme'], cvt.THEME_SCHEME)
+
+    def test_components(self):
+        comps = self.cvtr.convert_data(self.pod, "ark:/88434/mds00hw91v")['components']
+        self.assertEqual([c.get('filepath') for c in comps],
+                         ["trial1.json", "trial1.json.sha256", "trial2.json", "trial3",
+                          "trial3/trial3a.json", "trial3/trial3a.json.sha256",
+                          u"trial3/trial3α.json", "sim++.json", None])
+
+        self.assertEqual(comps[0]['@id'], "cmps/trial1.json")
+        self.assertEqual(comps[0]['@type'],
+                         ["nrdp:DataFile", "nrdp:DownloadableFile", "dcat:Distribution"])
+        self.assertEqual(comps[0]['title'], self.pod['distribution'][0]['title'])
+        self.assertTrue(comps[0]['_extensionSchemas'][0].endswith("#/definitions/DataFile"))
+
+        self.assertEqual(comps[1]['@type'][0], "nrdp:ChecksumFile")
+        self.assertEqual(comps[1]['describes'], "cmps/trial1.json")
+        self.assertEqual(comps[1]['algorithm'], {"@type": "Thing", "tag": "sha256"})
+
+        self.assertEqual(comps[3]['@id'], "cmps/trial3")
+        self.assertEqual(comps[3]['@type'], ["nrdp:Subcollection"])
+
+        self.assertEqual(comps[-1]['@type'], ["nrd:Hidden", "dcat:Distribution"])
+        self.assertEqual(comps[-1]['@id'], "#doi:10.80443/pdrut-T4SW26")
+
+        # the input was not changed
+        self.assertNotIn('@id', self.pod['distribution'][0])
+
+    def test_accesspage(self):
+        comp = self.cvtr.dist2comp({"accessURL": "https://goob.net/gurn", "title": "Goob"})
+        self.assertEqual(comp['@type'], ["nrdp:AccessPage", "dcat:Distribution"])
+        self.assertEqual(comp['title'], "Goob")
+        self.assertNotIn('filepath', comp)
+
+    def test_noid(self):
+        res = self.cvtr.convert(json.dumps({"identifier": "goob"}), "")
+        self.assertEqual(res['@context'], cvt.NERDM_CONTEXT)
+        self.assertEqual(res['ediid'], "goob")
+        self.assertNotIn('components', res)
+        self.assertNotIn('doi', res)
+
+    def test_themes(self):
+        self.cvtr = cvt.PODds2Res(["Physics: Optical physics", "Fire : Fire detection"])
+        self.pod['theme'] = ["Fire:Fire detection", "Optical physics"]
+        res = self.cvtr.convert_data(self.pod, "ark:/88434/mds00hw91v")
+        self.assertEqual(res['theme'], self.pod['theme'])
+        self.assertEqual([t['tag'] for t in res['topic']], ["Fire: Fire detection"])
+
+class TestInventory(test.TestCase):
+
+    def setUp(self):
+        # the inventory and hierarchy in this record predate the addition of the
+        # trial3-alpha file
+        self.nerd = read_json(nerdfile)
+        self.comps = [c for c in self.nerd['components']
+                      if c.get('filepath') != u"trial3/trial3α.json"]
+
+    def test_inventory(self):
+        inv = cvt.ComponentCounter().inventory(self.comps)
+        self.assertEqual(inv, self.nerd['inventory'])
+
+    def test_hierarchy(self):
+        hier = cvt.HierarchyBuilder().build_hierarchy(self.comps)
+        self.assertEqual(hier, self.nerd['dataHierarchy'])
+
+    def test_nested(self):
+        comps = [
+            {"filepath": "a", "@type": ["nrdp:Subcollection"]},
+            {"filepath": "a/b", "@type": ["nrdp:Subcollection"]},
+            {"filepath": "a/b/c.txt", "@type": ["nrdp:DataFile"]},
+            {"filepath": "d.txt", "@type": ["nrdp:DataFile"]}
+        ]
+        inv = cvt.ComponentCounter().inventory(comps)
+        self.assertEqual([i['forCollection'] for i in inv], ["", "a", "a/b"])
+        self.assertEqual([(i['childCount'], i['descCount']) for i in inv],
+                         [(2, 4), (1, 2), (1, 1)])
+        self.assertEqual(inv[0]['childCollections'], ["a"])
+        self.assertEqual(inv[1]['childCollections'], ["a/b"])
+
+        hier = cvt.HierarchyBuilder().build_hierarchy(comps)
+        self.assertEqual(hier, [
+            {"filepath": "a", "children": [
+                {"filepath": "a/b", "children": [{"filepath": "a/b/c.txt"}]}
+            ]},
+            {"filepath": "d.txt"}
+        ])
+
+class TestFactories(test.TestCase):
+
+    def test_native(self):
+        cvtr = cvt.make_pod_converter("native")
+        self.assertTrue(isinstance(cvtr, cvt.PODds2Res))
+        self.assertIs(cvt.make_pod_converter("native"), cvtr)
+        self.assertTrue(isinstance(cvt.make_component_counter("native"),
+                                   cvt.ComponentCounter))
+        self.assertTrue(isinstance(cvt.make_hierarchy_builder("native"),
+                                   cvt.HierarchyBuilder))
+
+    def test_default(self):
+        defeng = cvt.default_engine()
+        try:
+            cvt.set_default_engine("native")
+            self.assertTrue(isinstance(cvt.make_pod_converter(), cvt.PODds2Res))
+            with self.assertRaises(ConfigurationException):
+                cvt.set_default_engine("goob")
+            self.assertEqual(cvt.default_engine(), "native")
+        finally:
+            cvt.set_default_engine(defeng)
+
+        with self.assertRaises(ConfigurationException):
+            cvt.make_pod_converter("goob")
+
+class TestJQOutputParity(test.TestCase):
+    # compares against the record produced earlier by the jq engine (nerdfile),
+    # so that this does not depend on jq being installed
+
+    def setUp(self):
+        self.nerd = read_json(nerdfile)
+        self.res = cvt.PODds2Res().convert_data(read_json(podfile), self.nerd['@id'])
+
+    def test_properties(self):
+        for prop in "@id ediid title description keyword theme contactPoint " \
+                    "landingPage modified accessLevel license publisher " \
+                    "language bureauCode programCode".split():
+            self.assertEqual(self.res.get(prop), self.nerd.get(prop), prop)
+
+    def test_references(self):
+        # the schema version in the extension schema URIs may differ
+        strip = lambda ref: OrderedDict((k, v) for k, v in ref.items()
+                                        if k != '_extensionSchemas')
+        self.assertEqual([strip(r) for r in self.res['references']],
+                         [strip(r) for r in self.nerd['references']])
+        for ref in self.res['references']:
+            self.assertTrue(ref['_extensionSchemas'][0].endswith(
+                                                "#/definitions/DCiteReference"))
+
+    def test_components(self):
+        self.assertEqual(dict((c.get('filepath'), c['@type'])
+                              for c in self.res['components']),
+                         dict((c.get('filepath'), c['@type'])
+                              for c in self.nerd['components']))
+
+@test.skipIf(not jq_available(), "jq engine not available")
+class TestJQParity(test.TestCase):
+
+    def setUp(self):
+        self.nerd = read_json(nerdfile)
+
+    def test_inventory(self):
+        jq = cvt.make_component_counter("jq", def_jq_libdir)
+        self.assertEqual(cvt.ComponentCounter().inventory(self.nerd['components']),
+                         jq.inventory(self.nerd['components']))
+
+    def test_hierarchy(self):
+        jq = cvt.make_hierarchy_builder("jq", def_jq_libdir)
+        self.assertEqual(cvt.HierarchyBuilder().build_hierarchy(self.nerd['components']),
+                         jq.build_hierarchy(self.nerd['components']))
+
+    def test_convert(self):
+        pod = read_json(podfile)
+        jq = cvt.make_pod_converter("jq", def_jq_libdir).convert_data(pod, "ark:/88434/goob")
+        nat = cvt.PODds2Res().convert_data(pod, "ark:/88434/goob")
+        for prop in "@id ediid title description doi keyword references".split():
+            self.assertEqual(nat.get(prop), jq.get(prop), prop)
+        self.assertEqual([(c.get('filepath'), c['@type']) for c in nat['components']],
+                         [(c.get('filepath'), c['@type']) for c in jq['components']])
+
+
+if __name__ == '__main__':
+    test.main()
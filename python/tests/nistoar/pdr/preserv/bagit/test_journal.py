@@ -0,0 +1,121 @@
+import os, sys, pdb, shutil
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.bagit.journal import ChangeJournal, CREATED, UPDATED, REMOVED
+
+datadir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "simplesip")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestChangeJournal(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.bagdir = self.tf.mkdir("jbag")
+        self.datadir = os.path.join(self.bagdir, "data")
+        shutil.copytree(datadir, self.datadir)
+        self.jfile = os.path.join(self.bagdir, "__changes.json")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_record(self):
+        jnl = ChangeJournal()
+        self.assertEqual(len(jnl), 0)
+        self.assertFalse(jnl.has_baseline)
+
+        jnl.record("trial1.json", CREATED)
+        jnl.record("trial1.json", UPDATED)
+        jnl.record("", UPDATED)
+        jnl.record("trial2.json", REMOVED)
+        self.assertEqual(jnl.changes, {"trial1.json": CREATED, "": UPDATED,
+                                       "trial2.json": REMOVED})
+        self.assertEqual(jnl.dirty_components(), ["trial1.json", ""])
+        self.assertEqual(jnl.removed_components(), ["trial2.json"])
+
+        jnl.record("trial2.json", CREATED)
+        self.assertEqual(jnl.changes["trial2.json"], UPDATED)
+        jnl.record("trial1.json", REMOVED)
+        self.assertEqual(jnl.removed_components(), ["trial1.json"])
+
+        with self.assertRaises(ValueError):
+            jnl.record("trial1.json", "goob")
+
+    def test_persist(self):
+        jnl = ChangeJournal(self.jfile, self.datadir)
+        jnl.record("trial1.json")
+        self.assertTrue(os.path.exists(self.jfile))
+
+        jnl.reset([100, 3])
+        self.assertFalse(jnl.dirty)
+        jnl.record("trial2.json", CREATED)
+        self.assertTrue(jnl.dirty)
+
+        # an unsaved journal cannot be trusted by other processes
+        other = ChangeJournal(self.jfile, self.datadir)
+        self.assertFalse(other.has_baseline)
+
+        # the file is not rewritten with every change...
+        # (a whole-second time survives os.utime() exactly, even on py2)
+        mtime = int(os.stat(self.jfile).st_mtime) - 10
+        os.utime(self.jfile, (mtime, mtime))
+        jnl.record("trial3", CREATED)
+        self.assertEqual(os.stat(self.jfile).st_mtime, mtime)
+
+        # ...only when saved
+        jnl.save()
+        self.assertFalse(jnl.dirty)
+        jnl = ChangeJournal(self.jfile, self.datadir)
+        self.assertTrue(jnl.has_baseline)
+        self.assertEqual(jnl.changes, {"trial2.json": CREATED, "trial3": CREATED})
+
+        jnl.invalidate()
+        self.assertFalse(jnl.has_baseline)
+        self.assertEqual(len(jnl), 0)
+
+        jnl.unpersist()
+        self.assertFalse(os.path.exists(self.jfile))
+        jnl.record("trial2.json")
+        self.assertFalse(os.path.exists(self.jfile))
+
+    def test_payload_oxum(self):
+        jnl = ChangeJournal(self.jfile, self.datadir)
+        self.assertIsNone(jnl.payload_oxum())
+        jnl.reset([1000, 10])
+        self.assertEqual(jnl.payload_oxum(), [1000, 10])
+
+        t1 = os.path.join(self.datadir, "trial1.json")
+        t1sz = os.stat(t1).st_size
+        jnl.note_data_change("trial1.json")
+        with open(t1, 'a') as fd:
+            fd.write("goob")
+        self.assertEqual(jnl.payload_oxum(), [1004, 10])
+
+        # a new file
+        jnl.note_data_change("trial3/new.json")
+        with open(os.path.join(self.datadir, "trial3", "new.json"), 'w') as fd:
+            fd.write("{}")
+        self.assertEqual(jnl.payload_oxum(), [1006, 11])
+
+        # remove the directory containing the new file
+        t3 = os.path.join(self.datadir, "trial3")
+        t3sz = sum([os.stat(os.path.join(t3, f)).st_size for f in os.listdir(t3)])
+        t3n = len(os.listdir(t3))
+        jnl.note_data_change("trial3")
+        shutil.rmtree(t3)
+        jnl.record("trial3", REMOVED)
+        self.assertEqual(jnl.payload_oxum(), [1006 - t3sz, 11 - t3n])
+
+        # a second change to the same file does not reset its starting size
+        jnl.note_data_change("trial1.json")
+        os.remove(t1)
+        self.assertEqual(jnl.payload_oxum(), [1000 - t3sz + 2 - t1sz, 10 - t3n])
+
+
+if __name__ == '__main__':
+    test.main()
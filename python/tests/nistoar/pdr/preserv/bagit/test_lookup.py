@@ -0,0 +1,114 @@
+import os, sys, pdb, shutil, json, time
+import unittest as test
+
+from nistoar.testing import *
+import nistoar.pdr.preserv.bagit.lookup as lu
+
+datadir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+bagsrc = os.path.join(datadir, "samplembag")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestFileLookupIndex(test.TestCase):
+
+    def setUp(self):
+        lu.clear_cache()
+        self.tf = Tempfiles()
+        self.bagdir = os.path.join(self.tf.mkdir("lubag"), "samplembag")
+        shutil.copytree(bagsrc, self.bagdir)
+        self.lufile = os.path.join(self.bagdir, "multibag", lu.LOOKUP_FILENAME)
+
+    def tearDown(self):
+        lu.clear_cache()
+        self.tf.clean()
+
+    def _append(self, line):
+        st = os.stat(self.lufile)
+        with open(self.lufile, 'a') as fd:
+            fd.write(line+"\n")
+        os.utime(self.lufile, (st.st_atime, st.st_mtime + 5))
+
+    def test_lookup(self):
+        idx = lu.FileLookupIndex(self.bagdir)
+        self.assertEqual(idx.lookupfile, self.lufile)
+        self.assertEqual(idx.lookup_file("data/trial1.json"), "samplembag")
+        self.assertEqual(idx.lookup_file("data/trial3/trial3a.json"), "samplembag")
+        self.assertEqual(idx.lookup_file("metadata/pod.json"), "samplembag")
+        self.assertIsNone(idx.lookup_file("data/goob.txt"))
+        self.assertIn("data/trial2.json", idx)
+        self.assertNotIn("data/goob.txt", idx)
+        self.assertEqual(idx.bag_names(), ["samplembag"])
+        self.assertGreater(len(idx), 4)
+
+    def test_first_listing_wins(self):
+        self._append("data/goob.txt\tgoob-bag")
+        self._append("data/trial1.json\tgoob-bag")
+        idx = lu.FileLookupIndex(self.bagdir)
+        self.assertEqual(idx.lookup_file("data/goob.txt"), "goob-bag")
+        self.assertEqual(idx.lookup_file("data/trial1.json"), "samplembag")
+        self.assertEqual(idx.bag_names(), ["samplembag", "goob-bag"])
+
+    def test_cache(self):
+        idx = lu.FileLookupIndex(self.bagdir)
+        self.assertIsNone(idx.lookup_file("data/goob.txt"))
+        self.assertIn(self.lufile, lu._cache)
+
+        # a new index picks up the cached data while the file is unchanged
+        lu._cache[self.lufile][1][1]['data/cached.txt'] = 0
+        idx = lu.FileLookupIndex(self.bagdir)
+        self.assertEqual(idx.lookup_file("data/cached.txt"), "samplembag")
+
+        # ...but rereads the file once it changes
+        self._append("data/goob.txt\tsamplembag")
+        idx.refresh()
+        self.assertEqual(idx.lookup_file("data/goob.txt"), "samplembag")
+        self.assertIsNone(idx.lookup_file("data/cached.txt"))
+
+        lu.set_cache_size(0)
+        try:
+            self.assertEqual(len(lu._cache), 0)
+            idx.refresh()
+            self.assertEqual(len(lu._cache), 0)
+        finally:
+            lu.set_cache_size(lu.DEF_CACHE_SIZE)
+
+    def test_sidecar(self):
+        sidecar = os.path.join(self.tf.mkdir("lucache"), "samplembag-lookup.json")
+        idx = lu.FileLookupIndex(self.bagdir, sidecar)
+        self.assertEqual(idx.lookup_file("data/trial1.json"), "samplembag")
+        self.assertTrue(os.path.isfile(sidecar))
+        with open(sidecar) as fd:
+            data = json.load(fd)
+        self.assertEqual(data['bags'], ["samplembag"])
+        self.assertEqual(data['files']['data/trial1.json'], 0)
+
+        # the sidecar is used by other processes (i.e. when not cached in memory)
+        lu.clear_cache()
+        data['files']['data/sidecar.txt'] = 0
+        with open(sidecar, 'w') as fd:
+            json.dump(data, fd)
+        idx = lu.FileLookupIndex(self.bagdir, sidecar)
+        self.assertEqual(idx.lookup_file("data/sidecar.txt"), "samplembag")
+
+        # an out-of-date sidecar is rebuilt
+        lu.clear_cache()
+        self._append("data/goob.txt\tsamplembag")
+        idx = lu.FileLookupIndex(self.bagdir, sidecar)
+        self.assertEqual(idx.lookup_file("data/goob.txt"), "samplembag")
+        self.assertIsNone(idx.lookup_file("data/sidecar.txt"))
+        with open(sidecar) as fd:
+            self.assertIn('data/goob.txt', json.load(fd)['files'])
+
+    def test_no_lookup_file(self):
+        os.remove(self.lufile)
+        idx = lu.FileLookupIndex(self.bagdir)
+        self.assertIsNone(idx.lookup_file("data/trial1.json"))
+        self.assertEqual(len(idx), 0)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -216,6 +216,51 @@ class TestMultibagSplitter(test.TestCase):
                          ["dataset-0", "dataset-1", "dataset-2", "dataset-3"])
         self.assertTrue(os.path.isdir(os.path.join(bags[-1], "multibag")))
 
+    def _snapshot(self, bagdir):
+        # map each file in a bag to its checksum
+        out = {}
+        for dir, subdirs, files in os.walk(bagdir):
+            for f in files:
+                path = os.path.join(dir, f)
+                out[os.path.relpath(path, bagdir)] = checksum_of(path)
+        return out
+
+    def test_split_link(self):
+        cfg = {
+            "max_bag_size": 400000,
+            "max_headbag_size": 50000,
+            "split_mode": "link",
+            "verify_complete": True,
+            "validate": True
+        }
+        self.spltr = multibag.MultibagSplitter(self.bagdir, cfg)
+
+        before = self._snapshot(self.bagdir)
+        bags = self.spltr.split(self.workdir)
+
+        # the source bag is left untouched
+        self.assertEqual(self._snapshot(self.bagdir), before)
+        self.assertEqual([os.path.basename(b) for b in bags],
+                         ["dataset-1", "dataset-2", "dataset-3", "dataset-4"])
+        self.assertEqual([f for f in os.listdir(self.workdir) if f.startswith("_")], [])
+
+        # the payload files are shared with the source bag
+        with open(os.path.join(bags[0],"manifest-sha256.txt")) as fd:
+            datafile = fd.readline().strip().split()[-1]
+        self.assertEqual(os.stat(os.path.join(bags[0], datafile)).st_ino,
+                         os.stat(os.path.join(self.bagdir, datafile)).st_ino)
+
+        # ...but the tag and metadata files are not
+        for bag in bags:
+            for f in ["bag-info.txt", "manifest-sha256.txt", "metadata/nerdm.json"]:
+                if os.path.exists(os.path.join(bag, f)):
+                    self.assertNotEqual(os.stat(os.path.join(bag, f)).st_ino,
+                                        os.stat(os.path.join(self.bagdir, f)).st_ino)
+
+    def test_split_mode(self):
+        with self.assertRaises(multibag.ConfigurationException):
+            multibag.MultibagSplitter(self.bagdir, {"split_mode": "goob"})
+
     def test_split_too_small(self):
         cfg = {
             "max_bag_size": 400000000,
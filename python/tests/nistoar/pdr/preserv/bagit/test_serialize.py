@@ -1,4 +1,4 @@
-import os, pdb, sys, json, logging
+import os, pdb, sys, json, logging, hashlib, shutil
 import subprocess as sp
 import zipfile as zip
 import unittest as test
@@ -105,6 +105,66 @@ class TestSerialize(test.TestCase):
             ser.zip7_serialize(baddir, destdir, log, destfile)
         self.assertTrue(not os.path.exists(outzip))
 
+class TestZipStreamSerialize(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.tmpdir = self.tf.mkdir("ser")
+        self.teedir = self.tf.mkdir("store")
+        
+    def tearDown(self):
+        self.tf.clean()
+
+    def sha256(self, filepath):
+        with open(filepath, 'rb') as fd:
+            return hashlib.sha256(fd.read()).hexdigest()
+        
+    def test_zipstream_serialize(self):
+        outzip = os.path.join(self.tmpdir, "badsip.zip")
+        self.assertTrue(not os.path.exists(outzip))
+
+        (bagfile, csum, teefile) = ser.zipstream_serialize(badsip, self.tmpdir, log)
+        self.assertEqual(bagfile, outzip)
+        self.assertIsNone(teefile)
+        self.assertTrue(zip.is_zipfile(outzip))
+        self.assertEqual(csum, self.sha256(outzip))
+
+        z = zip.ZipFile(outzip)
+        self.assertIsNone(z.testzip())
+        contents = z.namelist()
+        self.assertEqual(len(contents), 2)
+        self.assertIn("badsip/", contents)
+        self.assertIn("badsip/trial1.json", contents)
+        self.assertEqual(z.getinfo("badsip/trial1.json").compress_type, zip.ZIP_DEFLATED)
+        with open(os.path.join(badsip, "trial1.json"), 'rb') as fd:
+            self.assertEqual(z.read("badsip/trial1.json"), fd.read())
+
+    def test_zipstream_tee(self):
+        srcbag = os.path.join(self.tmpdir, "goob")
+        shutil.copytree(badsip, srcbag)
+        shutil.copy(os.path.join(badsip, "trial1.json"),
+                    os.path.join(srcbag, "trial1.json.gz"))
+        os.mkdir(os.path.join(srcbag, "empty"))
+
+        (bagfile, csum, teefile) = ser.zipstream_serialize(srcbag, self.tmpdir, log,
+                                                           teedir=self.teedir)
+        self.assertEqual(teefile, os.path.join(self.teedir, ".goob.zip.part"))
+        self.assertEqual(csum, self.sha256(bagfile))
+        self.assertEqual(csum, self.sha256(teefile))
+
+        z = zip.ZipFile(bagfile)
+        self.assertIsNone(z.testzip())
+        self.assertEqual(z.namelist(), ["goob/", "goob/trial1.json", "goob/trial1.json.gz",
+                                        "goob/empty/"])
+        self.assertEqual(z.getinfo("goob/trial1.json.gz").compress_type, zip.ZIP_STORED)
+        self.assertEqual(z.read("goob/trial1.json.gz"), z.read("goob/trial1.json"))
+
+    def test_zipstream_fail(self):
+        baddir = os.path.join(badsip, "goob")
+        with self.assertRaises(Exception):
+            ser.zipstream_serialize(baddir, self.tmpdir, log)
+        self.assertTrue(not os.path.exists(os.path.join(self.tmpdir, "goob.zip")))
+
 class TestDefaultSerializer(test.TestCase):
     def setUp(self):
         self.tf = Tempfiles()
@@ -137,6 +197,28 @@ class TestDefaultSerializer(test.TestCase):
         self.ser.serialize(badsip, os.path.dirname(outzip), "7z", log)
         self.assertTrue(os.path.exists(outzip))
         # can't test contents yet
+
+    def test_native_zip(self):
+        self.assertFalse(self.ser.is_streaming("zip"))
+        self.ser = ser.DefaultSerializer(config={"native_zip": True})
+        self.assertTrue(self.ser.is_streaming("zip"))
+        self.assertFalse(self.ser.is_streaming("7z"))
+
+        outzip = self.tf.track("badsip.zip")
+        (bagfile, csum, teefile) = \
+            self.ser.serialize_and_checksum(badsip, os.path.dirname(outzip), "zip", log)
+        self.assertEqual(bagfile, outzip)
+        self.assertTrue(csum)
+        self.assertIsNone(teefile)
+        z = zip.ZipFile(outzip)
+        self.assertIn("badsip/trial1.json", z.namelist())
+
+        # non-streaming formats give no checksum
+        outzip = self.tf.track("badsip.7z")
+        (bagfile, csum, teefile) = \
+            self.ser.serialize_and_checksum(badsip, os.path.dirname(outzip), "7z", log)
+        self.assertEqual(bagfile, outzip)
+        self.assertIsNone(csum)
         
 
 if __name__ == '__main__':
@@ -120,6 +120,23 @@ class TestValidatorBase(test.TestCase):
         self.assertIn(", line ", res.failed()[0].description)
 
     
+    def test_timings(self):
+        tests = self._TestBase({})
+        res = tests.validate(self.bag)
+        self.assertEqual(list(res.timings.keys()), ["None:test_raise_except"])
+        self.assertGreaterEqual(res.timings["None:test_raise_except"], 0.0)
+
+    def test_walk(self):
+        tests = self._TestBase({})
+        expect = list(os.walk(self.bag.data_dir))
+        self.assertEqual(list(tests._walk(self.bag, self.bag.data_dir)), expect)
+
+        ibag = base.InventoriedBag(self.bag)
+        self.assertEqual(ibag.name, self.bag.name)
+        self.assertEqual(list(tests._walk(ibag, ibag.data_dir)), expect)
+        self.assertTrue(tests._isfile(ibag, os.path.join(bagdir, "bagit.txt")))
+        self.assertTrue(tests._isdir(ibag, os.path.join(bagdir, "metadata")))
+
     def test_fmt_exc(self):
         a = {}
         try:
@@ -131,7 +148,45 @@ class TestValidatorBase(test.TestCase):
             self.assertIn(', line ', prob)
             self.assertIn('KeyError', prob)
 
-    
+class TestBagInventory(test.TestCase):
+
+    def setUp(self):
+        self.inv = base.BagInventory(bagdir)
+
+    def test_walk(self):
+        self.assertEqual(list(self.inv.walk(bagdir)), list(os.walk(bagdir)))
+        top = os.path.join(bagdir, "metadata", "trial3")
+        self.assertEqual(list(self.inv.walk(top)), list(os.walk(top)))
+        self.assertEqual(list(self.inv.walk(os.path.join(bagdir, "goob"))), [])
+
+    def test_lookups(self):
+        self.assertTrue(self.inv.isfile(os.path.join(bagdir, "bagit.txt")))
+        self.assertFalse(self.inv.isdir(os.path.join(bagdir, "bagit.txt")))
+        self.assertTrue(self.inv.exists(os.path.join(bagdir, "bagit.txt")))
+        self.assertTrue(self.inv.isdir(os.path.join(bagdir, "data", "trial3")))
+        self.assertFalse(self.inv.isfile(os.path.join(bagdir, "data", "trial3")))
+        self.assertTrue(self.inv.exists(bagdir))
+        self.assertFalse(self.inv.exists(os.path.join(bagdir, "data", "goob.json")))
+
+        # paths outside of the bag are looked up on disk
+        self.assertTrue(self.inv.isfile(__file__))
+
+class TestValidationResults(test.TestCase):
+
+    def test_merge(self):
+        res1 = base.ValidationResults("goob")
+        res1._err(base.ValidationIssue("Life", "3.1", "A1.1"), True)
+        res1._record_time("Life:test_a", 0.5)
+        res2 = base.ValidationResults("goob")
+        res2._warn(base.ValidationIssue("Life", "3.1", "A1.2"), False)
+        res2._err(base.ValidationIssue("Life", "3.1", "A1.3"), True)
+        res2._record_time("Life:test_b", 0.25)
+
+        res1._merge(res2)
+        self.assertEqual([i.label for i in res1.applied()], ["A1.1", "A1.3", "A1.2"])
+        self.assertEqual(res1.count_failed(), 1)
+        self.assertEqual(list(res1.timings.items()),
+                         [("Life:test_a", 0.5), ("Life:test_b", 0.25)])
 
 
 if __name__ == '__main__':
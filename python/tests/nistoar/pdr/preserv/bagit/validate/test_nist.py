@@ -432,8 +432,38 @@ class TestMultibagValidator(test.TestCase):
         self.assertEqual(errs.failed()[0].label, "4.1-4-2c")
         self.assertEqual(errs.failed()[1].label, "4.1-4-2a")
 
-        
-        
+class TestNISTAIPValidator(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.bagdir = self.tf.track("XXXX.1_0.mbag0_4-0")
+        shutil.copytree(bagdir, self.bagdir)
+        self.bag = bag.NISTBag(self.bagdir)
+
+        # introduce a checksum failure
+        with open(os.path.join(self.bagdir, "data", "trial1.json"), 'a') as fd:
+            fd.write("\n")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_concurrent(self):
+        config = { "nist": { "nerdm_schema_dir": schemadir } }
+        seq = val.NISTAIPValidator(config).validate(self.bag)
+
+        config['workers'] = 4
+        valid8 = val.NISTAIPValidator(config)
+        self.assertEqual(valid8.workers, 4)
+        self.assertEqual(valid8._vals[0].cfg['test_manifest']['checksum_workers'], 4)
+        self.assertNotIn('bagit', config)
+        conc = valid8.validate(self.bag)
+
+        self.assertEqual([i.to_tuple() for i in conc.applied()],
+                         [i.to_tuple() for i in seq.applied()])
+        self.assertIn("3-2-2", [i.label for i in conc.failed()])
+        self.assertEqual(list(conc.timings.keys()), list(seq.timings.keys()))
+        self.assertIn("BagIt:test_manifest", conc.timings)
+        self.assertIn("NIST:test_nerdm_validity", conc.timings)
         
 
 if __name__ == '__main__':
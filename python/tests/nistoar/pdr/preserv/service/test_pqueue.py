@@ -0,0 +1,116 @@
+import os, pdb, sys, json, time
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.service import pqueue
+
+def setUpModule():
+    ensure_tmpdir()
+def tearDownModule():
+    rmtmpdir()
+
+class TestPreservationQueue(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.qdir = self.tf.track("pqueue")
+        self.q = pqueue.PreservationQueue(self.qdir, claim_timeout=5)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_ctor(self):
+        self.assertTrue(os.path.isdir(os.path.join(self.qdir, pqueue.PENDING_DIR)))
+        self.assertTrue(os.path.isdir(os.path.join(self.qdir, pqueue.RUNNING_DIR)))
+        self.assertEqual(self.q.pending(), [])
+        self.assertEqual(self.q.running(), [])
+
+        # can be recreated on an existing queue
+        self.q = pqueue.PreservationQueue(self.qdir)
+
+    def test_add(self):
+        ent = self.q.add("ark:/88434/mds2-1000", "midas3", priority=5)
+        self.assertEqual(ent['id'], "ark:/88434/mds2-1000")
+        self.assertEqual(ent['siptype'], "midas3")
+        self.assertFalse(ent['asupdate'])
+        self.assertEqual(ent['priority'], 5)
+        self.assertTrue(os.path.isfile(os.path.join(self.qdir, pqueue.PENDING_DIR,
+                                                    "mds2-1000.json")))
+        self.q.add("mds2-1001", "midas3", True, 5, "mds2-1001.log")
+        self.q.add("mds2-1002", "midas3", priority=1)
+
+        ids = [e['id'] for e in self.q.pending()]
+        self.assertEqual(ids, ["mds2-1002", "ark:/88434/mds2-1000", "mds2-1001"])
+        self.assertTrue(self.q.pending()[2]['asupdate'])
+        self.assertEqual(self.q.pending()[2]['logfile'], "mds2-1001.log")
+        self.assertEqual(self.q.position("mds2-1001"), 3)
+        self.assertEqual(self.q.position("ark:/88434/mds2-1000"), 2)
+        self.assertIsNone(self.q.position("mds2-1003"))
+
+        # re-adding keeps original place among equal priorities
+        seq = self.q.pending()[1]['seq']
+        self.q.add("ark:/88434/mds2-1000", "midas3", priority=5)
+        self.assertEqual(self.q.pending()[1]['seq'], seq)
+        self.assertEqual(self.q.position("ark:/88434/mds2-1000"), 2)
+
+        self.assertTrue(self.q.remove("mds2-1002"))
+        self.assertFalse(self.q.remove("mds2-1002"))
+        self.assertEqual(self.q.position("mds2-1001"), 2)
+
+    def test_persistence(self):
+        self.q.add("mds2-1000", "midas3")
+        self.q.add("mds2-1001", "midas3")
+        self.q = pqueue.PreservationQueue(self.qdir)
+        self.assertEqual([e['id'] for e in self.q.pending()], ["mds2-1000", "mds2-1001"])
+
+    def test_claim(self):
+        self.q.add("mds2-1000", "midas3", priority=2)
+        self.q.add("mds2-1001", "midas3", priority=1)
+        self.q.add("mds2-1002", "midas3", priority=3)
+
+        with self.q.lock():
+            ent = self.q.claim_next(2)
+        self.assertEqual(ent['id'], "mds2-1001")
+        self.assertIn('claimed', ent)
+        self.assertEqual([e['id'] for e in self.q.pending()], ["mds2-1000", "mds2-1002"])
+        self.assertEqual([e['id'] for e in self.q.running()], ["mds2-1001"])
+
+        self.q.set_pid("mds2-1001", os.getpid())
+        self.assertEqual(self.q.running()[0]['pid'], os.getpid())
+        self.assertIn('started', self.q.running()[0])
+
+        self.assertEqual(self.q.claim_next(2)['id'], "mds2-1000")
+        self.assertIsNone(self.q.claim_next(2))
+        self.assertEqual(len(self.q.running()), 2)
+        self.assertEqual(self.q.position("mds2-1002"), 1)
+
+        self.q.finish("mds2-1001")
+        self.assertEqual([e['id'] for e in self.q.running()], ["mds2-1000"])
+        self.assertEqual(self.q.claim_next(2)['id'], "mds2-1002")
+        self.assertIsNone(self.q.claim_next())
+
+    def test_unlimited(self):
+        for i in range(3):
+            self.q.add("mds2-100"+str(i), "midas3")
+        for i in range(3):
+            self.assertIsNotNone(self.q.claim_next(0))
+        self.assertEqual(len(self.q.running()), 3)
+
+    def test_abandoned(self):
+        self.q.add("mds2-1000", "midas3")
+        self.q.add("mds2-1001", "midas3")
+        self.q.claim_next()
+        self.q.claim_next()
+
+        # a dead process
+        self.q.set_pid("mds2-1000", 999999999)
+        self.assertEqual([e['id'] for e in self.q.running()], ["mds2-1001"])
+
+        # a stale claim without a process
+        self.q.claim_timeout = 0
+        self.assertEqual(self.q.running(), [])
+        self.assertEqual(os.listdir(os.path.join(self.qdir, pqueue.RUNNING_DIR)), [])
+
+
+if __name__ == '__main__':
+    test.main()
@@ -409,6 +409,46 @@ class TestMultiprocPreservationService(test.TestCase):
         self.assertTrue(os.path.exists(os.path.join(self.store,
                                     self.midasid+".1_0_0.mbag0_4-0.zip.sha256")))
         
+    def test_launch_queued(self):
+        self.config['worker_pool'] = { "max_workers": 1, "poll_interval": 60 }
+        self.svc = serv.MultiprocPreservationService(self.config)
+        self.assertIsNotNone(self.svc._queue)
+        self.assertEqual(self.svc.queued(), [])
+
+        # occupy the only worker slot
+        self.svc._queue.add("mds2-0000", "midas")
+        self.svc._queue.claim_next()
+        self.svc._queue.set_pid("mds2-0000", os.getpid())
+
+        hndlr = self.svc._make_handler(self.midasid, 'midas')
+        self.assertTrue(hndlr.isready())
+        hndlr._status.reset()     # lay claim to the SIP, as preserve() does
+        (stat, proc) = self.svc._launch_handler(hndlr, 1)
+        self.assertIsNone(proc)
+        self.assertEqual(stat['state'], status.PENDING)
+        self.assertEqual(stat['queue_position'], 1)
+
+        stat = self.svc.status(self.midasid, 'midas')
+        self.assertEqual(stat['state'], status.PENDING)
+        self.assertEqual(stat['queue_position'], 1)
+
+        queued = self.svc.queued()
+        self.assertEqual(len(queued), 1)
+        self.assertEqual(queued[0]['id'], self.midasid)
+        self.assertEqual(queued[0]['queue_position'], 1)
+
+        # the queue survives a restart
+        svc = serv.MultiprocPreservationService(self.config)
+        self.assertEqual([q['id'] for q in svc.queued()], [self.midasid])
+
+    def test_bad_worker_pool(self):
+        self.config['worker_pool'] = { "max_workers": "goob" }
+        with self.assertRaises(serv.ConfigurationException):
+            serv.MultiprocPreservationService(self.config)
+        self.config['worker_pool'] = { "max_workers": 2, "priority": "goob" }
+        with self.assertRaises(serv.ConfigurationException):
+            serv.MultiprocPreservationService(self.config)
+
     def test_subprocess_handle(self):
         try: 
             serv._subprocess_handle(self.svc.cfg, "SUBDIR/pres.log", self.midasid, "MIDAS-SIP", False, 5)
@@ -1,4 +1,4 @@
-import os, pdb, sys, logging, yaml, stat
+import os, pdb, sys, logging, yaml, stat, re, hashlib
 import unittest as test
 
 from nistoar.testing import *
@@ -183,6 +183,37 @@ class TestMIDAS3SIPHandler(test.TestCase):
         bfs = [f for f in os.listdir(self.bagparent) if f.startswith(bb)]
         self.assertEqual(len(bfs), 0)
 
+    def test_bagit_parallel_multibag(self):
+        self.config['multibag'] = {
+            "max_headbag_size": 100,
+            "max_bag_size": 150,
+            "serialize_workers": 3
+        }
+        self.sip = sip.MIDAS3SIPHandler(self.midasid, self.config)
+        self.sip.bagit()
+        self.assertEqual(self.sip.state, status.SUCCESSFUL)
+
+        bagfiles = self.sip.status['bagfiles']
+        self.assertGreater(len(bagfiles), 1)
+
+        # bag files are reported in sequence order (head bag last)
+        seq = [int(re.search(r'-(\d+)\.zip$', b['name']).group(1)) for b in bagfiles]
+        self.assertEqual(seq, sorted(seq))
+
+        for bf in bagfiles:
+            bagfile = os.path.join(self.storedir, bf['name'])
+            self.assertTrue(os.path.exists(bagfile))
+            with open(bagfile+".sha256") as fd:
+                self.assertEqual(fd.read().strip(), bf['sha256'])
+            with open(bagfile, 'rb') as fd:
+                self.assertEqual(hashlib.sha256(fd.read()).hexdigest(), bf['sha256'])
+
+            # checksum files MIDAS picks up
+            cf = os.path.join(self.bagparent, "%s_%d.sha256" %
+                              (self.midasid, int(re.search(r'-(\d+)\.zip$',
+                                                           bf['name']).group(1))))
+            self.assertTrue(os.path.exists(cf), "Does not exist: "+cf)
+
     def test_bagit_withnerdstaging(self):
         mdcache = os.path.join(self.stagedir, "_nerd")
         if not os.path.exists(mdcache):
@@ -0,0 +1,188 @@
+import os, sys, pdb, hashlib, shutil, time
+import unittest as test
+from collections import OrderedDict
+
+from nistoar.testing import *
+from nistoar.pdr.preserv.checksum import ChecksumEngine, ChecksumBatch, ChecksumCache
+from nistoar.pdr.exceptions import ConfigurationException
+
+datadir = os.path.join(os.path.dirname(__file__), "data", "simplesip")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+def syssum(filepath, alg="sha256"):
+    with open(filepath, 'rb') as fd:
+        return hashlib.new(alg, fd.read()).hexdigest()
+
+class TestChecksumEngine(test.TestCase):
+
+    def setUp(self):
+        self.files = [os.path.join(datadir, f) for f in
+                      ["trial1.json", "trial2.json", "trial3/trial3a.json"]]
+
+    def test_ctor(self):
+        eng = ChecksumEngine()
+        self.assertEqual(eng.workers, 1)
+        self.assertEqual(eng.algorithms, ["sha256"])
+
+        eng = ChecksumEngine({"workers": 4, "algorithms": ["sha256", "md5"]})
+        self.assertEqual(eng.workers, 4)
+        self.assertEqual(eng.algorithms, ["sha256", "md5"])
+
+        with self.assertRaises(ConfigurationException):
+            ChecksumEngine({"pool_type": "goober"})
+        with self.assertRaises(ConfigurationException):
+            ChecksumEngine({"workers": "4"})
+        with self.assertRaises(ConfigurationException):
+            ChecksumEngine({"algorithms": []})
+
+    def test_checksum_of(self):
+        eng = ChecksumEngine({"buffer_size": 10})
+        self.assertEqual(eng.checksum_of(self.files[0]), syssum(self.files[0]))
+        self.assertEqual(eng.checksum_of(self.files[0], "md5"),
+                         syssum(self.files[0], "md5"))
+
+    def test_digests_of(self):
+        eng = ChecksumEngine({"algorithms": ["sha256", "md5"]})
+        sums = eng.digests_of(self.files[1])
+        self.assertEqual(list(sums.keys()), ["sha256", "md5"])
+        self.assertEqual(sums['sha256'], syssum(self.files[1]))
+        self.assertEqual(sums['md5'], syssum(self.files[1], "md5"))
+
+    def test_checksums_of_serial(self):
+        eng = ChecksumEngine()
+        sums = eng.checksums_of(self.files)
+        self.assertEqual(list(sums.keys()), self.files)
+        for f in self.files:
+            self.assertEqual(sums[f], syssum(f))
+
+    def test_checksums_of_threads(self):
+        eng = ChecksumEngine({"workers": 3, "buffer_size": 100})
+        sums = eng.checksums_of(self.files)
+        self.assertEqual(list(sums.keys()), self.files)
+        for f in self.files:
+            self.assertEqual(sums[f], syssum(f))
+
+    def test_checksums_of_procs(self):
+        eng = ChecksumEngine({"workers": 2, "pool_type": "process"})
+        sums = eng.digests_for(self.files)
+        self.assertEqual(list(sums.keys()), self.files)
+        for f in self.files:
+            self.assertEqual(sums[f]['sha256'], syssum(f))
+
+    def test_checksums_of_missing(self):
+        eng = ChecksumEngine({"workers": 2})
+        with self.assertRaises(IOError):
+            eng.checksums_of(self.files + [os.path.join(datadir, "goober.json")])
+
+    def test_batch(self):
+        for workers in (1, 2):
+            eng = ChecksumEngine({"workers": workers,
+                                  "algorithms": ["sha256", "md5"]})
+            batch = eng.batch()
+            self.assertTrue(isinstance(batch, ChecksumBatch))
+            for f in self.files:
+                batch.submit(f, os.path.basename(f))
+            self.assertEqual(len(batch), 3)
+
+            sums = batch.results('md5')
+            self.assertEqual(list(sums.keys()),
+                             [os.path.basename(f) for f in self.files])
+            for f in self.files:
+                self.assertEqual(sums[os.path.basename(f)], syssum(f, "md5"))
+
+class TestChecksumCache(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.workdir = self.tf.mkdir("cscache")
+        self.cachefile = os.path.join(self.workdir, "checksums.json")
+        self.datafile = os.path.join(self.workdir, "trial1.json")
+        shutil.copy(os.path.join(datadir, "trial1.json"), self.datafile)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_key_for(self):
+        key = ChecksumCache.key_for(self.datafile)
+        self.assertTrue(key)
+        self.assertEqual(len(key.split(':')), 4)
+        self.assertIsNone(ChecksumCache.key_for(self.datafile+"-goob"))
+
+        # a hard link has the same key
+        lnk = os.path.join(self.workdir, "link.json")
+        os.link(self.datafile, lnk)
+        self.assertEqual(ChecksumCache.key_for(lnk), key)
+
+    def test_store_lookup(self):
+        cache = ChecksumCache()
+        key = cache.key_for(self.datafile)
+        self.assertIsNone(cache.lookup(key))
+        self.assertEqual(len(cache), 0)
+
+        cache.store(key, self.datafile, {"sha256": "abc", "md5": "def"})
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.lookup(key), {"sha256": "abc"})
+        self.assertEqual(cache.lookup(key, ["md5", "sha256"]),
+                         {"md5": "def", "sha256": "abc"})
+        self.assertIsNone(cache.lookup(key, ["sha512"]))
+        self.assertEqual(cache.checksum_for(self.datafile), "abc")
+
+        # a change to the file invalidates the entry
+        with open(self.datafile, 'a') as fd:
+            fd.write("\n")
+        self.assertIsNone(cache.checksum_for(self.datafile))
+
+    def test_persist(self):
+        cache = ChecksumCache(self.cachefile)
+        key = cache.key_for(self.datafile)
+        cache.store(key, self.datafile, {"sha256": "abc"})
+        self.assertFalse(os.path.exists(self.cachefile))
+        cache.save()
+        self.assertTrue(os.path.exists(self.cachefile))
+
+        cache = ChecksumCache(self.cachefile)
+        self.assertEqual(cache.checksum_for(self.datafile), "abc")
+
+        cache.unpersist()
+        self.assertFalse(os.path.exists(self.cachefile))
+        self.assertEqual(cache.checksum_for(self.datafile), "abc")
+        cache.store(key, self.datafile, {"md5": "def"})
+        cache.save()
+        self.assertFalse(os.path.exists(self.cachefile))
+
+    def test_engine_reuse(self):
+        cache = ChecksumCache(self.cachefile)
+        eng = ChecksumEngine({"workers": 2}, cache=cache)
+        csum = eng.checksum_of(self.datafile)
+        self.assertEqual(csum, syssum(self.datafile))
+
+        # the cache is only written out on request
+        self.assertFalse(os.path.exists(self.cachefile))
+        eng.save_cache()
+        self.assertTrue(os.path.exists(self.cachefile))
+
+        # fake a cached value to show that the file is not re-read
+        key = cache.key_for(self.datafile)
+        cache.store(key, self.datafile, {"sha256": "abc"})
+        self.assertEqual(eng.checksum_of(self.datafile), "abc")
+        self.assertEqual(eng.checksums_of([self.datafile]),
+                         {self.datafile: "abc"})
+
+        # ...unless forced
+        self.assertEqual(eng.checksum_of(self.datafile, force=True), csum)
+        self.assertEqual(eng.checksum_of(self.datafile), csum)
+
+        # a different algorithm is calculated and added to the entry
+        self.assertEqual(eng.checksum_of(self.datafile, "md5"),
+                         syssum(self.datafile, "md5"))
+        self.assertEqual(cache.lookup(key, ["sha256", "md5"]),
+                         {"sha256": csum, "md5": syssum(self.datafile, "md5")})
+
+
+if __name__ == '__main__':
+    test.main()
@@ -121,6 +121,83 @@ class TestApp(test.TestCase):
             if 'downloadURL' in cmp:
                 self.assertNotIn("/od/ds/", cmp['downloadURL'])
         
+    def test_metadata_validators(self):
+        req = {
+            'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491',
+            'REQUEST_METHOD': 'GET'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        etag = [r for r in self.resp if r.startswith("ETag: ")]
+        self.assertEqual(len(etag), 1)
+        etag = etag[0][len("ETag: "):]
+        self.assertTrue(any(r.startswith("Last-Modified: ") for r in self.resp))
+
+        # the transformed record is cached
+        mdfile = os.path.join(datadir, '3A1EE2F169DD3B8CE0531A570681DB5D1491.json')
+        st = os.stat(mdfile)
+        cached = self.svc.records.get(mdfile, (st.st_mtime, st.st_size))
+        self.assertEqual(cached[2], body[0])
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = etag
+        body = self.svc(req, self.start)
+        self.assertIn("304", self.resp[0])
+        self.assertEqual(body, [])
+
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = '"goob"'
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertEqual(json.loads(body[0])['ediid'], '3A1EE2F169DD3B8CE0531A570681DB5D1491')
+
+    def test_metadata_follows_sip(self):
+        # a change to the files in the SIP changes the served record and its ETag
+        sipdir = os.path.join(self.tf.mkdir("sip"), "review")
+        shutil.copytree(self.revdir, sipdir)
+        self.config['review_dir'] = sipdir
+        self.config['upload_dir'] = None
+        self.svc = wsgi.app(self.config)
+        req = {
+            'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491',
+            'REQUEST_METHOD': 'GET'
+        }
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        etag = [r for r in self.resp if r.startswith("ETag: ")][0][len("ETag: "):]
+        comps = dict((c['filepath'], c) for c in json.loads(body[0])['components']
+                     if 'filepath' in c)
+        self.assertNotIn("/od/ds/", comps['trial1.json']['downloadURL'])
+
+        os.remove(os.path.join(sipdir, "1491", "trial1.json"))
+        self.resp = []
+        req['HTTP_IF_NONE_MATCH'] = etag
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        self.assertNotIn("ETag: "+etag, self.resp)
+        comps = dict((c['filepath'], c) for c in json.loads(body[0])['components']
+                     if 'filepath' in c)
+        self.assertIn("/od/ds/", comps['trial1.json']['downloadURL'])
+        self.assertNotIn("/od/ds/", comps['trial2.json']['downloadURL'])
+
+    def test_record_cache(self):
+        cache = wsgi.RecordCache(2)
+        cache.put("a.json", (1, 10), "a")
+        cache.put("b.json", (1, 10), "b")
+        self.assertEqual(cache.get("a.json", (1, 10)), "a")
+        self.assertIsNone(cache.get("a.json", (2, 10)))
+        self.assertIsNone(cache.get("a.json", (1, 10)))
+
+        cache.put("a.json", (2, 10), "A")
+        cache.put("c.json", (1, 10), "c")
+        self.assertIsNone(cache.get("b.json", (1, 10)))
+        self.assertEqual(cache.get("a.json", (2, 10)), "A")
+        self.assertEqual(cache.get("c.json", (1, 10)), "c")
+
+        cache = wsgi.RecordCache(0)
+        cache.put("a.json", (1, 10), "a")
+        self.assertIsNone(cache.get("a.json", (1, 10)))
+
     def test_head_good_id(self):
         req = {
             'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491',
@@ -172,6 +249,32 @@ class TestApp(test.TestCase):
         self.assertGreater(len(redirect), 0)
         self.assertEqual(redirect[0],"X-Accel-Redirect: /midasdata/upload_dir/1491/trial3/trial3a.json")
 
+    def test_get_datafile_range(self):
+        # without an X-Accel-Redirect mapping, the file is sent by the app
+        self.svc.filemap.clear()
+        req = {
+            'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491/trial1.json',
+            'REQUEST_METHOD': 'GET',
+            'HTTP_RANGE': 'bytes=0-9'
+        }
+        body = self.svc(req, self.start)
+
+        self.assertIn("206", self.resp[0])
+        self.assertEqual([r for r in self.resp if "X-Accel-Redirect:" in r], [])
+        self.assertIn("Content-Length: 10", self.resp)
+        self.assertIn("Content-Range: bytes 0-9/", [r[:len("Content-Range: bytes 0-9/")]
+                                                     for r in self.resp])
+        self.assertTrue(any(r.startswith("ETag: ") for r in self.resp))
+        with open(os.path.join(self.revdir, "1491", "trial1.json")) as fd:
+            self.assertEqual("".join(body), fd.read(10))
+
+        self.resp = []
+        del req['HTTP_RANGE']
+        body = self.svc(req, self.start)
+        self.assertIn("200", self.resp[0])
+        with open(os.path.join(self.revdir, "1491", "trial1.json")) as fd:
+            self.assertEqual("".join(body), fd.read())
+
     def test_get_datafile_unicode(self):
         req = {
             'PATH_INFO': '/3A1EE2F169DD3B8CE0531A570681DB5D1491/trial\xce\xb1.json',
@@ -0,0 +1,94 @@
+import os, sys, pdb, time, threading
+import unittest as test
+
+from nistoar.pdr.publish.midas3 import pool
+
+class TestBaggingPool(test.TestCase):
+
+    def setUp(self):
+        self.pool = pool.BaggingPool(2, "test")
+        self.lock = threading.Lock()
+        self.log = []
+        self.running = 0
+        self.maxrunning = 0
+
+    def make_work(self, key, turns=1, dur=0.05):
+        remaining = [turns]
+        def work():
+            with self.lock:
+                self.running += 1
+                self.maxrunning = max(self.maxrunning, self.running)
+            time.sleep(dur)
+            with self.lock:
+                self.running -= 1
+                self.log.append(key)
+            remaining[0] -= 1
+            return remaining[0] > 0
+        return work
+
+    def test_ctor(self):
+        self.assertEqual(self.pool.size, 2)
+        self.assertEqual(self.pool.queue_depth(), 0)
+        self.assertIsNone(self.pool.ticket_for("a"))
+        with self.assertRaises(ValueError):
+            pool.BaggingPool(0)
+
+    def test_bounded(self):
+        tickets = [self.pool.submit(k, self.make_work(k)) for k in "abcdef"]
+        self.assertTrue(any(t.is_alive() for t in tickets))
+        self.pool.join(10)
+        self.assertTrue(all(not t.is_alive() for t in tickets))
+        self.assertEqual(sorted(self.log), list("abcdef"))
+        self.assertLessEqual(self.maxrunning, 2)
+
+        # tickets are dropped once their work is done
+        self.assertIsNone(self.pool.ticket_for("a"))
+        self.assertEqual(len(self.pool._tickets), 0)
+
+        stats = self.pool.stats()
+        self.assertEqual(stats['pool_size'], 2)
+        self.assertEqual(stats['turns'], 6)
+        self.assertEqual(stats['failures'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreaterEqual(stats['max_queue_depth'], 4)
+        self.assertGreater(stats['mean_processing_time'], 0.0)
+        self.assertGreater(stats['max_wait_time'], 0.0)
+
+    def test_coalesce(self):
+        self.pool = pool.BaggingPool(1, "test")
+        self.pool.submit("a", self.make_work("a"))
+        self.pool.submit("b", self.make_work("b"))
+        self.pool.submit("b", self.make_work("b"))
+        self.pool.submit("b", self.make_work("b"))
+        self.pool.join(10)
+        self.assertEqual(self.log.count("b"), 1)
+
+    def test_fair(self):
+        # a dataset with many queued updates does not starve the others
+        self.pool = pool.BaggingPool(1, "test")
+        self.pool.submit("a", self.make_work("a", 4, 0.02))
+        self.pool.submit("b", self.make_work("b", 1, 0.02))
+        self.pool.submit("c", self.make_work("c", 1, 0.02))
+        self.pool.join(10)
+        self.assertEqual(self.log, ["a", "b", "c", "a", "a", "a"])
+
+    def test_resubmit_while_active(self):
+        self.pool = pool.BaggingPool(1, "test")
+        t = self.pool.submit("a", self.make_work("a", 1, 0.2))
+        time.sleep(0.05)
+        self.assertIs(self.pool.submit("a", self.make_work("a")), t)
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(self.log, ["a", "a"])
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("oops")
+        t = self.pool.submit("a", fail)
+        t.join(10)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(self.pool.stats()['failures'], 1)
+
+        
+if __name__ == '__main__':
+    test.main()
@@ -353,6 +353,21 @@ class TestMIDAS3PublishingService(test.TestCase):
         self.assertTrue(os.path.isfile(nerdf))
         nerd = utils.read_json(nerdf)
         self.assertEqual(nerd['title'], "Goober!")
+
+        stats = self.svc.bagging_stats()
+        self.assertEqual(stats['pool_size'], 4)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['turns'], 2)
+        self.assertEqual(stats['failures'], 0)
+
+    def test_bad_bagging_pool(self):
+        cfg = deepcopy(self.defcfg)
+        cfg['bagging_pool'] = { "max_workers": 0 }
+        with self.assertRaises(mdsvc.ConfigurationException):
+            mdsvc.MIDAS3PublishingService(cfg, self.workdir, self.revdir, self.upldir)
+        cfg['bagging_pool'] = { "max_workers": "goob" }
+        with self.assertRaises(mdsvc.ConfigurationException):
+            mdsvc.MIDAS3PublishingService(cfg, self.workdir, self.revdir, self.upldir)
         
         
                         
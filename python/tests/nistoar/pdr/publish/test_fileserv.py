@@ -0,0 +1,149 @@
+import os, sys, pdb, time
+import unittest as test
+from email.utils import formatdate
+
+from nistoar.testing import *
+from nistoar.pdr.publish import fileserv
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class FileWrapper(object):
+    def __init__(self, fd, blksz):
+        self.fd = fd
+        self.blksz = blksz
+    def __iter__(self):
+        with self.fd:
+            for buf in iter(lambda: self.fd.read(self.blksz), ''):
+                yield buf
+
+class TestParseRange(test.TestCase):
+
+    def test_make_etag(self):
+        self.assertEqual(fileserv.make_etag(1.5, 16), '"16e360-10"')
+        self.assertNotEqual(fileserv.make_etag(1.5, 16), fileserv.make_etag(1.25, 16))
+        self.assertEqual(fileserv.make_etag(1.5, 16, "ab12"), '"16e360-10-ab12"')
+
+    def test_parse_range(self):
+        self.assertIsNone(fileserv.parse_range(None, 100))
+        self.assertIsNone(fileserv.parse_range("", 100))
+        self.assertIsNone(fileserv.parse_range("lines=1-4", 100))
+        self.assertIsNone(fileserv.parse_range("bytes=4-1", 100))
+        self.assertIsNone(fileserv.parse_range("bytes=a-b", 100))
+        self.assertIsNone(fileserv.parse_range("bytes=-", 100))
+
+        self.assertEqual(fileserv.parse_range("bytes=0-9", 100), [(0, 9)])
+        self.assertEqual(fileserv.parse_range("bytes=90-", 100), [(90, 99)])
+        self.assertEqual(fileserv.parse_range("bytes=90-200", 100), [(90, 99)])
+        self.assertEqual(fileserv.parse_range("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(fileserv.parse_range("bytes=-200", 100), [(0, 99)])
+        self.assertEqual(fileserv.parse_range("bytes=0-1, 5-6", 100), [(0, 1), (5, 6)])
+
+        # unsatisfiable
+        self.assertEqual(fileserv.parse_range("bytes=100-", 100), [])
+        self.assertEqual(fileserv.parse_range("bytes=0-1,200-", 100), [(0, 1)])
+
+class TestFileSender(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.file = self.tf.track("data.txt")
+        with open(self.file, 'w') as fd:
+            fd.write("0123456789"*10)
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def headers(self, sender):
+        return dict(sender.headers)
+
+    def test_whole(self):
+        sender = fileserv.FileSender(self.file, {}, "text/plain", blocksize=30)
+        self.assertEqual(sender.code, 200)
+        hdrs = self.headers(sender)
+        self.assertEqual(hdrs['Content-Length'], "100")
+        self.assertEqual(hdrs['Content-Type'], "text/plain")
+        self.assertEqual(hdrs['Accept-Ranges'], "bytes")
+        self.assertTrue(hdrs['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', hdrs)
+
+        body = list(sender.body())
+        self.assertEqual(len(body), 4)
+        self.assertEqual("".join(body), "0123456789"*10)
+
+    def test_file_wrapper(self):
+        sender = fileserv.FileSender(self.file, {'wsgi.file_wrapper': FileWrapper},
+                                     "text/plain", blocksize=30)
+        body = sender.body()
+        self.assertIsInstance(body, FileWrapper)
+        self.assertEqual("".join(body), "0123456789"*10)
+
+        # not used for ranges
+        sender = fileserv.FileSender(self.file, {'wsgi.file_wrapper': FileWrapper,
+                                                 'HTTP_RANGE': "bytes=5-"})
+        self.assertNotIsInstance(sender.body(), FileWrapper)
+
+    def test_range(self):
+        sender = fileserv.FileSender(self.file, {'HTTP_RANGE': "bytes=5-24"},
+                                     "text/plain", blocksize=7)
+        self.assertEqual(sender.code, 206)
+        hdrs = self.headers(sender)
+        self.assertEqual(hdrs['Content-Length'], "20")
+        self.assertEqual(hdrs['Content-Range'], "bytes 5-24/100")
+        self.assertEqual("".join(sender.body()), "56789012345678901234")
+
+    def test_multirange(self):
+        sender = fileserv.FileSender(self.file, {'HTTP_RANGE': "bytes=0-1,-3"},
+                                     "text/plain")
+        self.assertEqual(sender.code, 206)
+        hdrs = self.headers(sender)
+        self.assertEqual(hdrs['Content-Type'],
+                         "multipart/byteranges; boundary="+sender.boundary)
+        body = "".join(sender.body())
+        self.assertEqual(int(hdrs['Content-Length']), len(body))
+        parts = body.split("--"+sender.boundary)
+        self.assertEqual(len(parts), 4)
+        self.assertIn("Content-Range: bytes 0-1/100\r\n\r\n01\r\n", parts[1])
+        self.assertIn("Content-Range: bytes 97-99/100\r\n\r\n789\r\n", parts[2])
+        self.assertEqual(parts[3], "--\r\n")
+
+    def test_unsatisfiable(self):
+        sender = fileserv.FileSender(self.file, {'HTTP_RANGE': "bytes=200-"})
+        self.assertEqual(sender.code, 416)
+        self.assertEqual(self.headers(sender)['Content-Range'], "bytes */100")
+        self.assertEqual(list(sender.body()), [])
+
+    def test_conditional(self):
+        etag = fileserv.FileSender(self.file, {}).etag
+        sender = fileserv.FileSender(self.file, {'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(sender.code, 304)
+        self.assertEqual(list(sender.body()), [])
+
+        sender = fileserv.FileSender(self.file, {'HTTP_IF_NONE_MATCH': '"goob"'})
+        self.assertEqual(sender.code, 200)
+
+        later = formatdate(time.time()+60, usegmt=True)
+        sender = fileserv.FileSender(self.file, {'HTTP_IF_MODIFIED_SINCE': later})
+        self.assertEqual(sender.code, 304)
+        earlier = formatdate(time.time()-3600, usegmt=True)
+        sender = fileserv.FileSender(self.file, {'HTTP_IF_MODIFIED_SINCE': earlier})
+        self.assertEqual(sender.code, 200)
+
+    def test_if_range(self):
+        etag = fileserv.FileSender(self.file, {}).etag
+        sender = fileserv.FileSender(self.file, {'HTTP_RANGE': "bytes=5-9",
+                                                 'HTTP_IF_RANGE': etag})
+        self.assertEqual(sender.code, 206)
+
+        # the client's copy is out of date: send the whole file
+        sender = fileserv.FileSender(self.file, {'HTTP_RANGE': "bytes=5-9",
+                                                 'HTTP_IF_RANGE': '"goob"'})
+        self.assertEqual(sender.code, 200)
+        self.assertEqual(len("".join(sender.body())), 100)
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import os, sys, pdb, json
+import unittest as test
+from collections import OrderedDict
+
+from nistoar.testing import *
+from nistoar.pdr import jsoncodec
+import nistoar.pdr.utils as utils
+
+testdir = os.path.dirname(os.path.abspath(__file__))
+testdatadir = os.path.join(testdir, 'preserv', 'data')
+testnerd = os.path.join(testdatadir, "3A1EE2F169DD3B8CE0531A570681DB5D1491.json")
+testpod = os.path.join(testdatadir, "simplesip", "_pod.json")
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+def sample_data():
+    return OrderedDict([
+        ("zeta", 1),
+        ("alpha", OrderedDict([("z", None), ("y", True), ("x", False)])),
+        ("title", u"Thé däta — \U0001F600 \"quoted\" \\ /"),
+        ("floats", [0.1, -2.5e-300, 1.7976931348623157e+308, 3.0, 12345.6789]),
+        ("ints", [0, -1, 2**53 + 1, 10**20]),
+        ("empty", [OrderedDict(), [], u""]),
+        ("ctrl", u"tab\tnl\ncr\r\x00"),
+        ("mu", "plain str")
+    ])
+
+class TestJSONCodec(test.TestCase):
+    # these tests are run against every backend that is installed
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.backends = jsoncodec.available_backends()
+
+    def tearDown(self):
+        jsoncodec.set_default_codec(None)
+        self.tf.clean()
+
+    def test_available(self):
+        self.assertIn("json", self.backends)
+        self.assertEqual(jsoncodec.get_codec("json").module, json)
+        self.assertIs(jsoncodec.get_codec("json"), jsoncodec.get_codec("json"))
+        self.assertIn(jsoncodec.default_codec().name, self.backends)
+        with self.assertRaises(ValueError):
+            jsoncodec.get_codec("goob")
+
+    def test_set_default(self):
+        jsoncodec.set_default_codec("json")
+        self.assertEqual(jsoncodec.default_codec().name, "json")
+        self.assertIs(jsoncodec.get_codec(), jsoncodec.get_codec("json"))
+        with self.assertRaises(ValueError):
+            jsoncodec.set_default_codec("goob")
+
+    def test_roundtrip(self):
+        data = sample_data()
+        for name in self.backends:
+            codec = jsoncodec.get_codec(name)
+            for indent in (4, 2, 0, None):
+                out = codec.loads(codec.dumps(data, indent))
+                self.assertEqual(out, data, name)
+                self.assertTrue(isinstance(out, OrderedDict))
+                self.assertTrue(isinstance(out['alpha'], OrderedDict))
+                self.assertEqual(list(out.keys()), list(data.keys()))
+                self.assertEqual(list(out['alpha'].keys()), ["z", "y", "x"])
+                self.assertEqual([repr(f) for f in out['floats']],
+                                 [repr(f) for f in data['floats']])
+
+    def test_string_types(self):
+        # all backends decode strings as unicode, whether given text or bytes
+        text = json.dumps(sample_data())
+        for name in self.backends:
+            codec = jsoncodec.get_codec(name)
+            for inp in (text, text.encode('utf-8'), text.decode('utf-8')):
+                out = codec.loads(inp)
+                self.assertTrue(isinstance(out['mu'], unicode), name)
+                self.assertTrue(isinstance(out['title'], unicode), name)
+                self.assertTrue(isinstance(list(out.keys())[0], unicode), name)
+                self.assertTrue(isinstance(list(out['alpha'].keys())[0], unicode),
+                                name)
+
+    def test_format(self):
+        # all backends produce the same text as the standard library
+        data = sample_data()
+        pretty = json.dumps(data, indent=4, separators=(',', ': '))
+        compact = json.dumps(data, separators=(',', ':'))
+        self.assertNotIn('\n', compact)
+        self.assertNotIn('": ', compact)
+        for name in self.backends:
+            codec = jsoncodec.get_codec(name)
+            self.assertEqual(codec.dumps(data), pretty, name)
+            self.assertEqual(codec.dumps(data, None), compact, name)
+
+    def test_cross_backend(self):
+        data = utils.read_json(testnerd)
+        for writer in self.backends:
+            text = jsoncodec.get_codec(writer).dumps(data)
+            for reader in self.backends:
+                self.assertEqual(jsoncodec.get_codec(reader).loads(text), data)
+
+    def test_file_roundtrip(self):
+        # reading and re-writing a metadata file reproduces it exactly
+        outf = self.tf("nerdm.json")
+        for name in self.backends:
+            jsoncodec.set_default_codec(name)
+            for src in (testnerd, testpod):
+                data = utils.read_json(src)
+                self.assertEqual(data, json.load(open(src)))
+                self.assertTrue(isinstance(list(data.keys())[0], unicode), name)
+                utils.write_json(data, outf)
+                self.assertEqual(utils.read_json(outf), data)
+
+                utils.write_json(utils.read_json(outf), outf+".2")
+                with open(outf) as fd1, open(outf+".2") as fd2:
+                    self.assertEqual(fd1.read(), fd2.read())
+                with open(outf) as fd:
+                    self.assertEqual(fd.read(),
+                                     json.dumps(data, indent=4, separators=(',', ': ')))
+
+    def test_write_compact(self):
+        outf = self.tf("cache.json")
+        data = utils.read_json(testnerd)
+        utils.write_json(data, outf, None)
+        with open(outf) as fd:
+            text = fd.read()
+        self.assertNotIn('\n', text)
+        self.assertNotIn('": ', text)
+        out = utils.read_json(outf)
+        self.assertEqual(out, data)
+        self.assertEqual(list(out.keys()), list(data.keys()))
+        self.assertLess(len(text), os.stat(testnerd).st_size)
+
+    def test_write_failure_preserves_file(self):
+        outf = self.tf("data.json")
+        utils.write_json({"a": 1}, outf)
+        with self.assertRaises(utils.StateException):
+            utils.write_json({"a": object()}, outf)
+        self.assertEqual(utils.read_json(outf), {"a": 1})
+
+
+if __name__ == '__main__':
+    test.main()
@@ -0,0 +1,108 @@
+import os, sys, pdb, time
+import unittest as test
+
+from nistoar.testing import *
+from nistoar.pdr import schemas
+
+class FakeValidator(object):
+    # stands in for an ejsonschema validator, recording what it validates
+    created = []
+
+    def __init__(self, schemadir, prefix):
+        self.schemadir = schemadir
+        self.prefix = prefix
+        self.validated = []
+        FakeValidator.created.append(self)
+
+    def validate(self, instance, schemauri=None, strict=False, raiseex=True):
+        self.validated.append((instance.get('id'), schemauri))
+        if instance.get('bad'):
+            return ["bad instance"]
+        return []
+
+def setUpModule():
+    ensure_tmpdir()
+
+def tearDownModule():
+    rmtmpdir()
+
+class TestSchemas(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.schemadir = self.tf.mkdir("schemas")
+        with open(os.path.join(self.schemadir, "nerdm-schema.json"), 'w') as fd:
+            fd.write("{}")
+
+        self.create_validator = schemas.create_validator
+        schemas.create_validator = FakeValidator
+        FakeValidator.created = []
+        schemas.clear_cache()
+
+    def tearDown(self):
+        schemas.create_validator = self.create_validator
+        schemas.clear_cache()
+        self.tf.clean()
+
+    def test_prefix_for(self):
+        self.assertEqual(schemas.prefix_for({"$schema": "goob"}), "$")
+        self.assertEqual(schemas.prefix_for({"_extensionSchemas": ["goob"]}), "_")
+        self.assertEqual(schemas.prefix_for({}), "_")
+        self.assertEqual(schemas.prefix_for({}, "$"), "$")
+
+    def test_get_validator(self):
+        v = schemas.get_validator(self.schemadir)
+        self.assertEqual(v.ejsprefix, "_")
+        self.assertIs(schemas.get_validator(self.schemadir, "_"), v)
+        self.assertIs(schemas.get_validator(self.schemadir, {"_schema": "goob"}), v)
+        v2 = schemas.get_validator(self.schemadir, {"$schema": "goob"})
+        self.assertIsNot(v2, v)
+        self.assertEqual(v2.ejsprefix, "$")
+
+        # the schemas are not loaded until needed, and then only once
+        self.assertEqual(len(FakeValidator.created), 0)
+        self.assertEqual(v.validate({"id": 1}), [])
+        self.assertEqual(v.validate({"id": 2, "bad": True}), ["bad instance"])
+        self.assertEqual(len(FakeValidator.created), 1)
+        self.assertEqual(FakeValidator.created[0].validated, [(1, None), (2, None)])
+
+    def test_reload(self):
+        v = schemas.get_validator(self.schemadir)
+        v.validate({"id": 1})
+        self.assertEqual(len(FakeValidator.created), 1)
+
+        # a change in a schema file forces a reload
+        schf = os.path.join(self.schemadir, "nerdm-schema.json")
+        os.utime(schf, (time.time()+10, time.time()+10))
+        v.validate({"id": 2})
+        self.assertEqual(len(FakeValidator.created), 2)
+        v.validate({"id": 3})
+        self.assertEqual(len(FakeValidator.created), 2)
+
+        with open(os.path.join(self.schemadir, "nerdm-pub-schema.json"), 'w') as fd:
+            fd.write("{}")
+        v.validate({"id": 4})
+        self.assertEqual(len(FakeValidator.created), 3)
+
+    def test_validate(self):
+        self.assertEqual(schemas.validate({"id": 1}, self.schemadir, "urn:goob"), [])
+        self.assertEqual(schemas.validate({"id": 2, "bad": 1}, self.schemadir), ["bad instance"])
+        self.assertEqual(len(FakeValidator.created), 1)
+        self.assertEqual(FakeValidator.created[0].validated, [(1, "urn:goob"), (2, None)])
+
+    def test_validate_all(self):
+        items = [({"id": 1}, "urn:a"), ({"id": 2, "$schema": "urn:b", "bad": 1}, None),
+                 ({"id": 3, "bad": 1}, "urn:c")]
+        errs = schemas.validate_all(items, self.schemadir)
+        self.assertEqual(errs, [[], ["bad instance"], ["bad instance"]])
+
+        # one validator for each prefix
+        self.assertEqual(len(FakeValidator.created), 2)
+        self.assertEqual(FakeValidator.created[0].prefix, "_")
+        self.assertEqual(FakeValidator.created[0].validated, [(1, "urn:a"), (3, "urn:c")])
+        self.assertEqual(FakeValidator.created[1].prefix, "$")
+        self.assertEqual(FakeValidator.created[1].validated, [(2, None)])
+
+
+if __name__ == '__main__':
+    test.main()
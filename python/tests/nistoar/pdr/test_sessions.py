@@ -0,0 +1,77 @@
+import os, sys, pdb
+import unittest as test
+
+from nistoar.pdr import sessions
+from nistoar.pdr.exceptions import ConfigurationException
+
+class TestSessions(test.TestCase):
+
+    def tearDown(self):
+        sessions.configure(None)
+
+    def test_create_session(self):
+        sess = sessions.create_session()
+        self.assertTrue(isinstance(sess, sessions.PDRSession))
+        self.assertEqual(sess.timeout, (30, None))
+        adapter = sess.get_adapter("https://data.nist.gov/")
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertEqual(adapter.max_retries.backoff_factor, 0.3)
+        self.assertIs(sess.get_adapter("http://localhost/"), adapter)
+
+        sess = sessions.create_session({"retries": 5, "read_timeout": 60,
+                                        "status_forcelist": [503]})
+        self.assertEqual(sess.timeout, (30, 60))
+        adapter = sess.get_adapter("https://data.nist.gov/")
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+        with self.assertRaises(ConfigurationException):
+            sessions.create_session({"retries": "goob"})
+        with self.assertRaises(ConfigurationException):
+            sessions.create_session(["goob"])
+
+    def test_get_session(self):
+        sess = sessions.get_session()
+        self.assertIs(sessions.get_session(), sess)
+        self.assertIs(sessions.get_session({}), sess)
+        self.assertIs(sessions.get_session({"retries": 2}), sess)
+
+        other = sessions.get_session({"retries": 0})
+        self.assertIsNot(other, sess)
+        self.assertIs(sessions.get_session({"retries": 0}), other)
+
+    def test_session_key(self):
+        # list-valued properties, including the default (empty) status_forcelist,
+        # must yield a hashable key
+        cfg = sessions._merge_config(None)
+        self.assertEqual(cfg['status_forcelist'], [])
+        key = sessions._key_for(cfg)
+        self.assertIn(("status_forcelist", ()), key)
+        hash(key)
+        self.assertIn(("status_forcelist", (503,)),
+                      sessions._key_for(sessions._merge_config({"status_forcelist": [503]})))
+
+        sess = sessions.get_session(sessions.DEF_SESSION_CONFIG)
+        self.assertIs(sessions.get_session(), sess)
+        self.assertIsNot(sessions.get_session({"status_forcelist": [503]}), sess)
+
+    def test_configure(self):
+        sess = sessions.get_session()
+        sessions.configure({"connect_timeout": 5, "retries": 1})
+        newsess = sessions.get_session()
+        self.assertIsNot(newsess, sess)
+        self.assertEqual(newsess.timeout, (5, None))
+        self.assertEqual(newsess.get_adapter("http://localhost/").max_retries.total, 1)
+
+        # defaults apply to custom configurations as well
+        self.assertEqual(sessions.get_session({"retries": 0}).timeout, (5, None))
+
+        sessions.configure(None)
+        self.assertEqual(sessions.get_session().timeout, (30, None))
+
+        with self.assertRaises(ConfigurationException):
+            sessions.configure("goob")
+
+
+if __name__ == '__main__':
+    test.main()
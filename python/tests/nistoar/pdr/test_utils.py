@@ -100,8 +100,16 @@ class TestChecksum(test.TestCase):
         dfile = os.path.join(testdatadir4,u"trial3/trial3\u03b1.json")
         self.assertEqual(utils.checksum_of(dfile), self.syssum(dfile))
 
-    def syssum(self, filepath):
-        cmd = ["sha256sum", filepath]
+    def test_digests_of(self):
+        dfile = os.path.join(testdatadir2,"trial1.json")
+        sums = utils.digests_of(dfile, ["sha256", "md5"], 100)
+        self.assertEqual(list(sums.keys()), ["sha256", "md5"])
+        self.assertEqual(sums['sha256'], self.syssum(dfile))
+        self.assertEqual(sums['md5'], self.syssum(dfile, "md5sum"))
+        self.assertEqual(utils.checksum_of(dfile, "md5"), sums['md5'])
+
+    def syssum(self, filepath, cmd="sha256sum"):
+        cmd = [cmd, filepath]
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE)
         (out, err) = proc.communicate()
@@ -261,6 +269,41 @@ class TestLockedFile(test.TestCase):
 
         self.assertEqual(data, "tatroaor")
 
+class TestExclusiveFileLock(test.TestCase):
+
+    def setUp(self):
+        self.tf = Tempfiles()
+        self.lfile = self.tf("test.lock")
+
+    def tearDown(self):
+        self.tf.clean()
+
+    def test_exclusive(self):
+        out = []
+        def f(who, pause=0):
+            time.sleep(pause)
+            with utils.ExclusiveFileLock(self.lfile):
+                out.append(who+'a')
+                time.sleep(0.2)
+                out.append(who+'r')
+        t = threading.Thread(target=f, args=('o', 0.05))
+        t.start()
+        f('t')
+        t.join()
+
+        self.assertEqual("".join(out), "tatroaor")
+        self.assertTrue(os.path.isfile(self.lfile))
+        self.assertEqual(os.stat(self.lfile).st_size, 0)
+
+        # the lock is released on an exception
+        with self.assertRaises(RuntimeError):
+            with utils.ExclusiveFileLock(self.lfile):
+                raise RuntimeError("oops")
+        t = threading.Thread(target=f, args=('x',))
+        t.start()
+        t.join(5)
+        self.assertFalse(t.is_alive())
+
 class TestJsonIO(test.TestCase):
     # this class focuses on testing the locking of JSON file IO
     
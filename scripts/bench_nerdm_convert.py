@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+#
+from __future__ import print_function
+import os, sys, time, json, traceback as tb
+from collections import OrderedDict
+from argparse import ArgumentParser
+from distutils.spawn import find_executable
+
+basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+oarpypath = os.path.join(basedir, "python")
+if 'OAR_HOME' in os.environ:
+    basedir = os.environ['OAR_HOME']
+    oarpypath = os.path.join(basedir, "lib", "python") +":"+ \
+                os.path.join(basedir, "python")
+
+if 'OAR_PYTHONPATH' in os.environ:
+    oarpypath = os.environ['OAR_PYTHONPATH']
+
+sys.path.extend(oarpypath.split(os.pathsep))
+try:
+    import nistoar
+except ImportError, e:
+    nistoardir = os.path.join(basedir, "python")
+    sys.path.append(nistoardir)
+    import nistoar
+
+from nistoar.pdr import def_jq_libdir
+from nistoar.pdr.exceptions import PDRException
+import nistoar.pdr.preserv.bagit.convert as cvt
+
+prog = os.path.basename(sys.argv[0])
+if not prog or prog == 'python':
+    prog = "bench_nerdm_convert"
+
+defpod = os.path.join(basedir, "python", "tests", "nistoar", "pdr", "preserv", "data",
+                      "midassip", "review", "1491", "_pod.json")
+
+description = \
+"""measure the per-record latency of the POD-to-NERDm conversion, inventory, and
+hierarchy computations for each of the available engines and compare them.  The jq
+engine requires the jq executable, the jq conversion library, and the nistoar.nerdm
+package (all provided by oar-metadata); if any are missing, the reason is reported."""
+
+epilog = None
+
+def define_opts(progname=None):
+    parser = ArgumentParser(progname, None, description, epilog)
+    parser.add_argument('podfile', metavar='PODFILE', type=str, nargs='?', default=defpod,
+                        help="the POD record to convert (default: a test record)")
+    parser.add_argument('-n', '--count', metavar='N', type=int, dest='count', default=50,
+                        help="the number of times to repeat each computation")
+    parser.add_argument('-e', '--engine', metavar='ENGINE', action='append',
+                        dest='engines', choices=cvt.ENGINES,
+                        help="an engine to benchmark (default: all)")
+    parser.add_argument('-J', '--jq-lib', metavar='DIR', type=str, dest='jqlib',
+                        default=def_jq_libdir,
+                        help="the directory containing the jq conversion library")
+
+    return parser
+
+def time_it(func, count):
+    """
+    call func count times and return the mean latency in milliseconds
+    """
+    start = time.time()
+    for i in range(count):
+        func()
+    return 1000.0 * (time.time() - start) / count
+
+def jq_unavailable(jqlib):
+    """
+    return the reason that the jq engine cannot be run or None if it can be
+    """
+    if not find_executable("jq"):
+        return "jq executable not found on PATH"
+    if not jqlib or not os.path.exists(os.path.join(jqlib, "pod2nerdm.jq")):
+        return "jq conversion library not found (set OAR_JQ_LIB or use -J)"
+    try:
+        import nistoar.nerdm.convert
+    except ImportError as ex:
+        return "nistoar.nerdm package (from oar-metadata) not installed: "+str(ex)
+    return None
+
+def main(args):
+    parser = define_opts()
+    opts = parser.parse_args(args)
+    engines = opts.engines or list(cvt.ENGINES)
+
+    with open(opts.podfile) as fd:
+        pod = json.load(fd, object_pairs_hook=OrderedDict)
+    id = "ark:/88434/mds00bench"
+
+    print("{0:8s} {1:>14s} {2:>14s} {3:>14s}".format("engine", "convert(ms)",
+                                                    "inventory(ms)", "hierarchy(ms)"))
+    results = OrderedDict()
+    for engine in engines:
+        if engine == cvt.JQ_ENGINE:
+            why = jq_unavailable(opts.jqlib)
+            if why:
+                print("{0:8s} unavailable: {1}".format(engine, why))
+                continue
+        try:
+            pod2nrd = cvt.make_pod_converter(engine, opts.jqlib)
+            counter = cvt.make_component_counter(engine, opts.jqlib)
+            hierer = cvt.make_hierarchy_builder(engine, opts.jqlib)
+            comps = pod2nrd.convert_data(pod, id).get('components', [])
+        except Exception as ex:
+            print("{0:8s} unavailable: {1}".format(engine, str(ex)))
+            continue
+
+        lat = [ time_it(lambda: pod2nrd.convert_data(pod, id), opts.count),
+                time_it(lambda: counter.inventory(comps), opts.count),
+                time_it(lambda: hierer.build_hierarchy(comps), opts.count) ]
+        print("{0:8s} {1:14.3f} {2:14.3f} {3:14.3f}".format(engine, *lat))
+        results[engine] = lat
+
+    # compare the jq engine to the native one
+    if cvt.JQ_ENGINE in results and cvt.NATIVE_ENGINE in results:
+        ratios = [j / max(n, 1.0e-6) for j, n in zip(results[cvt.JQ_ENGINE],
+                                                      results[cvt.NATIVE_ENGINE])]
+        print("{0:8s} {1:13.1f}x {2:13.1f}x {3:13.1f}x".format("speed-up", *ratios))
+    elif len(engines) > 1:
+        print("(no comparison: only {0} could be measured)"
+              .format(", ".join(results.keys()) or "no engine"))
+
+
+if __name__ == '__main__':
+    try:
+        main(sys.argv[1:])
+        sys.exit(0)
+    except PDRException as e:
+        print(prog+":", str(e), file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(prog+":", repr(e), file=sys.stderr)
+        tb.print_exc()
+        sys.exit(10)